@@ -0,0 +1,171 @@
+__author__ = "Andrea Galassi"
+__copyright__ = "Copyright 2018-2020 Andrea Galassi"
+__license__ = "BSD 3-clause"
+__version__ = "0.1.0"
+__email__ = "a.galassi@unibo.it"
+
+"""
+Bootstrap confidence intervals of the scores of the evaluation headline, resampling the documents of a split.
+The predictions of each iteration of a network are reduced to a confusion matrix for each document and task (link,
+relation, component). A resample of the documents is a vector of multinomial weights: its confusion matrices are the
+weighted sums of the ones of the documents, so thousands of resamples are a single matrix product, and their scores are
+computed on all the matrices at once. The resamples are split in chunks, each one drawn with its own seed and scored
+by a process of a pool: the same seed gives the same resamples, so the distributions of two networks evaluated on the
+same documents can be compared pair by pair.
+"""
+
+import time
+import numpy as np
+
+from multiprocessing import Pool
+from evaluation_metrics import confusion_tensor, batch_precision_recall_fscore_support
+
+
+BOOTSTRAP_CHUNK_SIZE = 250
+
+
+def get_document_id(component_id):
+    """
+    :param component_id: the ID of a component, "<document ID>_<index>"
+    :return: the ID of its document
+    """
+    return str(component_id)[:str(component_id).rfind('_')]
+
+
+def create_confusion_tensors(Y_test_links, Y_pred_links, Y_test_rel, Y_pred_rel, Y_test_prop, Y_pred_prop,
+                             pair_documents, component_documents, documents, output_units):
+    """
+    Creates the confusion matrices of each document of the labels evaluated by perform_evaluation
+    :param pair_documents: the document ID of each link and relation label
+    :param component_documents: the document ID of each component label
+    :param documents: the sorted IDs of all the documents of the split
+    :param output_units: the number of classes of each output of the network (see dataset_config)
+    :return: dictionary with the confusion matrices of the documents, (documents, classes, classes), of each task
+    """
+    pair_segments = np.searchsorted(documents, pair_documents)
+    component_segments = np.searchsorted(documents, component_documents)
+    return {'link': confusion_tensor(Y_test_links, Y_pred_links, pair_segments, len(documents), output_units[0]),
+            'relation': confusion_tensor(Y_test_rel, Y_pred_rel, pair_segments, len(documents), output_units[1]),
+            'component': confusion_tensor(Y_test_prop, Y_pred_prop, component_segments, len(documents),
+                                          output_units[2])}
+
+
+def compute_headline_scores(tensors, relations_labels, not_a_link_label, weights):
+    """
+    Computes the columns of the evaluation headline, in the same order of create_report in evaluate_net.py, for a batch
+    of resamples of the documents
+    :param tensors: the confusion matrices of the documents created by create_confusion_tensors
+    :param relations_labels: the labels of the relations that are links
+    :param not_a_link_label: the label of the relations that are not links
+    :param weights: how many times each document is taken by each resample, (resamples, documents)
+    :return: the scores, (resamples, columns)
+    """
+    matrices = {}
+    for task in tensors.keys():
+        tensor = tensors[task]
+        matrices[task] = np.dot(weights, tensor.reshape(len(tensor), -1)).reshape((len(weights),) + tensor.shape[1:])
+
+    # as in the evaluation of the whole split, the default labels are the ones that appear in its true or predicted
+    # labels
+    total_rel = tensors['relation'].sum(axis=0)
+    rel_labels = np.nonzero(total_rel.sum(axis=0) + total_rel.sum(axis=1))[0]
+    total_prop = tensors['component'].sum(axis=0)
+    prop_labels = np.nonzero(total_prop.sum(axis=0) + total_prop.sum(axis=1))[0]
+
+    f1_link = batch_precision_recall_fscore_support(matrices['link'], [0])[2][:, 0]
+    f1_non_link = batch_precision_recall_fscore_support(matrices['link'], [1])[2][:, 0]
+    f1_rel = batch_precision_recall_fscore_support(matrices['relation'], relations_labels)[2]
+    f1_rel_AVGM = batch_precision_recall_fscore_support(matrices['relation'], relations_labels, 'macro')[2]
+    f1_rel_completeM = batch_precision_recall_fscore_support(matrices['relation'], rel_labels, 'macro')[2]
+    f1_non_rel = batch_precision_recall_fscore_support(matrices['relation'], [not_a_link_label])[2][:, 0]
+
+    prec_prop, rec_prop, f1_prop, supp_prop = batch_precision_recall_fscore_support(matrices['component'],
+                                                                                   prop_labels)
+    prec_prop_AVGM, rec_prop_AVGM, f1_prop_AVGM, _ = batch_precision_recall_fscore_support(matrices['component'],
+                                                                                          prop_labels, 'macro')
+    prec_prop_AVGm, rec_prop_AVGm, f1_prop_AVGm, _ = batch_precision_recall_fscore_support(matrices['component'],
+                                                                                          prop_labels, 'micro')
+
+    f1_AVG_LP = (f1_link + f1_prop_AVGM) / 2
+    f1_AVG_all = (f1_link + f1_prop_AVGM + f1_rel_AVGM) / 3
+
+    columns = [f1_AVG_all, f1_AVG_LP, f1_link, f1_rel_AVGM, f1_rel, f1_prop_AVGM, f1_prop, f1_prop_AVGm,
+               prec_prop_AVGM, prec_prop, prec_prop_AVGm, rec_prop_AVGM, rec_prop, rec_prop_AVGm, supp_prop,
+               f1_non_link, f1_rel_completeM, f1_non_rel]
+    return np.concatenate([np.reshape(column, (len(weights), -1)) for column in columns], axis=1)
+
+
+def compute_bootstrap_chunk(task):
+    """
+    Draws and scores a chunk of resamples. The scores of the iterations of the network are averaged, as in the final
+    evaluation.
+    :param task: the seed of the chunk, the number of its resamples, the list of the confusion tensors of each
+    iteration, the labels of the relations that are links and the label of the relations that are not links
+    :return: the scores of the resamples, (resamples, columns)
+    """
+    seed, resamples, iteration_tensors, relations_labels, not_a_link_label = task
+    documents = len(iteration_tensors[0]['link'])
+    weights = np.random.RandomState(seed).multinomial(documents, np.full(documents, 1.0 / documents), size=resamples)
+
+    scores = 0
+    for tensors in iteration_tensors:
+        scores = scores + compute_headline_scores(tensors, relations_labels, not_a_link_label, weights)
+    return scores / len(iteration_tensors)
+
+
+def bootstrap_scores(iteration_tensors, relations_labels, not_a_link_label, resamples=1000, seed=0, processes=None,
+                     chunk_size=BOOTSTRAP_CHUNK_SIZE):
+    """
+    Computes the scores of the evaluation headline on resamples of the documents of a split
+    :param iteration_tensors: the confusion tensors of each iteration, created by create_confusion_tensors
+    :param relations_labels: the labels of the relations that are links
+    :param not_a_link_label: the label of the relations that are not links
+    :param resamples: the number of resamples
+    :param seed: the seed of the first chunk of resamples
+    :param processes: the number of processes of the pool. If None, the number of CPUs. If 1, no pool is used
+    :param chunk_size: the number of resamples scored by a single task
+    :return: the scores of the resamples, (resamples, columns)
+    """
+    tasks = []
+    for start in range(0, resamples, chunk_size):
+        tasks.append((seed + len(tasks), min(chunk_size, resamples - start), iteration_tensors,
+                      list(relations_labels), not_a_link_label))
+
+    print(str(time.ctime()) + "\t\tBOOTSTRAP: " + str(resamples) + " RESAMPLES OF " +
+          str(len(iteration_tensors[0]['link'])) + " DOCUMENTS")
+    if processes == 1:
+        chunks = [compute_bootstrap_chunk(task) for task in tasks]
+    else:
+        with Pool(processes) as pool:
+            chunks = pool.map(compute_bootstrap_chunk, tasks)
+    return np.concatenate(chunks, axis=0)
+
+
+def compute_confidence_intervals(scores, confidence=0.95):
+    """
+    :param scores: the scores of the resamples, (resamples, columns)
+    :param confidence: the confidence level
+    :return: the lower and the upper bound of the percentile interval of each column
+    """
+    alpha = (1 - confidence) / 2
+    return np.percentile(scores, 100 * alpha, axis=0), np.percentile(scores, 100 * (1 - alpha), axis=0)
+
+
+def compare_bootstrap(first_path, second_path, split='test', confidence=0.95):
+    """
+    Compares two networks evaluated with the same bootstrap seed on the same documents: the resamples are paired
+    :param first_path: the bootstrap file of the first network
+    :param second_path: the bootstrap file of the second network
+    :param split: the split to compare
+    :param confidence: the confidence level of the intervals
+    :return: the interval of the difference (first - second) of each column, and the fraction of the resamples where
+    the first network is not better than the second
+    """
+    with np.load(first_path) as first, np.load(second_path) as second:
+        if not np.array_equal(first[split + '_documents'], second[split + '_documents']) or \
+                int(first['seed']) != int(second['seed']):
+            raise Exception('THE BOOTSTRAP RESAMPLES ARE NOT PAIRED')
+        differences = first[split + '_scores'] - second[split + '_scores']
+
+    low, high = compute_confidence_intervals(differences, confidence)
+    return low, high, np.mean(differences <= 0, axis=0)
@@ -0,0 +1,170 @@
+__author__ = "Andrea Galassi"
+__copyright__ = "Copyright 2018-2020 Andrea Galassi"
+__license__ = "BSD 3-clause"
+__version__ = "0.1.0"
+__email__ = "a.galassi@unibo.it"
+
+"""
+Build manifest of the dataframe -> vocabulary -> embeddings pipeline.
+For each stage, the manifest records the content hashes of its input files, of its configuration and of its output
+files. A stage is up to date if none of them changed since it was recorded. File hashes are cached by size and
+modification time, so that unchanged files (e.g. the GloVe file) are not read again.
+"""
+
+import os
+import json
+import hashlib
+
+
+MANIFEST_NAME = "build_manifest.json"
+
+
+def get_manifest_path(dataset_path):
+    return os.path.join(dataset_path, MANIFEST_NAME)
+
+
+def load_manifest(manifest_path):
+    """
+    :param manifest_path: path of the manifest
+    :return: the manifest, empty if it does not exist
+    """
+    manifest = {'files': {}, 'stages': {}}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+    manifest['path'] = manifest_path
+    return manifest
+
+
+def save_manifest(manifest):
+    manifest_path = manifest['path']
+    with open(manifest_path, "w") as f:
+        json.dump({'files': manifest['files'], 'stages': manifest['stages']}, f, indent=1, sort_keys=True)
+
+
+def hash_string(string):
+    return hashlib.sha1(string.encode("utf-8")).hexdigest()
+
+
+def hash_config(config):
+    """
+    :param config: json-serializable configuration of a stage
+    :return: the hash of the configuration
+    """
+    return hash_string(json.dumps(config, sort_keys=True, default=str))
+
+
+def hash_file(manifest, path):
+    """
+    Computes the hash of the content of a file, reusing the cached one if size and modification time did not change
+    :param manifest: the manifest, which holds the cache
+    :param path: path of the file
+    :return: the hash of the file
+    """
+    key = os.path.relpath(path, os.path.dirname(manifest['path']))
+    stat = os.stat(path)
+    cached = manifest['files'].get(key)
+    if cached is not None and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+        return cached[2]
+
+    sha = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    file_hash = sha.hexdigest()
+    manifest['files'][key] = [stat.st_size, stat.st_mtime_ns, file_hash]
+    return file_hash
+
+
+def hash_paths(manifest, paths):
+    """
+    Computes the hashes of a list of files and folders. Folders are explored recursively. Missing paths are ignored.
+    :param manifest: the manifest, which holds the cache
+    :param paths: list of paths
+    :return: dictionary from the relative path of each file to its hash
+    """
+    root = os.path.dirname(manifest['path'])
+    hashes = {}
+    for path in paths:
+        if os.path.isdir(path):
+            for folder, folder_names, file_names in os.walk(path):
+                folder_names.sort()
+                for file_name in sorted(file_names):
+                    file_path = os.path.join(folder, file_name)
+                    hashes[os.path.relpath(file_path, root)] = hash_file(manifest, file_path)
+        elif os.path.exists(path):
+            hashes[os.path.relpath(path, root)] = hash_file(manifest, path)
+    return hashes
+
+
+def is_stage_current(manifest, stage, config, inputs, output_paths):
+    """
+    Checks whether a stage needs to be run again
+    :param manifest: the manifest
+    :param stage: name of the stage
+    :param config: configuration of the stage
+    :param inputs: hashes of the input files (see hash_paths)
+    :param output_paths: files and folders produced by the stage
+    :return: True if inputs, configuration and outputs are the same of the last recorded run
+    """
+    record = manifest['stages'].get(stage)
+    if record is None:
+        return False
+    if record['config'] != hash_config(config) or record['inputs'] != inputs:
+        return False
+    outputs = hash_paths(manifest, output_paths)
+    return len(outputs) > 0 and record['outputs'] == outputs
+
+
+def get_stage_config(manifest, stage):
+    """
+    :return: the hash of the configuration of the last recorded run of a stage, None if it has never been run
+    """
+    record = manifest['stages'].get(stage)
+    if record is None:
+        return None
+    return record['config']
+
+
+def record_stage(manifest, stage, config, inputs, output_paths):
+    """
+    Records a completed run of a stage and saves the manifest
+    :param manifest: the manifest
+    :param stage: name of the stage
+    :param config: configuration of the stage
+    :param inputs: hashes of the input files, computed before the run
+    :param output_paths: files and folders produced by the stage
+    :return: None
+    """
+    manifest['stages'][stage] = {'config': hash_config(config),
+                                 'inputs': inputs,
+                                 'outputs': hash_paths(manifest, output_paths)}
+    save_manifest(manifest)
+
+
+class LookupRecorder(object):
+    """
+    Vocabulary model made of the results of previous lookups: the words found in it (with their values) and the words
+    that were not. The lookups of words whose presence is unknown are recorded in "unknown": if there are none, the
+    tokenization performed with this model is the same that would have been obtained with the whole original model.
+    It can also wrap the whole model (which is not copied), to record all the words that are not found in it.
+    """
+
+    def __init__(self, hits, misses=()):
+        self.hits = hits
+        self.misses = set(misses)
+        self.unknown = set()
+
+    def keys(self):
+        # the tokenizers check the presence of the words with "word in model.keys()"
+        return self
+
+    def __contains__(self, word):
+        if word in self.hits:
+            return True
+        if word not in self.misses:
+            self.unknown.add(word)
+        return False
+
+    def __getitem__(self, word):
+        return self.hits[word]
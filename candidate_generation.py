@@ -0,0 +1,308 @@
+__author__ = "Andrea Galassi"
+__copyright__ = "Copyright 2018-2020 Andrea Galassi"
+__license__ = "BSD 3-clause"
+__version__ = "0.1.0"
+__email__ = "a.galassi@unibo.it"
+
+"""
+Candidate generation for the pairs that are scored at inference time.
+
+The dataframes contain every ordered pair of components of a document, but links between distant components are rare.
+A candidate function receives the dataset created by training.load_dataset, the name of a split and, if its
+uses_predictions attribute is True, the predictions of the network on the split. It returns a boolean mask over the
+pairs of that split: the pairs that are not selected are not given to the network and are reported as non-links.
+The functions that use the predictions need only the types of the components, so they receive the predictions of a
+pre-pass that scores only the closest pair of each component (create_prepass_mask): the pre-pass is linear in the
+number of components, and the full network is then run only on the candidates.
+"""
+
+import numpy as np
+
+from dataset_config import dataset_info
+
+
+def get_pair_differences(dataset, split):
+    """
+    :param dataset: dataset created by training.load_dataset
+    :param split: name of the split
+    :return: integer array with the difference between target and source position of each pair
+    """
+    return np.asarray(dataset[split]['difference'], dtype=int)
+
+
+def get_predicted_types(dataset, split, predictions):
+    """
+    Predicted type of the source and of the target of each pair of a split. As in the evaluation, the type of a
+    component is the class with the highest score summing all its predictions, as source and as target. The pairs that
+    have not been scored, such as the ones outside the pre-pass, have zero type scores and do not vote.
+    :param dataset: dataset created by training.load_dataset
+    :param split: name of the split
+    :param predictions: predictions of the network on the split (link, relation, source, target)
+    :return: the source types and the target types, as integer arrays
+    """
+    sids = np.asarray(dataset[split]['s_id'])
+    tids = np.asarray(dataset[split]['t_id'])
+    components, positions = np.unique(np.concatenate([sids, tids]), return_inverse=True)
+
+    scores = np.zeros((len(components), np.shape(predictions[2])[-1]))
+    np.add.at(scores, positions[:len(sids)], predictions[2])
+    np.add.at(scores, positions[len(sids):], predictions[3])
+    types = np.argmax(scores, axis=-1)
+
+    return types[positions[:len(sids)]], types[positions[len(sids):]]
+
+
+def get_link_truth(dataset, split):
+    """
+    Boolean array that states which pairs of a split are linked
+    """
+    links = np.array(dataset[split]['links'], ndmin=2)
+    if len(links[0]) == 0:
+        return np.zeros(0, dtype=bool)
+    return np.argmax(links, axis=-1) == 0
+
+
+def create_distance_window_fn(window):
+    """
+    Keeps only the pairs whose components are at most window positions apart
+    :param window: maximum absolute distance between the two components
+    :return: candidate function
+    """
+    def distance_window(dataset, split, predictions=None):
+        return np.abs(get_pair_differences(dataset, split)) <= window
+
+    distance_window.__name__ = "window_" + str(window)
+    distance_window.uses_predictions = False
+
+    return distance_window
+
+
+def create_type_rules_fn(dataset_name, allowed_pairs=None):
+    """
+    Keeps only the pairs whose (source type, target type) combination can be linked.
+    The allowed combinations come from the gold types of the training split, while the types of the evaluated pairs
+    are the ones predicted by the network in the pre-pass created by create_prepass_mask.
+    :param dataset_name: name of the dataset, used to retrieve the prop_types from dataset_info
+    :param allowed_pairs: list of (source type, target type) names. If None, they are the type combinations that have
+    at least one link in the training split
+    :return: candidate function
+    """
+    prop_types = [prop_type.lower() for prop_type in dataset_info[dataset_name]["prop_types"]]
+    allowed_matrix = None
+
+    if allowed_pairs is not None:
+        allowed_matrix = np.zeros((len(prop_types), len(prop_types)), dtype=bool)
+        for source_type, target_type in allowed_pairs:
+            allowed_matrix[prop_types.index(source_type.lower()), prop_types.index(target_type.lower())] = True
+
+    def type_rules(dataset, split, predictions=None):
+        nonlocal allowed_matrix
+
+        if predictions is None:
+            raise Exception('THE TYPE RULES REQUIRE THE PREDICTIONS OF THE NETWORK')
+
+        if allowed_matrix is None:
+            allowed_matrix = np.zeros((len(prop_types), len(prop_types)), dtype=bool)
+            links = get_link_truth(dataset, 'train')
+            if len(links) > 0:
+                s_types = np.argmax(dataset['train']['sources_type'], axis=-1)[links]
+                t_types = np.argmax(dataset['train']['targets_type'], axis=-1)[links]
+                allowed_matrix[s_types, t_types] = True
+
+        if len(dataset[split]['s_id']) == 0:
+            return np.zeros(0, dtype=bool)
+
+        s_types, t_types = get_predicted_types(dataset, split, predictions)
+        return allowed_matrix[s_types, t_types]
+
+    type_rules.__name__ = "type_rules"
+    type_rules.uses_predictions = True
+
+    return type_rules
+
+
+def create_distance_prior_fn(threshold=0.0, max_distance=20):
+    """
+    Cheap pre-scorer: estimates on the training split the probability that two components are linked given their
+    distance, and keeps only the pairs whose probability is greater than the threshold.
+    :param threshold: minimum link probability required to keep a pair
+    :param max_distance: distances beyond this value are considered as equal to it
+    :return: candidate function
+    """
+    prior = None
+
+    def distance_prior(dataset, split, predictions=None):
+        nonlocal prior
+
+        if prior is None:
+            differences = np.clip(get_pair_differences(dataset, 'train'), -max_distance, max_distance) + max_distance
+            links = get_link_truth(dataset, 'train')
+            total = np.bincount(differences, minlength=max_distance * 2 + 1)
+            linked = np.bincount(differences[links], minlength=max_distance * 2 + 1)
+            prior = linked / np.maximum(total, 1)
+
+        differences = np.clip(get_pair_differences(dataset, split), -max_distance, max_distance) + max_distance
+        return prior[differences] > threshold
+
+    distance_prior.__name__ = "prior_" + str(threshold)
+    distance_prior.uses_predictions = False
+
+    return distance_prior
+
+
+def create_combined_fn(candidate_fns):
+    """
+    Keeps only the pairs that are kept by all the given candidate functions
+    """
+    def combined(dataset, split, predictions=None):
+        mask = np.ones(len(dataset[split]['s_id']), dtype=bool)
+        for candidate_fn in candidate_fns:
+            mask = np.logical_and(mask, candidate_fn(dataset, split, predictions))
+        return mask
+
+    combined.__name__ = "+".join([candidate_fn.__name__ for candidate_fn in candidate_fns])
+    combined.uses_predictions = any([candidate_fn.uses_predictions for candidate_fn in candidate_fns])
+
+    return combined
+
+
+def create_candidate_generator(dataset_name, window=-1, type_rules=False, prior_threshold=None):
+    """
+    Creates the candidate function from the evaluation options
+    :param dataset_name: name of the dataset
+    :param window: maximum distance between the components of a pair. Negative values disable the window
+    :param type_rules: whether to keep only the predicted type combinations that are linked in the training split
+    :param prior_threshold: minimum link probability given the distance. None disables the pre-scorer
+    :return: the candidate function, None if no pruning has been required
+    """
+    candidate_fns = []
+    if window is not None and window >= 0:
+        candidate_fns.append(create_distance_window_fn(window))
+    if type_rules:
+        candidate_fns.append(create_type_rules_fn(dataset_name))
+    if prior_threshold is not None:
+        candidate_fns.append(create_distance_prior_fn(prior_threshold))
+
+    if len(candidate_fns) == 0:
+        return None
+    elif len(candidate_fns) == 1:
+        return candidate_fns[0]
+    return create_combined_fn(candidate_fns)
+
+
+def create_candidate_mask(candidate_fn, dataset, split, keep_components=True, predictions=None):
+    """
+    Applies the candidate function to a split
+    :param candidate_fn: candidate function
+    :param dataset: dataset created by training.load_dataset
+    :param split: name of the split
+    :param keep_components: if True, every component keeps at least its closest pair, so that its type is still
+    predicted by the network
+    :param predictions: predictions of the network on the split, required if the function uses them
+    :return: boolean mask over the pairs of the split
+    """
+    mask = np.array(candidate_fn(dataset, split, predictions), dtype=bool)
+
+    if keep_components:
+        cover_components(dataset, split, mask)
+
+    return mask
+
+
+def cover_components(dataset, split, mask):
+    """
+    Adds to the mask the closest pair of each component that is not in any selected pair
+    :param dataset: dataset created by training.load_dataset
+    :param split: name of the split
+    :param mask: boolean mask over the pairs of the split, modified in place
+    :return: the mask
+    """
+    if len(mask) > 0:
+        sids = np.array(dataset[split]['s_id'])
+        tids = np.array(dataset[split]['t_id'])
+        covered = set(sids[mask]) | set(tids[mask])
+        # closest pairs first, so the first pair found for a component is its closest one
+        order = np.argsort(np.abs(get_pair_differences(dataset, split)), kind='stable')
+        for index in order:
+            if sids[index] not in covered or tids[index] not in covered:
+                mask[index] = True
+                covered.add(sids[index])
+                covered.add(tids[index])
+
+    return mask
+
+
+def create_prepass_mask(dataset, split):
+    """
+    Selects the pairs scored to predict the component types required by the candidate functions that use the
+    predictions: the closest pair of each component, so at most one pair per component instead of all the pairs
+    :param dataset: dataset created by training.load_dataset
+    :param split: name of the split
+    :return: boolean mask over the pairs of the split
+    """
+    return cover_components(dataset, split, np.zeros(len(dataset[split]['s_id']), dtype=bool))
+
+
+def prune_inputs(X_split, mask):
+    """
+    Selects the candidate pairs from the inputs of the network
+    """
+    return [x[mask] for x in X_split]
+
+
+def expand_pruned_predictions(Y_pred, mask, not_link_relation):
+    """
+    Creates the predictions for all the pairs of a split from the ones of the candidate pairs.
+    The pruned pairs are predicted as non-links, with the not-link relation, and do not vote for the type of their
+    components.
+    :param Y_pred: predictions of the network on the candidate pairs (link, relation, source, target)
+    :param mask: boolean mask used to select the candidates
+    :param not_link_relation: index of the relation class that represents the absence of a link
+    :return: predictions for all the pairs of the split
+    """
+    Y_full = []
+    for Y_part in Y_pred:
+        Y_full.append(np.zeros((len(mask),) + Y_part.shape[1:], dtype=Y_part.dtype))
+
+    Y_full[0][:, 1] = 1
+    Y_full[1][:, not_link_relation] = 1
+
+    for Y_part, Y_full_part in zip(Y_pred, Y_full):
+        Y_full_part[mask] = Y_part
+
+    return Y_full
+
+
+def create_pruning_report(mask, links, split, scored=None, note=None):
+    """
+    Reports the pairs saved by the candidate generation and the links that are lost
+    :param mask: boolean mask used to select the candidates
+    :param links: link ground truth of the split, as (pairs, 2) one-hot
+    :param split: name of the split
+    :param scored: number of pairs actually given to the network, including the pre-pass. If None, the kept pairs
+    :param note: explanation added at the end of the report line. Optional
+    :return: report string
+    """
+    truelink = np.argmax(links, axis=-1) == 0
+    pairs = len(mask)
+    kept = int(np.sum(mask))
+    if scored is None:
+        scored = kept
+    total_links = int(np.sum(truelink))
+    lost_links = int(np.sum(np.logical_and(truelink, np.logical_not(mask))))
+
+    saved = (pairs - scored) / pairs if pairs > 0 else 0
+    recall = (total_links - lost_links) / total_links if total_links > 0 else 1
+
+    report = split
+    report += "\tpairs\t" + str(pairs)
+    report += "\tkept\t" + str(kept)
+    report += "\tscored\t" + str(scored)
+    report += "\tsaved\t" + ("{:10.4f}".format(saved)).replace(" ", "")
+    report += "\tlinks\t" + str(total_links)
+    report += "\tlost\t" + str(lost_links)
+    report += "\tmax link recall\t" + ("{:10.4f}".format(recall)).replace(" ", "")
+    if note is not None:
+        report += "\t" + note
+    report += "\n"
+    return report
@@ -13,9 +13,14 @@ import pandas
 import json
 import random
 import sys
+import multiprocessing
 import ast
 import numpy as np
 import argparse
+import dataset_store
+
+from dataset_store import save_dataframe, load_dataframe, merge_dataframes, dataframe_exists
+from build_manifest import load_manifest, get_manifest_path, hash_file, hash_paths, is_stage_current, record_stage
 
 
 
@@ -26,7 +31,175 @@ def split_propositions(text, propositions_offsets):
     return propositions
 
 
-def create_preprocessed_cdcp_pickle(dataset_path, dataset_version, link_types, dataset_type='train', validation=0, reflexive=False):
+def create_relation_index(data, relation_types):
+    """
+    Indexes the links of a document by their (source, target) couple, so that the relations of a pair of propositions
+    are found without scanning all the links of the document
+    :param data: dictionary that contains, for each relation type, the list of its [source, target] links
+    :param relation_types: relation types to index, in the order in which they are considered
+    :return: dictionary (source, target) -> list of (position, relation type), where the position is the order in which
+    the link is met scanning the relation types and their links
+    """
+    relation_index = {}
+    position = 0
+    for relation_type in relation_types:
+        for link in data[relation_type]:
+            key = (link[0], link[1])
+            if key not in relation_index.keys():
+                relation_index[key] = []
+            relation_index[key].append((position, relation_type))
+            position += 1
+    return relation_index
+
+
+def get_pair_relations(relation_index, sourceID, targetID):
+    """
+    Lists the links between two propositions, in the same order in which a scan of all the links of the document would
+    meet them
+    :param relation_index: index created by create_relation_index
+    :param sourceID: id of the source proposition
+    :param targetID: id of the target proposition
+    :return: list of (relation type, direct) couples. Direct is True for the links from source to target, False for the
+    links from target to source
+    """
+    direct_links = relation_index.get((sourceID, targetID), [])
+    # a reflexive link is always met as a direct one
+    if sourceID == targetID:
+        return [(relation_type, True) for (position, relation_type) in direct_links]
+
+    inverse_links = relation_index.get((targetID, sourceID), [])
+    links = ([(position, relation_type, True) for (position, relation_type) in direct_links] +
+             [(position, relation_type, False) for (position, relation_type) in inverse_links])
+    links.sort(key=lambda link: link[0])
+    return [(relation_type, direct) for (position, relation_type, direct) in links]
+
+
+def get_document_random(seed, document_ID):
+    """
+    Creates the random generator of a document. It is seeded with the ID of the document, so that the random choices
+    (e.g. the split assignment) do not depend on the order in which the documents are processed.
+    :param seed: seed of the dataset creation
+    :param document_ID: identifier of the document
+    :return: a random.Random instance
+    """
+    return random.Random(str(seed) + "_" + str(document_ID))
+
+
+def map_documents(function, arguments, processes=1):
+    """
+    Applies a per-document function to a list of arguments, using a pool of processes if required.
+    The results are returned in the order of the arguments, so that the rows of the dataframes do not depend on the
+    scheduling of the processes.
+    :param function: top-level function that processes a single document
+    :param arguments: list of tuples, the arguments of each call
+    :param processes: number of processes. If None, one for each core
+    :return: list of the results
+    """
+    if processes == 1 or len(arguments) <= 1:
+        return [function(*argument) for argument in arguments]
+
+    with multiprocessing.Pool(processes) as pool:
+        return pool.starmap(function, arguments)
+
+
+def count_rows(rows, prop_labels, rel_counter, prop_counter):
+    """
+    Updates the counters of the relations of some dataframe rows and of the labels of their propositions
+    """
+    for row in rows:
+        relation_type = row['relation_type']
+        if relation_type not in rel_counter.keys():
+            rel_counter[relation_type] = 0
+        rel_counter[relation_type] += 1
+
+    for prop_label in prop_labels:
+        if prop_label not in prop_counter.keys():
+            prop_counter[prop_label] = 0
+        prop_counter[prop_label] += 1
+
+
+def create_cdcp_document_rows(data_path, i, link_types, split, reflexive):
+    """
+    Creates the dataframe rows of a document of the CDCP corpus
+    :return: the list of rows and the list of the labels of the propositions
+    """
+    file_name = "%05d" % (i)
+    text_file_path = os.path.join(data_path, file_name + ".txt")
+
+    rows = []
+    prop_labels = []
+
+    text_file = open(text_file_path, 'r')
+    labels_file = open(os.path.join(data_path, file_name + ".ann.json"), 'r')
+    data = json.load(labels_file)
+    raw_text = text_file.read()
+    text_file.close()
+    labels_file.close()
+
+    propositions = split_propositions(raw_text, data['prop_offsets'])
+
+    if len(data['url'])>0:
+        print('URL! ' + str(i))
+
+    num_propositions = len(propositions)
+
+    if (num_propositions <= 1):
+        print('YEP!')
+
+    relation_index = create_relation_index(data, link_types)
+
+    for sourceID in range(num_propositions):
+
+        type1 = data['prop_labels'][sourceID]
+
+        for targetID in range(num_propositions):
+            if sourceID == targetID and not reflexive:
+                continue
+            relation_type = None
+            relation1to2 = False
+
+            # relation type
+            for link_type, direct in get_pair_relations(relation_index, sourceID, targetID):
+                if direct:
+                    if relation_type is not None and not relation_type == link_type:
+                        raise Exception('MORE RELATION FOR THE SAME PROPOSITIONS: document ' + file_name)
+                    relation_type = link_type
+                    relation1to2 = True
+
+                else:
+                    relation_type = "inv_" + link_type
+
+            # proposition type
+            type2 = data['prop_labels'][targetID]
+
+            dataframe_row = {'text_ID': i,
+                             'rawtext': raw_text,
+                             'source_proposition': propositions[sourceID],
+                             'source_ID': str(i) + "_" + str(sourceID),
+                             'target_proposition': propositions[targetID],
+                             'target_ID': str(i) + "_" + str(targetID),
+                             'source_type': type1,
+                             'target_type': type2,
+                             'relation_type': relation_type,
+                             'source_to_target': relation1to2,
+                             'set': split
+                             }
+
+            rows.append(dataframe_row)
+
+        prop_labels.append(type1)
+
+    return rows, prop_labels
+
+
+def create_preprocessed_cdcp_pickle(dataset_path, dataset_version, link_types, dataset_type='train', validation=0,
+                                    reflexive=False, processes=1, seed=0):
+    """
+    Creates the pickles of a split of the preprocessed CDCP corpus
+    :param validation: fraction of the documents to move into the validation split
+    :param processes: number of processes used to parse the documents. If None, one for each core
+    :param seed: seed of the split assignment
+    """
     data_path = os.path.join(dataset_path, dataset_version, dataset_type)
 
     normal_list = []
@@ -37,6 +210,7 @@ def create_preprocessed_cdcp_pickle(dataset_path, dataset_version, link_types, d
     val_prop_counter = {}
     val_rel_counter = {}
 
+    arguments = []
     for i in range(2000):
         file_name = "%05d" % (i)
         text_file_path = os.path.join(data_path, file_name + ".txt")
@@ -45,94 +219,22 @@ def create_preprocessed_cdcp_pickle(dataset_path, dataset_version, link_types, d
             split = dataset_type
 
             if validation > 0 and validation < 1:
-                p = random.random()
+                p = get_document_random(seed, dataset_type + "_" + file_name).random()
                 if p < validation:
                     split = 'validation'
 
-            text_file = open(text_file_path, 'r')
-            labels_file = open(os.path.join(data_path, file_name + ".ann.json"), 'r')
-            data = json.load(labels_file)
-            raw_text = text_file.read()
-            text_file.close()
-            labels_file.close()
-
-            propositions = split_propositions(raw_text, data['prop_offsets'])
-
-            if len(data['url'])>0:
-                print('URL! ' + str(i))
+            arguments.append((data_path, i, link_types, split, reflexive))
 
-            num_propositions = len(propositions)
+    results = map_documents(create_cdcp_document_rows, arguments, processes)
 
-            if (num_propositions <= 1):
-                print('YEP!')
-
-
-            for sourceID in range(num_propositions):
-
-                type1 = data['prop_labels'][sourceID]
-
-                for targetID in range(num_propositions):
-                    if sourceID == targetID and not reflexive:
-                        continue
-                    relation_type = None
-                    relation1to2 = False
-
-                    # relation type
-                    for link_type in link_types:
-                        links = data[link_type]
-
-                        for link in links:
-                            # DEBUG
-                            # if not link[0][0] == link[0][1]:
-                                # raise Exception('MORE PROPOSITIONS IN THE SAME RELATION: document ' + file_name)
-
-                            if link[0] == sourceID and link[1] == targetID:
-                                if relation_type is not None and not relation_type == link_type:
-                                    raise Exception('MORE RELATION FOR THE SAME PROPOSITIONS: document ' + file_name)
-                                relation_type = link_type
-                                relation1to2 = True
-
-                            elif link[0] == targetID and link[1] == sourceID:
-                                relation_type = "inv_" + link_type
-
-                    # proposition type
-                    type2 = data['prop_labels'][targetID]
-
-                    dataframe_row = {'text_ID': i,
-                                     'rawtext': raw_text,
-                                     'source_proposition': propositions[sourceID],
-                                     'source_ID': str(i) + "_" + str(sourceID),
-                                     'target_proposition': propositions[targetID],
-                                     'target_ID': str(i) + "_" + str(targetID),
-                                     'source_type': type1,
-                                     'target_type': type2,
-                                     'relation_type': relation_type,
-                                     'source_to_target': relation1to2,
-                                     'set': split
-                                     }
-
-                    if split == 'validation':
-                        validation_list.append(dataframe_row)
-
-                        if relation_type not in val_rel_counter.keys():
-                            val_rel_counter[relation_type] = 0
-                        val_rel_counter[relation_type] += 1
-                    else:
-                        normal_list.append(dataframe_row)
-
-                        if relation_type not in rel_counter.keys():
-                            rel_counter[relation_type] = 0
-                        rel_counter[relation_type] += 1
-
-
-                if split == 'validation':
-                    if type1 not in val_prop_counter.keys():
-                        val_prop_counter[type1] = 0
-                    val_prop_counter[type1] += 1
-                else:
-                    if type1 not in prop_counter.keys():
-                        prop_counter[type1] = 0
-                    prop_counter[type1] += 1
+    for argument, (rows, prop_labels) in zip(arguments, results):
+        split = argument[3]
+        if split == 'validation':
+            validation_list.extend(rows)
+            count_rows(rows, prop_labels, val_rel_counter, val_prop_counter)
+        else:
+            normal_list.extend(rows)
+            count_rows(rows, prop_labels, rel_counter, prop_counter)
 
     pickles_path = os.path.join(dataset_path, 'pickles', dataset_version)
     if not os.path.exists(pickles_path):
@@ -154,7 +256,7 @@ def create_preprocessed_cdcp_pickle(dataset_path, dataset_version, link_types, d
                                'set']]
 
         dataframe_path = os.path.join(pickles_path, dataset_type + ".pkl")
-        dataframe.to_pickle(dataframe_path)
+        save_dataframe(dataframe, dataframe_path)
 
     if len(validation_list) > 0:
         dataframe = pandas.DataFrame(validation_list)
@@ -172,7 +274,7 @@ def create_preprocessed_cdcp_pickle(dataset_path, dataset_version, link_types, d
                                'set']]
 
         dataframe_path = os.path.join(pickles_path, 'validation' + ".pkl")
-        dataframe.to_pickle(dataframe_path)
+        save_dataframe(dataframe, dataframe_path)
 
     print("_______________")
     print(dataset_type)
@@ -185,9 +287,185 @@ def create_preprocessed_cdcp_pickle(dataset_path, dataset_version, link_types, d
     print("_______________")
 
 
+def create_scidtb_document_rows(document_path, split, relation_types, asymmetric_link_types, symmetric_link_types,
+                                reflexive):
+    """
+    Creates the dataframe rows of a document of the SciDTB corpus
+    :return: the list of sentence rows, the list of pair rows and the number of tokens of the document
+    """
+    document_name = os.path.basename(document_path)
+    doc_ID = int(document_name.split("-")[1][:])
+
+    token_counter = 0
+    rows_by_id = {}
+    sentences_rows = []
+    rows = []
+
+    original_file = open(document_path, 'r', encoding="utf-8")
+
+    raw_text = original_file.read()
+    original_file.close()
+
+    sentence = ""
+    current_label = ""
+    count = 0
+    sent_id = 0
+
+    sent_ids = []
+
+    for line in raw_text.split('\n'):
+        if len(line)<5:
+            continue
+
+        token_counter += 1
+        sentence_splits = line.split()
+        text = sentence_splits[0]
+        label = sentence_splits[1]
+
+        if label[0] == "B" or sentence == "":
+            # if it is the first line
+            if len(sentence) > 1:
+                current_label = current_label.replace("-", ".")
+                current_label = current_label.replace("..", ".-")
+
+                labels_splits = current_label.split(".")
+                source_type = labels_splits[1]
+                relation_type = labels_splits[2]
+                source_to_target = False
+                target_offset = labels_splits[3]
+                source_id = str(doc_ID) + "_" + str(sent_id)
+                target_id = ""
+
+                if relation_type in relation_types:
+                    target_id = str(doc_ID) + "_" + str(sent_id + int(target_offset))
+                else:
+                    relation_type = None
+                if (relation_type in asymmetric_link_types) or (relation_type in symmetric_link_types):
+                    source_to_target = True
+
+                sentences_row = {'text_ID': doc_ID,
+                                'source_ID': source_id,
+                                'target_ID': target_id,
+                                'source_type': source_type,
+                                'relation_type': relation_type,
+                                'source_to_target': source_to_target,
+                                'set': split,
+                                'source_length': count,
+                                'source_proposition': sentence,
+                                }
+                rows_by_id[source_id] = sentences_row
+                sentences_rows.append(sentences_row)
+                sent_ids.append(source_id)
+                sent_id += 1
+
+            sentence = text
+            current_label = label
+            count = 0
+        elif label[0] == "O":
+            # exiting from a worker process would leave the pool waiting
+            raise Exception("WHAAAT?!? There's a O!!! " + document_path)
+        else:
+            assert current_label[1:] == label[1:]
+            sentence += "  " + text
+            count += 1
+    # include last sentence
+    if len(sentence) > 1:
+        current_label = current_label.replace("-", ".")
+        current_label = current_label.replace("..", ".-")
+
+        labels_splits = current_label.split(".")
+        source_type = labels_splits[1]
+        relation_type = labels_splits[2]
+        source_to_target = False
+        target_offset = labels_splits[3]
+        source_id = str(doc_ID) + "_" + str(sent_id)
+        target_id = ""
+
+        if relation_type in relation_types:
+            target_id = str(doc_ID) + "_" + str(sent_id + int(target_offset))
+        else:
+            relation_type = None
+        if (relation_type in asymmetric_link_types) or (relation_type in symmetric_link_types):
+            source_to_target = True
+
+        sentences_row = {'text_ID': doc_ID,
+                        'source_ID': source_id,
+                        'target_ID': target_id,
+                        'source_type': source_type,
+                        'relation_type': relation_type,
+                        'source_to_target': source_to_target,
+                        'set': split,
+                        'source_length': count,
+                        'source_proposition': sentence,
+                        }
+        rows_by_id[source_id] = sentences_row
+        sentences_rows.append(sentences_row)
+        sent_ids.append(source_id)
+        sent_id += 1
+
+
+
+    if len(sent_ids) == 1:
+        print("Document " + str(doc_ID) + " has only 1 sentence!")
+
+    # addition to couples dataframe
+    for sent_id_source in sent_ids:
+
+        source_row = rows_by_id[sent_id_source]
+
+        for sent_id_target in sent_ids:
+
+            if sent_id_source == sent_id_target and not reflexive:
+                continue
+
+            target_row = rows_by_id[sent_id_target]
+
+            relation_type = None
+            relation1to2 = False
+
+            if source_row["target_ID"] == sent_id_target:
+                relation_type = source_row["relation_type"]
+                relation1to2 = source_row["source_to_target"]
+            elif target_row["target_ID"] == sent_id_source:
+                relation_type = "inv_" + str(target_row["relation_type"])
+
+            dataframe_row = {'text_ID': str(doc_ID),
+                             'source_proposition': source_row["source_proposition"],
+                             'source_ID': str(sent_id_source),
+                             'target_proposition': target_row["source_proposition"],
+                             'target_ID': str(sent_id_target),
+                             'source_type': source_row["source_type"],
+                             'target_type': target_row["source_type"],
+                             'relation_type': relation_type,
+                             'source_to_target': relation1to2,
+                             'source_length': source_row["source_length"],
+                             'target_length': target_row["source_length"],
+                             'set': split
+                             }
+
+            rows.append(dataframe_row)
+
+            # CONTATORI
+            """
+            if relation_type not in rel_count.keys():
+                rel_count[relation_type] = 0
+            rel_count[relation_type] += 1
+
+            if relation1to2 == True:
+                link_count += 1
+            """
+
+    return sentences_rows, rows, token_counter
+
+
 def create_scidtb_pickle(dataset_path, dataset_version, documents_path,
                          asymmetric_link_types, symmetric_link_types, a_non_link_types, s_non_link_types,
-                         test=0.0, validation=0.0, reflexive=False):
+                         test=0.0, validation=0.0, reflexive=False, processes=1, seed=0):
+    """
+    Creates the pickles of the SciDTB corpus
+    :param processes: number of processes used to parse the documents. If None, one for each core
+    :param seed: seed of the split assignment
+    """
     print()
 
     for key in sorted(locals().keys()):
@@ -231,6 +509,7 @@ def create_scidtb_pickle(dataset_path, dataset_version, documents_path,
 
     sentences_rows = []
 
+    arguments = []
     for document_path in documents_paths_list:
 
         document_name = os.path.basename(document_path)
@@ -240,165 +519,22 @@ def create_scidtb_pickle(dataset_path, dataset_version, documents_path,
 
         split = "train"
         if validation > 0 or test > 0:
-            p = random.random()
+            p = get_document_random(seed, doc_ID).random()
             if p < validation:
                 split = 'validation'
             elif validation < p < test + validation:
                 split = "test"
 
-        original_file = open(document_path, 'r', encoding="utf-8")
-
-        raw_text = original_file.read()
-        original_file.close()
+        arguments.append((document_path, split, relation_types, asymmetric_link_types, symmetric_link_types,
+                          reflexive))
 
-        sentence = ""
-        current_label = ""
-        count = 0
-        sent_id = 0
+    results = map_documents(create_scidtb_document_rows, arguments, processes)
 
-        sent_ids = []
-
-        for line in raw_text.split('\n'):
-            if len(line)<5:
-                continue
-
-            token_counter += 1
-            sentence_splits = line.split()
-            text = sentence_splits[0]
-            label = sentence_splits[1]
-
-            if label[0] == "B" or sentence == "":
-                # if it is the first line
-                if len(sentence) > 1:
-                    current_label = current_label.replace("-", ".")
-                    current_label = current_label.replace("..", ".-")
-
-                    labels_splits = current_label.split(".")
-                    source_type = labels_splits[1]
-                    relation_type = labels_splits[2]
-                    source_to_target = False
-                    target_offset = labels_splits[3]
-                    source_id = str(doc_ID) + "_" + str(sent_id)
-                    target_id = ""
-
-                    if relation_type in relation_types:
-                        target_id = str(doc_ID) + "_" + str(sent_id + int(target_offset))
-                    else:
-                        relation_type = None
-                    if (relation_type in asymmetric_link_types) or (relation_type in symmetric_link_types):
-                        source_to_target = True
-
-                    sentences_row = {'text_ID': doc_ID,
-                                    'source_ID': source_id,
-                                    'target_ID': target_id,
-                                    'source_type': source_type,
-                                    'relation_type': relation_type,
-                                    'source_to_target': source_to_target,
-                                    'set': split,
-                                    'source_length': count,
-                                    'source_proposition': sentence,
-                                    }
-                    rows_by_id[source_id] = sentences_row
-                    sentences_rows.append(sentences_row)
-                    sent_ids.append(source_id)
-                    sent_id += 1
-
-                sentence = text
-                current_label = label
-                count = 0
-            elif label[0] == "O":
-                print("WHAAAT?!? There's a O!!!")
-                exit(-4)
-            else:
-                assert current_label[1:] == label[1:]
-                sentence += "  " + text
-                count += 1
-        # include last sentence
-        if len(sentence) > 1:
-            current_label = current_label.replace("-", ".")
-            current_label = current_label.replace("..", ".-")
-
-            labels_splits = current_label.split(".")
-            source_type = labels_splits[1]
-            relation_type = labels_splits[2]
-            source_to_target = False
-            target_offset = labels_splits[3]
-            source_id = str(doc_ID) + "_" + str(sent_id)
-            target_id = ""
-
-            if relation_type in relation_types:
-                target_id = str(doc_ID) + "_" + str(sent_id + int(target_offset))
-            else:
-                relation_type = None
-            if (relation_type in asymmetric_link_types) or (relation_type in symmetric_link_types):
-                source_to_target = True
-
-            sentences_row = {'text_ID': doc_ID,
-                            'source_ID': source_id,
-                            'target_ID': target_id,
-                            'source_type': source_type,
-                            'relation_type': relation_type,
-                            'source_to_target': source_to_target,
-                            'set': split,
-                            'source_length': count,
-                            'source_proposition': sentence,
-                            }
-            rows_by_id[source_id] = sentences_row
-            sentences_rows.append(sentences_row)
-            sent_ids.append(source_id)
-            sent_id += 1
-
-
-
-        if len(sent_ids) == 1:
-            print("Document " + str(doc_ID) + " has only 1 sentence!")
-
-        # addition to couples dataframe
-        for sent_id_source in sent_ids:
-
-            source_row = rows_by_id[sent_id_source]
-
-            for sent_id_target in sent_ids:
-
-                if sent_id_source == sent_id_target and not reflexive:
-                    continue
-
-                target_row = rows_by_id[sent_id_target]
-
-                relation_type = None
-                relation1to2 = False
-
-                if source_row["target_ID"] == sent_id_target:
-                    relation_type = source_row["relation_type"]
-                    relation1to2 = source_row["source_to_target"]
-                elif target_row["target_ID"] == sent_id_source:
-                    relation_type = "inv_" + str(target_row["relation_type"])
-
-                dataframe_row = {'text_ID': str(doc_ID),
-                                 'source_proposition': source_row["source_proposition"],
-                                 'source_ID': str(sent_id_source),
-                                 'target_proposition': target_row["source_proposition"],
-                                 'target_ID': str(sent_id_target),
-                                 'source_type': source_row["source_type"],
-                                 'target_type': target_row["source_type"],
-                                 'relation_type': relation_type,
-                                 'source_to_target': relation1to2,
-                                 'source_length': source_row["source_length"],
-                                 'target_length': target_row["source_length"],
-                                 'set': split
-                                 }
-
-                row_list[split].append(dataframe_row)
-
-                # CONTATORI
-                """
-                if relation_type not in rel_count.keys():
-                    rel_count[relation_type] = 0
-                rel_count[relation_type] += 1
-
-                if relation1to2 == True:
-                    link_count += 1
-                """
+    for argument, (document_sentences_rows, rows, document_token_counter) in zip(arguments, results):
+        split = argument[1]
+        sentences_rows.extend(document_sentences_rows)
+        row_list[split].extend(rows)
+        token_counter += document_token_counter
 
     pickles_path = os.path.join(dataset_path, 'pickles', dataset_version)
     if not os.path.exists(pickles_path):
@@ -442,7 +578,7 @@ def create_scidtb_pickle(dataset_path, dataset_version, documents_path,
                                    'set']]
 
             dataframe_path = os.path.join(pickles_path, str(split) + ".pkl")
-            dataframe.to_pickle(dataframe_path)
+            save_dataframe(dataframe, dataframe_path)
     print("TOKENS!")
     print(token_counter)
 
@@ -484,7 +620,183 @@ ukp_test_ids = [4, 5, 6, 21, 42, 52, 61, 68, 71, 72, 77, 82, 86, 91, 97, 98,
 
 
 
-def create_ukp_pickle(dataset_path, dataset_version, link_types, dataset_type='train', validation=0, reflexive=False):
+def create_ukp_document_rows(data_path, i, link_types, split, reflexive):
+    """
+    Creates the dataframe rows of an essay of the UKP corpus. The essays are divided in paragraphs, which are considered
+    as documents.
+    :return: the list of rows and the list of the labels of the propositions
+    """
+    file_name = "essay" + "%03d" % (i)
+    text_file_path = os.path.join(data_path, file_name + ".txt")
+
+    rows = []
+    prop_labels = []
+
+    text_file = open(text_file_path, 'r', encoding='utf-8')
+    labels_file = open(os.path.join(data_path, file_name + ".ann"), 'r')
+
+    labels_line = []
+
+    raw_text = text_file.read()
+    for splits in labels_file.read().split('\n'):
+        labels_line.append(splits)
+
+    text_file.close()
+    labels_file.close()
+
+    # elaborate the offsets of the paragraphs
+    paragraphs_offsets = []
+    start = 0
+    while start < len(raw_text):
+        try:
+            end = raw_text.index("\n", start)
+        except ValueError:
+            end = len(raw_text)
+        if end != start:
+            paragraphs_offsets.append([start, end])
+        start = end + 1
+
+    data = {'prop_labels': {},
+            'prop_offsets': {},
+            'start_offsets': {},
+            'T_ids': [],
+            'propositions': {}}
+
+    for link_type in link_types:
+        data[link_type] = []
+
+    paragraphs = split_propositions(raw_text, paragraphs_offsets)
+
+    for line in labels_line:
+        splits = line.split(maxsplit=4)
+        if len(splits) <= 0:
+            continue
+        if splits[0][0] == 'T':
+            T_id = int(splits[0][1:])-1
+            data['T_ids'].append(T_id)
+            data['prop_labels'][T_id] = splits[1]
+            data['prop_offsets'][T_id] = [int(splits[2]), int(splits[3])]
+            data['start_offsets'][int(splits[2])] = T_id
+            data['propositions'][T_id] = splits[4].split('\n')
+        elif splits[0][0] == 'R':
+            source = int(splits[2][6:]) - 1
+            target = int(splits[3][6:]) - 1
+            data[splits[1]].append([source, target])
+
+    # new order given by the start offsets
+    new_order = {}
+    new_id = 0
+    # find the match between the starting offsets and set the new id
+    for new_off in sorted(data['start_offsets'].keys()):
+        for old_id in data['T_ids']:
+            old_off = data['prop_offsets'][old_id][0]
+            if new_off == old_off:
+                new_order[old_id] = new_id
+                new_id += 1
+                break
+
+    new_data = {'prop_labels': [-1]*len(data['prop_labels']),
+                'prop_offsets': [-1]*len(data['prop_labels']),
+                'propositions': [-1]*len(data['prop_labels']),}
+
+    for link_type in link_types:
+        new_data[link_type] = []
+
+    for link_type in link_types:
+        for link in data[link_type]:
+            old_source = link[0]
+            old_target = link[1]
+            new_source = new_order[old_source]
+            new_target = new_order[old_target]
+            new_data[link_type].append([new_source, new_target])
+
+    for old_id in data['T_ids']:
+        new_id = new_order[old_id]
+        new_data['prop_labels'][new_id] = data['prop_labels'][old_id]
+        new_data['prop_offsets'][new_id] = data['prop_offsets'][old_id]
+        new_data['propositions'][new_id] = data['propositions'][old_id]
+
+    data = new_data
+
+    propositions = data['propositions']
+
+    num_propositions = len(propositions)
+
+    assert (num_propositions >= 1)
+
+    relation_index = create_relation_index(data, link_types)
+
+    for sourceID in range(num_propositions):
+
+        source_start = data['prop_offsets'][sourceID][0]
+        p_offsets = (-1, -1)
+        par = -1
+        # find the paragraph
+        for paragraph in range(len(paragraphs)):
+            p_start = paragraphs_offsets[paragraph][0]
+            p_end = paragraphs_offsets[paragraph][1]
+            if p_end >= source_start >= p_start:
+                p_offsets = (p_start, p_end)
+                par = paragraph
+
+        assert par != -1
+        type1 = data['prop_labels'][sourceID]
+
+        for targetID in range(num_propositions):
+            # proposition type
+            type2 = data['prop_labels'][targetID]
+
+            target_start = data['prop_offsets'][targetID][0]
+
+            if sourceID == targetID and not reflexive:
+                continue
+
+            # relations in different paragraphs are not allowed
+            if target_start < p_offsets[0] or target_start > p_offsets[1]:
+                continue
+
+            relation_type = None
+            relation1to2 = False
+
+            # relation type
+            for link_type, direct in get_pair_relations(relation_index, sourceID, targetID):
+                if direct:
+                    if relation_type is not None and not relation_type == link_type:
+                        raise Exception('MORE RELATION FOR THE SAME PROPOSITIONS: document ' + file_name)
+                    relation_type = link_type
+                    relation1to2 = True
+
+                else:
+                    relation_type = "inv_" + link_type
+
+            dataframe_row = {'text_ID': str(i) + "_" + str(par),
+                             'rawtext': paragraphs[par],
+                             'source_proposition': propositions[sourceID][0],
+                             'source_ID': str(i) + "_" + str(par) + "_" + str(sourceID),
+                             'target_proposition': propositions[targetID][0],
+                             'target_ID': str(i) + "_" + str(par) + "_" + str(targetID),
+                             'source_type': type1,
+                             'target_type': type2,
+                             'relation_type': relation_type,
+                             'source_to_target': relation1to2,
+                             'set': split
+                             }
+
+            rows.append(dataframe_row)
+
+        prop_labels.append(type1)
+
+    return rows, prop_labels
+
+
+def create_ukp_pickle(dataset_path, dataset_version, link_types, dataset_type='train', validation=0, reflexive=False,
+                      processes=1, seed=0):
+    """
+    Creates the pickles of a split of the UKP corpus
+    :param validation: fraction of the documents to move into the validation split
+    :param processes: number of processes used to parse the documents. If None, one for each core
+    :param seed: seed of the split assignment
+    """
     data_path = os.path.join(dataset_path, "original_data")
 
     normal_list = []
@@ -505,6 +817,7 @@ def create_ukp_pickle(dataset_path, dataset_version, link_types, dataset_type='t
     val_rel_counter = {}
 
 
+    arguments = []
     for i in idlist:
         file_name = "essay" + "%03d" % (i)
         text_file_path = os.path.join(data_path, file_name + ".txt")
@@ -513,186 +826,22 @@ def create_ukp_pickle(dataset_path, dataset_version, link_types, dataset_type='t
             split = dataset_type
 
             if validation > 0 and validation < 1:
-                p = random.random()
+                p = get_document_random(seed, dataset_type + "_" + file_name).random()
                 if p < validation:
                     split = 'validation'
 
-            text_file = open(text_file_path, 'r', encoding='utf-8')
-            labels_file = open(os.path.join(data_path, file_name + ".ann"), 'r')
-
-            labels_line = []
-
-            raw_text = text_file.read()
-            for splits in labels_file.read().split('\n'):
-                labels_line.append(splits)
-
-            text_file.close()
-            labels_file.close()
-
-            # elaborate the offsets of the paragraphs
-            paragraphs_offsets = []
-            start = 0
-            while start < len(raw_text):
-                try:
-                    end = raw_text.index("\n", start)
-                except ValueError:
-                    end = len(raw_text)
-                if end != start:
-                    paragraphs_offsets.append([start, end])
-                start = end + 1
-
-            data = {'prop_labels': {},
-                    'prop_offsets': {},
-                    'start_offsets': {},
-                    'T_ids': [],
-                    'propositions': {}}
-
-            for link_type in link_types:
-                data[link_type] = []
-
-            paragraphs = split_propositions(raw_text, paragraphs_offsets)
-
-            for line in labels_line:
-                splits = line.split(maxsplit=4)
-                if len(splits) <= 0:
-                    continue
-                if splits[0][0] == 'T':
-                    T_id = int(splits[0][1:])-1
-                    data['T_ids'].append(T_id)
-                    data['prop_labels'][T_id] = splits[1]
-                    data['prop_offsets'][T_id] = [int(splits[2]), int(splits[3])]
-                    data['start_offsets'][int(splits[2])] = T_id
-                    data['propositions'][T_id] = splits[4].split('\n')
-                elif splits[0][0] == 'R':
-                    source = int(splits[2][6:]) - 1
-                    target = int(splits[3][6:]) - 1
-                    data[splits[1]].append([source, target])
-
-            # new order given by the start offsets
-            new_order = {}
-            new_id = 0
-            # find the match between the starting offsets and set the new id
-            for new_off in sorted(data['start_offsets'].keys()):
-                for old_id in data['T_ids']:
-                    old_off = data['prop_offsets'][old_id][0]
-                    if new_off == old_off:
-                        new_order[old_id] = new_id
-                        new_id += 1
-                        break
-
-            new_data = {'prop_labels': [-1]*len(data['prop_labels']),
-                        'prop_offsets': [-1]*len(data['prop_labels']),
-                        'propositions': [-1]*len(data['prop_labels']),}
-
-            for link_type in link_types:
-                new_data[link_type] = []
-
-            for link_type in link_types:
-                for link in data[link_type]:
-                    old_source = link[0]
-                    old_target = link[1]
-                    new_source = new_order[old_source]
-                    new_target = new_order[old_target]
-                    new_data[link_type].append([new_source, new_target])
-
-            for old_id in data['T_ids']:
-                new_id = new_order[old_id]
-                new_data['prop_labels'][new_id] = data['prop_labels'][old_id]
-                new_data['prop_offsets'][new_id] = data['prop_offsets'][old_id]
-                new_data['propositions'][new_id] = data['propositions'][old_id]
-
-            data = new_data
-
-            propositions = data['propositions']
-
-            num_propositions = len(propositions)
-
-            assert (num_propositions >= 1)
-
-            for sourceID in range(num_propositions):
-
-                source_start = data['prop_offsets'][sourceID][0]
-                p_offsets = (-1, -1)
-                par = -1
-                # find the paragraph
-                for paragraph in range(len(paragraphs)):
-                    p_start = paragraphs_offsets[paragraph][0]
-                    p_end = paragraphs_offsets[paragraph][1]
-                    if p_end >= source_start >= p_start:
-                        p_offsets = (p_start, p_end)
-                        par = paragraph
-
-                assert par != -1
-                type1 = data['prop_labels'][sourceID]
-
-                for targetID in range(num_propositions):
-                    # proposition type
-                    type2 = data['prop_labels'][targetID]
-
-                    target_start = data['prop_offsets'][targetID][0]
-
-                    if sourceID == targetID and not reflexive:
-                        continue
-
-                    # relations in different paragraphs are not allowed
-                    if target_start < p_offsets[0] or target_start > p_offsets[1]:
-                        continue
+            arguments.append((data_path, i, link_types, split, reflexive))
 
-                    relation_type = None
-                    relation1to2 = False
-
-                    # relation type
-                    for link_type in link_types:
-                        links = data[link_type]
-
-                        for link in links:
-                            # DEBUG
-                            # if not link[0][0] == link[0][1]:
-                            # raise Exception('MORE PROPOSITIONS IN THE SAME RELATION: document ' + file_name)
-
-                            if link[0] == sourceID and link[1] == targetID:
-                                if relation_type is not None and not relation_type == link_type:
-                                    raise Exception('MORE RELATION FOR THE SAME PROPOSITIONS: document ' + file_name)
-                                relation_type = link_type
-                                relation1to2 = True
-
-                            elif link[0] == targetID and link[1] == sourceID:
-                                relation_type = "inv_" + link_type
-
-                    dataframe_row = {'text_ID': str(i) + "_" + str(par),
-                                     'rawtext': paragraphs[par],
-                                     'source_proposition': propositions[sourceID][0],
-                                     'source_ID': str(i) + "_" + str(par) + "_" + str(sourceID),
-                                     'target_proposition': propositions[targetID][0],
-                                     'target_ID': str(i) + "_" + str(par) + "_" + str(targetID),
-                                     'source_type': type1,
-                                     'target_type': type2,
-                                     'relation_type': relation_type,
-                                     'source_to_target': relation1to2,
-                                     'set': split
-                                     }
-
-                    if split == 'validation':
-                        validation_list.append(dataframe_row)
-
-                        if relation_type not in val_rel_counter.keys():
-                            val_rel_counter[relation_type] = 0
-                        val_rel_counter[relation_type] += 1
-                    else:
-                        normal_list.append(dataframe_row)
-
-                        if relation_type not in rel_counter.keys():
-                            rel_counter[relation_type] = 0
-                        rel_counter[relation_type] += 1
-
-                if split == 'validation':
-                    if type1 not in val_prop_counter.keys():
-                        val_prop_counter[type1] = 0
-                    val_prop_counter[type1] += 1
-                else:
-                    if type1 not in prop_counter.keys():
-                        prop_counter[type1] = 0
-                    prop_counter[type1] += 1
+    results = map_documents(create_ukp_document_rows, arguments, processes)
+
+    for argument, (rows, prop_labels) in zip(arguments, results):
+        split = argument[3]
+        if split == 'validation':
+            validation_list.extend(rows)
+            count_rows(rows, prop_labels, val_rel_counter, val_prop_counter)
+        else:
+            normal_list.extend(rows)
+            count_rows(rows, prop_labels, rel_counter, prop_counter)
 
     pickles_path = os.path.join(dataset_path, 'pickles', dataset_version)
     if not os.path.exists(pickles_path):
@@ -715,7 +864,7 @@ def create_ukp_pickle(dataset_path, dataset_version, link_types, dataset_type='t
 
         dataframe_path = os.path.join(pickles_path, dataset_type + ".pkl")
 
-        dataframe.to_pickle(dataframe_path)
+        save_dataframe(dataframe, dataframe_path)
 
     if len(validation_list) > 0:
         dataframe = pandas.DataFrame(validation_list)
@@ -733,7 +882,7 @@ def create_ukp_pickle(dataset_path, dataset_version, link_types, dataset_type='t
                                'set']]
 
         dataframe_path = os.path.join(pickles_path, 'validation' + ".pkl")
-        dataframe.to_pickle(dataframe_path)
+        save_dataframe(dataframe, dataframe_path)
 
     print("_______________")
     print(dataset_type)
@@ -747,10 +896,311 @@ def create_ukp_pickle(dataset_path, dataset_version, link_types, dataset_type='t
 
 
 
+def create_inv_document_rows(document_path, documents_path, split, relation_types, argumentative_relation_types,
+                             asymmetric_link_types, symmetric_link_types, s_non_link_types, maxdistance, reflexive):
+    """
+    Creates the dataframe rows of a document of the DrInventor corpus (see create_inv_pickle)
+    :return: the list of rows and the list of the labels of the propositions
+    """
+    document_name = os.path.basename(document_path)
+    doc_ID = int(document_name.split(".")[0][1:])
+
+    raw_text_name = str(document_name.split(".")[0]) + ".txt"
+    raw_text_document = os.path.join(documents_path, raw_text_name)
+
+    rows = []
+    prop_labels = []
+
+    labels_file = open(document_path, 'r', encoding="utf-8")
+    text_file = open(raw_text_document, 'r', encoding="utf-8")
+
+    raw_text = text_file.read()
+    text_file.close()
+
+    labels_line = []
+
+    for splits in labels_file.read().split('\n'):
+        labels_line.append(splits)
+
+    labels_file.close()
+
+    # elaborate the offsets of the paragraphs
+    paragraphs_offsets = []
+    start = raw_text.index("<H1>", 0)
+    while start < len(raw_text):
+        try:
+            end = raw_text.index("<H1>", start)
+        except ValueError:
+            end = len(raw_text)
+        if end != start:
+            paragraphs_offsets.append([start, end])
+        start = end + 1
+
+    data = {'prop_labels': {},
+            'prop_offsets': {},
+            'T_ids': [],
+            'propositions': {},
+            'start_offsets': {}
+            }
+
+    for relation_type in relation_types:
+        data[relation_type] = []
+
+    paragraphs = split_propositions(raw_text, paragraphs_offsets)
+
+    for line in labels_line:
+        splits = line.split(maxsplit=4)
+        if len(splits) <= 0:
+            continue
+        # if it is a component label
+        if splits[0][0] == 'T':
+            T_id = int(splits[0][1:]) - 1
+            data['T_ids'].append(T_id)
+            data['prop_labels'][T_id] = splits[1]
+            data['prop_offsets'][T_id] = [int(splits[2]), int(splits[3])]
+            # each starting offset is linked to a proposition ID
+            data['start_offsets'][int(splits[2])] = T_id
+            data['propositions'][T_id] = splits[4].split('\n')[0]
+        # if it is a relation label
+        elif splits[0][0] == 'R':
+            source = int(splits[2][6:]) - 1
+            target = int(splits[3][6:]) - 1
+
+            relation = splits[1].lower()
+            if relation in data.keys():
+                data[relation].append([source, target])
+
+    # in case annotations are not made following the temporal order
+    # new order given by the starting offsets
+    new_order = {}
+    new_id = 0
+    # find the match between the starting offsets and set the new id
+    # for each initial offset, from lowest to highest
+    for offset in sorted(data['start_offsets'].keys()):
+        # find the corresponding ID
+        old_id = data['start_offsets'][offset]
+        # give it the lowest ID
+        new_order[old_id] = new_id
+        # increase the lowest ID to assign
+        new_id += 1
+
+    # adjust data to the new order
+    new_data = {'prop_labels': [-1] * len(data['prop_labels']),
+                'prop_offsets': [-1] * len(data['prop_labels']),
+                'propositions': [-1] * len(data['prop_labels']), }
+
+    for relation_type in relation_types:
+        new_data[relation_type] = []
+
+    for relation_type in relation_types:
+        for link in data[relation_type]:
+            old_source = link[0]
+            old_target = link[1]
+            new_source = new_order[old_source]
+            new_target = new_order[old_target]
+            new_data[relation_type].append([new_source, new_target])
+
+    for old_id in data['T_ids']:
+        new_id = new_order[old_id]
+        new_data['prop_labels'][new_id] = data['prop_labels'][old_id]
+        new_data['prop_offsets'][new_id] = data['prop_offsets'][old_id]
+        new_data['propositions'][new_id] = data['propositions'][old_id]
+
+    data = new_data
+
+    # TRANSITIVITY DUE OF PARTS_OF_SAME
+    # create the chain of parts of same
+    # links stored from last ID to first ID
+    parts_of_same = {}
+    for [source, target] in data["parts_of_same"]:
+        min = target
+        max = source
+        if source < target:
+            min = source
+            max = target
+
+        while max in parts_of_same.keys():
+            # found a previous relationship
+            middle = parts_of_same[max]
+            # continue down the chain to find the place of min
+            if min < middle:
+                max = middle
+            # min belongs between max and middle
+            else:
+                parts_of_same[max] = min
+                max = min
+                min = middle
+        parts_of_same[max] = min
+        # print(str(source) + " <-> " + str(target))
+    # DEBUG
+    # print(parts_of_same)
+
+    # all the linked parts need to indicate the same id
+    new_parts_of_same = {}
+    for idmax in sorted(parts_of_same.keys()):
+        idmin = parts_of_same[idmax]
+        if idmin in parts_of_same.keys():
+            idmin = parts_of_same[idmin]
+            parts_of_same[idmax] = idmin
+        new_parts_of_same[idmin] = set()
+        new_parts_of_same[idmin].add(idmin)
+    # print(parts_of_same)
+    # print(new_parts_of_same)
+    # create the sets
+    for idmax in parts_of_same.keys():
+        idmin = parts_of_same[idmax]
+        new_parts_of_same[idmin].add(idmax)
+    # index the sets from each component
+    for idmin in new_parts_of_same.keys():
+        same_set = new_parts_of_same[idmin]
+        for element in same_set:
+            parts_of_same[element] = same_set
+
+    # print(parts_of_same)
+    sys.stdout.flush()
+    # create symmetric relationships
+    for relation_type in relation_types:
+        # print("!!!!!!!!!!!!!!!")
+        # print(parts_of_same)
+        #  print(relation_type)
+        # print(data[relation_type])
+        # print("-----------")
+        new_relations = []
+        for [source, target] in data[relation_type]:
+            if source in parts_of_same.keys() and target in parts_of_same.keys():
+                for same_source in parts_of_same[source]:
+                    for same_target in parts_of_same[target]:
+                        if [same_source, same_target] not in data[relation_type] and same_source is not same_target:
+                            new_relations.append([same_source, same_target])
+            elif source in parts_of_same.keys():
+                for same_source in parts_of_same[source]:
+                    if [same_source, target] not in data[relation_type] and same_source is not target:
+                        new_relations.append([same_source, target])
+            elif target in parts_of_same.keys():
+                for same_target in parts_of_same[target]:
+                    if [source, same_target] not in data[relation_type] and source is not same_target:
+                        new_relations.append([source, same_target])
+        # print(new_relations)
+        data[relation_type].extend(new_relations)
+
+    # print("-------------------------------------------------------")
+    # sys.stdout.flush()
+    # exit(0)
+
+    # it is necessary to expand the
+
+    # CREATE THE PROPER DATAFRAME
+
+    propositions = data['propositions']
+
+    num_propositions = len(propositions)
+
+    assert (num_propositions >= 1)
+
+    relation_index = create_relation_index(data, argumentative_relation_types)
+    # all the relations are indexed too, to log the ones that cross the sections
+    full_relation_index = create_relation_index(data, relation_types)
+
+    for sourceID in range(num_propositions):
+
+        source_start = data['prop_offsets'][sourceID][0]
+        p_offsets = (-1, -1)
+        par = -1
+        # find the paragraph
+        for paragraph in range(len(paragraphs)):
+            p_start = paragraphs_offsets[paragraph][0]
+            p_end = paragraphs_offsets[paragraph][1]
+            if p_end >= source_start >= p_start:
+                p_offsets = (p_start, p_end)
+                par = paragraph
+
+        source_start = data['prop_offsets'][sourceID][0]
+        type1 = data['prop_labels'][sourceID]
+
+        for targetID in range(num_propositions):
+            # proposition type
+            type2 = data['prop_labels'][targetID]
+
+            target_start = data['prop_offsets'][targetID][0]
+
+            # relations in different paragraphs are not allowed, but we want to log them
+            if target_start < p_offsets[0] or target_start > p_offsets[1]:
+                for (position, relation_type) in full_relation_index.get((sourceID, targetID), []):
+                    # find the target paragraph
+                    par_t = -1
+                    # find the paragraph
+                    for paragraph in range(len(paragraphs)):
+                        p_t_start = paragraphs_offsets[paragraph][0]
+                        p_t_end = paragraphs_offsets[paragraph][1]
+                        if p_t_end >= target_start >= p_t_start:
+                            par_t = paragraph
+
+                    relation_type = relation_type
+                    print("LINK OUTSIDE OF PARAGRAPHS!!!!")
+                    print("source_proposition: " + propositions[sourceID])
+                    print("source_ID: " + str(doc_ID) + "_" + str(par) + "_" + str(sourceID))
+                    print("target_proposition: " + propositions[targetID])
+                    print("target_ID: " + str(doc_ID) + "_" + str(par_t) + "_" + str(targetID))
+                    print("relation: " + str(relation_type))
+                continue
+
+            # skip reflexive relations if they are present
+            if sourceID == targetID and not reflexive:
+                continue
+
+            # if the two propositions are too distance, they are dropped
+            if abs(sourceID-targetID) > maxdistance > 0:
+                continue
+
+            relation_label = None
+            relation1to2 = False
+
+
+            # relation type
+            for relation_type, direct in get_pair_relations(relation_index, sourceID, targetID):
+                if direct:
+
+                    if relation_type is not None and not relation_type == relation_type:
+                        raise Exception('MORE DIFFERENT RELATIONS FOR THE SAME COUPLE OF PROPOSITIONS:'
+                                        + documents_path)
+                    relation_label = relation_type
+                    if relation_type in symmetric_link_types or relation_type in asymmetric_link_types:
+                        relation1to2 = True
+
+                # create the symmetric or the asymmetric (inverse) relation
+                else:
+                    if relation_type in asymmetric_link_types:
+                        relation_label = "inv_" + relation_type
+                    elif relation_type in s_non_link_types:
+                        relation_label = relation_type
+                    elif relation_type in symmetric_link_types:
+                        relation_label = relation_type
+                        relation1to2 = True
+
+            dataframe_row = {'text_ID': str(doc_ID) + "_" + str(par),
+                             'rawtext': "", #paragraphs[par],
+                             'source_proposition': propositions[sourceID],
+                             'source_ID': str(doc_ID) + "_" + str(par) + "_" + str(sourceID),
+                             'target_proposition': propositions[targetID],
+                             'target_ID': str(doc_ID) + "_" + str(par) + "_" + str(targetID),
+                             'source_type': type1,
+                             'target_type': type2,
+                             'relation_type': relation_label,
+                             'source_to_target': relation1to2,
+                             'set': split
+                             }
+
+            rows.append(dataframe_row)
+
+        prop_labels.append(type1)
+
+    return rows, prop_labels
+
+
 def create_inv_pickle(dataset_path, dataset_version, documents_path,
                       asymmetric_link_types, symmetric_link_types, s_non_link_types,
                       test=0.3, validation=0.14, maxdistance=50,
-                      reflexive=False):
+                      reflexive=False, processes=1, seed=0):
     """
     Creates a pickle for the DrInventor Corpus. The sections are considered as documents, therefore no links are allowed
     in different sections (but they are still logged). The "parts_of_same" links are exploited to create new links between
@@ -766,6 +1216,8 @@ def create_inv_pickle(dataset_path, dataset_version, documents_path,
     :param maxdistance: number of maximum argumentative distance to be taken into account for links. A value <=0
                         means no limits
     :param reflexive: whether reflexive links should be added
+    :param processes: number of processes used to parse the documents. If None, one for each core
+    :param seed: seed of the split assignment
     :return: None
     """
     for key in sorted(locals().keys()):
@@ -794,6 +1246,7 @@ def create_inv_pickle(dataset_path, dataset_version, documents_path,
     print(str(len(documents_paths_list)) + " documents found for " + documents_path)
 
 
+    arguments = []
     for document_path in documents_paths_list:
 
         document_name = os.path.basename(document_path)
@@ -801,315 +1254,26 @@ def create_inv_pickle(dataset_path, dataset_version, documents_path,
             continue
         doc_ID = int(document_name.split(".")[0][1:])
 
-        raw_text_name = str(document_name.split(".")[0]) + ".txt"
-        raw_text_document = os.path.join(documents_path, raw_text_name)
-
         split = "train"
         if validation > 0 or test > 0:
-            p = random.random()
+            p = get_document_random(seed, doc_ID).random()
             if p < validation:
                 split = 'validation'
             elif validation < p < test + validation:
                 split = "test"
 
-        labels_file = open(document_path, 'r', encoding="utf-8")
-        text_file = open(raw_text_document, 'r', encoding="utf-8")
+        arguments.append((document_path, documents_path, split, relation_types, argumentative_relation_types,
+                          asymmetric_link_types, symmetric_link_types, s_non_link_types, maxdistance, reflexive))
 
-        raw_text = text_file.read()
-        text_file.close()
+    results = map_documents(create_inv_document_rows, arguments, processes)
 
-        labels_line = []
-
-        for splits in labels_file.read().split('\n'):
-            labels_line.append(splits)
-
-        labels_file.close()
-
-        # elaborate the offsets of the paragraphs
-        paragraphs_offsets = []
-        start = raw_text.index("<H1>", 0)
-        while start < len(raw_text):
-            try:
-                end = raw_text.index("<H1>", start)
-            except ValueError:
-                end = len(raw_text)
-            if end != start:
-                paragraphs_offsets.append([start, end])
-            start = end + 1
-
-        data = {'prop_labels': {},
-                'prop_offsets': {},
-                'T_ids': [],
-                'propositions': {},
-                'start_offsets': {}
-                }
-
-        for relation_type in relation_types:
-            data[relation_type] = []
-
-        paragraphs = split_propositions(raw_text, paragraphs_offsets)
-
-        for line in labels_line:
-            splits = line.split(maxsplit=4)
-            if len(splits) <= 0:
-                continue
-            # if it is a component label
-            if splits[0][0] == 'T':
-                T_id = int(splits[0][1:]) - 1
-                data['T_ids'].append(T_id)
-                data['prop_labels'][T_id] = splits[1]
-                data['prop_offsets'][T_id] = [int(splits[2]), int(splits[3])]
-                # each starting offset is linked to a proposition ID
-                data['start_offsets'][int(splits[2])] = T_id
-                data['propositions'][T_id] = splits[4].split('\n')[0]
-            # if it is a relation label
-            elif splits[0][0] == 'R':
-                source = int(splits[2][6:]) - 1
-                target = int(splits[3][6:]) - 1
-
-                relation = splits[1].lower()
-                if relation in data.keys():
-                    data[relation].append([source, target])
-
-        # in case annotations are not made following the temporal order
-        # new order given by the starting offsets
-        new_order = {}
-        new_id = 0
-        # find the match between the starting offsets and set the new id
-        # for each initial offset, from lowest to highest
-        for offset in sorted(data['start_offsets'].keys()):
-            # find the corresponding ID
-            old_id = data['start_offsets'][offset]
-            # give it the lowest ID
-            new_order[old_id] = new_id
-            # increase the lowest ID to assign
-            new_id += 1
-
-        # adjust data to the new order
-        new_data = {'prop_labels': [-1] * len(data['prop_labels']),
-                    'prop_offsets': [-1] * len(data['prop_labels']),
-                    'propositions': [-1] * len(data['prop_labels']), }
-
-        for relation_type in relation_types:
-            new_data[relation_type] = []
-
-        for relation_type in relation_types:
-            for link in data[relation_type]:
-                old_source = link[0]
-                old_target = link[1]
-                new_source = new_order[old_source]
-                new_target = new_order[old_target]
-                new_data[relation_type].append([new_source, new_target])
-
-        for old_id in data['T_ids']:
-            new_id = new_order[old_id]
-            new_data['prop_labels'][new_id] = data['prop_labels'][old_id]
-            new_data['prop_offsets'][new_id] = data['prop_offsets'][old_id]
-            new_data['propositions'][new_id] = data['propositions'][old_id]
-
-        data = new_data
-
-        # TRANSITIVITY DUE OF PARTS_OF_SAME
-        # create the chain of parts of same
-        # links stored from last ID to first ID
-        parts_of_same = {}
-        for [source, target] in data["parts_of_same"]:
-            min = target
-            max = source
-            if source < target:
-                min = source
-                max = target
-
-            while max in parts_of_same.keys():
-                # found a previous relationship
-                middle = parts_of_same[max]
-                # continue down the chain to find the place of min
-                if min < middle:
-                    max = middle
-                # min belongs between max and middle
-                else:
-                    parts_of_same[max] = min
-                    max = min
-                    min = middle
-            parts_of_same[max] = min
-            # print(str(source) + " <-> " + str(target))
-        # DEBUG
-        # print(parts_of_same)
-
-        # all the linked parts need to indicate the same id
-        new_parts_of_same = {}
-        for idmax in sorted(parts_of_same.keys()):
-            idmin = parts_of_same[idmax]
-            if idmin in parts_of_same.keys():
-                idmin = parts_of_same[idmin]
-                parts_of_same[idmax] = idmin
-            new_parts_of_same[idmin] = set()
-            new_parts_of_same[idmin].add(idmin)
-        # print(parts_of_same)
-        # print(new_parts_of_same)
-        # create the sets
-        for idmax in parts_of_same.keys():
-            idmin = parts_of_same[idmax]
-            new_parts_of_same[idmin].add(idmax)
-        # index the sets from each component
-        for idmin in new_parts_of_same.keys():
-            same_set = new_parts_of_same[idmin]
-            for element in same_set:
-                parts_of_same[element] = same_set
-
-        # print(parts_of_same)
-        sys.stdout.flush()
-        # create symmetric relationships
-        for relation_type in relation_types:
-            # print("!!!!!!!!!!!!!!!")
-            # print(parts_of_same)
-            #  print(relation_type)
-            # print(data[relation_type])
-            # print("-----------")
-            new_relations = []
-            for [source, target] in data[relation_type]:
-                if source in parts_of_same.keys() and target in parts_of_same.keys():
-                    for same_source in parts_of_same[source]:
-                        for same_target in parts_of_same[target]:
-                            if [same_source, same_target] not in data[relation_type] and same_source is not same_target:
-                                new_relations.append([same_source, same_target])
-                elif source in parts_of_same.keys():
-                    for same_source in parts_of_same[source]:
-                        if [same_source, target] not in data[relation_type] and same_source is not target:
-                            new_relations.append([same_source, target])
-                elif target in parts_of_same.keys():
-                    for same_target in parts_of_same[target]:
-                        if [source, same_target] not in data[relation_type] and source is not same_target:
-                            new_relations.append([source, same_target])
-            # print(new_relations)
-            data[relation_type].extend(new_relations)
-
-        # print("-------------------------------------------------------")
-        # sys.stdout.flush()
-        # exit(0)
-
-        # it is necessary to expand the
-
-        # CREATE THE PROPER DATAFRAME
-
-        propositions = data['propositions']
-
-        num_propositions = len(propositions)
-
-        assert (num_propositions >= 1)
-
-        for sourceID in range(num_propositions):
-
-            source_start = data['prop_offsets'][sourceID][0]
-            p_offsets = (-1, -1)
-            par = -1
-            # find the paragraph
-            for paragraph in range(len(paragraphs)):
-                p_start = paragraphs_offsets[paragraph][0]
-                p_end = paragraphs_offsets[paragraph][1]
-                if p_end >= source_start >= p_start:
-                    p_offsets = (p_start, p_end)
-                    par = paragraph
-
-            source_start = data['prop_offsets'][sourceID][0]
-            type1 = data['prop_labels'][sourceID]
-
-            for targetID in range(num_propositions):
-                # proposition type
-                type2 = data['prop_labels'][targetID]
-
-                target_start = data['prop_offsets'][targetID][0]
-
-                # relations in different paragraphs are not allowed, but we want to log them
-                if target_start < p_offsets[0] or target_start > p_offsets[1]:
-                    for relation_type in relation_types:
-                        for link in data[relation_type]:
-                            if link[0] == sourceID and link[1] == targetID:
-                                # find the target paragraph
-                                par_t = -1
-                                # find the paragraph
-                                for paragraph in range(len(paragraphs)):
-                                    p_t_start = paragraphs_offsets[paragraph][0]
-                                    p_t_end = paragraphs_offsets[paragraph][1]
-                                    if p_t_end >= target_start >= p_t_start:
-                                        par_t = paragraph
-
-                                source_prop = propositions[sourceID]
-                                target_prop = propositions[targetID]
-                                relation_type = relation_type
-                                print("LINK OUTSIDE OF PARAGRAPHS!!!!")
-                                print("source_proposition: " + propositions[sourceID])
-                                print("source_ID: " + str(doc_ID) + "_" + str(par) + "_" + str(sourceID))
-                                print("target_proposition: " + propositions[targetID])
-                                print("target_ID: " + str(doc_ID) + "_" + str(par_t) + "_" + str(targetID))
-                                print("relation: " + str(relation_type))
-                    continue
-
-                # skip reflexive relations if they are present
-                if sourceID == targetID and not reflexive:
-                    continue
-
-                # if the two propositions are too distance, they are dropped
-                if abs(sourceID-targetID) > maxdistance > 0:
-                    continue
-
-                relation_label = None
-                relation1to2 = False
-
-
-                # relation type
-                for relation_type in argumentative_relation_types:
-                    links = data[relation_type]
-
-                    for link in links:
-                        # DEBUG
-                        # if not link[0][0] == link[0][1]:
-                        # raise Exception('MORE PROPOSITIONS IN THE SAME RELATION: document ' + file_name)
-
-                        if link[0] == sourceID and link[1] == targetID:
-
-                            if relation_type is not None and not relation_type == relation_type:
-                                raise Exception('MORE DIFFERENT RELATIONS FOR THE SAME COUPLE OF PROPOSITIONS:'
-                                                + documents_path)
-                            relation_label = relation_type
-                            if relation_type in symmetric_link_types or relation_type in asymmetric_link_types:
-                                relation1to2 = True
-
-                        # create the symmetric or the asymmetric (inverse) relation
-                        elif link[0] == targetID and link[1] == sourceID:
-                            if relation_type in asymmetric_link_types:
-                                relation_label = "inv_" + relation_type
-                            elif relation_type in s_non_link_types:
-                                relation_label = relation_type
-                            elif relation_type in symmetric_link_types:
-                                relation_label = relation_type
-                                relation1to2 = True
-
-                dataframe_row = {'text_ID': str(doc_ID) + "_" + str(par),
-                                 'rawtext': "", #paragraphs[par],
-                                 'source_proposition': propositions[sourceID],
-                                 'source_ID': str(doc_ID) + "_" + str(par) + "_" + str(sourceID),
-                                 'target_proposition': propositions[targetID],
-                                 'target_ID': str(doc_ID) + "_" + str(par) + "_" + str(targetID),
-                                 'source_type': type1,
-                                 'target_type': type2,
-                                 'relation_type': relation_label,
-                                 'source_to_target': relation1to2,
-                                 'set': split
-                                 }
-
-                row_list[split].append(dataframe_row)
-
-                if relation_type not in rel_count[split].keys():
-                    rel_count[split][relation_type] = 0
-                rel_count[split][relation_type] += 1
-
-                if relation1to2 == True:
-                    link_count[split] += 1
-
-            if type1 not in prop_count[split].keys():
-                prop_count[split][type1] = 0
-            prop_count[split][type1] += 1
+    for argument, (rows, prop_labels) in zip(arguments, results):
+        split = argument[2]
+        row_list[split].extend(rows)
+        count_rows(rows, prop_labels, rel_count[split], prop_count[split])
+        for row in rows:
+            if row['source_to_target'] == True:
+                link_count[split] += 1
 
 
     for split in ["test", "train", "validation"]:
@@ -1134,7 +1298,7 @@ def create_inv_pickle(dataset_path, dataset_version, documents_path,
 
             dataframe_path = os.path.join(pickles_path, split + ".pkl")
 
-            dataframe.to_pickle(dataframe_path)
+            save_dataframe(dataframe, dataframe_path)
 
             print("_______________")
             print(split)
@@ -1149,10 +1313,186 @@ def create_inv_pickle(dataset_path, dataset_version, documents_path,
 
 
 # TODO: fix the cases where the annotation includes ;
+def create_ECHR_document_rows(document_path, documents_path, doc_ID, split, relation_types, asymmetric_link_types,
+                              symmetric_link_types, a_non_link_types, s_non_link_types, maxdistance, reflexive):
+    """
+    Creates the dataframe rows of a document of the ECHR corpus (see create_ECHR_pickle)
+    :return: the list of rows and the list of the labels of the propositions
+    """
+    rows = []
+    prop_labels = []
+
+    labels_file = open(document_path, 'r', encoding="utf-8")
+
+    labels_line = []
+
+    for splits in labels_file.read().split('\n'):
+        labels_line.append(splits)
+
+    labels_file.close()
+
+    data = {'prop_labels': {},
+            'prop_offsets': {},
+            'T_ids': [],
+            'propositions': {},
+            'start_offsets': {}
+            }
+
+    for relation_type in relation_types:
+        data[relation_type] = []
+
+    for line in labels_line:
+        maxsplit = 4
+        splits = line.split(maxsplit=maxsplit)
+        if len(splits) <= 0:
+            continue
+        # if it is a component label
+        if splits[0][0] == 'T':
+            T_id = int(splits[0][1:]) - 1
+            data['T_ids'].append(T_id)
+
+            prop_label = splits[1]
+            if prop_label == "major-claim":
+                prop_label = "claim"
+            data['prop_labels'][T_id] = prop_label
+
+            # in case of segmented annotation
+            b1 = int(splits[2])
+            b2 = splits[maxsplit-1]
+            while ";" in b2:
+                maxsplit += 1
+                splits = line.split(maxsplit=maxsplit)
+                b2 = splits[maxsplit-1]
+
+            data['prop_offsets'][T_id] = [b1, int(b2)]
+            # each starting offset is linked to a proposition ID
+            data['start_offsets'][int(splits[2])] = T_id
+            data['propositions'][T_id] = splits[4].split('\n')[0]
+        # if it is a relation label
+        elif splits[0][0] == 'R':
+            source = int(splits[2][6:]) - 1
+            target = int(splits[3][6:]) - 1
+
+            relation = splits[1]
+            if relation in data.keys():
+                data[relation].append([source, target])
+
+
+    # in case annotations are not made following the temporal order
+    # new order given by the starting offsets
+    new_order = {}
+    new_id = 0
+    # find the match between the starting offsets and set the new id
+    # for each initial offset, from lowest to highest
+    for offset in sorted(data['start_offsets'].keys()):
+        # find the corresponding ID
+        old_id = data['start_offsets'][offset]
+        # give it the lowest ID
+        new_order[old_id] = new_id
+        # increase the lowest ID to assign
+        new_id += 1
+
+    # adjust data to the new order
+    new_data = {'prop_labels': [-1] * len(data['prop_labels']),
+                'prop_offsets': [-1] * len(data['prop_labels']),
+                'propositions': [-1] * len(data['prop_labels']), }
+
+    for relation_type in relation_types:
+        new_data[relation_type] = []
+
+    for relation_type in relation_types:
+        for link in data[relation_type]:
+            old_source = link[0]
+            old_target = link[1]
+            new_source = new_order[old_source]
+            new_target = new_order[old_target]
+            new_data[relation_type].append([new_source, new_target])
+
+    for old_id in data['T_ids']:
+        new_id = new_order[old_id]
+        new_data['prop_labels'][new_id] = data['prop_labels'][old_id]
+        new_data['prop_offsets'][new_id] = data['prop_offsets'][old_id]
+        new_data['propositions'][new_id] = data['propositions'][old_id]
+
+    data = new_data
+
+    # CREATE THE PROPER DATAFRAME
+
+    propositions = data['propositions']
+
+    num_propositions = len(propositions)
+
+    assert (num_propositions >= 1)
+
+    relation_index = create_relation_index(data, relation_types)
+
+    for sourceID in range(num_propositions):
+
+        type1 = data['prop_labels'][sourceID]
+
+        for targetID in range(num_propositions):
+            # proposition type
+            type2 = data['prop_labels'][targetID]
+
+            # skip reflexive relations if they are present
+            if sourceID == targetID and not reflexive:
+                continue
+
+            # if the two propositions are too distance, they are dropped
+            if abs(sourceID-targetID) > maxdistance > 0:
+                continue
+
+            relation_label = None
+            relation1to2 = False
+
+            # relation type
+            for relation_type, direct in get_pair_relations(relation_index, sourceID, targetID):
+                # there is a direct relation
+                if direct:
+                    if relation_label is not None and not relation_label == relation_type:
+                        raise Exception('MORE DIFFERENT RELATIONS FOR THE SAME COUPLE OF PROPOSITIONS:'
+                                        + document_path)
+                    relation_label = relation_type
+                    # there is a link
+                    if relation_type in symmetric_link_types or relation_type in asymmetric_link_types:
+                        relation1to2 = True
+
+                # there is an inverse relation
+                else:
+                    if relation_type in asymmetric_link_types or relation_type in a_non_link_types:
+                        relation_label = "inv_" + relation_type
+                    # symmetric relation, no link
+                    elif relation_type in s_non_link_types:
+                        relation_label = relation_type
+                    # symmetric relation, no link
+                    elif relation_type in symmetric_link_types:
+                        relation_label = relation_type
+                        relation1to2 = True
+
+            dataframe_row = {'text_ID': str(doc_ID),
+                             'rawtext': "", #paragraphs[par],
+                             'source_proposition': propositions[sourceID],
+                             'source_ID': str(doc_ID) + "_" + str(sourceID),
+                             'target_proposition': propositions[targetID],
+                             'target_ID': str(doc_ID) + "_" + str(targetID),
+                             'source_type': type1,
+                             'target_type': type2,
+                             'relation_type': relation_label,
+                             'source_to_target': relation1to2,
+                             'set': split
+                             }
+
+            rows.append(dataframe_row)
+
+        prop_labels.append(type1)
+
+    return rows, prop_labels
+
+
 def create_ECHR_pickle(dataset_path, dataset_version, documents_path,
                        asymmetric_link_types, symmetric_link_types, a_non_link_types, s_non_link_types,
                        maxdistance=-1,
-                       reflexive=False):
+                       reflexive=False, processes=1, seed=0):
     """
     :param dataset_path: the working directory for the RCT dataset
     :param dataset_version: the name of the specific sub-dataset in exam
@@ -1163,6 +1503,8 @@ def create_ECHR_pickle(dataset_path, dataset_version, documents_path,
     :param maxdistance: number of maximum argumentative distance to be taken into account for links. A value <=0
                         means no limits
     :param reflexive: whether reflexive links should be added
+    :param processes: number of processes used to parse the documents. If None, one for each core
+    :param seed: seed of the shuffling that determines the split of the documents
     :return: None
     """
     for key in sorted(locals().keys()):
@@ -1193,8 +1535,11 @@ def create_ECHR_pickle(dataset_path, dataset_version, documents_path,
     del documents_names_list
     print(str(len(documents_paths_list)) + " documents found for " + documents_path)
 
-    random.shuffle(documents_paths_list)
+    # the order of the documents (and therefore their split) depends only on the seed
+    documents_paths_list.sort()
+    get_document_random(seed, dataset_version).shuffle(documents_paths_list)
 
+    arguments = []
     for document_path in documents_paths_list:
 
         document_name = os.path.basename(document_path)
@@ -1202,9 +1547,6 @@ def create_ECHR_pickle(dataset_path, dataset_version, documents_path,
             continue
         doc_ID = n
 
-        raw_text_name = document_name[:-4] + ".txt"
-        raw_text_document = os.path.join(documents_path, raw_text_name)
-
         split = "train"
         if n_val < 1:
             split = 'validation'
@@ -1215,193 +1557,18 @@ def create_ECHR_pickle(dataset_path, dataset_version, documents_path,
 
         n += 1
 
-        labels_file = open(document_path, 'r', encoding="utf-8")
-        text_file = open(raw_text_document, 'r', encoding="utf-8")
-
-        raw_text = text_file.read()
-        text_file.close()
-
-        labels_line = []
-
-        for splits in labels_file.read().split('\n'):
-            labels_line.append(splits)
-
-        labels_file.close()
-
-        data = {'prop_labels': {},
-                'prop_offsets': {},
-                'T_ids': [],
-                'propositions': {},
-                'start_offsets': {}
-                }
-
-        for relation_type in relation_types:
-            data[relation_type] = []
-
-        for line in labels_line:
-            maxsplit = 4
-            splits = line.split(maxsplit=maxsplit)
-            if len(splits) <= 0:
-                continue
-            # if it is a component label
-            if splits[0][0] == 'T':
-                T_id = int(splits[0][1:]) - 1
-                data['T_ids'].append(T_id)
-
-                prop_label = splits[1]
-                if prop_label == "major-claim":
-                    prop_label = "claim"
-                data['prop_labels'][T_id] = prop_label
-
-                # in case of segmented annotation
-                b1 = int(splits[2])
-                b2 = splits[maxsplit-1]
-                while ";" in b2:
-                    maxsplit += 1
-                    splits = line.split(maxsplit=maxsplit)
-                    b2 = splits[maxsplit-1]
-
-                data['prop_offsets'][T_id] = [b1, int(b2)]
-                # each starting offset is linked to a proposition ID
-                data['start_offsets'][int(splits[2])] = T_id
-                data['propositions'][T_id] = splits[4].split('\n')[0]
-            # if it is a relation label
-            elif splits[0][0] == 'R':
-                source = int(splits[2][6:]) - 1
-                target = int(splits[3][6:]) - 1
-
-                relation = splits[1]
-                if relation in data.keys():
-                    data[relation].append([source, target])
-
-
-        # in case annotations are not made following the temporal order
-        # new order given by the starting offsets
-        new_order = {}
-        new_id = 0
-        # find the match between the starting offsets and set the new id
-        # for each initial offset, from lowest to highest
-        for offset in sorted(data['start_offsets'].keys()):
-            # find the corresponding ID
-            old_id = data['start_offsets'][offset]
-            # give it the lowest ID
-            new_order[old_id] = new_id
-            # increase the lowest ID to assign
-            new_id += 1
-
-        # adjust data to the new order
-        new_data = {'prop_labels': [-1] * len(data['prop_labels']),
-                    'prop_offsets': [-1] * len(data['prop_labels']),
-                    'propositions': [-1] * len(data['prop_labels']), }
-
-        for relation_type in relation_types:
-            new_data[relation_type] = []
-
-        for relation_type in relation_types:
-            for link in data[relation_type]:
-                old_source = link[0]
-                old_target = link[1]
-                new_source = new_order[old_source]
-                new_target = new_order[old_target]
-                new_data[relation_type].append([new_source, new_target])
-
-        for old_id in data['T_ids']:
-            new_id = new_order[old_id]
-            new_data['prop_labels'][new_id] = data['prop_labels'][old_id]
-            new_data['prop_offsets'][new_id] = data['prop_offsets'][old_id]
-            new_data['propositions'][new_id] = data['propositions'][old_id]
-
-        data = new_data
-
-        # CREATE THE PROPER DATAFRAME
-
-        propositions = data['propositions']
-
-        num_propositions = len(propositions)
-
-        assert (num_propositions >= 1)
-
+        arguments.append((document_path, documents_path, doc_ID, split, relation_types, asymmetric_link_types,
+                          symmetric_link_types, a_non_link_types, s_non_link_types, maxdistance, reflexive))
 
-        for sourceID in range(num_propositions):
+    results = map_documents(create_ECHR_document_rows, arguments, processes)
 
-            source_start = data['prop_offsets'][sourceID][0]
-
-            source_start = data['prop_offsets'][sourceID][0]
-            type1 = data['prop_labels'][sourceID]
-
-            for targetID in range(num_propositions):
-                # proposition type
-                type2 = data['prop_labels'][targetID]
-
-                target_start = data['prop_offsets'][targetID][0]
-
-                # skip reflexive relations if they are present
-                if sourceID == targetID and not reflexive:
-                    continue
-
-                # if the two propositions are too distance, they are dropped
-                if abs(sourceID-targetID) > maxdistance > 0:
-                    continue
-
-                relation_label = None
-                relation1to2 = False
-
-                # relation type
-                for relation_type in relation_types:
-                    links = data[relation_type]
-
-                    for link in links:
-                        # DEBUG
-                        # if not link[0][0] == link[0][1]:
-                        # raise Exception('MORE PROPOSITIONS IN THE SAME RELATION: document ' + file_name)
-
-                        # there is a direct relation
-                        if link[0] == sourceID and link[1] == targetID:
-                            if relation_label is not None and not relation_label == relation_type:
-                                raise Exception('MORE DIFFERENT RELATIONS FOR THE SAME COUPLE OF PROPOSITIONS:'
-                                                + document_path)
-                            relation_label = relation_type
-                            # there is a link
-                            if relation_type in symmetric_link_types or relation_type in asymmetric_link_types:
-                                relation1to2 = True
-
-                        # there is an inverse relation
-                        elif link[0] == targetID and link[1] == sourceID:
-                            if relation_type in asymmetric_link_types or relation_type in a_non_link_types:
-                                relation_label = "inv_" + relation_type
-                            # symmetric relation, no link
-                            elif relation_type in s_non_link_types:
-                                relation_label = relation_type
-                            # symmetric relation, no link
-                            elif relation_type in symmetric_link_types:
-                                relation_label = relation_type
-                                relation1to2 = True
-
-                dataframe_row = {'text_ID': str(doc_ID),
-                                 'rawtext': "", #paragraphs[par],
-                                 'source_proposition': propositions[sourceID],
-                                 'source_ID': str(doc_ID) + "_" + str(sourceID),
-                                 'target_proposition': propositions[targetID],
-                                 'target_ID': str(doc_ID) + "_" + str(targetID),
-                                 'source_type': type1,
-                                 'target_type': type2,
-                                 'relation_type': relation_label,
-                                 'source_to_target': relation1to2,
-                                 'set': split
-                                 }
-
-                row_list[split].append(dataframe_row)
-
-                if relation_type not in rel_count[split].keys():
-                    rel_count[split][relation_type] = 0
-                rel_count[split][relation_type] += 1
-
-                if relation1to2 == True:
-                    link_count[split] += 1
-
-            if type1 not in prop_count[split].keys():
-                prop_count[split][type1] = 0
-            prop_count[split][type1] += 1
+    for argument, (rows, prop_labels) in zip(arguments, results):
+        split = argument[3]
+        row_list[split].extend(rows)
+        count_rows(rows, prop_labels, rel_count[split], prop_count[split])
+        for row in rows:
+            if row['source_to_target'] == True:
+                link_count[split] += 1
 
 
     for split in ["test", "train", "validation"]:
@@ -1426,7 +1593,7 @@ def create_ECHR_pickle(dataset_path, dataset_version, documents_path,
 
             dataframe_path = os.path.join(pickles_path, split + ".pkl")
 
-            dataframe.to_pickle(dataframe_path)
+            save_dataframe(dataframe, dataframe_path)
 
             print("_______________")
             print(split)
@@ -1440,8 +1607,179 @@ def create_ECHR_pickle(dataset_path, dataset_version, documents_path,
 
 
 
+def create_RCT_document_rows(document_path, split, link_types, asymmetric_link_types, symmetric_link_types,
+                             reflexive):
+    """
+    Creates the dataframe rows of a document of the RCT corpus (see create_RCT_pickle)
+    :return: the list of rows and the list of the labels of the propositions
+    """
+    document_name = os.path.basename(document_path)
+    i = int(document_name.split(".")[0])
+
+    rows = []
+    prop_labels = []
+
+    labels_file = open(document_path, 'r')
+
+    labels_line = []
+
+    for splits in labels_file.read().split('\n'):
+        labels_line.append(splits)
+
+    labels_file.close()
+
+    data = {'prop_labels': {},
+            'prop_offsets': {},
+            'T_ids': [],
+            'propositions': {},
+            'start_offsets': {}
+            }
+
+    for link_type in link_types:
+        data[link_type] = []
+
+    for line in labels_line:
+        splits = line.split(maxsplit=4)
+        if len(splits) <= 0:
+            continue
+        # if it is a component label
+        if splits[0][0] == 'T':
+            T_id = int(splits[0][1:]) - 1
+            data['T_ids'].append(T_id)
+            data['prop_labels'][T_id] = splits[1]
+            data['prop_offsets'][T_id] = [int(splits[2]), int(splits[3])]
+            # each starting offset is linked to a proposition ID
+            data['start_offsets'][int(splits[2])] = T_id
+            data['propositions'][T_id] = splits[4].split('\n')[0]
+        # if it is a relation label
+        elif splits[0][0] == 'R':
+            source = int(splits[2][6:]) - 1
+            target = int(splits[3][6:]) - 1
+
+            relation = splits[1].lower()
+
+            # to correct the ambiguity in the labelling
+            if relation == "supports":
+                relation = "support"
+            elif relation == "attacks":
+                relation = "attack"
+
+            # if the "partial-attack" category is not considered, they are treated as attacks
+            if relation == "partial-attack" and relation not in data.keys():
+                relation = "attack"
+
+            data[relation].append([source, target])
+
+    # in case annotations are not made following the temporal order
+    # new order given by the starting offsets
+    new_order = {}
+    new_id = 0
+    # find the match between the starting offsets and set the new id
+    # for each initial offset, from lowest to highest
+    for offset in sorted(data['start_offsets'].keys()):
+        # find the corresponding ID
+        old_id = data['start_offsets'][offset]
+        # give it the lowest ID
+        new_order[old_id] = new_id
+        # increase the lowest ID to assign
+        new_id += 1
+
+    # adjust data to the new order
+    new_data = {'prop_labels': [-1] * len(data['prop_labels']),
+                'prop_offsets': [-1] * len(data['prop_labels']),
+                'propositions': [-1] * len(data['prop_labels']), }
+
+    for link_type in link_types:
+        new_data[link_type] = []
+
+    for link_type in link_types:
+        for link in data[link_type]:
+            old_source = link[0]
+            old_target = link[1]
+            new_source = new_order[old_source]
+            new_target = new_order[old_target]
+            new_data[link_type].append([new_source, new_target])
+
+    for old_id in data['T_ids']:
+        new_id = new_order[old_id]
+        new_data['prop_labels'][new_id] = data['prop_labels'][old_id]
+        new_data['prop_offsets'][new_id] = data['prop_offsets'][old_id]
+        new_data['propositions'][new_id] = data['propositions'][old_id]
+
+    data = new_data
+
+    # CREATE THE PROPER DATAFRAME
+
+    propositions = data['propositions']
+
+    num_propositions = len(propositions)
+
+    assert (num_propositions >= 1)
+
+    relation_index = create_relation_index(data, link_types)
+
+    for sourceID in range(num_propositions):
+
+        type1 = data['prop_labels'][sourceID]
+
+        if type1 == "MajorClaim":
+            type1 = "Claim"
+
+        for targetID in range(num_propositions):
+            # proposition type
+            type2 = data['prop_labels'][targetID]
+
+            if type2 == "MajorClaim":
+                type2 = "Claim"
+
+            # skip reflexive relations if they are present
+            if sourceID == targetID and not reflexive:
+                continue
+
+            relation_type = None
+            relation1to2 = False
+
+            # relation type
+            for link_type, direct in get_pair_relations(relation_index, sourceID, targetID):
+                if direct:
+                    if relation_type is not None and not relation_type == link_type:
+                        raise Exception('MORE DIFFERENT RELATIONS FOR THE SAME COUPLE OF PROPOSITIONS:'
+                                        + document_path)
+                    relation_type = link_type
+                    relation1to2 = True
+
+                # create the symmetric or the asymmetric (inverse) relation
+                else:
+                    if link_type in asymmetric_link_types:
+                        relation_type = "inv_" + link_type
+                    elif link_type in symmetric_link_types:
+                        relation_type = link_type
+                        relation1to2 = True
+
+
+
+
+            dataframe_row = {'text_ID': str(i),
+                             'source_proposition': propositions[sourceID],
+                             'source_ID': str(i) + "_" + str(sourceID),
+                             'target_proposition': propositions[targetID],
+                             'target_ID': str(i) + "_" + str(targetID),
+                             'source_type': type1,
+                             'target_type': type2,
+                             'relation_type': relation_type,
+                             'source_to_target': relation1to2,
+                             'set': split
+                             }
+
+            rows.append(dataframe_row)
+
+        prop_labels.append(type1)
+
+    return rows, prop_labels
+
+
 def create_RCT_pickle(dataset_path, dataset_version, documents_path,
-                      asymmetric_link_types, symmetric_link_types, reflexive):
+                      asymmetric_link_types, symmetric_link_types, reflexive, processes=1):
     """
     Creates a pickle for each split of the specific version of the RCT dataset. IMPORTANT: if "PARTIAL-ATTACK" is not
     in the link list, they will be converted to "attack". MajorClaim will be converted to Claim.
@@ -1451,6 +1789,7 @@ def create_RCT_pickle(dataset_path, dataset_version, documents_path,
     :param asymmetric_link_types: list of links that are asymmetric. For these, the "inv_..." non-links will be created
     :param symmetric_link_types: list of links that are symmetric. For these, 2 links rows will be created
     :param reflexive: whether reflexive links should be added
+    :param processes: number of processes used to parse the documents. If None, one for each core
     :return: None
     """
 
@@ -1483,6 +1822,7 @@ def create_RCT_pickle(dataset_path, dataset_version, documents_path,
 
         print(str(len(documents_paths_list)) + " documents found for " + dataset_version + ", " + split)
 
+        arguments = []
         for document_path in documents_paths_list:
 
             # in case of subfolders, add their content to the document list
@@ -1499,181 +1839,18 @@ def create_RCT_pickle(dataset_path, dataset_version, documents_path,
             document_name = os.path.basename(document_path)
             if ".ann" not in document_name:
                 continue
-            i = int(document_name.split(".")[0])
-
-            labels_file = open(document_path, 'r')
-
-            labels_line = []
-
-            for splits in labels_file.read().split('\n'):
-                labels_line.append(splits)
-
-            labels_file.close()
-
-            data = {'prop_labels': {},
-                    'prop_offsets': {},
-                    'T_ids': [],
-                    'propositions': {},
-                    'start_offsets': {}
-                    }
-
-            for link_type in link_types:
-                data[link_type] = []
-
-            for line in labels_line:
-                splits = line.split(maxsplit=4)
-                if len(splits) <= 0:
-                    continue
-                # if it is a component label
-                if splits[0][0] == 'T':
-                    T_id = int(splits[0][1:]) - 1
-                    data['T_ids'].append(T_id)
-                    data['prop_labels'][T_id] = splits[1]
-                    data['prop_offsets'][T_id] = [int(splits[2]), int(splits[3])]
-                    # each starting offset is linked to a proposition ID
-                    data['start_offsets'][int(splits[2])] = T_id
-                    data['propositions'][T_id] = splits[4].split('\n')[0]
-                # if it is a relation label
-                elif splits[0][0] == 'R':
-                    source = int(splits[2][6:]) - 1
-                    target = int(splits[3][6:]) - 1
-
-                    relation = splits[1].lower()
-
-                    # to correct the ambiguity in the labelling
-                    if relation == "supports":
-                        relation = "support"
-                    elif relation == "attacks":
-                        relation = "attack"
-
-                    # if the "partial-attack" category is not considered, they are treated as attacks
-                    if relation == "partial-attack" and relation not in data.keys():
-                        relation = "attack"
-
-                    data[relation].append([source, target])
-
-            # in case annotations are not made following the temporal order
-            # new order given by the starting offsets
-            new_order = {}
-            new_id = 0
-            # find the match between the starting offsets and set the new id
-            # for each initial offset, from lowest to highest
-            for offset in sorted(data['start_offsets'].keys()):
-                # find the corresponding ID
-                old_id = data['start_offsets'][offset]
-                # give it the lowest ID
-                new_order[old_id] = new_id
-                # increase the lowest ID to assign
-                new_id += 1
-
-            # adjust data to the new order
-            new_data = {'prop_labels': [-1] * len(data['prop_labels']),
-                        'prop_offsets': [-1] * len(data['prop_labels']),
-                        'propositions': [-1] * len(data['prop_labels']), }
-
-            for link_type in link_types:
-                new_data[link_type] = []
-
-            for link_type in link_types:
-                for link in data[link_type]:
-                    old_source = link[0]
-                    old_target = link[1]
-                    new_source = new_order[old_source]
-                    new_target = new_order[old_target]
-                    new_data[link_type].append([new_source, new_target])
-
-            for old_id in data['T_ids']:
-                new_id = new_order[old_id]
-                new_data['prop_labels'][new_id] = data['prop_labels'][old_id]
-                new_data['prop_offsets'][new_id] = data['prop_offsets'][old_id]
-                new_data['propositions'][new_id] = data['propositions'][old_id]
-
-            data = new_data
-
-            # CREATE THE PROPER DATAFRAME
-
-            propositions = data['propositions']
-
-            num_propositions = len(propositions)
-
-            assert (num_propositions >= 1)
-
-            for sourceID in range(num_propositions):
-
-                source_start = data['prop_offsets'][sourceID][0]
-                type1 = data['prop_labels'][sourceID]
-
-                if type1 == "MajorClaim":
-                    type1 = "Claim"
-
-                for targetID in range(num_propositions):
-                    # proposition type
-                    type2 = data['prop_labels'][targetID]
-
-                    if type2 == "MajorClaim":
-                        type2 = "Claim"
-
-                    target_start = data['prop_offsets'][targetID][0]
-
-                    # skip reflexive relations if they are present
-                    if sourceID == targetID and not reflexive:
-                        continue
-
-                    relation_type = None
-                    relation1to2 = False
 
-                    # relation type
-                    for link_type in link_types:
-                        links = data[link_type]
+            arguments.append((document_path, split, link_types, asymmetric_link_types, symmetric_link_types,
+                              reflexive))
 
-                        for link in links:
-                            # DEBUG
-                            # if not link[0][0] == link[0][1]:
-                            # raise Exception('MORE PROPOSITIONS IN THE SAME RELATION: document ' + file_name)
+        results = map_documents(create_RCT_document_rows, arguments, processes)
 
-                            if link[0] == sourceID and link[1] == targetID:
-                                if relation_type is not None and not relation_type == link_type:
-                                    raise Exception('MORE DIFFERENT RELATIONS FOR THE SAME COUPLE OF PROPOSITIONS:'
-                                                    + documents_path)
-                                relation_type = link_type
-                                relation1to2 = True
-
-                            # create the symmetric or the asymmetric (inverse) relation
-                            elif link[0] == targetID and link[1] == sourceID:
-                                if link_type in asymmetric_link_types:
-                                    relation_type = "inv_" + link_type
-                                elif link_type in symmetric_link_types:
-                                    relation_type = link_type
-                                    relation1to2 = True
-
-
-
-
-                    dataframe_row = {'text_ID': str(i),
-                                     'source_proposition': propositions[sourceID],
-                                     'source_ID': str(i) + "_" + str(sourceID),
-                                     'target_proposition': propositions[targetID],
-                                     'target_ID': str(i) + "_" + str(targetID),
-                                     'source_type': type1,
-                                     'target_type': type2,
-                                     'relation_type': relation_type,
-                                     'source_to_target': relation1to2,
-                                     'set': split
-                                     }
-
-                    row_list.append(dataframe_row)
-
-                    if relation_type not in rel_count.keys():
-                        rel_count[relation_type] = 0
-                    rel_count[relation_type] += 1
-
-                    if relation1to2 == True:
-                        link_count += 1
-
-                if type1 not in prop_count.keys():
-                    prop_count[type1] = 0
-                prop_count[type1] += 1
-            i += 1
+        for rows, prop_labels in results:
+            row_list.extend(rows)
+            count_rows(rows, prop_labels, rel_count, prop_count)
+            for row in rows:
+                if row['source_to_target'] == True:
+                    link_count += 1
 
         pickles_path = os.path.join(dataset_path, 'pickles', dataset_version)
         if not os.path.exists(pickles_path):
@@ -1695,7 +1872,7 @@ def create_RCT_pickle(dataset_path, dataset_version, documents_path,
 
             dataframe_path = os.path.join(pickles_path, split + ".pkl")
 
-            dataframe.to_pickle(dataframe_path)
+            save_dataframe(dataframe, dataframe_path)
 
             print("_______________")
             print(split)
@@ -1707,7 +1884,8 @@ def create_RCT_pickle(dataset_path, dataset_version, documents_path,
 
 
 def print_dataframe_details(dataframe_path):
-    df = pandas.read_pickle(dataframe_path)
+    df = load_dataframe(dataframe_path, columns=['text_ID', 'source_ID', 'source_type', 'relation_type',
+                                                  'source_to_target'])
 
     print()
     print('total relations')
@@ -1743,17 +1921,11 @@ def create_total_dataframe(pickles_path):
     :param pickles_path:
     :return:
     """
-    frames = []
+    dataframe_paths = []
     for split in ["train", "test", "validation"]:
-        dataframe_path = os.path.join(pickles_path, split + ".pkl")
-        if os.path.exists(dataframe_path):
-            df1 = pandas.read_pickle(dataframe_path)
-            frames.append(df1)
-
-    if len(frames) > 0:
-        dataframe = pandas.concat(frames).sort_values('source_ID')
-        dataframe_path = os.path.join(pickles_path, 'total.pkl')
-        dataframe.to_pickle(dataframe_path)
+        dataframe_paths.append(os.path.join(pickles_path, split + ".pkl"))
+
+    merge_dataframes(dataframe_paths, os.path.join(pickles_path, 'total.pkl'))
 
 
 def create_collective_version_dataframe(pickle_path, split):
@@ -1764,18 +1936,13 @@ def create_collective_version_dataframe(pickle_path, split):
     :param split: One between "train", "test", "validation", or "total"
     :return:
     """
-    frames = []
+    dataframe_paths = []
     for path in os.listdir(pickle_path):
-        if os.path.isdir(os.path.join(pickle_path, path)):
-            dataframe_path = os.path.join(pickle_path, path, split + ".pkl")
-            if os.path.exists(dataframe_path):
-                df1 = pandas.read_pickle(dataframe_path)
-                frames.append(df1)
-
-    if len(frames) > 0:
-        dataframe = pandas.concat(frames).sort_values('source_ID')
-        dataframe_path = os.path.join(pickle_path, split + ".pkl")
-        dataframe.to_pickle(dataframe_path)
+        # the folders of the columnar dataframes are not dataset versions
+        if os.path.isdir(os.path.join(pickle_path, path)) and not path.endswith(dataset_store.STORE_SUFFIX):
+            dataframe_paths.append(os.path.join(pickle_path, path, split + ".pkl"))
+
+    merge_dataframes(dataframe_paths, os.path.join(pickle_path, split + ".pkl"))
 
 
 def print_distance_analysis(pickles_path):
@@ -1784,8 +1951,8 @@ def print_distance_analysis(pickles_path):
         print(split)
         dataframe_path = os.path.join(pickles_path, split + '.pkl')
 
-        if os.path.exists(dataframe_path):
-            df = pandas.read_pickle(dataframe_path)
+        if dataframe_exists(dataframe_path):
+            df = load_dataframe(dataframe_path, columns=['source_ID', 'target_ID', 'source_to_target'])
 
             diff_l = {}
             diff_nl = {}
@@ -1830,10 +1997,11 @@ def print_distance_analysis(pickles_path):
 
 
 
-def routine_RCT_corpus():
+def routine_RCT_corpus(processes=None):
     """
     Creates pickles for the RCT corpus. For each dataset version, creates a specific pickle file.
     It creates also a collective pickle file with all the previous versions mixed together.
+    :param processes: number of processes used to parse the documents. If None, one for each core
     :return:
     """
     a_link_types = ['support', 'attack']
@@ -1852,7 +2020,8 @@ def routine_RCT_corpus():
     for dataset_version in dataset_versions:
         print("DATASET VERSION: " + dataset_version)
         print()
-        create_RCT_pickle(dataset_path, dataset_version, document_path, a_link_types, s_link_types, False)
+        create_RCT_pickle(dataset_path, dataset_version, document_path, a_link_types, s_link_types, False,
+                          processes=processes)
         print('____________________________________________________________________________________________')
         pickles_path = os.path.join(dataset_path, "pickles", dataset_version)
 
@@ -1875,7 +2044,7 @@ def routine_RCT_corpus():
         print('_______________________')
         print(split)
         dataframe_path = os.path.join(pickles_path, split + '.pkl')
-        if os.path.exists(dataframe_path):
+        if dataframe_exists(dataframe_path):
             print_dataframe_details(dataframe_path)
             print('_______________________')
             sys.stdout.flush()
@@ -1893,7 +2062,7 @@ def routine_RCT_corpus():
             print('_______________________')
             print(split)
             dataframe_path = os.path.join(pickles_path, split + '.pkl')
-            if os.path.exists(dataframe_path):
+            if dataframe_exists(dataframe_path):
                 print_dataframe_details(dataframe_path)
                 print('_______________________')
                 sys.stdout.flush()
@@ -1914,7 +2083,7 @@ def routine_RCT_corpus():
         pickles_path = os.path.join(dataset_path, "pickles", dataset_version)
         print_distance_analysis(pickles_path)
 
-def routine_DrInventor_corpus(maxdistance=0):
+def routine_DrInventor_corpus(maxdistance=0, processes=None, seed=0):
     # DR INVENTOR CORPUS
     a_link_types = ['supports', 'contradicts']
     s_link_types = ['semantically_same']
@@ -1931,7 +2100,7 @@ def routine_DrInventor_corpus(maxdistance=0):
     print("-------------------------------------------------------------")
 
     create_inv_pickle(dataset_path, dataset_version, document_path, a_link_types, s_link_types, s_non_link_types,
-                      maxdistance=maxdistance, reflexive=False)
+                      maxdistance=maxdistance, reflexive=False, processes=processes, seed=seed)
     print('____________________________________________________________________________________________')
     pickles_path = os.path.join(dataset_path, "pickles", dataset_version)
     sys.stdout.flush()
@@ -1952,7 +2121,7 @@ def routine_DrInventor_corpus(maxdistance=0):
         print('_______________________')
         print(split)
         dataframe_path = os.path.join(pickles_path, split + '.pkl')
-        if os.path.exists(dataframe_path):
+        if dataframe_exists(dataframe_path):
             print_dataframe_details(dataframe_path)
             print('_______________________')
             sys.stdout.flush()
@@ -1970,7 +2139,7 @@ def routine_DrInventor_corpus(maxdistance=0):
         print('_______________________')
         print(split)
         dataframe_path = os.path.join(pickles_path, split + '.pkl')
-        if os.path.exists(dataframe_path):
+        if dataframe_exists(dataframe_path):
             print_dataframe_details(dataframe_path)
             print('_______________________')
             sys.stdout.flush()
@@ -1993,7 +2162,7 @@ def routine_DrInventor_corpus(maxdistance=0):
     lowest = 0
 
 
-def routine_ECHR_corpus():
+def routine_ECHR_corpus(processes=None, seed=0):
     a_link_types = ['Support', 'Attack']
     s_link_types = []
     s_non_link_types = ['Duplicate']
@@ -2012,7 +2181,7 @@ def routine_ECHR_corpus():
 
     create_ECHR_pickle(dataset_path, dataset_version, document_path,
                        a_link_types, s_link_types, a_non_link_types, s_non_link_types,
-                       maxdistance=maxdistance, reflexive=False)
+                       maxdistance=maxdistance, reflexive=False, processes=processes, seed=seed)
     print('____________________________________________________________________________________________')
     pickles_path = os.path.join(dataset_path, "pickles", dataset_version)
     sys.stdout.flush()
@@ -2033,7 +2202,7 @@ def routine_ECHR_corpus():
         print('_______________________')
         print(split)
         dataframe_path = os.path.join(pickles_path, split + '.pkl')
-        if os.path.exists(dataframe_path):
+        if dataframe_exists(dataframe_path):
             print_dataframe_details(dataframe_path)
             print('_______________________')
             sys.stdout.flush()
@@ -2051,7 +2220,7 @@ def routine_ECHR_corpus():
         print('_______________________')
         print(split)
         dataframe_path = os.path.join(pickles_path, split + '.pkl')
-        if os.path.exists(dataframe_path):
+        if dataframe_exists(dataframe_path):
             print_dataframe_details(dataframe_path)
             print('_______________________')
             sys.stdout.flush()
@@ -2076,7 +2245,7 @@ def routine_ECHR_corpus():
 
 
 # this has been changed and not yet tested:
-def routine_CDCP_corpus():
+def routine_CDCP_corpus(processes=None, seed=0):
     # CDCP CORPUS
     link_types = ['evidences', 'reasons']
     dataset_name = 'cdcp_ACL17'
@@ -2087,9 +2256,11 @@ def routine_CDCP_corpus():
     dataset_path = os.path.join(os.getcwd(), 'Datasets', dataset_name)
     create_function = create_preprocessed_cdcp_pickle
 
-    create_function(dataset_path, dataset_version, link_types, dataset_type, validation=0.1, reflexive=False)
+    create_function(dataset_path, dataset_version, link_types, dataset_type, validation=0.1, reflexive=False,
+                    processes=processes, seed=seed)
     dataset_type = 'test'
-    create_function(dataset_path, dataset_version, link_types, dataset_type, reflexive=False)
+    create_function(dataset_path, dataset_version, link_types, dataset_type, reflexive=False,
+                    processes=processes, seed=seed)
 
     pickles_path = os.path.join(dataset_path, 'pickles', dataset_version)
     create_total_dataframe(pickles_path)
@@ -2104,7 +2275,7 @@ def routine_CDCP_corpus():
         print('_______________________')
 
 
-def routine_UKP_corpus():
+def routine_UKP_corpus(processes=None, seed=0):
     link_types = ['supports', 'attacks']
     dataset_name = 'AAEC_v2'
     dataset_version = 'new_2R'
@@ -2116,10 +2287,12 @@ def routine_UKP_corpus():
     # Use of reflexive creates 8k additional pairs of no-link :(
     # Avoidance of reflexive misses 400 major claims :(
 
-    create_ukp_pickle(dataset_path, dataset_version, link_types, dataset_type, validation=0.1, reflexive=True)
+    create_ukp_pickle(dataset_path, dataset_version, link_types, dataset_type, validation=0.1, reflexive=True,
+                      processes=processes, seed=seed)
 
     dataset_type = 'test'
-    create_ukp_pickle(dataset_path, dataset_version, link_types, dataset_type, validation=0, reflexive=True)
+    create_ukp_pickle(dataset_path, dataset_version, link_types, dataset_type, validation=0, reflexive=True,
+                      processes=processes, seed=seed)
 
     pickles_path = os.path.join(dataset_path, 'pickles', dataset_version)
     create_total_dataframe(pickles_path)
@@ -2134,7 +2307,7 @@ def routine_UKP_corpus():
         print('_______________________')
 
 
-def routine_scidtb_corpus():
+def routine_scidtb_corpus(processes=None, seed=0):
     link_types = ["support", "attack"]
     asymmetric_non_link_types = []
     # asymmetric_non_link_types = ["detail", "additional", "sequence"]
@@ -2146,7 +2319,7 @@ def routine_scidtb_corpus():
     pickles_path = os.path.join(dataset_path, 'pickles', dataset_version)
 
     create_scidtb_pickle(dataset_path, dataset_version, document_path, link_types, [], asymmetric_non_link_types, [],
-                         test=0.2, validation=0.2, reflexive=False)
+                         test=0.2, validation=0.2, reflexive=False, processes=processes, seed=seed)
 
 
     create_total_dataframe(pickles_path)
@@ -2161,6 +2334,15 @@ def routine_scidtb_corpus():
 
 
 
+# folders of the annotated documents of each corpus
+CORPUS_SOURCES = {"rct": ('RCT', ["original_data"]),
+                  "drinv": ('DrInventor', ["original_data"]),
+                  "echr": ('ECHR2018', ["original_data"]),
+                  "cdcp": ('cdcp_ACL17', ["new_3"]),
+                  "ukp": ('AAEC_v2', ["original_data"]),
+                  "scidtb": ('scidtb_argmin_annotations', ["original_data"])}
+
+
 if __name__ == '__main__':
 
     parser = argparse.ArgumentParser(description="Create a new dataframe")
@@ -2170,25 +2352,54 @@ if __name__ == '__main__':
                         help="Corpus", default="cdcp")
     parser.add_argument('-d', '--distance',
                         help="The maximum distance considered to create pairs. Used only for some corpora.", default=10)
+    parser.add_argument('-p', '--processes',
+                        help="Number of processes used to parse the documents. By default, one for each core",
+                        type=int, default=None)
+    parser.add_argument('-s', '--seed',
+                        help="Seed of the random split of the documents", type=int, default=0)
+    parser.add_argument('-f', '--format',
+                        choices=dataset_store.FORMATS,
+                        help="Format of the dataframes: pickles of the pairs, or normalised columnar tables",
+                        default=dataset_store.DEFAULT_FORMAT)
+    parser.add_argument('--force', help="Create the dataframes even if they are up to date", action='store_true')
 
 
     args = parser.parse_args()
 
     corpus = args.corpus
     distance = args.distance
+    processes = args.processes
+    seed = args.seed
+    dataset_store.DEFAULT_FORMAT = args.format
 
-    if corpus.lower() == "rct":
-        routine_RCT_corpus()
-    elif corpus.lower() == "cdcp":
-        routine_CDCP_corpus()
-    elif corpus.lower() == "drinv":
-        routine_DrInventor_corpus(distance)
-    elif corpus.lower() == "ukp":
-        routine_UKP_corpus()
-    elif corpus.lower() == "scidtb":
-        routine_scidtb_corpus()
-    else:
-        print("Datset not yet supported")
-
-
+    dataset_name, source_folders = CORPUS_SOURCES[corpus.lower()]
+    dataset_path = os.path.join(os.getcwd(), 'Datasets', dataset_name)
 
+    # the dataframes are created again only if the annotations, the options or this code changed
+    manifest = load_manifest(get_manifest_path(dataset_path))
+    stage = "dataframes"
+    config = {'corpus': corpus.lower(),
+              'distance': distance,
+              'seed': seed,
+              'format': args.format,
+              'code': hash_file(manifest, os.path.abspath(__file__))}
+    inputs = hash_paths(manifest, [os.path.join(dataset_path, folder) for folder in source_folders])
+    output_paths = [os.path.join(dataset_path, 'pickles')]
+
+    if not args.force and is_stage_current(manifest, stage, config, inputs, output_paths):
+        print("Dataframes up to date: " + dataset_path)
+    else:
+        if corpus.lower() == "rct":
+            routine_RCT_corpus(processes)
+        elif corpus.lower() == "cdcp":
+            routine_CDCP_corpus(processes, seed)
+        elif corpus.lower() == "drinv":
+            routine_DrInventor_corpus(distance, processes, seed)
+        elif corpus.lower() == "echr":
+            routine_ECHR_corpus(processes, seed)
+        elif corpus.lower() == "ukp":
+            routine_UKP_corpus(processes, seed)
+        elif corpus.lower() == "scidtb":
+            routine_scidtb_corpus(processes, seed)
+
+        record_stage(manifest, stage, config, inputs, output_paths)
@@ -0,0 +1,317 @@
+__author__ = "Andrea Galassi"
+__copyright__ = "Copyright 2018-2020 Andrea Galassi"
+__license__ = "BSD 3-clause"
+__version__ = "0.1.0"
+__email__ = "a.galassi@unibo.it"
+
+"""
+Normalised, columnar storage of the pair dataframes.
+A pair dataframe repeats the text of the document and of both the propositions in each of its O(n^2) rows. In the
+columnar format the same data is stored as three tables: the documents, the components (with the key of their
+document) and the pairs (with the keys of their source and target components and the labels of the pair).
+Each table is an uncompressed Feather (Arrow IPC) file, which is memory-mapped when loaded: a compressed file would
+be decompressed into memory anyway, losing the zero-copy reads.
+
+The dataframes are still addressed by the path of their pickle ("<split>.pkl"): the tables are stored in the folder
+"<split>.columnar" next to it, and load_dataframe rebuilds the pair dataframe from whichever of the two exists.
+"""
+
+import os
+import json
+import shutil
+import numpy as np
+import pandas
+
+try:
+    from pyarrow import feather
+except ImportError:
+    feather = None
+
+
+FORMATS = ["pickle", "columnar"]
+DEFAULT_FORMAT = "columnar" if feather is not None else "pickle"
+COMPRESSION = "uncompressed"
+STORE_SUFFIX = ".columnar"
+DOCUMENT_COLUMNS = ['text_ID', 'rawtext', 'set']
+DOCUMENT_KEY = ['set', 'text_ID']
+TABLES = ['documents', 'components', 'pairs']
+
+
+def get_store_path(dataframe_path):
+    """
+    :param dataframe_path: path of the pickle of the dataframe
+    :return: path of the folder of its columnar version
+    """
+    return os.path.splitext(dataframe_path)[0] + STORE_SUFFIX
+
+
+def dataframe_exists(dataframe_path):
+    """
+    :param dataframe_path: path of the pickle of the dataframe
+    :return: whether the dataframe exists, in any format
+    """
+    return os.path.exists(dataframe_path) or os.path.exists(get_store_path(dataframe_path))
+
+
+def check_pyarrow():
+    if feather is None:
+        raise Exception('PYARROW IS REQUIRED BY THE COLUMNAR FORMAT')
+
+
+def get_schema(columns):
+    """
+    Classifies the columns of a pair dataframe. The component attributes are the X such that both source_X and
+    target_X are columns; the document columns are the ones in DOCUMENT_COLUMNS; the others belong to the pairs.
+    :param columns: columns of the dataframe, in their order
+    :return: dictionary with the ordered columns, the document columns, the component attributes, the pair columns
+    """
+    columns = list(columns)
+    for column in DOCUMENT_KEY + ['source_ID', 'target_ID']:
+        if column not in columns:
+            raise Exception('NOT A PAIR DATAFRAME: MISSING COLUMN ' + column)
+
+    document_columns = [column for column in columns if column in DOCUMENT_COLUMNS]
+
+    component_columns = []
+    for column in columns:
+        if column.startswith('source_') and 'target_' + column[7:] in columns:
+            component_columns.append(column[7:])
+
+    pair_columns = []
+    for column in columns:
+        if column in document_columns:
+            continue
+        if column[:7] in ['source_', 'target_'] and column[7:] in component_columns:
+            continue
+        pair_columns.append(column)
+
+    return {'columns': columns,
+            'document': document_columns,
+            'component': component_columns,
+            'pair': pair_columns}
+
+
+def normalise_dataframe(dataframe):
+    """
+    Splits a pair dataframe into the documents, components and pairs tables. Documents are identified by their split
+    and text_ID, components by their split and ID. The index of the dataframe is not kept.
+    :param dataframe: the pair dataframe
+    :return: the three tables and the schema of the dataframe
+    """
+    schema = get_schema(dataframe.columns)
+
+    documents = dataframe[schema['document']].drop_duplicates()
+    document_number = len(documents)
+    documents = documents.drop_duplicates(subset=DOCUMENT_KEY).reset_index(drop=True)
+    if len(documents) != document_number:
+        raise Exception('DIFFERENT DOCUMENTS WITH THE SAME TEXT_ID AND SPLIT')
+
+    sides = []
+    for side in ['source_', 'target_']:
+        side_frame = dataframe[DOCUMENT_KEY + [side + column for column in schema['component']]]
+        side_frame.columns = DOCUMENT_KEY + schema['component']
+        sides.append(side_frame)
+    components = pandas.concat(sides).drop_duplicates()
+    component_number = len(components)
+    components = components.drop_duplicates(subset=['set', 'ID']).reset_index(drop=True)
+    if len(components) != component_number:
+        raise Exception('DIFFERENT COMPONENTS WITH THE SAME ID AND SPLIT')
+
+    document_index = pandas.MultiIndex.from_frame(documents[DOCUMENT_KEY])
+    component_index = pandas.MultiIndex.from_frame(components[['set', 'ID']])
+
+    components.insert(0, 'document', document_index.get_indexer(
+        pandas.MultiIndex.from_frame(components[DOCUMENT_KEY])).astype(np.int32))
+    components = components.drop(columns=DOCUMENT_KEY)
+
+    pairs = pandas.DataFrame()
+    for side in ['source', 'target']:
+        pair_keys = pandas.MultiIndex.from_arrays([dataframe['set'], dataframe[side + '_ID']])
+        pairs[side] = component_index.get_indexer(pair_keys).astype(np.int32)
+    for column in schema['pair']:
+        pairs[column] = dataframe[column].values
+
+    return {'documents': documents, 'components': components, 'pairs': pairs}, schema
+
+
+def get_column(tables, schema, column):
+    """
+    Rebuilds a column of the pair dataframe from the normalised tables
+    :param tables: dictionary with the (possibly partial) tables
+    :param schema: schema of the dataframe
+    :param column: name of the column
+    :return: the values of the column, one for each pair
+    """
+    pairs = tables['pairs']
+    if column in schema['document']:
+        # source and target always belong to the same document
+        documents = tables['components']['document'].values[pairs['source'].values]
+        return tables['documents'][column].values[documents]
+    elif column[:7] in ['source_', 'target_'] and column[7:] in schema['component']:
+        return tables['components'][column[7:]].values[pairs[column[:6]].values]
+    elif column in schema['pair']:
+        return pairs[column].values
+    raise Exception('UNKNOWN COLUMN: ' + str(column))
+
+
+def write_tables(store_path, tables, schema):
+    check_pyarrow()
+    if not os.path.exists(store_path):
+        os.makedirs(store_path)
+    for name in TABLES:
+        feather.write_feather(tables[name].reset_index(drop=True), os.path.join(store_path, name + ".feather"),
+                              compression=COMPRESSION)
+    with open(os.path.join(store_path, "schema.json"), "w") as f:
+        json.dump(schema, f)
+
+
+def read_schema(store_path):
+    with open(os.path.join(store_path, "schema.json"), "r") as f:
+        return json.load(f)
+
+
+def read_tables(store_path, schema, columns=None):
+    """
+    Reads the tables of a columnar dataframe, memory-mapping their files
+    :param store_path: folder of the tables
+    :param schema: schema of the dataframe
+    :param columns: columns of the pair dataframe that will be rebuilt. If None, all of them
+    :return: dictionary with the tables, restricted to what is needed by the columns
+    """
+    check_pyarrow()
+    if columns is None:
+        columns = schema['columns']
+
+    table_columns = {'documents': [], 'components': [], 'pairs': ['source', 'target']}
+    for column in columns:
+        if column in schema['document']:
+            table_columns['documents'].append(column)
+            if 'document' not in table_columns['components']:
+                table_columns['components'].append('document')
+        elif column[:7] in ['source_', 'target_'] and column[7:] in schema['component']:
+            if column[7:] not in table_columns['components']:
+                table_columns['components'].append(column[7:])
+        elif column in schema['pair']:
+            table_columns['pairs'].append(column)
+        else:
+            raise Exception('UNKNOWN COLUMN: ' + str(column))
+
+    tables = {}
+    for name in TABLES:
+        if len(table_columns[name]) < 1:
+            tables[name] = None
+            continue
+        table = feather.read_table(os.path.join(store_path, name + ".feather"), columns=table_columns[name],
+                                   memory_map=True)
+        tables[name] = table.to_pandas()
+    return tables
+
+
+def save_dataframe(dataframe, dataframe_path, dataframe_format=None):
+    """
+    Saves a pair dataframe. The version of the dataframe in the other format, if present, is removed.
+    :param dataframe: the pair dataframe
+    :param dataframe_path: path of the pickle of the dataframe
+    :param dataframe_format: one between "pickle" and "columnar". If None, DEFAULT_FORMAT
+    :return: None
+    """
+    if dataframe_format is None:
+        dataframe_format = DEFAULT_FORMAT
+    store_path = get_store_path(dataframe_path)
+
+    if dataframe_format == "pickle":
+        dataframe.to_pickle(dataframe_path)
+        if os.path.exists(store_path):
+            shutil.rmtree(store_path)
+    elif dataframe_format == "columnar":
+        tables, schema = normalise_dataframe(dataframe)
+        write_tables(store_path, tables, schema)
+        if os.path.exists(dataframe_path):
+            os.remove(dataframe_path)
+    else:
+        raise Exception('UNKNOWN DATAFRAME FORMAT: ' + str(dataframe_format))
+
+
+def load_dataframe(dataframe_path, columns=None):
+    """
+    Loads a pair dataframe, from its columnar version if present, from its pickle otherwise
+    :param dataframe_path: path of the pickle of the dataframe
+    :param columns: list of the columns to load. If None, all of them. The text columns of a columnar dataframe are
+    not even read if they are not requested
+    :return: the pair dataframe
+    """
+    store_path = get_store_path(dataframe_path)
+
+    if not os.path.exists(store_path):
+        dataframe = pandas.read_pickle(dataframe_path)
+        if columns is not None:
+            dataframe = dataframe[columns]
+        return dataframe
+
+    schema = read_schema(store_path)
+    if columns is None:
+        columns = schema['columns']
+    tables = read_tables(store_path, schema, columns)
+
+    data = {}
+    for column in columns:
+        data[column] = get_column(tables, schema, column)
+    return pandas.DataFrame(data, columns=columns)
+
+
+def merge_dataframes(dataframe_paths, dataframe_path, sort_column='source_ID', dataframe_format=None):
+    """
+    Concatenates a list of pair dataframes and sorts the result. If they are all columnar and share the same columns,
+    the tables are concatenated directly, without rebuilding the pairs. Missing dataframes are skipped.
+    :param dataframe_paths: paths of the pickles of the dataframes to merge
+    :param dataframe_path: path of the pickle of the result
+    :param sort_column: column used to sort the pairs
+    :param dataframe_format: one between "pickle" and "columnar". If None, DEFAULT_FORMAT
+    :return: None
+    """
+    if dataframe_format is None:
+        dataframe_format = DEFAULT_FORMAT
+
+    dataframe_paths = [path for path in dataframe_paths if dataframe_exists(path)]
+    if len(dataframe_paths) < 1:
+        return
+
+    store_paths = [get_store_path(path) for path in dataframe_paths]
+    columnar = dataframe_format == "columnar"
+    for store_path in store_paths:
+        columnar = columnar and os.path.exists(store_path)
+    if columnar:
+        schemas = [read_schema(store_path) for store_path in store_paths]
+        for schema in schemas:
+            columnar = columnar and schema['columns'] == schemas[0]['columns']
+
+    if not columnar:
+        frames = [load_dataframe(path) for path in dataframe_paths]
+        dataframe = pandas.concat(frames).sort_values(sort_column, kind='mergesort')
+        save_dataframe(dataframe, dataframe_path, dataframe_format)
+        return
+
+    schema = schemas[0]
+    parts = {'documents': [], 'components': [], 'pairs': []}
+    document_offset = 0
+    component_offset = 0
+    for store_path in store_paths:
+        tables = read_tables(store_path, schema)
+        tables['components']['document'] += document_offset
+        tables['pairs']['source'] += component_offset
+        tables['pairs']['target'] += component_offset
+        document_offset += len(tables['documents'])
+        component_offset += len(tables['components'])
+        for name in TABLES:
+            parts[name].append(tables[name])
+
+    tables = {}
+    for name in TABLES:
+        tables[name] = pandas.concat(parts[name], ignore_index=True)
+
+    order = pandas.Series(get_column(tables, schema, sort_column)).sort_values(kind='mergesort').index.values
+    tables['pairs'] = tables['pairs'].iloc[order]
+
+    write_tables(get_store_path(dataframe_path), tables, schema)
+    if os.path.exists(dataframe_path):
+        os.remove(dataframe_path)
@@ -5,152 +5,214 @@ __version__ = "0.2.0"
 __email__ = "a.galassi@unibo.it"
 
 
-import pandas
 import os
 import numpy as np
 import pickle
+import multiprocessing
 import argparse
-from glove_loader import SEPARATORS, STOPWORDS, REPLACINGS
-
-def save_embeddings(dataframe_path, vocabulary_path, embeddings_path, mode='texts', type='bow'):
-    df = pandas.read_pickle(dataframe_path)
+import tokenizer
+from tokenizer import SEPARATORS, Tokenizer
+from dataset_store import load_dataframe, get_store_path
+from embeddings_store import save_store, get_store_path as get_embeddings_store_path
+from build_manifest import (load_manifest, get_manifest_path, hash_string, hash_file, hash_paths,
+                            hash_config, is_stage_current, get_stage_config, record_stage)
+
+def tokenize_text(text, vocabulary, separators):
+    """
+    Splits a text in the tokens of the vocabulary, progressively using the separators
+    :param text: the text
+    :param vocabulary: the vocabulary, or anything that supports "word in vocabulary.keys()"
+    :param separators: list of separators
+    :return: the list of tokens. Unrecognized parts of the text are empty strings
+    """
+    return Tokenizer(vocabulary, separators).tokenize(text)
+
+
+# tokenizer of the worker processes, see init_worker_tokenizer
+WORKER_TOKENIZER = None
+
+
+def init_worker_tokenizer(words, separators):
+    global WORKER_TOKENIZER
+    WORKER_TOKENIZER = Tokenizer(dict.fromkeys(words), separators)
+
+
+def tokenize_texts(texts):
+    """
+    Tokenizes a chunk of texts with the tokenizer of the process
+    :return: list with the tokens of each text and the words that it looked up without finding them
+    """
+    results = []
+    for text in texts:
+        misses = set()
+        tokens = WORKER_TOKENIZER.tokenize(text, misses)
+        results.append((tokens, misses))
+    return results
+
+
+def tokenize_all(texts, words, separators, processes=1):
+    """
+    Tokenizes a list of texts, using a pool of processes if required. Each process tokenizes contiguous chunks of
+    texts, so that it can reuse the words it has already resolved.
+    :param texts: list of texts
+    :param words: the words of the vocabulary
+    :param separators: list of separators
+    :param processes: number of processes. If None, one for each core
+    :return: list with the tokens of each text and the words that it looked up without finding them
+    """
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if processes == 1 or len(texts) <= 1:
+        init_worker_tokenizer(words, separators)
+        return tokenize_texts(texts)
+
+    chunk_size = max(1, int(np.ceil(len(texts) / (processes * 4))))
+    chunks = [texts[start:start + chunk_size] for start in range(0, len(texts), chunk_size)]
+    with multiprocessing.Pool(processes, initializer=init_worker_tokenizer, initargs=(words, separators)) as pool:
+        results = pool.map(tokenize_texts, chunks)
+    return [result for chunk_results in results for result in chunk_results]
+
+
+def save_embeddings(dataframe_path, vocabulary_path, embeddings_path, mode='texts', type='bow', cache_path=None,
+                    processes=1):
+    """
+    Tokenizes the texts or the propositions of a dataframe and saves their embeddings in a single store (see
+    embeddings_store.py)
+    :param dataframe_path: path of the dataframe
+    :param vocabulary_path: path of the npz file of the vocabulary
+    :param embeddings_path: path of the embeddings folder: the store is saved next to it
+    :param mode: 'texts' or 'propositions'
+    :param type: 'bow' to save the indices of the words, 'embeddings' to save their vectors
+    :param cache_path: path of the cache with the tokens of the previous run. Optional
+    :param processes: number of processes used to tokenize the texts. If None, one for each core
+    :return: None
+    """
+    if mode == 'texts':
+        df = load_dataframe(dataframe_path, columns=['text_ID', 'rawtext'])
+    else:
+        df = load_dataframe(dataframe_path, columns=['source_ID', 'source_proposition'])
     vocabulary_list = np.load(vocabulary_path)
-    embed_list = vocabulary_list['embeds']
-    word_list = vocabulary_list['vocab']
+    word_list = vocabulary_list['vocab'].tolist()
 
+    # the 0 index must be left empty for padding
     vocabulary = {}
     for index in range(len(word_list)):
-        if type == 'embeddings':
-            vocabulary[word_list[index]] = embed_list[index]
-        elif type == 'bow':
-            # the 0 index must be left empty for padding
-            vocabulary[word_list[index]] = index + 1
+        vocabulary[word_list[index]] = index + 1
 
     df_text = []
     if mode == 'texts':
         df_text = df[['text_ID', 'rawtext']].drop_duplicates()
     elif mode == 'propositions':
         df_text = df[['source_ID', 'source_proposition']].drop_duplicates()
+    text_ids = df_text.iloc[:, 0].tolist()
+    texts = df_text.iloc[:, 1].tolist()
 
     separators = SEPARATORS
 
-    for index, (text_id, text) in df_text.iterrows():
-
-        for old in REPLACINGS.keys():
-            text = text.replace(old, REPLACINGS[old])
-
-        splits = text.split()
-        tokens = ['']*len(splits)
-
-        # initial split with common separators
-        i = 0
-        while i < len(splits):
-            word = splits[i]
-
-            # remove possible stop symbols in the end of the token
-            if len(word) > 1 and word[-1] in STOPWORDS and word[:-1] in vocabulary.keys():
-                symbol = word[-1]
-                word = word[:-1]
-                splits.insert(i + 1, symbol)
-                tokens.insert(i + 1, symbol)
-                splits[i] = word
-                tokens[i] = word
-                tokens[i] = word
-            elif word in vocabulary.keys():
-                tokens[i] = word
-
-            i += 1
-
-
-        for separator in separators:
-            i = 0
-            # iterate on the whole list of split, creating new splits with the separator
-            while i < len(splits):
-                # the word is not empty and is not recognized as a token
-                if tokens[i] == '' and splits[i] != '':
-                    index = 0
-                    prev_index = 0
-                    while index < len(splits[i]) and index >= 0:
-                        word = splits[i]
-                        index = word.find(separator, index)
-                        if index >= 0:
-                            prev_word = word[prev_index:index]
-                            next_word = word[index+len(separator):]
-                            if prev_word != '':
-                                splits.insert(i, prev_word)
-                                token = ''
-                                tokens.insert(i, token)
-                                i += 1
-
-                            # adds the separator
-                            splits[i] = separator
-                            tokens[i] = separator
-
-                            # avoids finding the same separator too many times
-                            index += len(separator)
-
-                            if next_word != '':
-                                splits.insert(i+1, next_word)
-                                token = ''
-                                tokens.insert(i+1, token)
-                i += 1
-
-            # recognize tokens
-            i = 0
-            while i < len(splits):
-                word = splits[i]
-                # remove possible stop symbols in the end of the token
-                if len(word) > 1 and word[-1] in STOPWORDS and word[:-1] in vocabulary.keys():
-                    symbol = word[-1]
-                    word = word[:-1]
-                    splits.insert(i + 1, symbol)
-                    tokens.insert(i + 1, symbol)
-                    splits[i] = word
-                    tokens[i] = word
-                    tokens[i] = word
-
-                elif word in vocabulary.keys():
-                    tokens[i] = word
-
-                i += 1
-
-        embeddings = []
+    cache = {}
+    if cache_path is not None and os.path.exists(cache_path):
+        with open(cache_path, 'rb') as f:
+            cache = pickle.load(f)
+    new_cache = {}
+
+    # the tokens of a text can be reused if the text did not change and the vocabulary still has all its tokens
+    # and none of the words it looked up without success
+    text_hashes = [hash_string(text) for text in texts]
+    results = [None] * len(texts)
+    pending = []
+    for index in range(len(texts)):
+        entry = cache.get(text_ids[index])
+        if (entry is not None and entry['text'] == text_hashes[index]
+                and all(token == '' or token in vocabulary for token in entry['tokens'])
+                and not any(word in vocabulary for word in entry['misses'])):
+            results[index] = (entry['tokens'], entry['misses'])
+        else:
+            pending.append(index)
+
+    print("Tokenizing " + str(len(pending)) + " texts out of " + str(len(texts)))
+    tokenized = tokenize_all([texts[index] for index in pending], word_list, separators, processes)
+    for index, result in zip(pending, tokenized):
+        results[index] = result
+
+    global MAX
+    token_lists = []
+    for index in range(len(texts)):
+        tokens, misses = results[index]
+
+        indices = []
         for token in tokens:
             if token == '':
                 print("TOKEN NOT RECOGNIZED!")
-                print(text_id)
-                print(text)
+                print(text_ids[index])
+                print(texts[index])
                 print(tokens)
                 print()
             else:
-                embeddings.append(vocabulary[token])
+                indices.append(vocabulary[token])
+        token_lists.append(indices)
 
-        array_type = np.float32
-        if type == 'bow':
-            array_type = int
+        new_cache[text_ids[index]] = {'text': text_hashes[index], 'tokens': tokens, 'misses': misses,
+                                      'length': len(indices)}
 
-        embeddings = np.array(embeddings, dtype=array_type)
+        if len(indices) > MAX:
+            MAX = len(indices)
 
-        if mode == 'texts':
-            name = str(text_id) + ".npz"
-        elif mode == 'propositions':
-            name = str(text_id) + ".npz"
+    vectors = None
+    if type == 'embeddings':
+        # each vector is stored once, the tokens become the rows of the used vectors
+        used = np.unique(np.concatenate([np.array(indices, dtype=np.int64) for indices in token_lists] +
+                                        [np.zeros(0, dtype=np.int64)]))
+        vectors = vocabulary_list['embeds'][used - 1]
+        token_lists = [np.searchsorted(used, indices) for indices in token_lists]
 
-        if not os.path.exists(embeddings_path):
-            os.makedirs(embeddings_path)
+    save_store(get_embeddings_store_path(embeddings_path), text_ids, token_lists, vectors)
 
-        document_path = os.path.join(embeddings_path, name)
-        np.savez(document_path, embeddings)
-
-        global MAX
-        max = len(embeddings)
-        if max > MAX:
-            MAX = max
+    if cache_path is not None:
+        with open(cache_path, 'wb') as f:
+            pickle.dump(new_cache, f)
 
     print("Finished")
 
 
-def RCT_routine(size):
+def update_embeddings(dataframe_path, vocabulary_path, embeddings_path, mode, type, manifest, force=False,
+                      processes=1):
+    """
+    Creates the embeddings of a dataframe as save_embeddings does, but only if the dataframe, the vocabulary or the
+    tokenization changed since the last build recorded in the manifest. Only the texts whose tokens may have changed
+    are tokenized again.
+    :param manifest: the build manifest of the corpus
+    :param force: whether to rebuild the embeddings from scratch
+    :param processes: number of processes used to tokenize the texts. If None, one for each core
+    :return: None
+    """
+    global MAX
+
+    stage = "embeddings/" + os.path.relpath(embeddings_path, os.path.dirname(manifest['path']))
+    config = {'mode': mode,
+              'type': type,
+              'code': hash_file(manifest, os.path.abspath(__file__)),
+              'tokenizer': hash_file(manifest, os.path.abspath(tokenizer.__file__))}
+    inputs = hash_paths(manifest, [dataframe_path, get_store_path(dataframe_path), vocabulary_path])
+    cache_path = embeddings_path + ".cache.pkl"
+    output_paths = [get_embeddings_store_path(embeddings_path), cache_path]
+
+    if not force and is_stage_current(manifest, stage, config, inputs, output_paths):
+        print("Embeddings up to date: " + embeddings_path)
+        with open(cache_path, 'rb') as f:
+            for entry in pickle.load(f).values():
+                if entry['length'] > MAX:
+                    MAX = entry['length']
+        return
+
+    if (force or get_stage_config(manifest, stage) != hash_config(config)) and os.path.exists(cache_path):
+        os.remove(cache_path)
+
+    save_embeddings(dataframe_path, vocabulary_path, embeddings_path, mode, type, cache_path, processes)
+
+    record_stage(manifest, stage, config, inputs, output_paths)
+
+
+def RCT_routine(size, force=False, processes=None):
     if size == 300:
         embed_name = "glove300"
     elif size == 25:
@@ -166,6 +228,7 @@ def RCT_routine(size):
     mode = "propositions"
 
     dataset_path = os.path.join(os.getcwd(), 'Datasets', dataset_name)
+    manifest = load_manifest(get_manifest_path(dataset_path))
     for version in ["neo", "glaucoma", "mixed"]:
 
         dataframe_path = os.path.join(dataset_path, 'pickles', version, 'total.pkl')
@@ -174,11 +237,11 @@ def RCT_routine(size):
         # load glove vocabulary and embeddings
         vocabulary_path = os.path.join(dataset_path, "resources", embed_name, 'glove.embeddings.npz')
 
-        save_embeddings(dataframe_path, vocabulary_path, embeddings_path, mode, type)
+        update_embeddings(dataframe_path, vocabulary_path, embeddings_path, mode, type, manifest, force, processes)
     print("MAX = " + str(MAX))
 
 
-def DrInventor_routine(size):
+def DrInventor_routine(size, force=False, processes=None):
     if size == 300:
         embed_name = "glove300"
     elif size == 25:
@@ -195,6 +258,7 @@ def DrInventor_routine(size):
     mode = "propositions"
 
     dataset_path = os.path.join(os.getcwd(), 'Datasets', dataset_name)
+    manifest = load_manifest(get_manifest_path(dataset_path))
     for version in ["arg10"]:
 
         dataframe_path = os.path.join(dataset_path, 'pickles', version, 'total.pkl')
@@ -203,12 +267,12 @@ def DrInventor_routine(size):
         # load glove vocabulary and embeddings
         vocabulary_path = os.path.join(dataset_path, "resources", embed_name, 'glove.embeddings.npz')
 
-        save_embeddings(dataframe_path, vocabulary_path, embeddings_path, mode, type)
+        update_embeddings(dataframe_path, vocabulary_path, embeddings_path, mode, type, manifest, force, processes)
     print("MAX = " + str(MAX))
 
 
 
-def UKP_routine(size):
+def UKP_routine(size, force=False, processes=None):
     if size == 300:
         embed_name = "glove300"
     elif size == 25:
@@ -225,6 +289,7 @@ def UKP_routine(size):
     mode = "propositions"
 
     dataset_path = os.path.join(os.getcwd(), 'Datasets', dataset_name)
+    manifest = load_manifest(get_manifest_path(dataset_path))
     for version in ["new_2R"]:
 
         dataframe_path = os.path.join(dataset_path, 'pickles', version, 'total.pkl')
@@ -233,11 +298,11 @@ def UKP_routine(size):
         # load glove vocabulary and embeddings
         vocabulary_path = os.path.join(dataset_path, "resources", embed_name, 'glove.embeddings.npz')
 
-        save_embeddings(dataframe_path, vocabulary_path, embeddings_path, mode, type)
+        update_embeddings(dataframe_path, vocabulary_path, embeddings_path, mode, type, manifest, force, processes)
     print("MAX = " + str(MAX))
 
 
-def cdcp_routine(size):
+def cdcp_routine(size, force=False, processes=None):
     if size == 300:
         embed_name = "glove300"
     elif size == 25:
@@ -254,6 +319,7 @@ def cdcp_routine(size):
     mode = "propositions"
 
     dataset_path = os.path.join(os.getcwd(), 'Datasets', dataset_name)
+    manifest = load_manifest(get_manifest_path(dataset_path))
     for version in ["new_3"]:
 
         dataframe_path = os.path.join(dataset_path, 'pickles', version, 'total.pkl')
@@ -262,11 +328,11 @@ def cdcp_routine(size):
         # load glove vocabulary and embeddings
         vocabulary_path = os.path.join(dataset_path, "resources", embed_name, 'glove.embeddings.npz')
 
-        save_embeddings(dataframe_path, vocabulary_path, embeddings_path, mode, type)
+        update_embeddings(dataframe_path, vocabulary_path, embeddings_path, mode, type, manifest, force, processes)
     print("MAX = " + str(MAX))
 
 
-def scidtb_routine(size):
+def scidtb_routine(size, force=False, processes=None):
     if size == 300:
         embed_name = "glove300"
     elif size == 25:
@@ -283,6 +349,7 @@ def scidtb_routine(size):
     mode = "propositions"
 
     dataset_path = os.path.join(os.getcwd(), 'Datasets', dataset_name)
+    manifest = load_manifest(get_manifest_path(dataset_path))
     for version in ["only_arg_v1"]:
 
         dataframe_path = os.path.join(dataset_path, 'pickles', version, 'total.pkl')
@@ -291,11 +358,11 @@ def scidtb_routine(size):
         # load glove vocabulary and embeddings
         vocabulary_path = os.path.join(dataset_path, "resources", embed_name, 'glove.embeddings.npz')
 
-        save_embeddings(dataframe_path, vocabulary_path, embeddings_path, mode, type)
+        update_embeddings(dataframe_path, vocabulary_path, embeddings_path, mode, type, manifest, force, processes)
     print("MAX = " + str(MAX))
 
 
-def ECHR_routine():
+def ECHR_routine(force=False, processes=None):
     global MAX
     MAX = 0
 
@@ -304,6 +371,7 @@ def ECHR_routine():
     mode = "propositions"
 
     dataset_path = os.path.join(os.getcwd(), 'Datasets', dataset_name)
+    manifest = load_manifest(get_manifest_path(dataset_path))
     for version in ["arg0"]:
 
         dataframe_path = os.path.join(dataset_path, 'pickles', version, 'total.pkl')
@@ -312,7 +380,7 @@ def ECHR_routine():
         # load glove vocabulary and embeddings
         vocabulary_path = os.path.join(dataset_path, 'glove', 'glove.embeddings.npz')
 
-        save_embeddings(dataframe_path, vocabulary_path, embeddings_path, mode, type)
+        update_embeddings(dataframe_path, vocabulary_path, embeddings_path, mode, type, manifest, force, processes)
     print("MAX = " + str(MAX))
 
 
@@ -326,22 +394,29 @@ if __name__ == '__main__':
     parser.add_argument('-s', '--size', help="embedding size",
                         choices=[25, 300],
                         type=int, default=300)
+    parser.add_argument('-f', '--force', help="Rebuild the embeddings even if they are up to date",
+                        action='store_true')
+    parser.add_argument('-p', '--processes',
+                        help="Number of processes used to tokenize the texts. By default, one for each core",
+                        type=int, default=None)
 
     args = parser.parse_args()
 
     corpus = args.corpus
     size = args.size
+    force = args.force
+    processes = args.processes
 
     if corpus.lower() == "rct":
-        RCT_routine(size)
+        RCT_routine(size, force, processes)
     elif corpus.lower() == "cdcp":
-        cdcp_routine(size)
+        cdcp_routine(size, force, processes)
     elif corpus.lower() == "drinv":
-        DrInventor_routine(size)
+        DrInventor_routine(size, force, processes)
     elif corpus.lower() == "ukp":
-        UKP_routine(size)
+        UKP_routine(size, force, processes)
     elif corpus.lower() == "scidtb":
-        scidtb_routine(size)
+        scidtb_routine(size, force, processes)
     else:
         print("Datset not yet supported")
 
@@ -0,0 +1,124 @@
+__author__ = "Andrea Galassi"
+__copyright__ = "Copyright 2018-2020 Andrea Galassi"
+__license__ = "BSD 3-clause"
+__version__ = "0.1.0"
+__email__ = "a.galassi@unibo.it"
+
+"""
+Single-file store of the embeddings of the texts or of the propositions of a dataframe.
+Instead of one npz file for each text, the store "<embeddings folder>.npz" contains:
+- ids: the IDs of the texts
+- offsets: the position of the first token of each text in tokens (one more than the texts)
+- tokens: the tokens of all the texts, concatenated, as indices
+- vectors: only for the "embeddings" type, the embeddings of the words used by the texts, each one stored once.
+The tokens are then rows of this matrix. For the "bow" type the tokens are the indices of the words in the vocabulary
+(starting from 1, 0 is the padding).
+"""
+
+import os
+import numpy as np
+
+
+STORE_SUFFIX = ".npz"
+
+
+def get_store_path(embeddings_path):
+    """
+    :param embeddings_path: path of the folder of the embeddings, one file for each text
+    :return: path of the single-file store of the same embeddings
+    """
+    return embeddings_path + STORE_SUFFIX
+
+
+def save_store(store_path, ids, token_lists, vectors=None):
+    """
+    Saves the embeddings of some texts. The file is replaced only when it is completely written.
+    :param store_path: path of the store
+    :param ids: list of the IDs of the texts
+    :param token_lists: list of the tokens of each text, as indices
+    :param vectors: matrix of the embeddings indexed by the tokens. None for the "bow" type
+    :return: None
+    """
+    offsets = np.zeros(len(token_lists) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(tokens) for tokens in token_lists])
+    tokens = np.zeros(offsets[-1], dtype=np.int32)
+    for index in range(len(token_lists)):
+        tokens[offsets[index]:offsets[index + 1]] = token_lists[index]
+
+    arrays = {'ids': np.array([str(text_id) for text_id in ids], dtype=str),
+              'offsets': offsets,
+              'tokens': tokens}
+    if vectors is not None:
+        arrays['vectors'] = np.asarray(vectors, dtype=np.float32)
+
+    folder = os.path.dirname(store_path)
+    if folder != '' and not os.path.exists(folder):
+        os.makedirs(folder)
+    temporary_path = store_path + ".tmp"
+    with open(temporary_path, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(temporary_path, store_path)
+
+
+class EmbeddingsStore(object):
+    """
+    Read-only access to a store: store[text_ID] gives the same array saved in "<text_ID>.npz" by the previous
+    versions of embedder.py
+    """
+
+    def __init__(self, store_path):
+        with np.load(store_path) as data:
+            self.ids = data['ids']
+            self.offsets = data['offsets']
+            self.tokens = data['tokens']
+            self.vectors = data['vectors'] if 'vectors' in data.files else None
+        self.positions = {text_id: position for position, text_id in enumerate(self.ids.tolist())}
+
+    def keys(self):
+        return self.positions.keys()
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, text_id):
+        return str(text_id) in self.positions
+
+    def get_length(self, text_id):
+        position = self.positions[str(text_id)]
+        return int(self.offsets[position + 1] - self.offsets[position])
+
+    def __getitem__(self, text_id):
+        position = self.positions[str(text_id)]
+        tokens = self.tokens[self.offsets[position]:self.offsets[position + 1]]
+        if self.vectors is None:
+            return tokens
+        return self.vectors[tokens]
+
+
+class EmbeddingsFolder(object):
+    """
+    Access to the embeddings saved as one npz file for each text, with the same interface of EmbeddingsStore
+    """
+
+    def __init__(self, embeddings_path):
+        self.embeddings_path = embeddings_path
+
+    def __contains__(self, text_id):
+        return os.path.exists(os.path.join(self.embeddings_path, str(text_id) + ".npz"))
+
+    def get_length(self, text_id):
+        return len(self[text_id])
+
+    def __getitem__(self, text_id):
+        return np.load(os.path.join(self.embeddings_path, str(text_id) + ".npz"))['arr_0']
+
+
+def open_embeddings(embeddings_path):
+    """
+    :param embeddings_path: path of the folder of the embeddings
+    :return: the store of the embeddings if it exists, the folder of the single files otherwise
+    """
+    store_path = get_store_path(embeddings_path)
+    if os.path.exists(store_path):
+        return EmbeddingsStore(store_path)
+    return EmbeddingsFolder(embeddings_path)
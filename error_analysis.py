@@ -0,0 +1,109 @@
+__author__ = "Andrea Galassi"
+__copyright__ = "Copyright 2018-2020 Andrea Galassi"
+__license__ = "BSD 3-clause"
+__version__ = "0.1.0"
+__email__ = "a.galassi@unibo.it"
+
+"""
+Error analysis of the predictions of a network: how many predictions are correct, grouped by
+- link_distance: the distance between the components of the pairs that are links (clipped to the maximum distance)
+- component_length: the number of tokens of the components
+- relation_type: the true type of the relations
+- document_link, document_component: the document of the pairs and of the components
+Each group is counted with a bincount over the grouping array. The results of all the splits and of all the networks
+of an ensemble are collected as rows of a single tidy table.
+"""
+
+import numpy as np
+
+
+ERROR_ANALYSIS_COLUMNS = ['member', 'split', 'analysis', 'group', 'total', 'correct', 'accuracy']
+
+
+def count_groups(groups, correct, num_groups):
+    """
+    :param groups: the group of each prediction, as integers
+    :param correct: whether each prediction is correct
+    :param num_groups: the number of groups
+    :return: the number of predictions and of correct predictions of each group
+    """
+    groups = np.asarray(groups, dtype=np.int64)
+    totals = np.bincount(groups, minlength=num_groups)
+    corrects = np.bincount(groups[np.asarray(correct, dtype=bool)], minlength=num_groups)
+    return totals, corrects
+
+
+def compute_error_analysis(Y_test_links, Y_pred_links, Y_test_rel, Y_pred_rel, Y_test_prop, Y_pred_prop, differences,
+                           component_lengths, pair_documents, component_documents, distance, max_prop_len,
+                           rel_names):
+    """
+    Groups the correct predictions of a split
+    :param Y_test_links: the true link labels (0 is a link)
+    :param Y_pred_links: the predicted link labels
+    :param Y_test_rel: the true relation labels
+    :param Y_pred_rel: the predicted relation labels
+    :param Y_test_prop: the true component labels
+    :param Y_pred_prop: the predicted component labels
+    :param differences: the distance between the components of each pair. If None, the distances are not analysed
+    :param component_lengths: the number of tokens of the component of each component label
+    :param pair_documents: the document ID of each pair
+    :param component_documents: the document ID of each component label
+    :param distance: the maximum distance considered
+    :param max_prop_len: the maximum number of tokens of a component
+    :param rel_names: the name of each relation label
+    :return: a dictionary with, for each analysis, the names of the groups and their numbers of predictions and of
+    correct predictions
+    """
+    analyses = {}
+
+    if differences is not None:
+        true_links = np.asarray(Y_test_links) == 0
+        correct_links = np.equal(Y_test_links, Y_pred_links)[true_links]
+        groups = np.clip(np.asarray(differences)[true_links], -distance, distance) + distance
+        analyses['link_distance'] = (list(range(-distance, distance + 1)),) + count_groups(groups, correct_links,
+                                                                                            distance * 2 + 1)
+
+    analyses['component_length'] = (list(range(max_prop_len + 1)),) + count_groups(component_lengths,
+                                                                                  np.equal(Y_test_prop, Y_pred_prop),
+                                                                                  max_prop_len + 1)
+
+    analyses['relation_type'] = (list(rel_names),) + count_groups(Y_test_rel, np.equal(Y_test_rel, Y_pred_rel),
+                                                                  len(rel_names))
+
+    documents, groups = np.unique(pair_documents, return_inverse=True)
+    analyses['document_link'] = (documents.tolist(),) + count_groups(groups, np.equal(Y_test_links, Y_pred_links),
+                                                                     len(documents))
+
+    documents, groups = np.unique(component_documents, return_inverse=True)
+    analyses['document_component'] = (documents.tolist(),) + count_groups(groups, np.equal(Y_test_prop, Y_pred_prop),
+                                                                          len(documents))
+    return analyses
+
+
+def create_error_rows(member, split, analyses):
+    """
+    :param member: the network that made the predictions (its iteration, or the ensemble)
+    :param split: the split
+    :param analyses: the analyses created by compute_error_analysis
+    :return: the rows of the tidy table, one for each group that contains predictions
+    """
+    rows = []
+    for analysis in sorted(analyses.keys()):
+        names, totals, corrects = analyses[analysis]
+        for index in np.nonzero(totals)[0]:
+            rows.append([str(member), split, analysis, str(names[index]), int(totals[index]), int(corrects[index]),
+                         corrects[index] / totals[index]])
+    return rows
+
+
+def write_error_analysis(table_path, rows):
+    """
+    Writes the tidy, tab-separated table of the error analysis
+    :param table_path: path of the table
+    :param rows: the rows created by create_error_rows
+    :return: None
+    """
+    with open(table_path, 'w') as f:
+        f.write('\t'.join(ERROR_ANALYSIS_COLUMNS) + '\n')
+        for row in rows:
+            f.write('\t'.join([str(value) for value in row[:-1]]) + '\t' + "{:.4f}".format(row[-1]) + '\n')
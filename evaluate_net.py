@@ -12,28 +12,163 @@ import json
 import training
 import argparse
 import krippendorff
+import candidate_generation
 
 from keras.utils.vis_utils import plot_model
-from tensorflow.keras.models import load_model, model_from_json
-from training_utils import get_avgF1
-from sklearn.metrics import f1_score, confusion_matrix, precision_recall_fscore_support, classification_report
+from tensorflow.keras.models import load_model, model_from_json, Model
+from training_utils import (get_custom_objects, get_iterations_number, get_last_weights_path, is_document_model,
+                            create_document_index, create_document_data, unpack_document_predictions)
+from sklearn.metrics import classification_report
+from evaluation_metrics import ConfusionScores
+from bootstrap_evaluation import (get_document_id, create_confusion_tensors, compute_headline_scores, bootstrap_scores,
+                                  compute_confidence_intervals)
+from error_analysis import compute_error_analysis, create_error_rows, write_error_analysis
 from glove_loader import DIM
+from vocabulary_store import load_embedding_matrix
 from scipy import stats
 from dataset_config import dataset_info
-from networks import (create_sum_fn, create_average_fn,
-                      create_count_nonpadding_fn, create_elementwise_division_fn, create_padding_mask_fn,
-                      create_mutiply_negative_elements_fn)
 
 import networks
 
 
 MAXEPOCHS = 1000
 MAXITERATIONS = 20
+ATTENTION_CHUNK_SIZE = 5000
+# document networks score every pair of a document at once, so pruning does not avoid any inference
+DOCUMENT_PRUNING_NOTE = "nothing saved: document networks score all the pairs before pruning"
+
+
+def create_attention_model(model):
+    """
+    Creates a model with the same inputs of a network that outputs the attention weights of the source and of the
+    target propositions, (pairs, tokens, 1). The fused attention layers (MaskedAttentionPooling) do not output their
+    weights: a copy of each one that returns them, with the same weights, is applied to the same inputs.
+    :param model: the network
+    :return: the attention model
+    """
+    layer_names = [layer.name for layer in model.layers]
+    outputs = []
+    for side in ['source', 'target']:
+        if 'att_weights_reshape_' + side in layer_names:
+            outputs.append(model.get_layer('att_weights_reshape_' + side).output)
+        elif ('att_scores_' + side in layer_names and
+              isinstance(model.get_layer('att_scores_' + side), networks.MaskedAttentionPooling)):
+            fused_layer = model.get_layer('att_scores_' + side)
+            attention_layer = networks.MaskedAttentionPooling(return_attention=True, name='att_export_' + side)
+            outputs.append(attention_layer(fused_layer.input)[1])
+            attention_layer.set_weights(fused_layer.get_weights())
+        else:
+            raise Exception('NO ATTENTION LAYER FOR THE ' + side.upper() + ' PROPOSITIONS')
+    return Model(inputs=model.inputs, outputs=outputs)
+
+
+def export_attention(model, X, source_props, target_props, source_lengths, target_lengths, s_ids, t_ids, export_path,
+                     words=None, batch_size=500, chunk_size=ATTENTION_CHUNK_SIZE):
+    """
+    Predicts the attention weights of all the pairs of a split, a chunk of pairs at a time, and saves them in a
+    compressed npz file with:
+    - s_id, t_id, document: the IDs of the propositions and of the document of each pair
+    - source_offsets, target_offsets: the position of the first token of each pair in the following arrays (one more
+    than the pairs)
+    - source_attention, target_attention: the weights of the tokens of all the pairs, concatenated, without padding
+    - source_tokens, target_tokens: the tokens, aligned to the weights. Only for the "bow" features
+    - words: the words of the vocabulary, indexed by the tokens (0 is the padding). Only if given
+    :param model: the network
+    :param X: the inputs of the network
+    :param source_props: the padded source propositions
+    :param target_props: the padded target propositions
+    :param source_lengths: the number of tokens of each source proposition
+    :param target_lengths: the number of tokens of each target proposition
+    :param s_ids: the source ID of each pair
+    :param t_ids: the target ID of each pair
+    :param export_path: path of the file
+    :param words: the words of the vocabulary, indexed by the tokens
+    :param batch_size: size of the batches used for the prediction
+    :param chunk_size: number of pairs predicted at a time
+    :return: None
+    """
+    attention_model = create_attention_model(model)
+
+    source_lengths = np.asarray(source_lengths, dtype=np.int64)
+    target_lengths = np.asarray(target_lengths, dtype=np.int64)
+    max_prop_len = source_props.shape[1]
+    # the propositions are padded on the left: their tokens are the last positions
+    source_real = np.arange(max_prop_len) >= max_prop_len - source_lengths[:, None]
+    target_real = np.arange(max_prop_len) >= max_prop_len - target_lengths[:, None]
+
+    source_attention = []
+    target_attention = []
+    for start in range(0, len(s_ids), chunk_size):
+        chunk = [inputs[start:start + chunk_size] for inputs in X]
+        source_weights, target_weights = attention_model.predict(chunk, batch_size=batch_size)
+        source_weights = np.reshape(source_weights, source_real[start:start + chunk_size].shape)
+        target_weights = np.reshape(target_weights, target_real[start:start + chunk_size].shape)
+        source_attention.append(source_weights[source_real[start:start + chunk_size]])
+        target_attention.append(target_weights[target_real[start:start + chunk_size]])
+
+    arrays = {'s_id': np.array(s_ids, dtype=str),
+              't_id': np.array(t_ids, dtype=str),
+              'document': np.array([str(s_id).rsplit('_', 1)[0] for s_id in s_ids], dtype=str),
+              'source_offsets': np.concatenate([[0], np.cumsum(source_lengths)]),
+              'target_offsets': np.concatenate([[0], np.cumsum(target_lengths)]),
+              'source_attention': np.concatenate(source_attention).astype(np.float32),
+              'target_attention': np.concatenate(target_attention).astype(np.float32)}
+    if np.ndim(source_props) == 2:
+        arrays['source_tokens'] = np.asarray(source_props)[source_real].astype(np.int32)
+        arrays['target_tokens'] = np.asarray(target_props)[target_real].astype(np.int32)
+    if words is not None:
+        arrays['words'] = np.asarray(words, dtype=str)
+
+    with open(export_path, "wb") as f:
+        np.savez_compressed(f, **arrays)
+    print(str(time.ctime()) + "\t\tATTENTION OF " + str(len(s_ids)) + " PAIRS EXPORTED: " + export_path)
+
+
+def load_attention(export_path, document=None):
+    """
+    Reads the attention weights exported by export_attention
+    :param export_path: path of the file
+    :param document: the ID of a document. If None, all the pairs are read
+    :return: a list with a dictionary for each pair of the document: the IDs of the propositions, and for each
+    proposition the weights and, if they were exported, the tokens and the words
+    """
+    pairs = []
+    with np.load(export_path) as data:
+        indices = range(len(data['s_id']))
+        if document is not None:
+            indices = np.nonzero(data['document'] == str(document))[0]
+        arrays = {name: data[name] for name in data.files}
+
+    for index in indices:
+        pair = {'s_id': str(arrays['s_id'][index]), 't_id': str(arrays['t_id'][index])}
+        for side in ['source', 'target']:
+            start = arrays[side + '_offsets'][index]
+            end = arrays[side + '_offsets'][index + 1]
+            pair[side + '_attention'] = arrays[side + '_attention'][start:end]
+            if side + '_tokens' in arrays:
+                pair[side + '_tokens'] = arrays[side + '_tokens'][start:end]
+                if 'words' in arrays:
+                    pair[side + '_words'] = arrays['words'][pair[side + '_tokens']].tolist()
+        pairs.append(pair)
+    return pairs
 
 
 def perform_evaluation(netfolder, dataset_name, dataset_version, feature_type='bow', retrocompatibility=False, distance=5,
                        ensemble=None, ensemble_top_n=1.00, ensemble_top_criterion="link", token_wise=False, error_analysis=False,
-                       visualize_attention=False, embed_name="glove300"):
+                       visualize_attention=False, embed_name="glove300", candidate_generator=None, bootstrap=0,
+                       bootstrap_seed=0, processes=None):
+    """
+    Evaluates all the iterations of a trained network (and their ensemble) on a dataset version
+    :param visualize_attention: whether to export the attention weights of each iteration on each split (see
+    export_attention)
+    :param bootstrap: number of resamples of the documents used to compute the 95% confidence intervals of the final
+    scores (see bootstrap_evaluation). If 0, they are not computed
+    :param bootstrap_seed: seed of the resamples. Networks evaluated with the same seed can be compared resample by
+    resample
+    :param processes: number of processes used for the bootstrap. If None, the number of CPUs
+    :param candidate_generator: optional candidate function (see candidate_generation). The pairs that it prunes are
+    not given to the network and are considered non-links
+    """
     return_value = 0
 
     # name of the network
@@ -68,13 +203,10 @@ def perform_evaluation(netfolder, dataset_name, dataset_version, feature_type='b
 
 
     # for token-wise evaluation, memorize the number of tokens in each proposition
+    # (their lengths in the embeddings store, read by load_dataset)
     num_of_tokens = {}
     for split in ['train', 'test', 'validation']:
-        for index in range(len(dataset[split]['t_id'])):
-            prop_id = dataset[split]['t_id'][index]
-            if prop_id not in num_of_tokens.keys():
-                target_prop = dataset[split]['target_props'][index]
-                num_of_tokens[prop_id] = len(target_prop) - len(np.where(target_prop == 0)[0])
+        num_of_tokens.update(zip(dataset[split]['t_id'], dataset[split]['target_lengths'].tolist()))
 
     print(str(time.ctime()) + "\tDATASET LOADED...")
 
@@ -225,56 +357,8 @@ def perform_evaluation(netfolder, dataset_name, dataset_version, feature_type='b
     not_a_link_labels = this_ds_info["link_as_sum"][1]
 
 
-    fmeasure_0 = get_avgF1([0])
-    fmeasure_1 = get_avgF1([1])
-    fmeasure_2 = get_avgF1([2])
-    fmeasure_3 = get_avgF1([3])
-    fmeasure_4 = get_avgF1([4])
-    fmeasure_0_1_2_3 = get_avgF1([0, 1, 2, 3])
-    fmeasure_0_1_2_3_4 = get_avgF1([0, 1, 2, 3, 4])
-    fmeasure_0_2 = get_avgF1([0, 2])
-    fmeasure_0_1_2 = get_avgF1([0, 1, 2])
-    fmeasure_0_1 = get_avgF1([0, 1, 2])
-
-    fmeasures = [fmeasure_0, fmeasure_1, fmeasure_2, fmeasure_3, fmeasure_4, fmeasure_0_1_2_3, fmeasure_0_1_2_3_4,
-                 fmeasure_0_2, fmeasure_0_1_2, fmeasure_0_1]
-
-    # for using them during model loading
-    custom_objects = {}
-    for fmeasure in fmeasures:
-        custom_objects[fmeasure.__name__] = fmeasure
-
-    crop0 = networks.create_crop_fn(1, 0, 1)
-    crop1 = networks.create_crop_fn(1, 1, 2)
-    crop2 = networks.create_crop_fn(1, 2, 3)
-    crop3 = networks.create_crop_fn(1, 3, 4)
-    crop4 = networks.create_crop_fn(1, 4, 5)
-
-    crops = [crop0, crop1, crop2, crop3, crop4]
-    for crop in crops:
-        custom_objects[crop.__name__] = crop
-
-
     # for using them during model loading
-    custom_objects = {}
-    for fmeasure in fmeasures:
-        custom_objects[fmeasure.__name__] = fmeasure
-
-    for crop in crops:
-        custom_objects[crop.__name__] = crop
-
-    mean_fn = create_average_fn(1)
-    sum_fn = create_sum_fn(1)
-    division_fn = create_elementwise_division_fn()
-    pad_fn = create_count_nonpadding_fn(1, (DIM,))
-    padd_fn = create_padding_mask_fn()
-    neg_fn = create_mutiply_negative_elements_fn()
-    custom_objects[mean_fn.__name__] = mean_fn
-    custom_objects[sum_fn.__name__] = sum_fn
-    custom_objects[division_fn.__name__] = division_fn
-    custom_objects[pad_fn.__name__] = pad_fn
-    custom_objects[padd_fn.__name__] = padd_fn
-    custom_objects[neg_fn.__name__] = neg_fn
+    custom_objects = get_custom_objects()
 
 
     save_dir = os.path.join(netfolder)
@@ -302,64 +386,69 @@ def perform_evaluation(netfolder, dataset_name, dataset_version, feature_type='b
 
     model.summary()
 
-    iterations = MAXITERATIONS
-    file_names = os.listdir(netfolder)
-    found = False
-
     # determine the number of iterations
-    for iteration in range(iterations, 0, -1):
-        net_file_name = (netname + "_" + str(iteration) + '_weights')
-        for name in file_names:
-            if net_file_name in name:
-                found = True
-                break
-        if found:
-            iterations = iteration
-            break
+    iterations = get_iterations_number(netfolder, netname, MAXITERATIONS)
 
     X = None
     Y = None
+    document_index = None
+    candidate_masks = None
+    attention_words = None
+
+    # for the bootstrap: the documents of each split, and the confusion matrices of each document for each iteration
+    bootstrap_documents = {}
+    bootstrap_tensors = {"train": [], "test": [], "validation": []}
+    candidate_report = ""
 
     components_id_list = {}
     components_id_list["train"] = []
     components_id_list["test"] = []
     components_id_list["validation"] = []
+    # number of tokens of each component of components_id_list, for the token-wise evaluation
+    components_tokens = {}
 
-    def create_report(Y_test_links, Y_pred_links, Y_test_rel, Y_pred_rel, Y_test_prop_real, Y_pred_prop_real, split, error_analysis):
+    # rows of the error analysis of all the splits and networks
+    error_rows = []
+
+    def create_report(Y_test_links, Y_pred_links, Y_test_rel, Y_pred_rel, Y_test_prop_real, Y_pred_prop_real, split, error_analysis,
+                      member):
 
         report = ""
 
+        # each confusion matrix is counted once, all the scores derive from it
+        link_scores = ConfusionScores(Y_test_links, Y_pred_links)
+        rel_scores = ConfusionScores(Y_test_rel, Y_pred_rel)
+        prop_scores = ConfusionScores(Y_test_prop_real, Y_pred_prop_real)
+
         # F1s
-        score_f1_link = f1_score(Y_test_links, Y_pred_links, average=None, labels=[0])
-        score_f1_rel = f1_score(Y_test_rel, Y_pred_rel, average=None, labels=relations_labels)
-        score_f1_rel_AVGM = f1_score(Y_test_rel, Y_pred_rel, average='macro', labels=relations_labels)
-        score_f1_non_link = f1_score(Y_test_links, Y_pred_links, average=None, labels=[1])
+        score_f1_link = link_scores.f1_score(average=None, labels=[0])
+        score_f1_rel = rel_scores.f1_score(average=None, labels=relations_labels)
+        score_f1_rel_AVGM = rel_scores.f1_score(average='macro', labels=relations_labels)
+        score_f1_non_link = link_scores.f1_score(average=None, labels=[1])
 
-        score_f1_rel_completeM = f1_score(Y_test_rel, Y_pred_rel, average='macro')
-        score_f1_non_rel = f1_score(Y_test_rel, Y_pred_rel, average=None, labels=[not_a_link_labels[-1]])
+        score_f1_rel_completeM = rel_scores.f1_score(average='macro')
+        score_f1_non_rel = rel_scores.f1_score(average=None, labels=[not_a_link_labels[-1]])
 
-        score_f1_prop_real = f1_score(Y_test_prop_real, Y_pred_prop_real, average=None)
-        score_f1_prop_AVGM_real = f1_score(Y_test_prop_real, Y_pred_prop_real, average='macro')
-        score_f1_prop_AVGm_real = f1_score(Y_test_prop_real, Y_pred_prop_real, average='micro')
+        score_f1_prop_real = prop_scores.f1_score(average=None)
+        score_f1_prop_AVGM_real = prop_scores.f1_score(average='macro')
+        score_f1_prop_AVGm_real = prop_scores.f1_score(average='micro')
 
         score_f1_AVG_LP_real = np.mean([score_f1_link, score_f1_prop_AVGM_real])
         score_f1_AVG_all_real = np.mean([score_f1_link, score_f1_prop_AVGM_real, score_f1_rel_AVGM])
 
         # Precision-recall-fscore-support
-        score_prfs_prop = precision_recall_fscore_support(Y_test_prop_real, Y_pred_prop_real, average=None)
+        score_prfs_prop = prop_scores.precision_recall_fscore_support(average=None)
         score_prec_prop = score_prfs_prop[0]
         score_rec_prop = score_prfs_prop[1]
         score_fscore_prop = score_prfs_prop[2]
         score_supp_prop = score_prfs_prop[3]
 
-        score_prfs_prop_AVGM = precision_recall_fscore_support(Y_test_prop_real, Y_pred_prop_real,
-                                                               average='macro')
+        score_prfs_prop_AVGM = prop_scores.precision_recall_fscore_support(average='macro')
         score_prec_prop_AVGM = score_prfs_prop_AVGM[0]
         score_rec_prop_AVGM = score_prfs_prop_AVGM[1]
         score_fscore_prop_AVGM = score_prfs_prop_AVGM[2]
 
-        score_prfs_prop_AVGm = precision_recall_fscore_support(Y_test_prop_real, Y_pred_prop_real,
-                                                               average='micro')
+        score_prfs_prop_AVGm = prop_scores.precision_recall_fscore_support(average='micro')
         score_prec_prop_AVGm = score_prfs_prop_AVGm[0]
         score_rec_prop_AVGm = score_prfs_prop_AVGm[1]
         score_fscore_prop_AVGm = score_prfs_prop_AVGm[2]
@@ -448,11 +537,11 @@ def perform_evaluation(netfolder, dataset_name, dataset_version, feature_type='b
         report += "\n"
 
         # CONFUSION MATRICES (the code for normalized matrices is in comment cause it requires python
-        confusion_link = confusion_matrix(Y_test_links, Y_pred_links)
+        confusion_link = link_scores.confusion_matrix()
         # confusion_link2 = confusion_matrix(Y_test_links, Y_pred_links, normalize='true')
-        confusion_rel = confusion_matrix(Y_test_rel, Y_pred_rel)
+        confusion_rel = rel_scores.confusion_matrix()
         # confusion_rel2 = confusion_matrix(Y_test_rel, Y_pred_rel, normalize='true')
-        confusion_prop_real = confusion_matrix(Y_test_prop_real, Y_pred_prop_real)
+        confusion_prop_real = prop_scores.confusion_matrix()
         # confusion_prop_real2 = confusion_matrix(Y_test_prop_real, Y_pred_prop_real, normalize='true')
         report += "\n\nlink\n"
         report += str(confusion_link)
@@ -471,75 +560,44 @@ def perform_evaluation(netfolder, dataset_name, dataset_version, feature_type='b
 
         if error_analysis:
             # error analysis
+            # the pairs are evaluated without the reflexive ones, the components are sorted as in components_id_list
+            not_reflexive = np.array(dataset[split]['s_id']) != np.array(dataset[split]['t_id'])
+            pair_documents = np.array([get_document_id(sid) for sid in dataset[split]['s_id']])[not_reflexive]
+            differences = None
+            if distance > 0:
+                differences = np.array(dataset[split]['difference'])[not_reflexive]
+
+            component_documents = np.array([get_document_id(p_id) for p_id in components_id_list[split]])
+            component_lengths = np.array([num_of_tokens[p_id] for p_id in components_id_list[split]], dtype=np.int64)
+            if token_wise:
+                component_documents = np.repeat(component_documents, components_tokens[split])
+                component_lengths = np.repeat(component_lengths, components_tokens[split])
+
+            analyses = compute_error_analysis(Y_test_links, Y_pred_links, Y_test_rel, Y_pred_rel, Y_test_prop_real,
+                                              Y_pred_prop_real, differences, component_lengths, pair_documents,
+                                              component_documents, distance, max_prop_len, this_ds_info["rel_types"])
+            error_rows.extend(create_error_rows(member, split, analyses))
+
             error_analysis_string = ""
-            length_corrects = [0] * (max_prop_len + 1)
-            length_total = [0] * (max_prop_len + 1)
-            length_norm = [0] * (max_prop_len + 1)
-
-            correct_predictions_comp = np.equal(Y_test_prop_real, Y_pred_prop_real)
-            for index in range(len(correct_predictions_comp)):
-                comp_id = components_id_list[split][index]
-                length = num_of_tokens[comp_id]
-                if correct_predictions_comp[index]:
-                    length_corrects[length] += 1
-                length_total[length] += 1
-
-            for index in range(max_prop_len+1):
-                if length_total[index] > 0:
-                    length_norm[index] = length_corrects[index] / length_total[index]
-                else:
-                    length_norm[index] = -99
-                    length_corrects[index] = -99
-
-            error_analysis_string += "Comp length\t"
-            error_analysis_string += "\t".join(map(str, range(max_prop_len + 1)))
-            # error_analysis_string += "\ttotal"
-            error_analysis_string += "\nComp number\t"
-            error_analysis_string += "\t".join(map(str, length_total))
-            # error_analysis_string += "\t" + str(sum(length_total))
-            error_analysis_string += "\nComp correctness\t"
-            error_analysis_string += "\t".join(map(str, length_corrects))
-            # error_analysis_string += "\t" + str(sum(length_corrects))
-            error_analysis_string += "\nComp norm\t"
-            error_analysis_string += "\t".join(map(str, length_norm))
-
-            correct_predictions_link = np.equal(Y_test_links, Y_pred_links)
-            truelink = np.equal(Y_test_links, [0]*len(Y_test_links))
-            difference_corrects = [0] * (distance*2 + 1)
-            difference_total = [0] * (distance*2 + 1)
-            difference_norm = [0] * (distance*2 + 1)
-            differences = dataset[split]['difference']
-
-            for index in range(len(correct_predictions_link)):
-                difference = differences[index]
-                if difference > distance:
-                    difference = distance
-                elif difference < -distance:
-                    difference = -distance
-                difference += 5
-                if truelink[index]:
-                    if correct_predictions_link[index]:
-                        difference_corrects[difference] += 1
-                    difference_total[difference] += 1
-
-            for index in range(distance*2 + 1):
-                if difference_total[index] > 0:
-                    difference_norm[index] = difference_corrects[index] / difference_total[index]
+            histograms = [("Comp", "component_length")]
+            if differences is not None:
+                histograms.append(("Link", "link_distance"))
+            for title, analysis in histograms:
+                names, totals, corrects = analyses[analysis]
+                # -99 marks the empty groups
+                norm = np.divide(corrects, totals, out=np.full(len(totals), -99.0), where=totals > 0)
+                corrects = np.where(totals > 0, corrects, -99)
+                if title == "Link":
+                    error_analysis_string += "\n\nLink distance\t"
                 else:
-                    difference_norm[index] = -99
-                    difference_corrects[index] = -99
-
-            error_analysis_string += "\n\nLink distance\t"
-            error_analysis_string += "\t".join(map(str, range(-distance, distance+1)))
-            # error_analysis_string += "\ttotal"
-            error_analysis_string += "\nLink number\t"
-            error_analysis_string += "\t".join(map(str, difference_total))
-            # error_analysis_string += "\t" + str(sum(difference_total))
-            error_analysis_string += "\nLink correctness\t"
-            error_analysis_string += "\t".join(map(str, difference_corrects))
-            # error_analysis_string += "\t" + str(sum(difference_corrects))
-            error_analysis_string += "\nLink norm\t"
-            error_analysis_string += "\t".join(map(str, difference_norm))
+                    error_analysis_string += "Comp length\t"
+                error_analysis_string += "\t".join(map(str, names))
+                error_analysis_string += "\n" + title + " number\t"
+                error_analysis_string += "\t".join(map(str, totals.tolist()))
+                error_analysis_string += "\n" + title + " correctness\t"
+                error_analysis_string += "\t".join(map(str, corrects.tolist()))
+                error_analysis_string += "\n" + title + " norm\t"
+                error_analysis_string += "\t".join(map(str, norm.tolist()))
             error_analysis_string += "\n\n"
 
             report += error_analysis_string
@@ -553,25 +611,15 @@ def perform_evaluation(netfolder, dataset_name, dataset_version, feature_type='b
         sys.stdout.flush()
 
         # explore all the possible epochs to fine the last one (the first one found)
-        last_epoch = MAXEPOCHS
-        last_path = ""
+        last_path = get_last_weights_path(netfolder, netname, iteration, MAXEPOCHS, save_weights_only)
+
+        if last_path != "":
+            print(str(time.ctime()) + "\tLOADING NETWORK: " + last_path)
 
-        for epoch in range(last_epoch, 0, -1):
             if save_weights_only:
-                netpath = os.path.join(netfolder, netname + "_" + str(iteration) + '_weights.%03d.h5' % epoch)
+                model.load_weights(last_path)
             else:
-                netpath = os.path.join(netfolder, netname + "_" + str(iteration) + '_completemodel.%03d.h5' % epoch)
-
-            if os.path.exists(netpath):
-                last_path = netpath
-
-                print(str(time.ctime()) + "\tLOADING NETWORK: " + last_path)
-
-                if save_weights_only:
-                    model.load_weights(last_path)
-                else:
-                    model = load_model(last_path, custom_objects=custom_objects)
-                break
+                model = load_model(last_path, custom_objects=custom_objects)
 
 
         if X == None:
@@ -588,11 +636,48 @@ def perform_evaluation(netfolder, dataset_name, dataset_version, feature_type='b
                  'train': Y_train,
                  'validation': Y_validation}
 
+            # document networks receive the pairs packed into documents
+            if is_document_model(model):
+                X3 = {'test': X3_test,
+                      'train': X3_train,
+                      'validation': X3_validation}
+                max_components = model.input_shape[0][1]
+                document_index = {}
+                for split in ['test', 'validation', 'train']:
+                    if len(dataset[split]['s_id']) > 0:
+                        document_index[split] = create_document_index(dataset[split]['s_id'],
+                                                                      dataset[split]['t_id'])
+                        X[split], _, _ = create_document_data(X3[split][0], X3[split][1], Y[split],
+                                                              document_index[split], distance, max_components)
+
+        if candidate_generator is not None and candidate_generator.uses_predictions:
+            # the masks depend on the predictions of each network: they are created after the prediction of each split
+            candidate_masks = {}
+            candidate_report = "CANDIDATE GENERATION\t" + candidate_generator.__name__ + "\n"
+        elif candidate_generator is not None and candidate_masks is None:
+            print(str(time.ctime()) + "\tGENERATING CANDIDATE PAIRS: " + candidate_generator.__name__)
+            candidate_masks = {}
+            candidate_report = "CANDIDATE GENERATION\t" + candidate_generator.__name__ + "\n"
+            for split in ['test', 'validation', 'train']:
+                if len(dataset[split]['s_id']) > 0:
+                    candidate_masks[split] = candidate_generation.create_candidate_mask(candidate_generator,
+                                                                                        dataset, split)
+                    if document_index is not None:
+                        # the whole matrix is scored anyway: nothing is saved at inference time
+                        candidate_report += candidate_generation.create_pruning_report(
+                            candidate_masks[split], Y[split][0], split, scored=len(candidate_masks[split]),
+                            note=DOCUMENT_PRUNING_NOTE)
+                    else:
+                        candidate_report += candidate_generation.create_pruning_report(candidate_masks[split],
+                                                                                       Y[split][0], split)
+            print(candidate_report)
+
         if training.DEBUG:
             plot_model(model, netname + ".png", show_shapes=True)
 
         if last_path == "":
-            print("ERROR! NO NETWORK LOADED!\n\tExpected example of network name: " + str(netpath))
+            print("ERROR! NO NETWORK LOADED!\n\tExpected example of network name: " +
+                  os.path.join(netfolder, netname + "_" + str(iteration) + '_weights.%03d.h5' % MAXEPOCHS))
             exit(1)
 
         print("\n\n\tLOADED NETWORK: " + last_path + "\n")
@@ -612,6 +697,8 @@ def perform_evaluation(netfolder, dataset_name, dataset_version, feature_type='b
             testfile.write("COMPONENT-WISE EVALUATION")
         testfile.write("\n")
 
+        testfile.write(candidate_report)
+
         testfile.write(evaluation_headline)
 
         print(evaluation_headline)
@@ -620,56 +707,74 @@ def perform_evaluation(netfolder, dataset_name, dataset_version, feature_type='b
 
         for split in ['test', 'validation', 'train']:
 
-            # TODO: see if this works!
-            if visualize_attention:
-
-                dataset_path = os.path.join(os.getcwd(), 'Datasets', dataset_name)
-                vocabulary_path = os.path.join(dataset_path, 'resources', embed_name, dataset_version,
-                                               'glove.embeddings.npz')
-                if not os.path.exists(vocabulary_path):
-                    vocabulary_path = os.path.join(dataset_path, 'resources', embed_name, 'glove.embeddings.npz')
-                vocabulary_list = np.load(vocabulary_path)
-                embed_list = vocabulary_list['embeds']
-                word_list = vocabulary_list['vocab']
-
-                source_attention_layer = model.get_layer("att_weights_reshape_source")
-                target_attention_layer = model.get_layer("att_weights_reshape_target")
-                source_scores = source_attention_layer(X[split][0:1])
-                target_scores = target_attention_layer(X[split][0:1])
-
-                source_sentences = []
-                target_sentences = []
-
-                for instance in X[split][0:1][0]:
-                    sentence = []
-                    for index in instance:
-                        word = word_list[index]
-                        sentence.append(word)
-                    source_sentences.append(sentence)
-
-                for instance in X[split][0:1][1]:
-                    sentence = []
-                    for index in instance:
-                        word = word_list[index]
-                        sentence.append(word)
-                    target_sentences.append(sentence)
-
-                for index in range(len(source_sentences)):
-                    print(str(source_sentences[index]))
-                    print(str(source_scores[index]))
-                    print(str(target_sentences[index]))
-                    print(str(target_scores[index]))
-                exit()
-
-
-            if len(X[split][0]) <= 1:
+            if len(dataset[split]['s_id']) <= 1:
                 continue
 
+            if visualize_attention:
+                if document_index is not None:
+                    raise Exception('ATTENTION EXPORT IS NOT AVAILABLE FOR DOCUMENT NETWORKS')
+
+                # the words of the vocabulary, to read the exported tokens
+                if attention_words is None and feature_type == 'bow':
+                    dataset_path = os.path.join(os.getcwd(), 'Datasets', dataset_name)
+                    vocabulary_path = os.path.join(dataset_path, 'resources', embed_name, dataset_version,
+                                                   'glove.embeddings.npz')
+                    if not os.path.exists(vocabulary_path):
+                        vocabulary_path = os.path.join(dataset_path, 'resources', embed_name, 'glove.embeddings.npz')
+                    with np.load(vocabulary_path) as vocabulary_list:
+                        attention_words = np.concatenate([[''], vocabulary_list['vocab']])
+
+                source_index = 1 if retrocompatibility else 0
+                export_attention(model, X[split], X[split][source_index], X[split][source_index + 1],
+                                 dataset[split]['source_lengths'], dataset[split]['target_lengths'],
+                                 dataset[split]['s_id'], dataset[split]['t_id'],
+                                 os.path.join(netfolder, netname + "_" + str(iteration) + "_" + split + "_attention.npz"),
+                                 attention_words)
+
             # 2 dim
             # ax0 = samples
             # ax1 = classes
 
-            Y_pred = model.predict(X[split])
+            uses_predictions = candidate_generator is not None and candidate_generator.uses_predictions
+            split_report = None
+            if document_index is not None:
+                # the whole matrix is scored anyway: the pruned pairs are discarded after the prediction
+                Y_pred = unpack_document_predictions(model.predict(X[split]), document_index[split])
+                if uses_predictions:
+                    candidate_masks[split] = candidate_generation.create_candidate_mask(candidate_generator, dataset,
+                                                                                        split, predictions=Y_pred)
+                    split_report = candidate_generation.create_pruning_report(
+                        candidate_masks[split], Y[split][0], split, scored=len(candidate_masks[split]),
+                        note=DOCUMENT_PRUNING_NOTE)
+                if candidate_masks is not None:
+                    Y_pred = candidate_generation.expand_pruned_predictions(
+                        candidate_generation.prune_inputs(Y_pred, candidate_masks[split]),
+                        candidate_masks[split], not_a_link_labels[-1])
+            elif uses_predictions:
+                # the component types come from a pre-pass on the closest pair of each component
+                prepass_mask = candidate_generation.create_prepass_mask(dataset, split)
+                Y_prepass = model.predict(candidate_generation.prune_inputs(X[split], prepass_mask))
+                Y_prepass = candidate_generation.expand_pruned_predictions(Y_prepass, prepass_mask,
+                                                                           not_a_link_labels[-1])
+                candidate_masks[split] = candidate_generation.create_candidate_mask(candidate_generator, dataset,
+                                                                                    split, predictions=Y_prepass)
+                Y_pred = model.predict(candidate_generation.prune_inputs(X[split], candidate_masks[split]))
+                Y_pred = candidate_generation.expand_pruned_predictions(Y_pred, candidate_masks[split],
+                                                                        not_a_link_labels[-1])
+                scored = int(np.sum(prepass_mask)) + int(np.sum(candidate_masks[split]))
+                split_report = candidate_generation.create_pruning_report(candidate_masks[split], Y[split][0], split,
+                                                                          scored=scored)
+            elif candidate_masks is not None:
+                Y_pred = model.predict(candidate_generation.prune_inputs(X[split], candidate_masks[split]))
+                Y_pred = candidate_generation.expand_pruned_predictions(Y_pred, candidate_masks[split],
+                                                                        not_a_link_labels[-1])
+            else:
+                Y_pred = model.predict(X[split])
+
+            if split_report is not None:
+                candidate_report += split_report
+                testfile.write(split_report)
+                print(split_report)
 
             # every proposition is evaluated multiple times. all these evaluation must be merged together.
             # merging is performed choosing the class that has received the highest probability score summing all the cases
@@ -712,6 +817,8 @@ def perform_evaluation(netfolder, dataset_name, dataset_version, feature_type='b
             if len(components_id_list[split]) == 0:
                 for p_id in sorted(t_pred_scores.keys()):
                     components_id_list[split].append(p_id)
+                components_tokens[split] = np.array([num_of_tokens[p_id] for p_id in components_id_list[split]],
+                                                    dtype=np.int64)
 
             # merges sources and targets
             for p_id in sorted(t_pred_scores.keys()):
@@ -762,26 +869,10 @@ def perform_evaluation(netfolder, dataset_name, dataset_version, feature_type='b
                     print("ERROR!!! Components_id_list must be as long as the list of the predictions!!!")
                     sys.exit(40)
 
-                Y_pred_scores_tok_real = []
-                Y_pred_tok_real = []
-                Y_test_tok_real = []
-
-                # expand each element for the number of tokens
-                for index in range(len(components_id_list[split])):
-                    id_prop = components_id_list[split][index]
-                    prop_pred = Y_pred_prop_real[index]
-                    prop_test = Y_test_prop_real[index]
-                    prop_score = Y_pred_scores_prop_real[index]
-                    tokens = num_of_tokens[id_prop]
-                    for j in range(tokens):
-                        Y_pred_scores_tok_real.append(prop_score)
-                        Y_pred_tok_real.append(prop_pred)
-                        Y_test_tok_real.append(prop_test)
-
-                # overwrite previous arrays
-                Y_pred_scores_prop_real = np.array(Y_pred_scores_tok_real)
-                Y_pred_prop_real = np.array(Y_pred_tok_real)
-                Y_test_prop_real = np.array(Y_test_tok_real)
+                # expand each element for the number of tokens, overwriting the previous arrays
+                Y_pred_scores_prop_real = np.repeat(Y_pred_scores_prop_real, components_tokens[split], axis=0)
+                Y_pred_prop_real = np.repeat(Y_pred_prop_real, components_tokens[split], axis=0)
+                Y_test_prop_real = np.repeat(Y_test_prop_real, components_tokens[split], axis=0)
 
 
             Y_pred_scores_links = Y_pred[0]
@@ -824,9 +915,23 @@ def perform_evaluation(netfolder, dataset_name, dataset_version, feature_type='b
 
             # predictions computed! Computing measures!
 
-            shortrep, report = create_report(Y_test_links, Y_pred_links, Y_test_rel, Y_pred_rel, Y_test_prop_real, Y_pred_prop_real, split, error_analysis)
+            shortrep, report = create_report(Y_test_links, Y_pred_links, Y_test_rel, Y_pred_rel, Y_test_prop_real, Y_pred_prop_real, split, error_analysis,
+                                             iteration)
             extensive_report += report
 
+            if bootstrap > 0:
+                pair_documents = np.delete(np.array([get_document_id(sid) for sid in sids]), reflexive)
+                component_documents = np.array([get_document_id(p_id) for p_id in components_id_list[split]])
+                if token_wise:
+                    component_documents = np.repeat(component_documents, components_tokens[split])
+                if split not in bootstrap_documents:
+                    bootstrap_documents[split] = np.unique(np.concatenate([pair_documents, component_documents]))
+                bootstrap_tensors[split].append(create_confusion_tensors(Y_test_links, Y_pred_links, Y_test_rel,
+                                                                         Y_pred_rel, Y_test_prop_real,
+                                                                         Y_pred_prop_real, pair_documents,
+                                                                         component_documents,
+                                                                         bootstrap_documents[split], output_units))
+
             testfile.write(shortrep)
             testfile.write("\n")
 
@@ -862,6 +967,8 @@ def perform_evaluation(netfolder, dataset_name, dataset_version, feature_type='b
         testfile.write("COMPONENT-WISE EVALUATION")
     testfile.write("\n")
 
+    testfile.write(candidate_report)
+
     testfile.write(evaluation_headline)
     print(evaluation_headline)
     extensive_report = ""
@@ -881,6 +988,44 @@ def perform_evaluation(netfolder, dataset_name, dataset_version, feature_type='b
             sys.stdout.flush()
             testfile.flush()
 
+    if bootstrap > 0:
+        print(str(time.ctime()) + "\t\tBOOTSTRAP CONFIDENCE INTERVALS")
+        testfile.write("\nBOOTSTRAP 95% CONFIDENCE INTERVALS: " + str(bootstrap) + " RESAMPLES OF THE DOCUMENTS, SEED "
+                       + str(bootstrap_seed) + "\n")
+        bootstrap_arrays = {'seed': bootstrap_seed, 'resamples': bootstrap}
+
+        for split in ['test', 'validation', 'train']:
+            if len(bootstrap_tensors[split]) == 0:
+                continue
+
+            # the scores of the whole split (every document taken once) should be the ones of the evaluation
+            full_split = np.ones((1, len(bootstrap_documents[split])))
+            split_scores = np.mean([compute_headline_scores(tensors, relations_labels, not_a_link_labels[-1],
+                                                            full_split)[0]
+                                    for tensors in bootstrap_tensors[split]], axis=0)
+            if not np.allclose(split_scores, np.average(np.array(final_scores[split], ndmin=2), axis=0),
+                               equal_nan=True):
+                print(str(time.ctime()) + "\tWARNING: BOOTSTRAP SCORES DIFFERENT FROM THE EVALUATION ON " +
+                      split.upper())
+
+            split_resamples = bootstrap_scores(bootstrap_tensors[split], relations_labels, not_a_link_labels[-1],
+                                               bootstrap, bootstrap_seed, processes)
+            bootstrap_arrays[split + '_scores'] = split_resamples
+            bootstrap_arrays[split + '_documents'] = bootstrap_documents[split]
+
+            for name, bound in zip(['_low', '_high'], compute_confidence_intervals(split_resamples)):
+                string = split + name
+                for value in bound:
+                    string += "\t" + ("{:10.4f}".format(value)).replace(" ", "")
+
+                testfile.write(string + "\n")
+                print(string)
+
+        np.savez(os.path.join(file_folder, os.path.pardir, netname + "_" + dataset_version + "_bootstrap.npz"),
+                 **bootstrap_arrays)
+        sys.stdout.flush()
+        testfile.flush()
+
     # ENSEMBLE SCORE
     # TODO: implement ensemble score consideration
     # REMEMBER THAT not-link relation votes have been merged, but the scores have not
@@ -955,7 +1100,7 @@ def perform_evaluation(netfolder, dataset_name, dataset_version, feature_type='b
                 Y_test_rel = ensemble_rel_truth[split]
 
                 shortrep, report = create_report(Y_test_links, Y_pred_links, Y_test_rel, Y_pred_rel, Y_test_prop_real,
-                                                 Y_pred_prop_real, split, error_analysis)
+                                                 Y_pred_prop_real, split, error_analysis, "ensemble")
 
 
                 report += "\n\nkrippendorff's alpha\n"
@@ -981,6 +1126,11 @@ def perform_evaluation(netfolder, dataset_name, dataset_version, feature_type='b
     testfile.write("------------------------------------------------------------------------------------------\n\n\n\n")
     testfile.close()
 
+    if error_analysis:
+        error_path = os.path.join(file_folder, os.path.pardir, netname + "_" + dataset_version + "_errors.tsv")
+        write_error_analysis(error_path, error_rows)
+        print(str(time.ctime()) + "\tERROR ANALYSIS: " + error_path)
+
     # return the F1
     return return_value
 
@@ -1201,13 +1351,7 @@ def regenerate_network(netname="cdcp7net2018", dataset_name='cdcp_ACL17', datase
                                            'glove.embeddings.npz')
             if not os.path.exists(vocabulary_path):
                 vocabulary_path = os.path.join(dataset_path, 'resources', "glove300", 'glove.embeddings.npz')
-            vocabulary_list = np.load(vocabulary_path)
-            embed_list = vocabulary_list['embeds']
-            word_list = vocabulary_list['vocab']
-
-            bow = np.zeros((len(word_list) + 1, DIM))
-            for index in range(len(word_list)):
-                bow[index + 1] = embed_list[index]
+            bow = load_embedding_matrix(vocabulary_path)
             print(str(time.ctime()) + "\t\t\tEMBEDDINGS LOADED...")
 
         realname = netname
@@ -1304,7 +1448,8 @@ def regenerate_network(netname="cdcp7net2018", dataset_name='cdcp_ACL17', datase
 
 
 
-def RCT_routine(netname="RCT11", retrocompatibility=False, distance=5, ensemble=True, token_wise=True, error_analysis=False):
+def RCT_routine(netname="RCT11", retrocompatibility=False, distance=5, ensemble=True, token_wise=True, error_analysis=False, candidate_generator=None,
+                visualize_attention=False, bootstrap=0):
 
     dataset_name = "RCT"
     training_dataset_version = "neo"
@@ -1313,18 +1458,25 @@ def RCT_routine(netname="RCT11", retrocompatibility=False, distance=5, ensemble=
 
     test_dataset_version = "neo"
 
-    perform_evaluation(netpath, dataset_name, test_dataset_version, retrocompatibility=retrocompatibility, distance=distance, ensemble=ensemble, token_wise=token_wise, error_analysis=error_analysis)
+    perform_evaluation(netpath, dataset_name, test_dataset_version, retrocompatibility=retrocompatibility, distance=distance, ensemble=ensemble, token_wise=token_wise, error_analysis=error_analysis,
+                       candidate_generator=candidate_generator, visualize_attention=visualize_attention,
+                       bootstrap=bootstrap)
 
     test_dataset_version = "mixed"
 
-    perform_evaluation(netpath, dataset_name, test_dataset_version, retrocompatibility=retrocompatibility, distance=distance, ensemble=ensemble, token_wise=token_wise, error_analysis=error_analysis)
+    perform_evaluation(netpath, dataset_name, test_dataset_version, retrocompatibility=retrocompatibility, distance=distance, ensemble=ensemble, token_wise=token_wise, error_analysis=error_analysis,
+                       candidate_generator=candidate_generator, visualize_attention=visualize_attention,
+                       bootstrap=bootstrap)
 
     test_dataset_version = "glaucoma"
 
-    perform_evaluation(netpath, dataset_name, test_dataset_version, retrocompatibility=retrocompatibility, distance=distance, ensemble=ensemble, token_wise=token_wise, error_analysis=error_analysis)
+    perform_evaluation(netpath, dataset_name, test_dataset_version, retrocompatibility=retrocompatibility, distance=distance, ensemble=ensemble, token_wise=token_wise, error_analysis=error_analysis,
+                       candidate_generator=candidate_generator, visualize_attention=visualize_attention,
+                       bootstrap=bootstrap)
 
 
-def drinv_routine(netname="RCT11", retrocompatibility=False, distance=5, ensemble=True, token_wise=True, error_analysis=False):
+def drinv_routine(netname="RCT11", retrocompatibility=False, distance=5, ensemble=True, token_wise=True, error_analysis=False, candidate_generator=None,
+                  visualize_attention=False, bootstrap=0):
 
     dataset_name = 'DrInventor'
     dataset_version = 'arg10'
@@ -1332,10 +1484,13 @@ def drinv_routine(netname="RCT11", retrocompatibility=False, distance=5, ensembl
 
     netpath = os.path.join(os.getcwd(), 'network_models', dataset_name, dataset_version, netname)
 
-    perform_evaluation(netpath, dataset_name, dataset_version, retrocompatibility=retrocompatibility, distance=distance, ensemble=ensemble, token_wise=token_wise, error_analysis=error_analysis)
+    perform_evaluation(netpath, dataset_name, dataset_version, retrocompatibility=retrocompatibility, distance=distance, ensemble=ensemble, token_wise=token_wise, error_analysis=error_analysis,
+                       candidate_generator=candidate_generator, visualize_attention=visualize_attention,
+                       bootstrap=bootstrap)
 
 
-def ECHR_routine(netname, retrocompatibility=False, distance=5, ensemble=True, token_wise=False, error_analysis=False):
+def ECHR_routine(netname, retrocompatibility=False, distance=5, ensemble=True, token_wise=False, error_analysis=False, candidate_generator=None,
+                 visualize_attention=False, bootstrap=0):
 
     dataset_name = 'ECHR2018'
     dataset_version = 'arg0'
@@ -1343,12 +1498,15 @@ def ECHR_routine(netname, retrocompatibility=False, distance=5, ensemble=True, t
 
     netpath = os.path.join(os.getcwd(), 'network_models', dataset_name, dataset_version, netname)
 
-    perform_evaluation(netpath, dataset_name, dataset_version, retrocompatibility=retrocompatibility, distance=distance, ensemble=ensemble, token_wise=token_wise, error_analysis=error_analysis)
+    perform_evaluation(netpath, dataset_name, dataset_version, retrocompatibility=retrocompatibility, distance=distance, ensemble=ensemble, token_wise=token_wise, error_analysis=error_analysis,
+                       candidate_generator=candidate_generator, visualize_attention=visualize_attention,
+                       bootstrap=bootstrap)
 
 
 
 
-def cdcp_routine(netname='cdcp111', retrocompatibility=False, distance=5, ensemble=True, token_wise=False, error_analysis=False):
+def cdcp_routine(netname='cdcp111', retrocompatibility=False, distance=5, ensemble=True, token_wise=False, error_analysis=False, candidate_generator=None,
+                 visualize_attention=False, bootstrap=0):
 
     dataset_name = 'cdcp_ACL17'
     training_dataset_version = 'new_3'
@@ -1357,12 +1515,15 @@ def cdcp_routine(netname='cdcp111', retrocompatibility=False, distance=5, ensemb
 
     netpath = os.path.join(os.getcwd(), 'network_models', dataset_name, training_dataset_version, netname)
 
-    perform_evaluation(netpath, dataset_name, test_dataset_version, retrocompatibility=retrocompatibility, distance=distance, ensemble=ensemble, token_wise=token_wise, error_analysis=error_analysis)
+    perform_evaluation(netpath, dataset_name, test_dataset_version, retrocompatibility=retrocompatibility, distance=distance, ensemble=ensemble, token_wise=token_wise, error_analysis=error_analysis,
+                       candidate_generator=candidate_generator, visualize_attention=visualize_attention,
+                       bootstrap=bootstrap)
     # perform_evaluation(netpath, dataset_name, test_dataset_version, context=False, distance=5,
     #                    ensemble=True, ensemble_top_criterion="link", ensemble_top_n=0.3)
 
 
-def UKP_routine(netname, retrocompatibility=False, distance=5, ensemble=True, token_wise=False, error_analysis=False):
+def UKP_routine(netname, retrocompatibility=False, distance=5, ensemble=True, token_wise=False, error_analysis=False, candidate_generator=None,
+                visualize_attention=False, bootstrap=0):
 
     dataset_name = 'AAEC_v2'
     training_dataset_version = 'new_2'
@@ -1372,8 +1533,11 @@ def UKP_routine(netname, retrocompatibility=False, distance=5, ensemble=True, to
     netpath = os.path.join(os.getcwd(), 'network_models', dataset_name, training_dataset_version, netname)
 
     perform_evaluation(netpath, dataset_name, test_dataset_version, retrocompatibility=retrocompatibility,
-                       distance=distance, ensemble=ensemble, token_wise=token_wise)
-    perform_evaluation(netpath, dataset_name, test_dataset_version, retrocompatibility=retrocompatibility, distance=distance, ensemble=ensemble, token_wise=True, error_analysis=error_analysis)
+                       distance=distance, ensemble=ensemble, token_wise=token_wise,
+                       candidate_generator=candidate_generator, visualize_attention=visualize_attention,
+                       bootstrap=bootstrap)
+    perform_evaluation(netpath, dataset_name, test_dataset_version, retrocompatibility=retrocompatibility, distance=distance, ensemble=ensemble, token_wise=True, error_analysis=error_analysis,
+                       candidate_generator=candidate_generator)
 
 
 if __name__ == '__main__':
@@ -1391,6 +1555,18 @@ if __name__ == '__main__':
     parser.add_argument('-t', '--token', help="Perform token-wise component classification (instead of component-wise)", action="store_true")
     parser.add_argument('-x', '--default', help="Perform the evaluation on the dataset with the default options configured for that specific dataset", action="store_true")
     parser.add_argument('-a', '--analysis', help="Perform error analysis", action="store_true")
+    parser.add_argument('-w', '--window', help="Prune the pairs whose components are farther than this distance",
+                        type=int, default=-1)
+    parser.add_argument('-y', '--type_rules', help="Prune the pairs whose predicted component types are never linked "
+                                                   "in the training split", action="store_true")
+    parser.add_argument('-s', '--attention', help="Export the attention weights of every pair of each split, for "
+                                                  "each iteration", action="store_true")
+    parser.add_argument('-b', '--bootstrap', help="Number of resamples of the documents used to compute the "
+                                                  "confidence intervals of the scores. If 0, they are not computed",
+                        type=int, default=0)
+    parser.add_argument('-p', '--prior', help="Prune the pairs whose link probability given their distance, "
+                                              "estimated on the training split, is not above this threshold",
+                        type=float, default=None)
 
     args = parser.parse_args()
 
@@ -1402,25 +1578,41 @@ if __name__ == '__main__':
     token_wise = args.token
     error_analysis = args.analysis
     default = args.default
+    attention = args.attention
+    bootstrap = args.bootstrap
+
+    corpus_names = {"rct": "RCT", "drinv": "DrInventor", "cdcp": "cdcp_ACL17", "echr": "ECHR2018", "ukp": "AAEC_v2"}
+    candidate_generator = candidate_generation.create_candidate_generator(corpus_names[corpus.lower()],
+                                                                          window=args.window,
+                                                                          type_rules=args.type_rules,
+                                                                          prior_threshold=args.prior)
 
     if default:
         if corpus.lower() == "rct":
-            RCT_routine(netname)
+            RCT_routine(netname, candidate_generator=candidate_generator, visualize_attention=attention,
+                        bootstrap=bootstrap)
         elif corpus.lower() == "cdcp":
-            cdcp_routine(netname)
+            cdcp_routine(netname, candidate_generator=candidate_generator, visualize_attention=attention,
+                         bootstrap=bootstrap)
         elif corpus.lower() == "drinv":
-            drinv_routine(netname)
+            drinv_routine(netname, candidate_generator=candidate_generator, visualize_attention=attention,
+                          bootstrap=bootstrap)
         elif corpus.lower() == "ukp":
-            UKP_routine(netname)
+            UKP_routine(netname, candidate_generator=candidate_generator, visualize_attention=attention,
+                        bootstrap=bootstrap)
     else:
         if corpus.lower() == "rct":
-            RCT_routine(netname, retrocompatibility, distance, ensemble, token_wise, error_analysis)
+            RCT_routine(netname, retrocompatibility, distance, ensemble, token_wise, error_analysis,
+                        candidate_generator, attention, bootstrap)
         elif corpus.lower() == "cdcp":
-            cdcp_routine(netname, retrocompatibility, distance, ensemble, token_wise, error_analysis)
+            cdcp_routine(netname, retrocompatibility, distance, ensemble, token_wise, error_analysis,
+                         candidate_generator, attention, bootstrap)
         elif corpus.lower() == "drinv":
-            drinv_routine(netname, retrocompatibility, distance, ensemble, token_wise, error_analysis)
+            drinv_routine(netname, retrocompatibility, distance, ensemble, token_wise, error_analysis,
+                          candidate_generator, attention, bootstrap)
         elif corpus.lower() == "ukp":
-            UKP_routine(netname, retrocompatibility, distance, ensemble, token_wise, error_analysis)
+            UKP_routine(netname, retrocompatibility, distance, ensemble, token_wise, error_analysis,
+                        candidate_generator, attention, bootstrap)
 
 
 
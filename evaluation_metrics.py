@@ -0,0 +1,173 @@
+__author__ = "Andrea Galassi"
+__copyright__ = "Copyright 2018-2020 Andrea Galassi"
+__license__ = "BSD 3-clause"
+__version__ = "0.1.0"
+__email__ = "a.galassi@unibo.it"
+
+"""
+Scores of the predictions of the networks, computed from a single confusion matrix.
+The evaluations need many F1, precision, recall and support values (per class, macro and micro averaged, on subsets
+of the labels) of the same label vectors: the matrix is counted once, with a bincount, and all the values are derived
+from it. The values are the same of sklearn.metrics: a score whose denominator is 0 is 0, the default labels are the
+ones that appear in the true or in the predicted labels, "macro" is the mean of the scores of the labels, "micro" is
+computed on the sums of the counts of the labels.
+The same scores can be computed on a batch of confusion matrices, for example the ones of the bootstrap resamples of
+a split, built from the confusion matrices of its documents.
+"""
+
+import numpy as np
+
+
+class ConfusionScores(object):
+    """
+    Confusion matrix of a classification, with the scores that derive from it
+    """
+
+    def __init__(self, y_true, y_pred, num_classes=None):
+        """
+        :param y_true: the true labels, as integers
+        :param y_pred: the predicted labels, as integers
+        :param num_classes: the number of labels. If None, the highest label found plus one
+        """
+        y_true = np.asarray(y_true, dtype=np.int64).ravel()
+        y_pred = np.asarray(y_pred, dtype=np.int64).ravel()
+        if len(y_true) != len(y_pred):
+            raise Exception('DIFFERENT NUMBER OF TRUE AND PREDICTED LABELS: ' + str(len(y_true)) + ' ' +
+                            str(len(y_pred)))
+
+        if num_classes is None:
+            num_classes = 0
+            if len(y_true) > 0:
+                num_classes = int(max(y_true.max(), y_pred.max())) + 1
+        self.num_classes = num_classes
+
+        # rows are the true labels, columns the predicted ones
+        self.matrix = np.bincount(y_true * num_classes + y_pred,
+                                  minlength=num_classes * num_classes).reshape(num_classes, num_classes)
+
+        self.true_positives = np.diag(self.matrix)
+        self.false_positives = self.matrix.sum(axis=0) - self.true_positives
+        self.false_negatives = self.matrix.sum(axis=1) - self.true_positives
+        self.present_labels = np.nonzero(self.matrix.sum(axis=0) + self.matrix.sum(axis=1))[0]
+
+    def get_counts(self, labels=None):
+        """
+        :param labels: the labels to consider. If None, the ones that appear in the true or in the predicted labels
+        :return: the true positives, the false positives and the false negatives of each label
+        """
+        if labels is None:
+            labels = self.present_labels
+        labels = np.asarray(labels, dtype=np.int64).ravel()
+
+        # the labels that never appear have no counts
+        known = labels < self.num_classes
+        counts = []
+        for values in [self.true_positives, self.false_positives, self.false_negatives]:
+            label_values = np.zeros(len(labels), dtype=np.int64)
+            label_values[known] = values[labels[known]]
+            counts.append(label_values)
+        return counts
+
+    def precision_recall_fscore_support(self, labels=None, average=None):
+        """
+        Same values of sklearn.metrics.precision_recall_fscore_support, with beta 1
+        :param labels: the labels to consider. If None, the ones that appear in the true or in the predicted labels
+        :param average: None for the scores of each label, 'macro' or 'micro'
+        :return: precision, recall, F1 and support. The support is None if the scores are averaged
+        """
+        true_positives, false_positives, false_negatives = self.get_counts(labels)
+        precision, recall, fscore, support = compute_scores(true_positives, false_positives, false_negatives, average)
+
+        if average is None:
+            return precision, recall, fscore, support
+        return float(precision), float(recall), float(fscore), None
+
+    def f1_score(self, labels=None, average=None):
+        """
+        Same values of sklearn.metrics.f1_score
+        :param labels: the labels to consider. If None, the ones that appear in the true or in the predicted labels
+        :param average: None for the scores of each label, 'macro' or 'micro'
+        :return: the F1 of each label, or their average
+        """
+        return self.precision_recall_fscore_support(labels, average)[2]
+
+    def confusion_matrix(self, labels=None):
+        """
+        Same values of sklearn.metrics.confusion_matrix
+        :param labels: the labels to consider. If None, the ones that appear in the true or in the predicted labels
+        :return: the matrix, with the true labels as rows and the predicted labels as columns
+        """
+        if labels is None:
+            labels = self.present_labels
+        labels = np.asarray(labels, dtype=np.int64).ravel()
+        matrix = np.zeros((len(labels), len(labels)), dtype=np.int64)
+        known = np.nonzero(labels < self.num_classes)[0]
+        matrix[np.ix_(known, known)] = self.matrix[np.ix_(labels[known], labels[known])]
+        return matrix
+
+
+def divide(numerator, denominator):
+    """
+    Element-wise division, 0 where the denominator is 0
+    """
+    return np.divide(numerator, denominator, out=np.zeros(np.shape(numerator), dtype=np.float64),
+                     where=denominator > 0)
+
+
+def compute_scores(true_positives, false_positives, false_negatives, average=None):
+    """
+    :param true_positives: the true positives, with the labels on the last axis
+    :param false_positives: the false positives, with the labels on the last axis
+    :param false_negatives: the false negatives, with the labels on the last axis
+    :param average: None for the scores of each label, 'macro' or 'micro', which remove the last axis
+    :return: precision, recall, F1 and support. The support is None if the scores are averaged
+    """
+    support = true_positives + false_negatives
+
+    if average == 'micro':
+        true_positives = true_positives.sum(axis=-1, keepdims=True)
+        false_positives = false_positives.sum(axis=-1, keepdims=True)
+        false_negatives = false_negatives.sum(axis=-1, keepdims=True)
+    elif average is not None and average != 'macro':
+        raise Exception('UNKNOWN AVERAGE: ' + str(average))
+
+    precision = divide(true_positives, true_positives + false_positives)
+    recall = divide(true_positives, true_positives + false_negatives)
+    fscore = divide(2 * true_positives, 2 * true_positives + false_positives + false_negatives)
+
+    if average is None:
+        return precision, recall, fscore, support
+    return np.mean(precision, axis=-1), np.mean(recall, axis=-1), np.mean(fscore, axis=-1), None
+
+
+def confusion_tensor(y_true, y_pred, segments, num_segments, num_classes):
+    """
+    Confusion matrices of the segments of a classification (for example its documents), counted with a single bincount
+    :param y_true: the true labels, as integers
+    :param y_pred: the predicted labels, as integers
+    :param segments: the segment of each label, as integers
+    :param num_segments: the number of segments
+    :param num_classes: the number of labels
+    :return: the matrices, (segments, true labels, predicted labels)
+    """
+    y_true = np.asarray(y_true, dtype=np.int64).ravel()
+    y_pred = np.asarray(y_pred, dtype=np.int64).ravel()
+    segments = np.asarray(segments, dtype=np.int64).ravel()
+    counts = np.bincount((segments * num_classes + y_true) * num_classes + y_pred,
+                         minlength=num_segments * num_classes * num_classes)
+    return counts.reshape(num_segments, num_classes, num_classes)
+
+
+def batch_precision_recall_fscore_support(matrices, labels, average=None):
+    """
+    Same values of ConfusionScores.precision_recall_fscore_support, for a batch of confusion matrices
+    :param matrices: the matrices, (batch, true labels, predicted labels)
+    :param labels: the labels to consider, all smaller than the size of the matrices
+    :param average: None for the scores of each label, 'macro' or 'micro'
+    :return: precision, recall, F1 and support, (batch, labels) or (batch) if averaged
+    """
+    labels = np.asarray(labels, dtype=np.int64).ravel()
+    true_positives = np.diagonal(matrices, axis1=-2, axis2=-1)[..., labels]
+    false_positives = matrices.sum(axis=-2)[..., labels] - true_positives
+    false_negatives = matrices.sum(axis=-1)[..., labels] - true_positives
+    return compute_scores(true_positives, false_positives, false_negatives, average)
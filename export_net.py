@@ -0,0 +1,205 @@
+__author__ = "Andrea Galassi"
+__copyright__ = "Copyright 2018-2020 Andrea Galassi"
+__license__ = "BSD 3-clause"
+__version__ = "0.1.0"
+__email__ = "a.galassi@unibo.it"
+
+"""
+Export of trained networks as self-contained inference artifacts.
+The weights of a network (or of the top members of an ensemble) are frozen into constants, the graph is pruned of
+everything that is not needed for the prediction and constant-folded, and the result is saved as a SavedModel with a
+serving signature. The artifact can be loaded with inference.py, without any custom object or training code.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+import tensorflow as tf
+
+from tensorflow.compat.v1.keras import backend as K
+from tensorflow.tools.graph_transforms import TransformGraph
+from training_utils import get_custom_objects, get_iterations_number, get_last_weights_path, load_network
+
+
+GRAPH_TRANSFORMS = ['strip_unused_nodes',
+                    'remove_nodes(op=Identity, op=CheckNumerics)',
+                    'fold_constants(ignore_errors=true)',
+                    'fold_batch_norms',
+                    'fold_old_batch_norms',
+                    'strip_unused_nodes',
+                    'sort_by_execution_order']
+
+
+def get_member_score(netfolder, netname, iteration, split='validation', column=2):
+    """
+    Reads the score of an iteration from its evaluation file. By default, the link F1 on the validation split.
+    If the split has been evaluated multiple times, the last evaluation is considered.
+    :return: the score, -1 if it has not been found
+    """
+    eval_path = os.path.join(netfolder, netname + "_" + str(iteration) + "_eval.txt")
+    score = -1
+    if os.path.exists(eval_path):
+        with open(eval_path, "r") as f:
+            for line in f:
+                values = line.split()
+                if len(values) > column + 1 and values[0] == split:
+                    score = float(values[column + 1])
+    return score
+
+
+def select_members(netfolder, top_n=None):
+    """
+    Selects the iterations of a network to export
+    :param netfolder: folder of the network
+    :param top_n: number of members to select, according to their validation link F1. If None, all of them
+    :return: list of the iteration indexes
+    """
+    netname = os.path.basename(netfolder)
+    iterations = get_iterations_number(netfolder, netname)
+
+    members = []
+    for iteration in range(iterations + 1):
+        if get_last_weights_path(netfolder, netname, iteration) != "":
+            members.append(iteration)
+
+    if top_n is not None and top_n < len(members):
+        scores = [get_member_score(netfolder, netname, iteration) for iteration in members]
+        order = np.argsort(scores, kind='stable')[::-1]
+        members = sorted([members[index] for index in order[:top_n]])
+
+    return members
+
+
+def freeze_model(model):
+    """
+    Freezes the current weights of a model into a pruned and constant-folded graph
+    :param model: the loaded model, built in inference mode
+    :return: the frozen GraphDef, the names of the input nodes and the names of the output nodes
+    """
+    session = K.get_session()
+    input_names = [tensor.op.name for tensor in model.inputs]
+    output_names = [tensor.op.name for tensor in model.outputs]
+
+    graph_def = tf.compat.v1.graph_util.convert_variables_to_constants(session,
+                                                                       session.graph.as_graph_def(),
+                                                                       output_names)
+    graph_def = tf.compat.v1.graph_util.remove_training_nodes(graph_def, protected_nodes=input_names + output_names)
+    graph_def = TransformGraph(graph_def, input_names, output_names, GRAPH_TRANSFORMS)
+
+    return graph_def, input_names, output_names
+
+
+def export_inference_artifact(netfolder, export_path=None, top_n=None):
+    """
+    Exports a trained network as a SavedModel. If more members are exported, the artifact averages their scores.
+    :param netfolder: folder of the network
+    :param export_path: destination folder. If None, a folder named <netname>_serving next to the network
+    :param top_n: number of ensemble members to export. If None, all of them
+    :return: the export path
+    """
+    netname = os.path.basename(netfolder)
+    if export_path is None:
+        export_path = os.path.join(netfolder, os.path.pardir, netname + "_serving")
+
+    print(str(time.ctime()) + "\tEXPORTING NETWORK: " + netname)
+
+    # dropout and batch normalization in inference mode, so that their training branches are pruned
+    K.set_learning_phase(0)
+
+    members = select_members(netfolder, top_n)
+    if len(members) < 1:
+        raise Exception('NO TRAINED MEMBERS FOUND IN ' + netfolder)
+    print(str(time.ctime()) + "\t\tMEMBERS: " + str(members))
+
+    # all the members share the same architecture: the model is loaded once and only the weights change
+    model, weights_path = load_network(netfolder, members[0], get_custom_objects())
+    signature_inputs = [tensor.op.name for tensor in model.inputs]
+    signature_outputs = list(model.output_names)
+
+    frozen_members = []
+    for iteration in members:
+        weights_path = get_last_weights_path(netfolder, netname, iteration)
+        print(str(time.ctime()) + "\t\tFREEZING: " + weights_path)
+        model.load_weights(weights_path)
+        frozen_members.append(freeze_model(model))
+        sys.stdout.flush()
+
+    serving_graph = tf.Graph()
+    with serving_graph.as_default():
+        placeholders = []
+        for tensor in model.inputs:
+            placeholders.append(tf.compat.v1.placeholder(tensor.dtype, shape=tensor.shape, name=tensor.op.name))
+
+        member_outputs = []
+        for index in range(len(frozen_members)):
+            graph_def, input_names, output_names = frozen_members[index]
+            input_map = {}
+            for name, placeholder in zip(input_names, placeholders):
+                input_map[name + ":0"] = placeholder
+            member_outputs.append(tf.import_graph_def(graph_def,
+                                                      input_map=input_map,
+                                                      return_elements=[name + ":0" for name in output_names],
+                                                      name="member_" + str(index)))
+
+        outputs = {}
+        for index in range(len(signature_outputs)):
+            scores = [member[index] for member in member_outputs]
+            if len(scores) > 1:
+                output = tf.math.add_n(scores) / len(scores)
+            else:
+                output = scores[0]
+            outputs[signature_outputs[index]] = tf.identity(output, name=signature_outputs[index])
+
+        inputs = {}
+        for name, placeholder in zip(signature_inputs, placeholders):
+            inputs[name] = placeholder
+
+        builder = tf.compat.v1.saved_model.Builder(export_path)
+        with tf.compat.v1.Session(graph=serving_graph) as session:
+            signature = tf.compat.v1.saved_model.predict_signature_def(inputs=inputs, outputs=outputs)
+            builder.add_meta_graph_and_variables(session,
+                                                 [tf.compat.v1.saved_model.tag_constants.SERVING],
+                                                 signature_def_map={'serving_default': signature})
+        builder.save()
+
+    # the order of inputs and outputs is not kept by the signature
+    extra_path = os.path.join(export_path, "assets.extra")
+    if not os.path.exists(extra_path):
+        os.makedirs(extra_path)
+    with open(os.path.join(extra_path, "signature.json"), "w") as f:
+        json.dump({"inputs": signature_inputs, "outputs": signature_outputs, "members": members,
+                   "network": netname}, f)
+
+    print(str(time.ctime()) + "\tEXPORTED TO: " + export_path)
+
+    return export_path
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Export a trained network as a SavedModel for inference.")
+    parser.add_argument("netname", help="The name of the network")
+
+    parser.add_argument('-c', '--corpus',
+                        choices=["rct", "drinv", "cdcp", "echr", "ukp", "scidtb"],
+                        help="corpus", default="cdcp")
+    parser.add_argument('-n', '--top_n', help="Export only the best N members of the ensemble, according to their "
+                                              "validation link F1", type=int, default=None)
+    parser.add_argument('-o', '--output', help="Destination folder", default=None)
+
+    args = parser.parse_args()
+
+    corpora = {"rct": ('RCT', 'neo'),
+               "drinv": ('DrInventor', 'arg10'),
+               "cdcp": ('cdcp_ACL17', 'new_3'),
+               "echr": ('ECHR2018', 'arg0'),
+               "ukp": ('AAEC_v2', 'new_2'),
+               "scidtb": ('scidtb_argmin_annotations', 'only_arg_v1')}
+
+    dataset_name, dataset_version = corpora[args.corpus.lower()]
+    netpath = os.path.join(os.getcwd(), 'network_models', dataset_name, dataset_version, args.netname)
+
+    export_inference_artifact(netpath, args.output, args.top_n)
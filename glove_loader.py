@@ -5,39 +5,37 @@ __version__ = "0.2.0"
 __email__ = "a.galassi@unibo.it"
 
 
-import pandas
 import os
 import numpy as np
 import re
+import hashlib
 import argparse
 
+from dataset_store import load_dataframe, get_store_path
+from glove_store import GloveStore, format_glove_line, get_store_path as get_glove_store_path
+from vocabulary_store import register_vocabulary
+from build_manifest import (LookupRecorder, load_manifest, get_manifest_path, hash_file, hash_paths, hash_config,
+                            is_stage_current, get_stage_config, record_stage)
+import tokenizer
+from tokenizer import SEPARATORS, STOPWORDS, REPLACINGS, normalise, create_vocabulary
+
 DIM = 300
-SEPARATORS = ['(', ')', '[', ']', '{', '}', '...', '_', '--', '|',
-              ';', ':',
-              "±", "·", "≥", "≤", "≈", '=', "<", ">", "£", "$", "€",
-              '!!!', '???', '?!?', '!?!', '?!', '!?', '??', '!!',
-              '!', '?',
-              '/', '"', '%', '$', '*', '#', '+',
-              ',', '.',
-              "'s", "'ve", "'ll", "'re", "'d",
-              '-', "'",
-              "∂", "∆", "∇"]
-
-REPLACINGS = {"’": "'",
-              "‘": "'",
-              "“": '"',
-              "”": '"',
-              "''": '"',
-              "—": '-',
-              "−": '-',
-              "–": '-',
-              "⁄": '/'}
-
-STOPWORDS = ['.', ',', ':', ';']
+ORPHAN_SEED = 0
 
 def load_glove(vocabulary_source_path):
-
-    print("Loading Glove")
+    """
+    Loads a GloVe file as a dictionary from the words to their lines. If the binary store of the file exists (see
+    glove_store.py), it is memory-mapped instead, with the same interface but with the vectors as values.
+    """
+    store_path = get_glove_store_path(vocabulary_source_path)
+    if os.path.exists(store_path):
+        print("Opening Glove store")
+        model = GloveStore(store_path)
+        if model.info['dim'] != DIM:
+            raise Exception('THE GLOVE STORE HAS EMBEDDINGS OF SIZE ' + str(model.info['dim']))
+        return model
+
+    print("Loading Glove (run glove_store.py to convert it into a binary store)")
     f = open(vocabulary_source_path, 'r', encoding="utf-8")
     model = {}
 
@@ -59,11 +57,13 @@ def load_glove(vocabulary_source_path):
 
 
 
-def vocabulary_creator(model, vocabulary_destination_path, dataframe_path):
-
-
-
-    df = pandas.read_pickle(dataframe_path)
+def load_documents(dataframe_path):
+    """
+    Loads the propositions of a dataframe, replacing the different versions of the same character
+    :param dataframe_path: path of the dataframe
+    :return: list of the propositions
+    """
+    df = load_dataframe(dataframe_path, columns=['source_proposition'])
 
     propositions = df['source_proposition'].drop_duplicates()
 
@@ -73,27 +73,82 @@ def vocabulary_creator(model, vocabulary_destination_path, dataframe_path):
     documents = []
     # replace different versions of the same character
     for proposition in propositions:
-        for old in REPLACINGS.keys():
-            proposition = proposition.replace(old, REPLACINGS[old])
-        documents.append(proposition)
+        documents.append(normalise(proposition))
 
+    return documents
+
+
+def vocabulary_creator(model, vocabulary_destination_path, dataframe_path, write_text=False):
+
+    documents = load_documents(dataframe_path)
 
     if not os.path.exists(vocabulary_destination_path):
         os.makedirs(vocabulary_destination_path)
-    orphans_path = os.path.join(vocabulary_destination_path, 'glove.orphans.txt')
-    embeddings_path = os.path.join(vocabulary_destination_path, 'glove.embeddings.txt')
-    npz_path = os.path.join(vocabulary_destination_path, 'glove.embeddings.npz')
-    vocabulary_path = os.path.join(vocabulary_destination_path, 'glove.vocabulary.txt')
     logfile_path = os.path.join(vocabulary_destination_path, 'glove.log.txt')
     logfile = open(logfile_path, 'w')
     logfile.write('Sep\tVoc_size\tOrphans\n')
 
     print("Splitting")
 
-    vocabulary, orphans = document_tokenizer_and_embedder(documents, model, logfile)
+    vocabulary, orphans = document_tokenizer_and_embedder(documents, model, logfile, vocabulary={})
 
 
     logfile.close()
+
+    save_vocabulary(vocabulary, orphans, vocabulary_destination_path, write_text=write_text)
+
+
+def get_embedding(value):
+    """
+    :param value: the value of a word in a GloVe model: either its line or its vector
+    :return: the vector, as float32
+    """
+    if isinstance(value, str):
+        return np.array(value.split()[-DIM:], dtype=np.float32)
+    return np.asarray(value, dtype=np.float32)
+
+
+def create_orphan_embeddings(orphans, seed=ORPHAN_SEED):
+    """
+    Creates the random embeddings of the orphans, uniform in [-0.5, 0.5). The embedding of a word depends only on the
+    word and on the seed, so it is the same in every build and in every vocabulary.
+    The values are generated all at once: each row is the splitmix64 sequence that starts from the 64-bit BLAKE2b
+    digest of the word, salted with the seed, so that different words practically never share their embedding.
+    :param orphans: list of words
+    :param seed: the seed, a non-negative integer
+    :return: float32 matrix with a row for each orphan
+    """
+    salt = int(seed).to_bytes(8, 'little')
+    keys = np.array([int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8, salt=salt).digest(), 'little')
+                     for word in orphans], dtype=np.uint64).reshape(-1, 1)
+    columns = np.arange(1, DIM + 1, dtype=np.uint64).reshape(1, -1)
+    with np.errstate(over='ignore'):
+        state = keys + columns * np.uint64(0x9E3779B97F4A7C15)
+        state = (state ^ (state >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        state = (state ^ (state >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        state = state ^ (state >> np.uint64(31))
+    uniform = (state >> np.uint64(11)).astype(np.float64) / float(1 << 53)
+    return (uniform - 0.5).astype(np.float32)
+
+
+def save_vocabulary(vocabulary, orphans, vocabulary_destination_path, misses=None, write_text=False):
+    """
+    Saves the files of a vocabulary: the list of words, the list of orphans and the embeddings (as npz and optionally
+    as text). The embeddings matrix is assembled directly, the orphans receive their seeded random embeddings.
+    :param vocabulary: dictionary from the words to their GloVe lines or vectors. The vectors of a GloVe store are
+    gathered at once, and only the lines of a GloVe text file are parsed
+    :param orphans: set of words that are not in GloVe
+    :param vocabulary_destination_path: destination folder
+    :param misses: words that have been looked up in GloVe without success. If not None, they are saved too
+    :param write_text: whether to write also the embeddings as text, in the format of the GloVe file
+    :return: None
+    """
+    orphans_path = os.path.join(vocabulary_destination_path, 'glove.orphans.txt')
+    embeddings_path = os.path.join(vocabulary_destination_path, 'glove.embeddings.txt')
+    npz_path = os.path.join(vocabulary_destination_path, 'glove.embeddings.npz')
+    vocabulary_path = os.path.join(vocabulary_destination_path, 'glove.vocabulary.txt')
+    misses_path = os.path.join(vocabulary_destination_path, 'glove.misses.txt')
+
     if '' in orphans:
         orphans.remove('')
 
@@ -112,40 +167,137 @@ def vocabulary_creator(model, vocabulary_destination_path, dataframe_path):
         orphans_file.write("\n")
     orphans_file.close()
 
-    print("handling orphans")
-
-    # create random embeddings for orphans
-    for word in sorted(orphans):
-        embedding = np.random.rand(DIM) - 0.5
-        line = word + " "
-        for value in embedding:
-            line += ("%.5g " % value) + " "
-        line += '\n'
-        vocabulary[word] = line
+    if misses is not None:
+        misses_file = open(misses_path, 'w')
+        for word in sorted(misses):
+            misses_file.write(word)
+            misses_file.write("\n")
+        misses_file.close()
 
     print("Saving")
 
-    # save embeddings
-    embeddings = []
-    vocabulary_list = []
-    embeddings_file = open(embeddings_path, 'w')
-    for word in sorted(vocabulary.keys()):
-        line = vocabulary[word]
-        embeddings_file.write(line)
-        splits = line.split()
-        embedding = splits[-DIM:]
-        embedding = np.array(embedding, dtype=np.float32)
-        embeddings.append(embedding)
-        vocabulary_list.append(word)
-    embeddings_file.close()
+    vocabulary_list = sorted(set(vocabulary.keys()) | set(orphans))
+    rows = {word: row for row, word in enumerate(vocabulary_list)}
+    embeddings = np.empty((len(vocabulary_list), DIM), dtype=np.float32)
+
+    # orphans that are also in the vocabulary keep their value
+    orphan_list = sorted(set(orphans) - set(vocabulary.keys()))
+    embeddings[[rows[word] for word in orphan_list]] = create_orphan_embeddings(orphan_list)
+    words = list(vocabulary.keys())
+    if len(words) > 0:
+        embeddings[[rows[word] for word in words]] = np.stack([get_embedding(vocabulary[word]) for word in words])
 
     print(vocabulary_list[0])
 
     np.savez(npz_path, vocab=vocabulary_list, embeds=embeddings)
+    register_vocabulary(npz_path)
+
+    if write_text:
+        with open(embeddings_path, 'w') as embeddings_file:
+            for row in range(len(vocabulary_list)):
+                embeddings_file.write(format_glove_line(vocabulary_list[row], embeddings[row]))
+    elif os.path.exists(embeddings_path):
+        os.remove(embeddings_path)
 
     print('Finished')
 
 
+def load_lookups(vocabulary_destination_path):
+    """
+    Loads the results of the GloVe lookups of a previous vocabulary
+    :param vocabulary_destination_path: folder of the vocabulary
+    :return: the vectors of the words found in GloVe, the set of words not found in GloVe
+    """
+    hits = {}
+    misses = set()
+
+    orphans_path = os.path.join(vocabulary_destination_path, 'glove.orphans.txt')
+    npz_path = os.path.join(vocabulary_destination_path, 'glove.embeddings.npz')
+    misses_path = os.path.join(vocabulary_destination_path, 'glove.misses.txt')
+    if not (os.path.exists(orphans_path) and os.path.exists(npz_path) and os.path.exists(misses_path)):
+        return hits, misses
+
+    with open(orphans_path, 'r') as f:
+        orphans = set(f.read().split('\n'))
+    with open(misses_path, 'r') as f:
+        misses = set(f.read().split('\n'))
+    misses.discard('')
+
+    vocabulary_list = np.load(npz_path)
+    embeddings = vocabulary_list['embeds']
+    for row, word in enumerate(vocabulary_list['vocab'].tolist()):
+        if word not in orphans:
+            hits[word] = embeddings[row]
+
+    return hits, misses
+
+
+def update_vocabulary(vocabulary_source_path, vocabulary_destination_path, dataframe_path, manifest, force=False,
+                      write_text=False):
+    """
+    Creates the vocabulary of a dataframe as vocabulary_creator does, but only if the dataframe, GloVe or the
+    tokenization changed since the last build recorded in the manifest.
+    GloVe is loaded only if the tokenization looks up words that were never looked up before: the words found and
+    not found by the previous build are reused.
+    :param vocabulary_source_path: path of the GloVe file
+    :param vocabulary_destination_path: destination folder
+    :param dataframe_path: path of the dataframe
+    :param manifest: the build manifest of the corpus
+    :param force: whether to rebuild the vocabulary from scratch
+    :param write_text: whether to write also the embeddings as text
+    :return: None
+    """
+    stage = "vocabulary/" + os.path.relpath(vocabulary_destination_path, os.path.dirname(manifest['path']))
+    config = {'glove': hash_file(manifest, vocabulary_source_path),
+              'dim': DIM,
+              'orphan_seed': ORPHAN_SEED,
+              'text': write_text,
+              'separators': SEPARATORS,
+              'stopwords': STOPWORDS,
+              'replacings': REPLACINGS,
+              'code': hash_file(manifest, os.path.abspath(__file__)),
+              'tokenizer': hash_file(manifest, os.path.abspath(tokenizer.__file__))}
+    inputs = hash_paths(manifest, [dataframe_path, get_store_path(dataframe_path)])
+    output_paths = [vocabulary_destination_path]
+
+    if not force and is_stage_current(manifest, stage, config, inputs, output_paths):
+        print("Vocabulary up to date: " + vocabulary_destination_path)
+        return
+
+    documents = load_documents(dataframe_path)
+
+    hits = {}
+    misses = set()
+    if not force and get_stage_config(manifest, stage) == hash_config(config):
+        hits, misses = load_lookups(vocabulary_destination_path)
+
+    if not os.path.exists(vocabulary_destination_path):
+        os.makedirs(vocabulary_destination_path)
+    logfile_path = os.path.join(vocabulary_destination_path, 'glove.log.txt')
+    logfile = open(logfile_path, 'w')
+    logfile.write('Sep\tVoc_size\tOrphans\n')
+
+    print("Splitting with the previous lookups")
+    model = LookupRecorder(hits, misses)
+    vocabulary, orphans = document_tokenizer_and_embedder(documents, model, logfile, vocabulary={})
+    logfile.close()
+
+    if len(model.unknown) > 0:
+        print(str(len(model.unknown)) + " words never looked up")
+        model = LookupRecorder(load_glove(vocabulary_source_path))
+
+        logfile = open(logfile_path, 'w')
+        logfile.write('Sep\tVoc_size\tOrphans\n')
+        print("Splitting")
+        vocabulary, orphans = document_tokenizer_and_embedder(documents, model, logfile, vocabulary={})
+        logfile.close()
+        misses = model.unknown
+
+    save_vocabulary(vocabulary, orphans, vocabulary_destination_path, misses, write_text)
+
+    record_stage(manifest, stage, config, inputs, output_paths)
+
+
 def print_vocabulary_and_orphans(vocabulary, vocabulary_path, orphans, orphans_path):
     voc_file = open(vocabulary_path,'w')
     for word in sorted(vocabulary.keys()):
@@ -159,9 +311,9 @@ def print_vocabulary_and_orphans(vocabulary, vocabulary_path, orphans, orphans_p
 
 
 def document_tokenizer_and_embedder(documents, model,
-                                    logfile=None, vocabulary={}, separators=None, not_vocab_separators=None):
+                                    logfile=None, vocabulary=None, separators=None, not_vocab_separators=None):
     """
-        Split the documents in tokens.
+        Split the documents in tokens (see tokenizer.create_vocabulary).
         The splitting is progressive using a series of separators,
         when a token match a key in model, it is inserted in the vocabulary.
         At the end of the process, the token that still do not match the model are returned as "orphans".
@@ -176,7 +328,7 @@ def document_tokenizer_and_embedder(documents, model,
             File where to print the log of the tokenization process
         vocabulary : dict, optional
             The dictionary to be filled with the tokens found in the document splitting.
-            If it is not provided, a empty dictionary is initialized.
+            If it is not provided, a new dictionary is initialized.
         separators : list of str
             String to be used as splitting tokens.
             They will be inserted in the vocabulary if they are not in the next param
@@ -191,70 +343,10 @@ def document_tokenizer_and_embedder(documents, model,
             The keys are the tokens found during the splitting, the values come from the model
     """
 
-    # punctuation and other special espressions
-    if separators == None:
-        separators = SEPARATORS
-    # tried but not present in glove: '\'t', 'e-'
-
-    orphans = set()
-    for composed_word in documents:
-        words = composed_word.split()
-        #words = filter(None, re.split("[" + separator + "]+", composed_word))
-        # remove stop symbols at the end of the tokens
-        for word in words:
-            if len(word) > 1 and word[-1] in STOPWORDS:
-                word2 = word[:-1]
-                if word2 in model.keys():
-                    word = word2
-
-            if word in model.keys():
-                vocabulary[word] = model[word]
-                # print("Found word: " + word)
-            else:
-                orphans.add(word)
-                # print("Word not found: " + word)
-
-
-    if not logfile == None:
-        logfile.write("Tab, space, newline" + '\t' +
-                      str(len(vocabulary.keys())) + '\t' +
-                      str(len(orphans)) + '\n')
-
-    for separator in separators:
-
-        # print("Separator: " + separator)
-        orphans, vocabulary = regular_split(orphans, vocabulary, model, separator)
-
-        if separator not in model.keys():
-            orphans.add(separator)
-        else:
-            vocabulary[separator] = model[separator]
-        # print("Orphans: " + str(len(orphans)))
-
-        if not logfile == None:
-            logfile.write(separator + '\t' +
-                          str(len(vocabulary.keys())) + '\t' +
-                          str(len(orphans)) + '\n')
-
-    return vocabulary, orphans
-
-
-def regular_split(old_orphans, vocabulary, model, separator):
-    orphans = set()
-    for composed_word in old_orphans:
-        words = composed_word.split(separator)
-        #words = filter(None, re.split("[" + separator + "]+", composed_word))
-        for word in words:
-            if word in model.keys():
-                vocabulary[word] = model[word]
-                # print("Found word: " + word)
-            else:
-                orphans.add(word)
-                # print("Word not found: " + word)
-    return orphans, vocabulary
-
-
-def DrInventor_routine():
+    return create_vocabulary(documents, model, logfile, vocabulary, separators)
+
+
+def DrInventor_routine(size, force=False, write_text=False):
     if size == 300:
         vocabulary_source_path = os.path.join(os.getcwd(), "resources", 'glove.840B.300d.txt')
         embed_name = "glove300"
@@ -274,14 +366,12 @@ def DrInventor_routine():
     dataframe_path = os.path.join(pickles_path, 'total.pkl')
     glove_path = os.path.join(dataset_path, "resources", embed_name)
 
-    model = load_glove(vocabulary_source_path)
+    manifest = load_manifest(get_manifest_path(dataset_path))
 
-    m1 = model.copy()
+    update_vocabulary(vocabulary_source_path, glove_path, dataframe_path, manifest, force, write_text)
 
-    vocabulary_creator(m1, glove_path, dataframe_path)
 
-
-def ECHR_routine():
+def ECHR_routine(force=False, write_text=False):
     vocabulary_source_path = os.path.join(os.getcwd(), 'glove.840B.300d.txt')
 
     dataset_name = 'ECHR2018'
@@ -292,15 +382,13 @@ def ECHR_routine():
     dataframe_path = os.path.join(pickles_path, 'total.pkl')
     glove_path = os.path.join(dataset_path, 'glove')
 
-    model = load_glove(vocabulary_source_path)
-
-    m1 = model.copy()
+    manifest = load_manifest(get_manifest_path(dataset_path))
 
-    vocabulary_creator(m1, glove_path, dataframe_path)
+    update_vocabulary(vocabulary_source_path, glove_path, dataframe_path, manifest, force, write_text)
 
 
 
-def scidtb_routine(size):
+def scidtb_routine(size, force=False, write_text=False):
     if size == 300:
         vocabulary_source_path = os.path.join(os.getcwd(), "resources", 'glove.840B.300d.txt')
         embed_name = "glove300"
@@ -321,14 +409,12 @@ def scidtb_routine(size):
     glove_path = os.path.join(dataset_path, "resources", embed_name)
 
 
-    model = load_glove(vocabulary_source_path)
+    manifest = load_manifest(get_manifest_path(dataset_path))
 
-    m1 = model.copy()
+    update_vocabulary(vocabulary_source_path, glove_path, dataframe_path, manifest, force, write_text)
 
-    vocabulary_creator(m1, glove_path, dataframe_path)
 
-
-def RCT_routine(size):
+def RCT_routine(size, force=False, write_text=False):
     if size == 300:
         vocabulary_source_path = os.path.join(os.getcwd(), "resources", 'glove.840B.300d.txt')
         embed_name = "glove300"
@@ -348,14 +434,12 @@ def RCT_routine(size):
     glove_path = os.path.join(dataset_path, "resources", embed_name)
 
 
-    model = load_glove(vocabulary_source_path)
-
-    m1 = model.copy()
+    manifest = load_manifest(get_manifest_path(dataset_path))
 
-    vocabulary_creator(m1, glove_path, dataframe_path)
+    update_vocabulary(vocabulary_source_path, glove_path, dataframe_path, manifest, force, write_text)
 
 
-def cdcp_routine():
+def cdcp_routine(size, force=False, write_text=False):
     if size == 300:
         vocabulary_source_path = os.path.join(os.getcwd(), "resources", 'glove.840B.300d.txt')
         embed_name = "glove300"
@@ -376,15 +460,13 @@ def cdcp_routine():
     glove_path = os.path.join(dataset_path, "resources", embed_name)
 
 
-    model = load_glove(vocabulary_source_path)
+    manifest = load_manifest(get_manifest_path(dataset_path))
 
-    m1 = model.copy()
+    update_vocabulary(vocabulary_source_path, glove_path, dataframe_path, manifest, force, write_text)
 
-    vocabulary_creator(m1, glove_path, dataframe_path)
 
 
-
-def UKP_routine():
+def UKP_routine(size, force=False, write_text=False):
     if size == 300:
         vocabulary_source_path = os.path.join(os.getcwd(), "resources", 'glove.840B.300d.txt')
         embed_name = "glove300"
@@ -405,11 +487,9 @@ def UKP_routine():
     glove_path = os.path.join(dataset_path, "resources", embed_name)
 
 
-    model = load_glove(vocabulary_source_path)
-
-    m1 = model.copy()
+    manifest = load_manifest(get_manifest_path(dataset_path))
 
-    vocabulary_creator(m1, glove_path, dataframe_path)
+    update_vocabulary(vocabulary_source_path, glove_path, dataframe_path, manifest, force, write_text)
 
 
 
@@ -425,22 +505,28 @@ if __name__ == '__main__':
     parser.add_argument('-s', '--size', help="embedding size",
                         choices=[25, 300],
                         type=int, default=300)
+    parser.add_argument('-f', '--force', help="Rebuild the vocabulary even if it is up to date",
+                        action='store_true')
+    parser.add_argument('-t', '--text', help="Write also the embeddings as text (glove.embeddings.txt)",
+                        action='store_true')
 
 
     args = parser.parse_args()
 
     corpus = args.corpus
     size = args.size
+    force = args.force
+    write_text = args.text
 
     if corpus.lower() == "rct":
-        RCT_routine(size)
+        RCT_routine(size, force, write_text)
     elif corpus.lower() == "cdcp":
-        cdcp_routine(size)
+        cdcp_routine(size, force, write_text)
     elif corpus.lower() == "drinv":
-        DrInventor_routine(size)
+        DrInventor_routine(size, force, write_text)
     elif corpus.lower() == "ukp":
-        UKP_routine(size)
+        UKP_routine(size, force, write_text)
     elif corpus.lower() == "scidtb":
-        scidtb_routine(size)
+        scidtb_routine(size, force, write_text)
     else:
         print("Datset not yet supported")
\ No newline at end of file
@@ -0,0 +1,201 @@
+__author__ = "Andrea Galassi"
+__copyright__ = "Copyright 2018-2020 Andrea Galassi"
+__license__ = "BSD 3-clause"
+__version__ = "0.1.0"
+__email__ = "a.galassi@unibo.it"
+
+"""
+Binary store of a GloVe file, to look words up without loading the text file in memory.
+The store is a folder next to the GloVe file, created once by convert_glove, with:
+- vectors.npy: the float32 matrix of the embeddings, one row for each line of the GloVe file
+- words.bin: the UTF-8 encodings of the words, concatenated in byte order
+- offsets.npy: the offsets of the words in words.bin (one more than the words)
+- rows.npy: the row of the vectors matrix of each word, in the same order
+- info.json: the size of the embeddings and the number of words
+All the files are memory-mapped: the words are found with a binary search on the sorted words.
+"""
+
+import os
+import sys
+import mmap
+import json
+import time
+import argparse
+import functools
+import numpy as np
+
+
+STORE_SUFFIX = ".store"
+LOOKUP_CACHE_SIZE = 1 << 20
+
+
+def get_store_path(vocabulary_source_path):
+    """
+    :param vocabulary_source_path: path of the GloVe text file
+    :return: path of the folder of its binary store
+    """
+    return os.path.splitext(vocabulary_source_path)[0] + STORE_SUFFIX
+
+
+def count_lines(file_path, block_size=1 << 24):
+    lines = 0
+    last = b"\n"
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            lines += block.count(b"\n")
+            last = block[-1:]
+    if last != b"\n":
+        lines += 1
+    return lines
+
+
+def convert_glove(vocabulary_source_path, dim, store_path=None):
+    """
+    Converts a GloVe text file into a binary store. Words are parsed as load_glove does: a word is everything that
+    precedes the last dim values of its line, so it can contain spaces. If a word appears more than once, the last
+    line wins.
+    :param vocabulary_source_path: path of the GloVe text file
+    :param dim: size of the embeddings
+    :param store_path: destination folder. If None, the one given by get_store_path
+    :return: the store path
+    """
+    if store_path is None:
+        store_path = get_store_path(vocabulary_source_path)
+    if not os.path.exists(store_path):
+        os.makedirs(store_path)
+
+    print(str(time.ctime()) + "\tCOUNTING LINES: " + vocabulary_source_path)
+    lines = count_lines(vocabulary_source_path)
+
+    print(str(time.ctime()) + "\tCONVERTING " + str(lines) + " LINES")
+    vectors = np.lib.format.open_memmap(os.path.join(store_path, "vectors.npy"), mode="w+", dtype=np.float32,
+                                        shape=(lines, dim))
+    words = []
+    with open(vocabulary_source_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip() == "":
+                continue
+            splits = line.rstrip("\r\n").split(' ')
+            if len(splits) <= dim:
+                raise Exception('MALFORMED GLOVE LINE ' + str(len(words) + 1))
+            vectors[len(words)] = np.array(splits[-dim:], dtype=np.float32)
+            words.append(" ".join(splits[:-dim]).encode("utf-8"))
+            if len(words) % 100000 == 0:
+                print(str(time.ctime()) + "\t\t" + str(len(words)) + " LINES")
+                sys.stdout.flush()
+    vectors.flush()
+    del vectors
+
+    print(str(time.ctime()) + "\tINDEXING")
+    # stable sort: among repeated words, the last one is kept
+    order = sorted(range(len(words)), key=words.__getitem__)
+    rows = []
+    for position in range(len(order)):
+        if position + 1 < len(order) and words[order[position + 1]] == words[order[position]]:
+            continue
+        rows.append(order[position])
+
+    offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    with open(os.path.join(store_path, "words.bin"), "wb") as f:
+        for index in range(len(rows)):
+            word = words[rows[index]]
+            f.write(word)
+            offsets[index + 1] = offsets[index] + len(word)
+    np.save(os.path.join(store_path, "offsets.npy"), offsets)
+    np.save(os.path.join(store_path, "rows.npy"), np.array(rows, dtype=np.int32))
+
+    with open(os.path.join(store_path, "info.json"), "w") as f:
+        json.dump({"dim": dim, "words": len(rows), "lines": lines,
+                   "source": os.path.basename(vocabulary_source_path)}, f)
+
+    print(str(time.ctime()) + "\tSTORE CREATED: " + store_path)
+    return store_path
+
+
+def format_glove_line(word, vector):
+    """
+    Creates the GloVe line of a word. The values are written with the shortest precision (6 or 9 significant digits)
+    that gives back the same float32 values when the line is parsed again.
+    """
+    values = ["%.6g" % value for value in vector.tolist()]
+    parsed = np.array(values, dtype=np.float32)
+    if not np.array_equal(parsed, vector):
+        for index in np.nonzero(parsed != vector)[0]:
+            values[index] = "%.9g" % vector[index]
+    return word + " " + " ".join(values) + "\n"
+
+
+class GloveStore(object):
+    """
+    Read-only, memory-mapped model with the same interface used by the tokenizers for the GloVe dictionary:
+    "word in model.keys()" and "model[word]", which returns the float32 vector of the word as a read-only view of the
+    store, so that the lookups neither copy the vectors nor format them as text.
+    """
+
+    def __init__(self, store_path):
+        with open(os.path.join(store_path, "info.json"), "r") as f:
+            self.info = json.load(f)
+        self.vectors = np.load(os.path.join(store_path, "vectors.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(store_path, "offsets.npy"), mmap_mode="r")
+        self.rows = np.load(os.path.join(store_path, "rows.npy"), mmap_mode="r")
+        self.words_file = open(os.path.join(store_path, "words.bin"), "rb")
+        self.words = mmap.mmap(self.words_file.fileno(), 0, access=mmap.ACCESS_READ)
+        # the tokenizers look up the same words many times
+        self.lookup = functools.lru_cache(maxsize=LOOKUP_CACHE_SIZE)(self.find_row)
+
+    def get_word(self, position):
+        return self.words[int(self.offsets[position]):int(self.offsets[position + 1])]
+
+    def find_row(self, word):
+        """
+        :param word: the word
+        :return: the row of the vectors matrix of the word, -1 if it is not in the store
+        """
+        key = word.encode("utf-8")
+        low = 0
+        high = len(self.rows)
+        while low < high:
+            middle = (low + high) // 2
+            if self.get_word(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self.rows) and self.get_word(low) == key:
+            return int(self.rows[low])
+        return -1
+
+    def keys(self):
+        return self
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, word):
+        return self.lookup(word) >= 0
+
+    def get_vector(self, word):
+        return np.array(self[word])
+
+    def __getitem__(self, word):
+        row = self.lookup(word)
+        if row < 0:
+            raise KeyError(word)
+        return self.vectors[row]
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Converts a GloVe file into a binary, memory-mapped store")
+
+    parser.add_argument('-s', '--size', help="embedding size",
+                        choices=[25, 300],
+                        type=int, default=300)
+
+    args = parser.parse_args()
+
+    if args.size == 300:
+        vocabulary_source_path = os.path.join(os.getcwd(), "resources", 'glove.840B.300d.txt')
+    else:
+        vocabulary_source_path = os.path.join(os.getcwd(), "resources", 'glove.twitter.27B.25d.txt')
+
+    convert_glove(vocabulary_source_path, args.size)
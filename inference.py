@@ -0,0 +1,47 @@
+__author__ = "Andrea Galassi"
+__copyright__ = "Copyright 2018-2020 Andrea Galassi"
+__license__ = "BSD 3-clause"
+__version__ = "0.1.0"
+__email__ = "a.galassi@unibo.it"
+
+"""
+Loader of the inference artifacts created by export_net.py. It only depends on TensorFlow and NumPy.
+"""
+
+import os
+import json
+import numpy as np
+import tensorflow as tf
+
+
+def load_inference_artifact(export_path):
+    """
+    Loads an exported network
+    :param export_path: folder of the SavedModel
+    :return: a prediction function that receives the list of inputs (source, target, distance) and returns the list of
+    outputs (link, relation, source, target), in the same order of the original network
+    """
+    with open(os.path.join(export_path, "assets.extra", "signature.json"), "r") as f:
+        order = json.load(f)
+
+    graph = tf.Graph()
+    session = tf.compat.v1.Session(graph=graph)
+    meta_graph = tf.compat.v1.saved_model.loader.load(session, [tf.compat.v1.saved_model.tag_constants.SERVING],
+                                                      export_path)
+    signature = meta_graph.signature_def['serving_default']
+
+    input_tensors = [graph.get_tensor_by_name(signature.inputs[name].name) for name in order["inputs"]]
+    output_tensors = [graph.get_tensor_by_name(signature.outputs[name].name) for name in order["outputs"]]
+
+    def predict(X, batch_size=500):
+        predictions = [[] for _ in output_tensors]
+        for start in range(0, len(X[0]), batch_size):
+            feed_dict = {}
+            for tensor, x in zip(input_tensors, X):
+                feed_dict[tensor] = x[start:start + batch_size]
+            batch_predictions = session.run(output_tensors, feed_dict=feed_dict)
+            for index in range(len(batch_predictions)):
+                predictions[index].append(batch_predictions[index])
+        return [np.concatenate(prediction) for prediction in predictions]
+
+    return predict
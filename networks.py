@@ -9,14 +9,16 @@ __email__ = "a.galassi@unibo.it"
 Code for creating some neural network models. Don't judge them, please. They are just born this way.
 """
 
+import os
 import tensorflow as tf
 import tensorflow.keras as keras
 import numpy as np
 import tensorflow.keras.backend as K
 from tensorflow.keras.layers import (BatchNormalization, Dropout, Dense, Input, Activation, LSTM, Conv1D, Add, Lambda, MaxPool1D,
                           Bidirectional, Concatenate, Flatten, Embedding, TimeDistributed, AveragePooling1D, Multiply,
-                          GlobalAveragePooling1D, GlobalMaxPooling1D, Reshape, Permute, RepeatVector, Masking)
+                          GlobalAveragePooling1D, GlobalMaxPooling1D, Reshape, Permute, RepeatVector, Masking, Layer)
 from glove_loader import DIM
+from vocabulary_store import load_embedding_view
 
 def make_resnet(input_layer, regularizer_weight, layers=(2, 2), res_size=int(DIM/3)*3, dropout=0, bn=True):
     prev_layer = input_layer
@@ -177,7 +179,7 @@ def make_embedder(input_layer, layer_name, regularizer_weight,
                                    recurrent_regularizer=keras.regularizers.l2(regularizer_weight),
                                    bias_regularizer=keras.regularizers.l2(regularizer_weight),
                                    return_sequences=False,
-                                   unroll=False, # not possible to unroll if the time shape is not specified
+                                   unroll=False,  # not possible to unroll if the time shape is not specified
                                    name=layer_name + '_LSTM'),
                               merge_mode='mul',
                               )(prev_layer)
@@ -1136,7 +1138,9 @@ def build_net_11(bow,
                 bn_final=True,
                 single_LSTM=False,
                 same_DE_layers=False,
-                temporalBN=False, ):
+                temporalBN=False,
+                fused_attention=False,
+                vocabulary_path=None):
     """
     Creates a neural network that takes as input two components (propositions) and ouputs the class of the two
     components, whether a relation between the two exists, and the class of that relation.
@@ -1172,27 +1176,33 @@ def build_net_11(bow,
     :param context: If the context (the original text) should be used as input
     :param distance: The maximum distance that is taken into account
     :param temporalBN: Whether temporal batch-norm is applied
+    :param fused_attention: Whether the attention of each proposition is computed by a single MaskedAttentionPooling
+                            layer, instead of the chain of scoring, masking, softmax and weighted sum layers. The
+                            weights of the unfused networks can be loaded with training_utils.transfer_weights
+    :param vocabulary_path: If it is different from None, the path of the vocabulary of the BoW input, and bow is not
+                            needed. The embeddings are then read from the shared store of the vocabularies by a
+                            SharedEmbedding layer, without being copied, and are not saved with the weights of the
+                            network
     :return:
     """
 
-    if bow is not None:
+    if bow is not None or vocabulary_path is not None:
         sourceprop_il = Input(shape=(propos_length,), name="source_input_L")
         targetprop_il = Input(shape=(propos_length,), name="target_input_L")
 
-
-        prev_source_l = Embedding(bow.shape[0],
-                                  bow.shape[1],
-                                  weights=[bow],
-                                  input_length=propos_length,
-                                  trainable=False,
-                                  name="source_embed")(sourceprop_il)
-
-        prev_target_l = Embedding(bow.shape[0],
-                                  bow.shape[1],
-                                  weights=[bow],
-                                  input_length=propos_length,
-                                  trainable=False,
-                                  name="target_embed")(targetprop_il)
+        # a single frozen table for both the inputs
+        if vocabulary_path is not None:
+            prop_embed = SharedEmbedding(vocabulary_path, name="prop_embed")
+        else:
+            prop_embed = Embedding(bow.shape[0],
+                                   bow.shape[1],
+                                   weights=[bow],
+                                   input_length=propos_length,
+                                   trainable=False,
+                                   name="prop_embed")
+
+        prev_source_l = prop_embed(sourceprop_il)
+        prev_target_l = prop_embed(targetprop_il)
     else:
         sourceprop_il = Input(shape=(propos_length, DIM), name="source_input_L")
         targetprop_il = Input(shape=(propos_length, DIM), name="target_input_L")
@@ -1279,11 +1289,9 @@ def build_net_11(bow,
                                     bias_regularizer=keras.regularizers.l2(regularizer_weight),
                                     return_sequences=True,
                                     unroll=False,  # not possible to unroll if the time shape is not specified
-                                    name='prop_LSTM',
-                                    ),
+                                    name='prop_LSTM'),
                                merge_mode='mul',
-                               name='biLSTM'
-                               )
+                               name='biLSTM')
 
         source_embed2 = embed2(prev_source_l)
         target_embed2 = embed2(prev_target_l)
@@ -1309,8 +1317,7 @@ def build_net_11(bow,
                                            unroll=False,  # not possible to unroll if the time shape is not specified
                                            name='source_LSTM'),
                                       merge_mode='mul',
-                                      name='source_biLSTM'
-                                      )(prev_source_l)
+                                      name='source_biLSTM')(prev_source_l)
 
         target_embed2 = Bidirectional(LSTM(units=embedding_size,
                                            dropout=dropout_embedder,
@@ -1322,8 +1329,7 @@ def build_net_11(bow,
                                            unroll=False,  # not possible to unroll if the time shape is not specified
                                            name='target_LSTM'),
                                       merge_mode='mul',
-                                      name='target_biLSTM'
-                                      )(prev_target_l)
+                                      name='target_biLSTM')(prev_target_l)
 
     # COARSE-GRAINED CO-ATTENTION (Ma et al) + ADDITIVE ATTENTION (Bahdanau et al):
     # average of the two act as query on the other
@@ -1350,78 +1356,588 @@ def build_net_11(bow,
     print("target query")
     print(target_query.shape)
 
-    time_shape = (source_keys.shape)[1]
-    space_shape = (source_keys.shape)[2]
+    if fused_attention:
+        # the layers take the names of the importance vectors, so that their weights can be loaded by name
+        target_embed2 = MaskedAttentionPooling(name='att_scores_target')([target_keys, target_query, prev_target_l,
+                                                                         targetprop_il])
+        source_embed2 = MaskedAttentionPooling(name='att_scores_source')([source_keys, source_query, prev_source_l,
+                                                                         sourceprop_il])
+    else:
+        time_shape = (source_keys.shape)[1]
+        space_shape = (source_keys.shape)[2]
+
+        # repeat the query and sum
+        source_query = RepeatVector(time_shape, name='repeat_query_source')(source_query)
+        target_query = RepeatVector(time_shape, name='repeat_query_target')(target_query)
+        print("repeat target query")
+        print(target_query.shape)
+        source_score = Add(name='att_addition_source')([source_query, source_keys])
+        target_score = Add(name='att_addition_target')([target_query, target_keys])
+        print("target score (sum)")
+        print(target_score.shape)
+
+        # activation and dot product with importance vector
+        target_score = Activation(activation='relu', name='att_activation_target')(target_score)
+        source_score = Activation(activation='relu', name='att_activation_source')(source_score)
+        print("target score (activation)")
+        print(target_score.shape)
+        imp_v_target = Dense(units=1,
+                             kernel_initializer='he_normal',
+                             name='importance_vector_target')
+        target_score = TimeDistributed(imp_v_target, name='att_scores_target')(target_score)
+        imp_v_source = Dense(units=1,
+                             kernel_initializer='he_normal',
+                             name='importance_vector_source')
+        source_score = TimeDistributed(imp_v_source, name='att_scores_source')(source_score)
+        print("target score (dot product)")
+        print(target_score.shape)
+
+        # application of mask: padding layer are associated to very negative scores to improve softmax
+        source_score = Flatten(name='att_scores_flat_source')(source_score)
+        target_score = Flatten(name='att_scores_flat_target')(target_score)
+        print("target score (flat)")
+        print(target_score.shape)
+        maskLayer = Lambda(create_padding_mask_fn(), name='masking')
+        negativeLayer = Lambda(create_mutiply_negative_elements_fn(), name='negative_mul')
+        mask_source = maskLayer(sourceprop_il)
+        mask_target = maskLayer(targetprop_il)
+        print("target mask (01)")
+        print(mask_target.shape)
+        neg_source = negativeLayer(mask_source)
+        neg_target = negativeLayer(mask_target)
+        print("target mask (negative)")
+        print(neg_target.shape)
+        source_score = Add(name='att_masked_addition_source')([neg_source, source_score])
+        target_score = Add(name='att_masked_addition_target')([neg_target, target_score])
+        print("target score (masked)")
+        print(neg_target.shape)
+
+        # softmax application
+        source_weight = Activation(activation='softmax', name='att_weights_source')(source_score)
+        target_weight = Activation(activation='softmax', name='att_weights_target')(target_score)
+        print("target weights (softmax)")
+        print(target_weight.shape)
+
+        # weighted sum
+        source_weight = Reshape(target_shape=(source_weight.shape[-1], 1), name='att_weights_reshape_source')(
+            source_weight)
+        target_weight = Reshape(target_shape=(target_weight.shape[-1], 1), name='att_weights_reshape_target')(
+            target_weight)
+        print("target weights (reshape)")
+        print(target_weight.shape)
+        source_weighted = Multiply(name='att_multiply_source')([source_weight, prev_source_l])
+        target_weighted = Multiply(name='att_multiply_target')([target_weight, prev_target_l])
+        print("target weighted values")
+        print(target_weighted.shape)
+        source_embed2 = Lambda(create_sum_fn(1), name='att_cv_source')(source_weighted)
+        target_embed2 = Lambda(create_sum_fn(1), name='att_cv_target')(target_weighted)
+        print("target context vector")
+        print(target_embed2.shape)
 
-    # repeat the query and sum
-    source_query = RepeatVector(time_shape, name='repeat_query_source')(source_query)
-    target_query = RepeatVector(time_shape, name='repeat_query_target')(target_query)
-    print("repeat target query")
-    print(target_query.shape)
-    source_score = Add(name='att_addition_source')([source_query, source_keys])
-    target_score = Add(name='att_addition_target')([target_query, target_keys])
-    print("target score (sum)")
-    print(target_score.shape)
 
-    # activation and dot product with importance vector
-    target_score = Activation(activation='relu', name='att_activation_target')(target_score)
-    source_score = Activation(activation='relu', name='att_activation_source')(source_score)
-    print("target score (activation)")
-    print(target_score.shape)
-    imp_v_target = Dense(units=1,
-                         kernel_initializer='he_normal',
-                         name='importance_vector_target')
-    target_score = TimeDistributed(imp_v_target, name='att_scores_target')(target_score)
-    imp_v_source = Dense(units=1,
-                         kernel_initializer='he_normal',
-                         name='importance_vector_source')
-    source_score = TimeDistributed(imp_v_source, name='att_scores_source')(source_score)
-    print("target score (dot product)")
-    print(target_score.shape)
+    if distance > 0:
+        prev_l = Concatenate(name='embed_merge')([source_embed2, target_embed2, dist_il])
+    else:
+        prev_l = Concatenate(name='embed_merge')([source_embed2, target_embed2])
 
-    # application of mask: padding layer are associated to very negative scores to improve softmax
-    source_score = Flatten(name='att_scores_flat_source')(source_score)
-    target_score = Flatten(name='att_scores_flat_target')(target_score)
-    print("target score (flat)")
-    print(target_score.shape)
-    maskLayer = Lambda(create_padding_mask_fn(), name='masking')
-    negativeLayer = Lambda(create_mutiply_negative_elements_fn(), name='negative_mul')
-    mask_source = maskLayer(sourceprop_il)
-    mask_target = maskLayer(targetprop_il)
-    print("target mask (01)")
-    print(mask_target.shape)
-    neg_source = negativeLayer(mask_source)
-    neg_target = negativeLayer(mask_target)
-    print("target mask (negative)")
-    print(neg_target.shape)
-    source_score = Add(name='att_masked_addition_source')([neg_source, source_score])
-    target_score = Add(name='att_masked_addition_target')([neg_target, target_score])
-    print("target score (masked)")
-    print(neg_target.shape)
+    if bn_res:
+        prev_l = BatchNormalization(name='merge_BN')(prev_l)
 
-    # softmax application
-    source_weight = Activation(activation='softmax', name='att_weights_source')(source_score)
-    target_weight = Activation(activation='softmax', name='att_weights_target')(target_score)
-    print("target weights (softmax)")
-    print(target_weight.shape)
+    prev_l = Dropout(dropout_resnet, name='merge_Dropout')(prev_l)
 
-    # weighted sum
-    source_weight = Reshape(target_shape=(source_weight.shape[-1], 1), name='att_weights_reshape_source')(
-        source_weight)
-    target_weight = Reshape(target_shape=(target_weight.shape[-1], 1), name='att_weights_reshape_target')(
-        target_weight)
-    print("target weights (reshape)")
-    print(target_weight.shape)
-    source_weighted = Multiply(name='att_multiply_source')([source_weight, prev_source_l])
-    target_weighted = Multiply(name='att_multiply_target')([target_weight, prev_target_l])
-    print("target weighted values")
-    print(target_weighted.shape)
-    source_embed2 = Lambda(create_sum_fn(1), name='att_cv_source')(source_weighted)
-    target_embed2 = Lambda(create_sum_fn(1), name='att_cv_target')(target_weighted)
-    print("target context vector")
-    print(target_embed2.shape)
+    prev_l = Dense(units=final_size,
+                   activation='relu',
+                   kernel_initializer='he_normal',
+                   kernel_regularizer=keras.regularizers.l2(regularizer_weight),
+                   bias_regularizer=keras.regularizers.l2(regularizer_weight),
+                   name='merge_dense'
+                   )(prev_l)
+
+    prev_l = make_resnet(prev_l, regularizer_weight, resnet_layers,
+                         res_size=res_size, dropout=dropout_resnet, bn=bn_res)
+
+    if bn_final:
+        prev_l = BatchNormalization(name='final_BN')(prev_l)
+
+    prev_l = Dropout(dropout_final, name='final_dropout')(prev_l)
+
+    rel_ol = Dense(units=outputs[1],
+                   name='relation',
+                   activation='softmax',
+                   )(prev_l)
+
+    if link_as_sum is None:
+        link_ol = Dense(units=outputs[0],
+                        name='link',
+                        activation='softmax',
+                        )(prev_l)
+    else:
+        link_scores = []
+        rel_scores = []
+        # creates a layer that extracts the score of a single relation classification class
+        for i in range(outputs[1]):
+            rel_scores.append(Lambda(create_crop_fn(1, i, i + 1), name='rel' + str(i))(rel_ol))
+
+        # for each link class, sums the relation score contributions
+        for i in range(len(link_as_sum)):
+            # terms to be summed together for one of the link classes
+            link_contribute = []
+            for j in range(len(link_as_sum[i])):
+                value = link_as_sum[i][j]
+                link_contribute.append(rel_scores[value])
+            link_class = Add(name='link_' + str(i))(link_contribute)
+            link_scores.append(link_class)
+
+        link_ol = Concatenate(name='link')(link_scores)
+
+
+    source_ol = Dense(units=outputs[2],
+                      name='source',
+                      activation='softmax',
+                      )(prev_l)
+
+    target_ol = Dense(units=outputs[3],
+                      name='target',
+                      activation='softmax',
+                      )(prev_l)
+
+    full_model = keras.Model(inputs=(sourceprop_il, targetprop_il, dist_il),
+                             outputs=(link_ol, rel_ol, source_ol, target_ol),
+                             )
+
+    return full_model
+
+
+def build_net_12(bow,
+                propos_length,
+                max_components,
+                outputs,
+                link_as_sum,
+                distance,
+                regularizer_weight=0.001,
+                dropout_embedder=0.1,
+                dropout_final=0,
+                embedding_size=int(25),
+                final_size=int(20),
+                bn_embed=True,
+                bn_final=True,
+                temporalBN=False,
+                vocabulary_path=None):
+    """
+    Creates a neural network that takes as input all the components (propositions) of a document and outputs, in a
+    single forward pass, the class of each component and the n x n matrices of the link and relation scores.
+    The pairs are scored by a biaffine classifier over the encoded components, to which an embedding of the distance
+    between the two components is added.
+
+    The matrices are flattened: the pair of source i and target j is at position i * max_components + j.
+    The padding components are all-zero; the pairs that involve them are classified as the not-link relation.
+
+    :param bow: If it is different from None, it is the matrix with the pre-trained embeddings used by the Embedding
+                layer of keras, the input is supposed in BoW form.
+                If it is None, the input is supposed to already contain pre-trained embeddings.
+    :param propos_length: The temporal length of the proposition input
+    :param max_components: The maximum number of components of a document
+    :param outputs: Tuple, the classes of the four classifiers: link, relation, source, target. The component
+                    classifier uses the number of source classes
+    :param link_as_sum: if None, the link classifier will be built as an additional biaffine classifier. If it is an
+                        array of arrays: the outputs of the relation classifier will be summed together according to
+                        the values in the arrays (see build_net_11). The last value of the second array is used as
+                        not-link relation for the padding pairs
+    :param distance: The maximum distance that is taken into account
+    :param regularizer_weight: Regularization weight
+    :param dropout_embedder: Dropout used in the embedder
+    :param dropout_final: Dropout used in the final classifiers
+    :param embedding_size: Size of the spatial reduced embeddings
+    :param final_size: Number of neurons of the biaffine projections
+    :param bn_embed: Whether the batch normalization should be used in the embedding block
+    :param bn_final: Whether the batch normalization should be used in the final layer
+    :param temporalBN: Whether temporal batch-norm is applied
+    :param vocabulary_path: If it is different from None, the path of the vocabulary of the BoW input, and bow is not
+                            needed. The embeddings are then read from the shared store of the vocabularies by a
+                            SharedEmbedding layer, without being copied, and are not saved with the weights of the
+                            network
+    :return:
+    """
+
+    if link_as_sum is not None:
+        not_link_label = link_as_sum[1][-1]
+    else:
+        not_link_label = 1
+
+    if bow is not None or vocabulary_path is not None:
+        document_il = Input(shape=(max_components, propos_length), name="document_input_L")
+
+        if vocabulary_path is not None:
+            prev_l = SharedEmbedding(vocabulary_path, name="document_embed")(document_il)
+        else:
+            prev_l = Embedding(bow.shape[0],
+                               bow.shape[1],
+                               weights=[bow],
+                               trainable=False,
+                               name="document_embed")(document_il)
+    else:
+        document_il = Input(shape=(max_components, propos_length, DIM), name="document_input_L")
+        prev_l = document_il
+
+    # clipped difference between the position of the target and the one of the source, shifted to be positive
+    dist_il = Input(shape=(max_components * max_components,), name="dist_input_L")
+
+    component_mask = Lambda(create_component_mask_fn(), name='component_mask')(document_il)
+
+    # every component is encoded independently from the others, as in the pair networks
+    if bn_embed:
+        if temporalBN:
+            prev_l = BatchNormalization(name="TBN_prop", axis=-2)(prev_l)
+        else:
+            prev_l = BatchNormalization(name="BN_prop")(prev_l)
+
+    prev_l = Dropout(dropout_embedder, name='prop_dropout')(prev_l)
+
+    relu_embedder = Dense(units=embedding_size,
+                          activation='relu',
+                          kernel_initializer='he_normal',
+                          kernel_regularizer=keras.regularizers.l2(regularizer_weight),
+                          bias_regularizer=keras.regularizers.l2(regularizer_weight),
+                          name='relu_embedder')
+    prev_l = TimeDistributed(relu_embedder, name='TD_prop_embedder')(prev_l)
+
+    if bn_embed:
+        prev_l = BatchNormalization(name="BN_LSTM_prop")(prev_l)
+
+    prop_LSTM = Bidirectional(LSTM(units=embedding_size,
+                                   dropout=dropout_embedder,
+                                   recurrent_dropout=dropout_embedder,
+                                   kernel_regularizer=keras.regularizers.l2(regularizer_weight),
+                                   recurrent_regularizer=keras.regularizers.l2(regularizer_weight),
+                                   bias_regularizer=keras.regularizers.l2(regularizer_weight),
+                                   return_sequences=False,
+                                   unroll=False,  # not possible to unroll if the time shape is not specified
+                                   name='prop_LSTM'),
+                              merge_mode='mul',
+                              name='prop_biLSTM')
+    prev_l = TimeDistributed(prop_LSTM, name='TD_prop_biLSTM')(prev_l)
+
+    # the components are contextualized by the rest of the document
+    document_l = Bidirectional(LSTM(units=embedding_size,
+                                    dropout=dropout_embedder,
+                                    recurrent_dropout=dropout_embedder,
+                                    kernel_regularizer=keras.regularizers.l2(regularizer_weight),
+                                    recurrent_regularizer=keras.regularizers.l2(regularizer_weight),
+                                    bias_regularizer=keras.regularizers.l2(regularizer_weight),
+                                    return_sequences=True,
+                                    unroll=False,
+                                    name='document_LSTM'),
+                               merge_mode='concat',
+                               name='document_biLSTM')(prev_l)
+
+    if bn_final:
+        document_l = BatchNormalization(name='final_BN')(document_l)
+
+    document_l = Dropout(dropout_final, name='final_dropout')(document_l)
+
+    component_ol = TimeDistributed(Dense(units=outputs[2],
+                                         activation='softmax',
+                                         ),
+                                   name='component')(document_l)
+
+    source_l = TimeDistributed(Dense(units=final_size,
+                                     activation='relu',
+                                     kernel_initializer='he_normal',
+                                     kernel_regularizer=keras.regularizers.l2(regularizer_weight),
+                                     bias_regularizer=keras.regularizers.l2(regularizer_weight),
+                                     ),
+                               name='source_projection')(document_l)
+    target_l = TimeDistributed(Dense(units=final_size,
+                                     activation='relu',
+                                     kernel_initializer='he_normal',
+                                     kernel_regularizer=keras.regularizers.l2(regularizer_weight),
+                                     bias_regularizer=keras.regularizers.l2(regularizer_weight),
+                                     ),
+                               name='target_projection')(document_l)
+
+    rel_scores = Biaffine(units=outputs[1], regularizer_weight=regularizer_weight,
+                          name='relation_biaffine')([source_l, target_l])
+    dist_scores = Embedding(int(max(distance, 0) * 2 + 1),
+                            outputs[1],
+                            embeddings_initializer='zeros',
+                            name='relation_distance')(dist_il)
+    rel_scores = Add(name='relation_scores')([rel_scores, dist_scores])
+    rel_scores = PairMasking(not_link_label=not_link_label, name='relation_masking')([rel_scores, component_mask])
+    rel_ol = Activation(activation='softmax', name='relation')(rel_scores)
+
+    if link_as_sum is None:
+        link_scores = Biaffine(units=outputs[0], regularizer_weight=regularizer_weight,
+                               name='link_biaffine')([source_l, target_l])
+        link_scores = PairMasking(not_link_label=not_link_label, name='link_masking')([link_scores, component_mask])
+        link_ol = Activation(activation='softmax', name='link')(link_scores)
+    else:
+        link_scores = []
+        rel_scores = []
+        # creates a layer that extracts the score of a single relation classification class
+        for i in range(outputs[1]):
+            rel_scores.append(Lambda(create_crop_fn(2, i, i + 1), name='rel' + str(i))(rel_ol))
+
+        # for each link class, sums the relation score contributions
+        for i in range(len(link_as_sum)):
+            # terms to be summed together for one of the link classes
+            link_contribute = []
+            for j in range(len(link_as_sum[i])):
+                value = link_as_sum[i][j]
+                link_contribute.append(rel_scores[value])
+            link_class = Add(name='link_' + str(i))(link_contribute)
+            link_scores.append(link_class)
+
+        link_ol = Concatenate(name='link')(link_scores)
+
+    full_model = keras.Model(inputs=(document_il, dist_il),
+                             outputs=(link_ol, rel_ol, component_ol),
+                             )
+
+    return full_model
+
+
+def make_encoder_layers(regularizer_weight, layer_name, units, layers=3, encoder='conv', bn=True):
+    """
+    Creates the layers of a non-recurrent proposition encoder, which can be shared by multiple inputs
+    'conv': residual blocks of Conv1D whose dilation doubles at each block (1, 2, 4, ...), so that the receptive field
+    grows exponentially with the number of blocks
+    'attention': a residual block of Conv1D, which encodes the local order of the words, followed by residual blocks
+    of self-attention
+    The inputs are padded on the left: the padding steps are set to zero before each convolution (see
+    apply_encoder_layers), so that the 'same' padding of the convolutions does not mix them with the real steps.
+    The encoded sequence is reduced to a vector by averaging its real steps.
+    :param regularizer_weight: Regularization weight
+    :param layer_name: prefix of the names of the layers
+    :param units: Size of the encoder, which must be the size of its input
+    :param layers: Number of residual blocks
+    :param encoder: 'conv' or 'attention'
+    :param bn: Whether the batch normalization is used at the beginning of the blocks
+    :return: the list of the blocks, each one a list of layers, and the pooling layer
+    """
+    if encoder not in ['conv', 'attention']:
+        raise Exception('UNKNOWN ENCODER: ' + str(encoder))
+
+    blocks = []
+    for i in range(layers):
+        block = []
+        if bn:
+            block.append(BatchNormalization(name=layer_name + '_encoder_BN_' + str(i)))
+
+        if encoder == 'attention' and i > 0:
+            block.append(MaskedSelfAttention(units=units,
+                                             regularizer_weight=regularizer_weight,
+                                             name=layer_name + '_encoder_attention_' + str(i)))
+        else:
+            dilation = 2 ** i if encoder == 'conv' else 1
+            block.append(Conv1D(filters=units,
+                                kernel_size=3,
+                                dilation_rate=dilation,
+                                padding='same',
+                                activation='relu',
+                                kernel_initializer='he_normal',
+                                kernel_regularizer=keras.regularizers.l2(regularizer_weight),
+                                bias_regularizer=keras.regularizers.l2(regularizer_weight),
+                                name=layer_name + '_encoder_conv_' + str(i)))
+        blocks.append(block)
+
+    pooling = MaskedGlobalPooling(name=layer_name + '_encoder_pooling')
+
+    return blocks, pooling
 
 
+def apply_encoder_layers(input_layer, tokens, blocks, pooling, layer_name, dropout=0):
+    """
+    Applies the layers created by make_encoder_layers to a sequence
+    :param input_layer: the sequence
+    :param tokens: the input of the network, where the padding is made of zeros
+    :param blocks: the residual blocks
+    :param pooling: the pooling layer
+    :param layer_name: prefix of the names of the layers created here
+    :param dropout: Dropout at the end of each block
+    :return: the vector that encodes the sequence
+    """
+    prev_layer = input_layer
+    for i in range(len(blocks)):
+        block_input = prev_layer
+        for layer in blocks[i]:
+            if isinstance(layer, MaskedSelfAttention):
+                prev_layer = layer([prev_layer, tokens])
+            else:
+                if isinstance(layer, Conv1D):
+                    # the previous layers (e.g. the batch normalization) may have moved the padding away from zero
+                    prev_layer = PaddingMasking(name=layer_name + '_encoder_mask_' + str(i))([prev_layer, tokens])
+                prev_layer = layer(prev_layer)
+        prev_layer = Dropout(dropout, name=layer_name + '_encoder_Dropout_' + str(i))(prev_layer)
+        prev_layer = Add(name=layer_name + '_encoder_sum_' + str(i))([block_input, prev_layer])
+
+    return pooling([prev_layer, tokens])
+
+
+def build_net_13(bow,
+                 propos_length,
+                 outputs,
+                 link_as_sum,
+                 distance,
+                 regularizer_weight=0.001,
+                 dropout_embedder=0.1,
+                 dropout_resnet=0.1,
+                 dropout_final=0,
+                 embedding_size=int(25),
+                 embedder_layers=2,
+                 resnet_layers=(2, 2),
+                 res_size=50,
+                 final_size=int(20),
+                 bn_embed=True,
+                 bn_res=True,
+                 bn_final=True,
+                 single_encoder=False,
+                 same_DE_layers=False,
+                 temporalBN=False,
+                 encoder='conv',
+                 encoder_layers=3,
+                 vocabulary_path=None):
+    """
+    Creates a neural network that takes as input two components (propositions) and ouputs the class of the two
+    components, whether a relation between the two exists, and the class of that relation.
+    It is the network 7 with a non-recurrent proposition encoder instead of the biLSTM, so that all the steps of a
+    proposition are processed in parallel.
+
+    :param bow: If it is different from None, it is the matrix with the pre-trained embeddings used by the Embedding
+                layer of keras, the input is supposed in BoW form.
+                If it is None, the input is supposed to already contain pre-trained embeddings.
+    :param propos_length: The temporal length of the proposition input
+    :param regularizer_weight: Regularization weight
+    :param dropout_embedder: Dropout used in the embedder and in the encoder
+    :param dropout_resnet: Dropout used in the residual network
+    :param dropout_final: Dropout used in the final classifiers
+    :param embedding_size: Size of the spatial reduced embeddings
+    :param embedder_layers: Number of layers in the initial embedder (int)
+    :param resnet_layers: Number of layers in the final residual network. Tuple where the first value indicates the
+                          number of blocks and the second the number of layers per block
+    :param res_size: Number of neurons in the residual blocks
+    :param final_size: Number of neurons of the final layer
+    :param outputs: Tuple, the classes of the four classifiers: link, relation, source, target
+    :param link_as_sum: if None, the link classifier will be built as usual. If it is an array of arrays: the outputs
+                        of the relation classifier will be summed together according to the values in the arrays.
+                        Example: if the link classification is binary, and its contributions from relation
+                        classification are classes 0 and 2 for positive and 1, 3, 4 for negative, it will be
+                        [[0, 2], [1, 3, 4]]
+    :param bn_embed: Whether the batch normalization should be used in the embedding block and in the encoder
+    :param bn_res: Whether the batch normalization should be used in the residual blocks
+    :param bn_final: Whether the batch normalization should be used in the final layer
+    :param single_encoder: Whether the same encoder should be used both for processing the target and the source
+    :param same_DE_layers: Whether the deep embedder layers should be shared between source and target
+    :param distance: The maximum distance that is taken into account
+    :param temporalBN: Whether temporal batch-norm is applied
+    :param encoder: 'conv' for the stacked dilated convolutions, 'attention' for the self-attention encoder. See
+                    make_encoder_layers
+    :param encoder_layers: Number of residual blocks of the encoder
+    :param vocabulary_path: If it is different from None, the path of the vocabulary of the BoW input, and bow is not
+                            needed. The embeddings are then read from the shared store of the vocabularies by a
+                            SharedEmbedding layer, without being copied, and are not saved with the weights of the
+                            network
+    :return:
+    """
+
+    if bow is not None or vocabulary_path is not None:
+        sourceprop_il = Input(shape=(propos_length,), name="source_input_L")
+        targetprop_il = Input(shape=(propos_length,), name="target_input_L")
+
+        # a single frozen table for both the inputs
+        if vocabulary_path is not None:
+            prop_embed = SharedEmbedding(vocabulary_path, name="prop_embed")
+        else:
+            prop_embed = Embedding(bow.shape[0],
+                                   bow.shape[1],
+                                   weights=[bow],
+                                   input_length=propos_length,
+                                   trainable=False,
+                                   name="prop_embed")
+
+        prev_source_l = prop_embed(sourceprop_il)
+        prev_target_l = prop_embed(targetprop_il)
+    else:
+        sourceprop_il = Input(shape=(propos_length, DIM), name="source_input_L")
+        targetprop_il = Input(shape=(propos_length, DIM), name="target_input_L")
+        prev_source_l = sourceprop_il
+        prev_target_l = targetprop_il
+
+    if distance > 0:
+        dist_il = Input(shape=(int(distance*2),), name="dist_input_L")
+    else:
+        dist_il = Input(shape=(2,), name="dist_input_L")
+
+    shape = int(np.shape(prev_source_l)[2])
+    layers = make_embedder_layers(regularizer_weight, shape=shape, layers=embedder_layers,
+                                  layers_size=embedding_size, temporalBN=temporalBN)
+    if same_DE_layers:
+        make_embedder = make_embedder_with_all_layers
+    else:
+        make_embedder = make_embedder_with_layers
+        layers = layers[0]
+
+    if embedder_layers > 0:
+
+        prev_source_l = make_embedder(prev_source_l, 'source', dropout=dropout_embedder,
+                                      layers=layers, bn=bn_embed, temporalBN=temporalBN)
+        prev_target_l = make_embedder(prev_target_l, 'target', dropout=dropout_embedder,
+                                      layers=layers, bn=bn_embed, temporalBN=temporalBN)
+
+    if same_DE_layers:
+        if bn_embed:
+            if temporalBN:
+                bn_layer = BatchNormalization(name="TBN_DENSE_prop", axis=-2)
+            else:
+                bn_layer = BatchNormalization(name="BN_DENSE_generic")
+            prev_source_l = bn_layer(prev_source_l)
+            prev_target_l = bn_layer(prev_target_l)
+
+        drop_layer = Dropout(dropout_embedder)
+
+        prev_source_l = drop_layer(prev_source_l)
+        prev_target_l = drop_layer(prev_target_l)
+
+    else:
+        if bn_embed:
+            if temporalBN:
+                prev_source_l = BatchNormalization(axis=-2)(prev_source_l)
+                prev_target_l = BatchNormalization(axis=-2)(prev_target_l)
+            else:
+                prev_source_l = BatchNormalization()(prev_source_l)
+                prev_target_l = BatchNormalization()(prev_target_l)
+
+        prev_source_l = Dropout(dropout_embedder)(prev_source_l)
+        prev_target_l = Dropout(dropout_embedder)(prev_target_l)
+
+    relu_embedder = Dense(units=embedding_size,
+                          activation='relu',
+                          kernel_initializer='he_normal',
+                          kernel_regularizer=keras.regularizers.l2(regularizer_weight),
+                          bias_regularizer=keras.regularizers.l2(regularizer_weight),
+                          name='relu_embedder')
+
+    TD_prop = TimeDistributed(relu_embedder, name='TD_prop_embedder')
+    prev_source_l = TD_prop(prev_source_l)
+    prev_target_l = TD_prop(prev_target_l)
+
+    if single_encoder:
+        blocks, pooling = make_encoder_layers(regularizer_weight, 'prop', units=embedding_size,
+                                              layers=encoder_layers, encoder=encoder, bn=bn_embed)
+        source_embed2 = apply_encoder_layers(prev_source_l, sourceprop_il, blocks, pooling, 'source',
+                                             dropout=dropout_embedder)
+        target_embed2 = apply_encoder_layers(prev_target_l, targetprop_il, blocks, pooling, 'target',
+                                             dropout=dropout_embedder)
+    else:
+        blocks, pooling = make_encoder_layers(regularizer_weight, 'source', units=embedding_size,
+                                              layers=encoder_layers, encoder=encoder, bn=bn_embed)
+        source_embed2 = apply_encoder_layers(prev_source_l, sourceprop_il, blocks, pooling, 'source',
+                                             dropout=dropout_embedder)
+
+        blocks, pooling = make_encoder_layers(regularizer_weight, 'target', units=embedding_size,
+                                              layers=encoder_layers, encoder=encoder, bn=bn_embed)
+        target_embed2 = apply_encoder_layers(prev_target_l, targetprop_il, blocks, pooling, 'target',
+                                             dropout=dropout_embedder)
+
     if distance > 0:
         prev_l = Concatenate(name='embed_merge')([source_embed2, target_embed2, dist_il])
     else:
@@ -1463,7 +1979,7 @@ def build_net_11(bow,
         rel_scores = []
         # creates a layer that extracts the score of a single relation classification class
         for i in range(outputs[1]):
-            rel_scores.append(Lambda(create_crop_fn(1, i, i + 1), name='rel' + str(i))(rel_ol))
+            rel_scores.append(Lambda(create_crop_fn(1, i, i+1), name='rel'+str(i))(rel_ol))
 
         # for each link class, sums the relation score contributions
         for i in range(len(link_as_sum)):
@@ -1472,12 +1988,11 @@ def build_net_11(bow,
             for j in range(len(link_as_sum[i])):
                 value = link_as_sum[i][j]
                 link_contribute.append(rel_scores[value])
-            link_class = Add(name='link_' + str(i))(link_contribute)
+            link_class = Add(name='link_'+str(i))(link_contribute)
             link_scores.append(link_class)
 
         link_ol = Concatenate(name='link')(link_scores)
 
-
     source_ol = Dense(units=outputs[2],
                       name='source',
                       activation='softmax',
@@ -1517,7 +2032,8 @@ def build_net_7(bow,
                 text_pooling=0,
                 pooling_type='avg',
                 same_DE_layers=False,
-                temporalBN=False,):
+                temporalBN=False,
+                vocabulary_path=None):
     """
     Creates a neural network that takes as input two components (propositions) and ouputs the class of the two
     components, whether a relation between the two exists, and the class of that relation.
@@ -1555,26 +2071,30 @@ def build_net_7(bow,
     :param context: If the context (the original text) should be used as input
     :param distance: The maximum distance that is taken into account
     :param temporalBN: Whether temporal batch-norm is applied
+    :param vocabulary_path: If it is different from None, the path of the vocabulary of the BoW input, and bow is not
+                            needed. The embeddings are then read from the shared store of the vocabularies by a
+                            SharedEmbedding layer, without being copied, and are not saved with the weights of the
+                            network
     :return:
     """
 
-    if bow is not None:
+    if bow is not None or vocabulary_path is not None:
         sourceprop_il = Input(shape=(propos_length,), name="source_input_L")
         targetprop_il = Input(shape=(propos_length,), name="target_input_L")
 
-        prev_source_l = Embedding(bow.shape[0],
-                                  bow.shape[1],
-                                  weights=[bow],
-                                  input_length=propos_length,
-                                  trainable=False,
-                                  name="source_embed")(sourceprop_il)
-
-        prev_target_l = Embedding(bow.shape[0],
-                                  bow.shape[1],
-                                  weights=[bow],
-                                  input_length=propos_length,
-                                  trainable=False,
-                                  name="target_embed")(targetprop_il)
+        # a single frozen table for both the inputs
+        if vocabulary_path is not None:
+            prop_embed = SharedEmbedding(vocabulary_path, name="prop_embed")
+        else:
+            prop_embed = Embedding(bow.shape[0],
+                                   bow.shape[1],
+                                   weights=[bow],
+                                   input_length=propos_length,
+                                   trainable=False,
+                                   name="prop_embed")
+
+        prev_source_l = prop_embed(sourceprop_il)
+        prev_target_l = prop_embed(targetprop_il)
     else:
         sourceprop_il = Input(shape=(propos_length, DIM), name="source_input_L")
         targetprop_il = Input(shape=(propos_length, DIM), name="target_input_L")
@@ -1670,12 +2190,10 @@ def build_net_7(bow,
                                     recurrent_regularizer=keras.regularizers.l2(regularizer_weight),
                                     bias_regularizer=keras.regularizers.l2(regularizer_weight),
                                     return_sequences=False,
-                                    unroll=False, # not possible to unroll if the time shape is not specified
-                                    name='prop_LSTM',
-                                    ),
+                                    unroll=False,  # not possible to unroll if the time shape is not specified
+                                    name='prop_LSTM'),
                                merge_mode='mul',
-                               name='biLSTM'
-                               )
+                               name='biLSTM')
 
         source_embed2 = embed2(prev_source_l)
         target_embed2 = embed2(prev_target_l)
@@ -1691,30 +2209,28 @@ def build_net_7(bow,
 
 
         source_embed2 = Bidirectional(LSTM(units=embedding_size,
-                                       dropout=dropout_embedder,
-                                       recurrent_dropout=dropout_embedder,
-                                       kernel_regularizer=keras.regularizers.l2(regularizer_weight),
-                                       recurrent_regularizer=keras.regularizers.l2(regularizer_weight),
-                                       bias_regularizer=keras.regularizers.l2(regularizer_weight),
-                                       return_sequences=False,
-                                       unroll=False,  # not possible to unroll if the time shape is not specified
-                                       name='source_LSTM'),
+                                           dropout=dropout_embedder,
+                                           recurrent_dropout=dropout_embedder,
+                                           kernel_regularizer=keras.regularizers.l2(regularizer_weight),
+                                           recurrent_regularizer=keras.regularizers.l2(regularizer_weight),
+                                           bias_regularizer=keras.regularizers.l2(regularizer_weight),
+                                           return_sequences=False,
+                                           unroll=False,  # not possible to unroll if the time shape is not specified
+                                           name='source_LSTM'),
                                       merge_mode='mul',
-                                      name='source_biLSTM'
-                                      )(prev_source_l)
+                                      name='source_biLSTM')(prev_source_l)
 
         target_embed2 = Bidirectional(LSTM(units=embedding_size,
-                                         dropout=dropout_embedder,
-                                         recurrent_dropout=dropout_embedder,
-                                         kernel_regularizer=keras.regularizers.l2(regularizer_weight),
-                                         recurrent_regularizer=keras.regularizers.l2(regularizer_weight),
-                                         bias_regularizer=keras.regularizers.l2(regularizer_weight),
-                                         return_sequences=False,
-                                         unroll=False,  # not possible to unroll if the time shape is not specified
-                                         name='target_LSTM'),
-                                    merge_mode='mul',
-                                  name='target_biLSTM'
-                                    )(prev_target_l)
+                                           dropout=dropout_embedder,
+                                           recurrent_dropout=dropout_embedder,
+                                           kernel_regularizer=keras.regularizers.l2(regularizer_weight),
+                                           recurrent_regularizer=keras.regularizers.l2(regularizer_weight),
+                                           bias_regularizer=keras.regularizers.l2(regularizer_weight),
+                                           return_sequences=False,
+                                           unroll=False,  # not possible to unroll if the time shape is not specified
+                                           name='target_LSTM'),
+                                      merge_mode='mul',
+                                      name='target_biLSTM')(prev_target_l)
 
     if distance > 0:
         prev_l = Concatenate(name='embed_merge')([source_embed2, target_embed2, dist_il])
@@ -2285,12 +2801,10 @@ def build_not_res_net_7(bow=None,
                                     recurrent_regularizer=keras.regularizers.l2(regularizer_weight),
                                     bias_regularizer=keras.regularizers.l2(regularizer_weight),
                                     return_sequences=False,
-                                    unroll=False, # not possible to unroll if the time shape is not specified
-                                    name='prop_LSTM',
-                                    ),
+                                    unroll=False,  # not possible to unroll if the time shape is not specified
+                                    name='prop_LSTM'),
                                merge_mode='mul',
-                               name='biLSTM'
-                               )
+                               name='biLSTM')
 
         source_embed2 = embed2(prev_source_l)
         target_embed2 = embed2(prev_target_l)
@@ -2305,8 +2819,7 @@ def build_not_res_net_7(bow=None,
                                          unroll=False,  # not possible to unroll if the time shape is not specified
                                          name='text_LSTM'),
                                     merge_mode='mul',
-                                    name='text_biLSTM'
-                                    )(prev_text_l)
+                                    name='text_biLSTM')(prev_text_l)
     else:
         if bn_embed:
             if temporalBN:
@@ -2317,32 +2830,6 @@ def build_not_res_net_7(bow=None,
                 prev_target_l = BatchNormalization(name="BN_LSTM_target")(prev_target_l)
 
         text_embed2 = Bidirectional(LSTM(units=embedding_size,
-                                       dropout=dropout_embedder,
-                                       recurrent_dropout=dropout_embedder,
-                                       kernel_regularizer=keras.regularizers.l2(regularizer_weight),
-                                       recurrent_regularizer=keras.regularizers.l2(regularizer_weight),
-                                       bias_regularizer=keras.regularizers.l2(regularizer_weight),
-                                       return_sequences=False,
-                                       unroll=False, # not possible to unroll if the time shape is not specified
-                                       name='text_LSTM'),
-                                  merge_mode='mul',
-                                  name='text_biLSTM'
-                                  )(prev_text_l)
-
-        source_embed2 = Bidirectional(LSTM(units=embedding_size,
-                                       dropout=dropout_embedder,
-                                       recurrent_dropout=dropout_embedder,
-                                       kernel_regularizer=keras.regularizers.l2(regularizer_weight),
-                                       recurrent_regularizer=keras.regularizers.l2(regularizer_weight),
-                                       bias_regularizer=keras.regularizers.l2(regularizer_weight),
-                                       return_sequences=False,
-                                       unroll=False,  # not possible to unroll if the time shape is not specified
-                                       name='source_LSTM'),
-                                      merge_mode='mul',
-                                      name='source_biLSTM'
-                                      )(prev_source_l)
-
-        target_embed2 = Bidirectional(LSTM(units=embedding_size,
                                          dropout=dropout_embedder,
                                          recurrent_dropout=dropout_embedder,
                                          kernel_regularizer=keras.regularizers.l2(regularizer_weight),
@@ -2350,10 +2837,33 @@ def build_not_res_net_7(bow=None,
                                          bias_regularizer=keras.regularizers.l2(regularizer_weight),
                                          return_sequences=False,
                                          unroll=False,  # not possible to unroll if the time shape is not specified
-                                         name='target_LSTM'),
+                                         name='text_LSTM'),
                                     merge_mode='mul',
-                                  name='target_biLSTM'
-                                    )(prev_target_l)
+                                    name='text_biLSTM')(prev_text_l)
+
+        source_embed2 = Bidirectional(LSTM(units=embedding_size,
+                                           dropout=dropout_embedder,
+                                           recurrent_dropout=dropout_embedder,
+                                           kernel_regularizer=keras.regularizers.l2(regularizer_weight),
+                                           recurrent_regularizer=keras.regularizers.l2(regularizer_weight),
+                                           bias_regularizer=keras.regularizers.l2(regularizer_weight),
+                                           return_sequences=False,
+                                           unroll=False,  # not possible to unroll if the time shape is not specified
+                                           name='source_LSTM'),
+                                      merge_mode='mul',
+                                      name='source_biLSTM')(prev_source_l)
+
+        target_embed2 = Bidirectional(LSTM(units=embedding_size,
+                                           dropout=dropout_embedder,
+                                           recurrent_dropout=dropout_embedder,
+                                           kernel_regularizer=keras.regularizers.l2(regularizer_weight),
+                                           recurrent_regularizer=keras.regularizers.l2(regularizer_weight),
+                                           bias_regularizer=keras.regularizers.l2(regularizer_weight),
+                                           return_sequences=False,
+                                           unroll=False,  # not possible to unroll if the time shape is not specified
+                                           name='target_LSTM'),
+                                      merge_mode='mul',
+                                      name='target_biLSTM')(prev_target_l)
 
     if context and distance > 0:
         prev_l = Concatenate(name='embed_merge')([text_embed2, source_embed2, target_embed2, dist_il])
@@ -2418,6 +2928,296 @@ def build_not_res_net_7(bow=None,
 
 
 
+class Biaffine(Layer):
+    """
+    Biaffine classifier of all the pairs of two sequences (Dozat and Manning).
+    Given the sources S (batch, n, d) and the targets T (batch, n, d), the score of class r for the pair (i, j) is
+    S_i U_r T_j + S_i W_r + T_j V_r + b_r.
+    The output is flattened as (batch, n * n, units), the pair (i, j) being at position i * n + j.
+    """
+    def __init__(self, units, regularizer_weight=0.0, **kwargs):
+        self.units = units
+        self.regularizer_weight = regularizer_weight
+        self.bilinear_initializer = keras.initializers.get('glorot_uniform')
+        self.source_kernel_initializer = keras.initializers.get('glorot_uniform')
+        self.target_kernel_initializer = keras.initializers.get('glorot_uniform')
+        self.bias_initializer = keras.initializers.get('zeros')
+        super(Biaffine, self).__init__(**kwargs)
+
+    def build(self, input_shape):
+        source_dim = int(input_shape[0][-1])
+        target_dim = int(input_shape[1][-1])
+        regularizer = keras.regularizers.l2(self.regularizer_weight)
+
+        self.bilinear = self.add_weight(name='bilinear',
+                                        shape=(self.units, source_dim, target_dim),
+                                        initializer=self.bilinear_initializer,
+                                        regularizer=regularizer)
+        self.source_kernel = self.add_weight(name='source_kernel',
+                                             shape=(source_dim, self.units),
+                                             initializer=self.source_kernel_initializer,
+                                             regularizer=regularizer)
+        self.target_kernel = self.add_weight(name='target_kernel',
+                                             shape=(target_dim, self.units),
+                                             initializer=self.target_kernel_initializer,
+                                             regularizer=regularizer)
+        self.bias = self.add_weight(name='bias',
+                                    shape=(self.units,),
+                                    initializer=self.bias_initializer)
+        super(Biaffine, self).build(input_shape)
+
+    def call(self, inputs):
+        sources, targets = inputs
+
+        scores = tf.einsum('bid,rde,bje->bijr', sources, self.bilinear, targets)
+        scores += K.expand_dims(K.dot(sources, self.source_kernel), axis=2)
+        scores += K.expand_dims(K.dot(targets, self.target_kernel), axis=1)
+        scores += self.bias
+
+        shape = tf.shape(scores)
+        return tf.reshape(scores, (shape[0], shape[1] * shape[2], self.units))
+
+    def compute_output_shape(self, input_shape):
+        n = input_shape[0][1]
+        if n is not None:
+            n = n * input_shape[1][1]
+        return (input_shape[0][0], n, self.units)
+
+    def get_config(self):
+        config = {'units': self.units,
+                  'regularizer_weight': self.regularizer_weight}
+        base_config = super(Biaffine, self).get_config()
+        return dict(list(base_config.items()) + list(config.items()))
+
+
+class PairMasking(Layer):
+    """
+    Given the flattened pair scores (batch, n * n, classes) and the component mask (batch, n), forces the pairs that
+    involve a padding component to the not-link class, adding a very high score to it
+    """
+    def __init__(self, not_link_label, **kwargs):
+        self.not_link_label = not_link_label
+        super(PairMasking, self).__init__(**kwargs)
+
+    def call(self, inputs):
+        scores, mask = inputs
+
+        pair_mask = K.expand_dims(mask, axis=2) * K.expand_dims(mask, axis=1)
+        pair_mask = tf.reshape(pair_mask, (tf.shape(scores)[0], tf.shape(scores)[1], 1))
+        not_link = K.one_hot(self.not_link_label, tf.shape(scores)[-1])
+
+        return scores + (1 - pair_mask) * not_link * 1e9
+
+    def compute_output_shape(self, input_shape):
+        return input_shape[0]
+
+    def get_config(self):
+        config = {'not_link_label': self.not_link_label}
+        base_config = super(PairMasking, self).get_config()
+        return dict(list(base_config.items()) + list(config.items()))
+
+
+def find_padding(tokens):
+    """
+    :param tokens: the input of a network (batch, time) or (batch, time, embedding), where the padding is made of zeros
+    :return: boolean tensor (batch, time), True in the padding positions
+    """
+    padding = tf.equal(tokens, 0)
+    if len(tokens.shape) > 2:
+        padding = K.all(padding, axis=-1)
+    return padding
+
+
+class MaskedSelfAttention(Layer):
+    """
+    Scaled dot-product self-attention (Vaswani et al.) of a sequence, with a single head. The padding positions (the
+    zero tokens of the input) are never attended.
+    Inputs: the sequence (batch, time, features) and the input of the network (batch, time) or
+    (batch, time, embedding), used to find the padding.
+    Output: (batch, time, units)
+    """
+    def __init__(self, units, regularizer_weight=0.0, **kwargs):
+        self.units = units
+        self.regularizer_weight = regularizer_weight
+        self.query_kernel_initializer = keras.initializers.get('glorot_uniform')
+        self.key_kernel_initializer = keras.initializers.get('glorot_uniform')
+        self.value_kernel_initializer = keras.initializers.get('glorot_uniform')
+        super(MaskedSelfAttention, self).__init__(**kwargs)
+
+    def build(self, input_shape):
+        features = int(input_shape[0][-1])
+        regularizer = keras.regularizers.l2(self.regularizer_weight)
+
+        self.query_kernel = self.add_weight(name='query_kernel',
+                                            shape=(features, self.units),
+                                            initializer=self.query_kernel_initializer,
+                                            regularizer=regularizer)
+        self.key_kernel = self.add_weight(name='key_kernel',
+                                          shape=(features, self.units),
+                                          initializer=self.key_kernel_initializer,
+                                          regularizer=regularizer)
+        self.value_kernel = self.add_weight(name='value_kernel',
+                                            shape=(features, self.units),
+                                            initializer=self.value_kernel_initializer,
+                                            regularizer=regularizer)
+        super(MaskedSelfAttention, self).build(input_shape)
+
+    def call(self, inputs):
+        sequence, tokens = inputs
+
+        queries = K.dot(sequence, self.query_kernel)
+        keys = K.dot(sequence, self.key_kernel)
+        values = K.dot(sequence, self.value_kernel)
+
+        scores = tf.matmul(queries, keys, transpose_b=True) / np.sqrt(self.units)
+        padding = K.cast(find_padding(tokens), dtype=scores.dtype)
+        scores += K.expand_dims(padding, axis=1) * (-1e9)
+
+        weights = K.softmax(scores, axis=-1)
+        return tf.matmul(weights, values)
+
+    def compute_output_shape(self, input_shape):
+        return (input_shape[0][0], input_shape[0][1], self.units)
+
+    def get_config(self):
+        config = {'units': self.units,
+                  'regularizer_weight': self.regularizer_weight}
+        base_config = super(MaskedSelfAttention, self).get_config()
+        return dict(list(base_config.items()) + list(config.items()))
+
+
+class PaddingMasking(Layer):
+    """
+    Sets to zero the steps of a sequence that are padding (the zero tokens of the input), so that the layers that
+    mix neighbouring steps, such as the convolutions, read only the real steps.
+    Inputs: the sequence (batch, time, features) and the input of the network (batch, time) or
+    (batch, time, embedding), used to find the padding.
+    Output: (batch, time, features)
+    """
+    def call(self, inputs):
+        sequence, tokens = inputs
+
+        real = 1 - K.cast(find_padding(tokens), dtype=sequence.dtype)
+        return sequence * K.expand_dims(real, axis=-1)
+
+    def compute_output_shape(self, input_shape):
+        return input_shape[0]
+
+
+class MaskedGlobalPooling(Layer):
+    """
+    Average of the steps of a sequence that are not padding (the zero tokens of the input).
+    Inputs: the sequence (batch, time, features) and the input of the network (batch, time) or
+    (batch, time, embedding), used to find the padding.
+    Output: (batch, features)
+    """
+    def call(self, inputs):
+        sequence, tokens = inputs
+
+        real = 1 - K.cast(find_padding(tokens), dtype=sequence.dtype)
+        count = K.maximum(K.sum(real, axis=-1, keepdims=True), 1)
+        return K.sum(sequence * K.expand_dims(real, axis=-1), axis=1) / count
+
+    def compute_output_shape(self, input_shape):
+        return (input_shape[0][0], input_shape[0][-1])
+
+
+class MaskedAttentionPooling(Layer):
+    """
+    Additive attention pooling of a sequence, fusing the steps of the attention of build_net_11: the scores are
+    relu(keys + query) v + b, the padding positions (the zero tokens of the input) are excluded, the softmax weights
+    are used to sum the values. The weighted values are never materialised as a (batch, time, features) tensor.
+    The weights have the same shapes and order of the importance vector Dense layer it replaces.
+    Inputs: keys (batch, time, units), query (batch, units), values (batch, time, features), and the input of the
+    network (batch, time) or (batch, time, embedding), used to find the padding.
+    Output: the pooled values (batch, features) and, if return_attention is True, the attention weights
+    (batch, time, 1).
+    """
+    def __init__(self, return_attention=False, **kwargs):
+        self.return_attention = return_attention
+        self.kernel_initializer = keras.initializers.get('he_normal')
+        self.bias_initializer = keras.initializers.get('zeros')
+        super(MaskedAttentionPooling, self).__init__(**kwargs)
+
+    def build(self, input_shape):
+        units = int(input_shape[0][-1])
+        self.kernel = self.add_weight(name='kernel',
+                                      shape=(units, 1),
+                                      initializer=self.kernel_initializer)
+        self.bias = self.add_weight(name='bias',
+                                    shape=(1,),
+                                    initializer=self.bias_initializer)
+        super(MaskedAttentionPooling, self).build(input_shape)
+
+    def call(self, inputs):
+        keys, query, values, tokens = inputs
+
+        scores = K.relu(keys + K.expand_dims(query, axis=1))
+        scores = K.squeeze(K.dot(scores, self.kernel), axis=-1) + self.bias
+
+        scores += K.cast(find_padding(tokens), dtype=scores.dtype) * (-1e9)
+
+        weights = K.softmax(scores, axis=-1)
+        pooled = tf.einsum('bt,btf->bf', weights, values)
+
+        if self.return_attention:
+            return [pooled, K.expand_dims(weights, axis=-1)]
+        return pooled
+
+    def compute_output_shape(self, input_shape):
+        pooled_shape = (input_shape[2][0], input_shape[2][-1])
+        if self.return_attention:
+            return [pooled_shape, (input_shape[0][0], input_shape[0][1], 1)]
+        return pooled_shape
+
+    def get_config(self):
+        config = {'return_attention': self.return_attention}
+        base_config = super(MaskedAttentionPooling, self).get_config()
+        return dict(list(base_config.items()) + list(config.items()))
+
+
+class SharedEmbedding(Layer):
+    """
+    Frozen embedding table read from the shared store of the vocabularies (vocabulary_store.py). The store is
+    memory-mapped when the layer is built and is never copied: each batch gathers from it only the rows of its words,
+    through the index of the vocabulary, so all the processes of a node share the same pages of the store. The table
+    is not one of the weights of the layer: the checkpoints of the network do not contain it, and it is attached again
+    from the store when the network is rebuilt from its JSON.
+    Input: (batch, ..., time) indexes of the words of the vocabulary, 0 is the padding.
+    Output: (batch, ..., time, embedding)
+    """
+    def __init__(self, vocabulary_path, **kwargs):
+        self.vocabulary_path = vocabulary_path
+        super(SharedEmbedding, self).__init__(**kwargs)
+
+    def build(self, input_shape):
+        vocabulary_path = self.vocabulary_path
+        if not os.path.isabs(vocabulary_path):
+            vocabulary_path = os.path.join(os.getcwd(), vocabulary_path)
+        self.vectors, self.index = load_embedding_view(vocabulary_path)
+        self.embedding_size = int(self.vectors.shape[-1])
+        super(SharedEmbedding, self).build(input_shape)
+
+    def gather(self, positions):
+        return np.asarray(self.vectors[self.index[positions]], dtype=np.float32)
+
+    def call(self, inputs):
+        if K.dtype(inputs) != 'int32':
+            inputs = K.cast(inputs, 'int32')
+        # the rows are gathered from the memory-mapped store, the words do not need a gradient
+        outputs = tf.compat.v1.py_func(self.gather, [inputs], tf.float32, stateful=False)
+        outputs.set_shape(inputs.get_shape().concatenate([self.embedding_size]))
+        return outputs
+
+    def compute_output_shape(self, input_shape):
+        return tuple(input_shape) + (self.embedding_size,)
+
+    def get_config(self):
+        config = {'vocabulary_path': self.vocabulary_path}
+        base_config = super(SharedEmbedding, self).get_config()
+        return dict(list(base_config.items()) + list(config.items()))
+
+
 def create_crop_fn(dimension, start, end):
     """
     From https://github.com/keras-team/keras/issues/890#issuecomment-319671916
@@ -2534,3 +3334,18 @@ def create_elementwise_division_fn():
     return func
 
 
+
+
+def create_component_mask_fn():
+    """
+    Given a document (batch, components, tokens, ...), provides a mask with the padding components set to 0
+    :return: a tensor (batch, components) whose elements are 1 in correspondence of the real components
+    """
+    def func(x):
+        shape = tf.shape(x)
+        x = tf.reshape(x, (shape[0], shape[1], -1))
+        nonzero = K.any(K.not_equal(x, 0), axis=-1)
+        return K.cast(nonzero, dtype='float32')
+
+    func.__name__ = "create_component_mask_"
+    return func
@@ -1,48 +1,184 @@
 __author__ = "Andrea Galassi"
 __copyright__ = "Copyright 2018, Andrea Galassi"
 __license__ = "BSD 3-clause"
-__version__ = "0.0.1"
+__version__ = "0.1.0"
 __email__ = "a.galassi@unibo.it"
 
 """
-Honestly I don't remember the purpose for this. I guess it is useful to find where an orphan belongs. Maybe.
+Finds where the orphans (the tokens that are not in GloVe and receive a random embedding) come from.
+The propositions of a dataset version are tokenized once with the vocabulary, building an inverted index from each
+orphan to the propositions that contain it and to the number of its occurrences. The index is saved next to the
+vocabulary and rebuilt only when the dataframe or the vocabulary change. The report lists the orphans from the most
+frequent, so that the ones that deserve a better embedding come first.
 """
 
 
-import pandas
 import os
-import numpy as np
+import time
+import pickle
+import argparse
+
+from dataset_store import load_dataframe, get_store_path
+from tokenizer import Tokenizer
+from build_manifest import load_manifest, get_manifest_path, hash_file, hash_paths, is_stage_current, record_stage
+
+
+def load_words(words_path):
+    """
+    :param words_path: path of a file with a word in each line
+    :return: the list of words
+    """
+    with open(words_path, 'r') as f:
+        return [word for word in f.read().split('\n') if word != '']
+
+
+def build_orphan_index(propositions, proposition_ids, document_ids, words, orphans):
+    """
+    Tokenizes the propositions and indexes the occurrences of the orphans
+    :param propositions: list of the propositions
+    :param proposition_ids: ID of each proposition
+    :param document_ids: ID of the document of each proposition
+    :param words: the words of the vocabulary found in GloVe
+    :param orphans: the orphans of the vocabulary
+    :return: the index: a dictionary with the propositions, their IDs, their documents, and for each orphan the number
+    of its occurrences and the positions of the propositions that contain it
+    """
+    # the orphans are part of the vocabulary used by the embedder
+    tokenizer = Tokenizer(dict.fromkeys(list(words) + list(orphans)))
+
+    counts = dict.fromkeys(orphans, 0)
+    postings = {orphan: [] for orphan in orphans}
+    for position in range(len(propositions)):
+        for token in tokenizer.tokenize(propositions[position]):
+            if token in counts:
+                counts[token] += 1
+                if len(postings[token]) < 1 or postings[token][-1] != position:
+                    postings[token].append(position)
+
+    return {'propositions': list(propositions),
+            'proposition_ids': list(proposition_ids),
+            'document_ids': list(document_ids),
+            'counts': counts,
+            'postings': postings}
+
+
+def get_orphans_by_frequency(index):
+    """
+    :return: the orphans, from the most frequent
+    """
+    return sorted(index['counts'].keys(), key=lambda orphan: (-index['counts'][orphan], orphan))
+
+
+def find_orphan(index, orphan):
+    """
+    :param index: the orphan index
+    :param orphan: the orphan
+    :return: the list of the propositions that contain the orphan, as (document ID, proposition ID, proposition)
+    """
+    return [(index['document_ids'][position], index['proposition_ids'][position], index['propositions'][position])
+            for position in index['postings'].get(orphan, [])]
+
+
+def write_report(index, report_path, frequency_path):
+    """
+    Writes the propositions of each orphan and a table with the frequency of the orphans
+    :param index: the orphan index
+    :param report_path: path of the file with the propositions of each orphan
+    :param frequency_path: path of the tab-separated table with the frequencies
+    :return: None
+    """
+    orphans = get_orphans_by_frequency(index)
+
+    with open(frequency_path, 'w') as f:
+        f.write('orphan\toccurrences\tpropositions\tdocuments\n')
+        for orphan in orphans:
+            documents = set(index['document_ids'][position] for position in index['postings'][orphan])
+            f.write(orphan + '\t' + str(index['counts'][orphan]) + '\t' + str(len(index['postings'][orphan])) + '\t' +
+                    str(len(documents)) + '\n')
+
+    with open(report_path, 'w') as f:
+        for orphan in orphans:
+            f.write(orphan + '\n\n')
+            for document_id, proposition_id, proposition in find_orphan(index, orphan):
+                f.write(str(document_id) + '\t' + str(proposition_id) + '\t' + proposition + '\n\n')
+            f.write('\n\n\n')
+
+
+def update_orphan_index(dataframe_path, vocabulary_path, index_path, manifest, force=False):
+    """
+    Loads the orphan index of a dataset version, building it if the dataframe or the vocabulary changed
+    :param dataframe_path: path of the dataframe
+    :param vocabulary_path: folder of the vocabulary created by glove_loader.py
+    :param index_path: path of the index
+    :param manifest: the build manifest of the corpus
+    :param force: whether to rebuild the index anyway
+    :return: the index
+    """
+    vocabulary_words_path = os.path.join(vocabulary_path, 'glove.vocabulary.txt')
+    orphans_path = os.path.join(vocabulary_path, 'glove.orphans.txt')
+
+    stage = "orphans/" + os.path.relpath(index_path, os.path.dirname(manifest['path']))
+    config = {'code': hash_file(manifest, os.path.abspath(__file__))}
+    inputs = hash_paths(manifest, [dataframe_path, get_store_path(dataframe_path), vocabulary_words_path,
+                                   orphans_path])
+
+    if not force and is_stage_current(manifest, stage, config, inputs, [index_path]):
+        print(str(time.ctime()) + "\tLOADING INDEX: " + index_path)
+        with open(index_path, 'rb') as f:
+            return pickle.load(f)
+
+    print(str(time.ctime()) + "\tINDEXING: " + dataframe_path)
+    df = load_dataframe(dataframe_path, columns=['text_ID', 'source_ID', 'source_proposition'])
+    df = df.drop_duplicates(subset=['source_ID'])
+
+    index = build_orphan_index(df['source_proposition'].tolist(), df['source_ID'].tolist(), df['text_ID'].tolist(),
+                               load_words(vocabulary_words_path), load_words(orphans_path))
+
+    with open(index_path, 'wb') as f:
+        pickle.dump(index, f)
+    record_stage(manifest, stage, config, inputs, [index_path])
+    return index
+
 
 if __name__ == '__main__':
-    dataset_name = 'cdcp_ACL17'
-    dataset_path = os.path.join(os.getcwd(),'Datasets', dataset_name)
-    pickles_path = os.path.join(os.path.join(dataset_path, 'pickles', 'good'))
-    dataframe_path = os.path.join(pickles_path, 'total.pkl')
-    # vocabulary_source_path = os.path.join(os.getcwd(), 'glove.840B.300d.txt')
-    glove_path = os.path.join(dataset_path, 'glove')
 
-    df = pandas.read_pickle(dataframe_path)
+    parser = argparse.ArgumentParser(description="Finds the propositions that contain the orphans of a vocabulary")
 
-    propositions = df['source_proposition'].drop_duplicates()
+    parser.add_argument('-d', '--dataset', help="Name of the dataset folder", default='cdcp_ACL17')
+    parser.add_argument('-v', '--version', help="Version of the dataset", default='new_3')
+    parser.add_argument('-e', '--embed_name', help="Name of the vocabulary folder in the resources of the dataset",
+                        default='glove300')
+    parser.add_argument('-g', '--glove', help="Path of the vocabulary folder, if it is not in the resources",
+                        default=None)
+    parser.add_argument('-q', '--query', help="Orphans to look for. If none, the whole report is written",
+                        nargs='*', default=[])
+    parser.add_argument('-f', '--force', help="Rebuild the index even if it is up to date",
+                        action='store_true')
 
-    orphans_path = os.path.join(glove_path, 'glove.orphans.txt')
-    vocabulary_path = os.path.join(glove_path, 'glove.vocabulary.txt')
-    orphans_log_path = os.path.join(glove_path, 'glove.orphans.log.txt')
-    orphans_log_file = open(orphans_log_path, 'w')
-    orphans_file = open(orphans_path, 'r')
+    args = parser.parse_args()
 
-    for line in orphans_file:
-        if len(line) > 0:
-            line = line.split()[0]
-            orphans_log_file.write(line + '\n\n')
+    dataset_path = os.path.join(os.getcwd(), 'Datasets', args.dataset)
+    pickles_path = os.path.join(dataset_path, 'pickles', args.version)
+    dataframe_path = os.path.join(pickles_path, 'total.pkl')
+    vocabulary_path = args.glove
+    if vocabulary_path is None:
+        vocabulary_path = os.path.join(dataset_path, 'resources', args.embed_name)
 
-            for proposition in propositions:
-                if line in proposition:
-                    orphans_log_file.write(proposition + '\n\n')
+    index_path = os.path.join(vocabulary_path, 'glove.orphans.' + args.version + '.index.pkl')
+    manifest = load_manifest(get_manifest_path(dataset_path))
+    index = update_orphan_index(dataframe_path, vocabulary_path, index_path, manifest, args.force)
 
-            orphans_log_file.write('\n\n\n')
+    if len(args.query) > 0:
+        for orphan in args.query:
+            occurrences = find_orphan(index, orphan)
+            print(orphan + "\t" + str(index['counts'].get(orphan, 0)) + " occurrences in " + str(len(occurrences)) +
+                  " propositions")
+            for document_id, proposition_id, proposition in occurrences:
+                print("\t" + str(document_id) + "\t" + str(proposition_id) + "\t" + proposition)
+    else:
+        report_path = os.path.join(vocabulary_path, 'glove.orphans.' + args.version + '.log.txt')
+        frequency_path = os.path.join(vocabulary_path, 'glove.orphans.' + args.version + '.frequency.tsv')
+        write_report(index, report_path, frequency_path)
+        print(str(time.ctime()) + "\tREPORT: " + report_path)
 
-    orphans_file.close()
-    orphans_log_file.close()
     print('Finished')
-
@@ -9,7 +9,6 @@ Code to print the details of a dataframe from a specific corpus
 """
 
 import os
-import pandas
 import json
 import random
 import sys
@@ -17,9 +16,11 @@ import ast
 import numpy as np
 import argparse
 
+from dataset_store import load_dataframe
+
 
 def print_dataframe_details(dataframe_path):
-    df = pandas.read_pickle(dataframe_path)
+    df = load_dataframe(dataframe_path)
 
     print(df.head())
 
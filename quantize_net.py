@@ -0,0 +1,288 @@
+__author__ = "Andrea Galassi"
+__copyright__ = "Copyright 2018-2020 Andrea Galassi"
+__license__ = "BSD 3-clause"
+__version__ = "0.1.0"
+__email__ = "a.galassi@unibo.it"
+
+"""
+Post-training quantisation of trained networks, for CPU-only inference.
+Each iteration of a network folder is converted to a TensorFlow Lite model with int8 dynamic-range quantisation of
+the weights. Optionally, a calibration set drawn from the validation split is used to quantise the activations too.
+The quantised model is evaluated next to the original one, reporting the F1 of each task, latency and size. The size
+of the original model is the one of its TensorFlow Lite conversion without optimisations, so that both sizes include
+the same tensors (the shared embedding matrix is not saved in the weights files).
+"""
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import tensorflow as tf
+import training
+
+from tensorflow.compat.v1.keras import backend as K
+from evaluation_metrics import ConfusionScores
+from dataset_config import dataset_info
+from training_utils import get_custom_objects, get_iterations_number, load_network, merge_component_scores
+
+
+def create_split_inputs(dataset, split, distance):
+    """
+    Creates the inputs of the network for a split of a dataset created by training.load_dataset
+    """
+    numdata = len(dataset[split]['s_id'])
+    if distance > 0:
+        X_dist = dataset[split]['distance']
+    else:
+        X_dist = np.zeros((numdata, 2))
+    return [dataset[split]['source_props'], dataset[split]['target_props'], X_dist]
+
+
+def create_representative_dataset(X, samples=200, seed=42):
+    """
+    Creates a generator of calibration samples, drawn from the inputs X
+    :param X: inputs of the network
+    :param samples: maximum number of samples to draw
+    :param seed: seed of the random selection
+    :return: the generator function
+    """
+    random_state = np.random.RandomState(seed)
+    indexes = random_state.choice(len(X[0]), min(samples, len(X[0])), replace=False)
+
+    def representative_dataset():
+        for index in indexes:
+            yield [np.array(x[index:index + 1], dtype=np.float32) for x in X]
+
+    return representative_dataset
+
+
+def create_converter(model):
+    """
+    :param model: the model to convert
+    :return: a TensorFlow Lite converter of the model, without optimisations
+    """
+    converter = tf.compat.v1.lite.TFLiteConverter.from_session(K.get_session(), model.inputs, model.outputs)
+    # the LSTMs are not fully covered by the builtin ops
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS, tf.lite.OpsSet.SELECT_TF_OPS]
+    return converter
+
+
+def convert_to_int8(model, calibration_X=None, calibration_samples=200):
+    """
+    Converts a loaded model into a quantised TensorFlow Lite model
+    :param model: the model to convert
+    :param calibration_X: inputs used to calibrate the quantisation of the activations. If None, only the weights
+    are quantised (dynamic range)
+    :param calibration_samples: number of calibration samples
+    :return: the serialized TensorFlow Lite model
+    """
+    converter = create_converter(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+    if calibration_X is not None:
+        calibration_X = calibration_X[:len(model.inputs)]
+        converter.representative_dataset = tf.lite.RepresentativeDataset(
+            create_representative_dataset(calibration_X, calibration_samples))
+
+    return converter.convert()
+
+
+def predict_tflite(tflite_model, model, X, batch_size=100):
+    """
+    Performs the prediction with a TensorFlow Lite model
+    :param tflite_model: the serialized TensorFlow Lite model
+    :param model: the original model, used to match inputs and outputs
+    :param X: the inputs
+    :param batch_size: size of the batches
+    :return: a list with the predictions of each output, in the same order of the original model
+    """
+    interpreter = tf.lite.Interpreter(model_content=tflite_model)
+
+    input_details = {}
+    for detail in interpreter.get_input_details():
+        input_details[detail['name']] = detail
+    output_details = {}
+    for detail in interpreter.get_output_details():
+        output_details[detail['name']] = detail
+
+    input_details = [input_details[tensor.name.split(':')[0]] for tensor in model.inputs]
+    output_details = [output_details[tensor.name.split(':')[0]] for tensor in model.outputs]
+
+    predictions = [[] for _ in output_details]
+    allocated_size = -1
+
+    for start in range(0, len(X[0]), batch_size):
+        batch = [x[start:start + batch_size] for x in X]
+
+        if len(batch[0]) != allocated_size:
+            for detail, x in zip(input_details, batch):
+                interpreter.resize_tensor_input(detail['index'], np.shape(x))
+            interpreter.allocate_tensors()
+            allocated_size = len(batch[0])
+
+        for detail, x in zip(input_details, batch):
+            interpreter.set_tensor(detail['index'], np.array(x, dtype=detail['dtype']))
+        interpreter.invoke()
+
+        for index in range(len(output_details)):
+            predictions[index].append(interpreter.get_tensor(output_details[index]['index']))
+
+    return [np.concatenate(prediction) for prediction in predictions]
+
+
+def compute_task_scores(Y_pred, dataset, split, dataset_name):
+    """
+    Computes the F1 scores of the three tasks, as done by the evaluation
+    :return: link F1, macro F1 of the relations, macro F1 of the components
+    """
+    relations_labels = dataset_info[dataset_name]["link_as_sum"][0]
+    not_a_link_labels = dataset_info[dataset_name]["link_as_sum"][1]
+
+    sids = dataset[split]['s_id']
+    tids = dataset[split]['t_id']
+
+    _, pred_prop = merge_component_scores(sids, tids, Y_pred[2], Y_pred[3])
+    _, test_prop = merge_component_scores(sids, tids, dataset[split]['sources_type'], dataset[split]['targets_type'])
+    Y_pred_prop = np.argmax(pred_prop, axis=-1)
+    Y_test_prop = np.argmax(test_prop, axis=-1)
+
+    not_reflexive = np.array(sids) != np.array(tids)
+    Y_pred_links = np.argmax(Y_pred[0], axis=-1)[not_reflexive]
+    Y_test_links = np.argmax(dataset[split]['links'], axis=-1)[not_reflexive]
+    Y_pred_rel = np.argmax(Y_pred[1], axis=-1)[not_reflexive]
+    Y_test_rel = np.argmax(dataset[split]['relations_type'], axis=-1)[not_reflexive]
+
+    for label in not_a_link_labels:
+        Y_test_rel = np.where(Y_test_rel == label, not_a_link_labels[-1], Y_test_rel)
+        Y_pred_rel = np.where(Y_pred_rel == label, not_a_link_labels[-1], Y_pred_rel)
+
+    score_link = ConfusionScores(Y_test_links, Y_pred_links).f1_score(average=None, labels=[0])[0]
+    score_rel = ConfusionScores(Y_test_rel, Y_pred_rel).f1_score(average='macro', labels=relations_labels)
+    score_prop = ConfusionScores(Y_test_prop, Y_pred_prop).f1_score(average='macro')
+
+    return [score_link, score_rel, score_prop]
+
+
+def perform_quantization(netfolder, dataset_name, dataset_version, feature_type='bow', distance=5, calibrate=False,
+                         calibration_samples=200, evaluation_split='test', batch_size=100, embed_name="glove300"):
+    """
+    Quantises all the iterations of a trained network and compares them with the original ones
+    :param netfolder: folder of the network
+    :param dataset_name: name of the dataset
+    :param dataset_version: version of the dataset
+    :param feature_type: 'bow' or 'embeddings'
+    :param distance: the maximum distance considered in the features
+    :param calibrate: whether to calibrate the quantisation of the activations on the validation split
+    :param calibration_samples: number of calibration samples
+    :param evaluation_split: split used to compare the models
+    :param batch_size: size of the batches used for the prediction
+    :param embed_name: name of the embeddings
+    """
+    netname = os.path.basename(netfolder)
+    print(str(time.ctime()) + "\tLAUNCHING QUANTIZATION: " + netname)
+
+    # dropout and batch normalization in inference mode
+    K.set_learning_phase(0)
+
+    this_ds_info = dataset_info[dataset_name]
+
+    print(str(time.ctime()) + "\tLOADING DATASET " + dataset_name)
+    dataset, max_text_len, max_prop_len = training.load_dataset(dataset_name=dataset_name,
+                                                                dataset_version=dataset_version,
+                                                                dataset_split='total',
+                                                                feature_type=feature_type,
+                                                                distance=distance,
+                                                                min_text_len=this_ds_info["min_text"],
+                                                                min_prop_len=this_ds_info["min_prop"],
+                                                                embed_name=embed_name)
+    print(str(time.ctime()) + "\tDATASET LOADED...")
+    sys.stdout.flush()
+
+    X_eval = create_split_inputs(dataset, evaluation_split, distance)
+    X_calibration = None
+    if calibrate:
+        X_calibration = create_split_inputs(dataset, 'validation', distance)
+
+    custom_objects = get_custom_objects()
+    iterations = get_iterations_number(netfolder, netname)
+
+    reportfile = open(os.path.join(netfolder, os.path.pardir, netname + "_quantization.txt"), 'a')
+    reportfile.write("\n\nDATASET VERSION:\n" + dataset_version + "\n")
+    reportfile.write("SPLIT:\n" + evaluation_split + "\n")
+    if calibrate:
+        reportfile.write("CALIBRATION SAMPLES:\n" + str(calibration_samples) + "\n")
+    reportfile.write("iteration\tformat\tsize (MB)\tlatency (ms/pair)\tLink\tRelation\tComponent\n")
+
+    for iteration in range(iterations + 1):
+        print(str(time.ctime()) + "\tQUANTIZING ITERATION " + str(iteration))
+        sys.stdout.flush()
+
+        model, _ = load_network(netfolder, iteration, custom_objects)
+        X = X_eval[:len(model.inputs)]
+
+        starttime = time.time()
+        Y_pred = model.predict(X, batch_size=batch_size)
+        float_latency = (time.time() - starttime) * 1000 / len(X[0])
+        float_scores = compute_task_scores(Y_pred, dataset, evaluation_split, dataset_name)
+        float_size = len(create_converter(model).convert()) / 2**20
+
+        tflite_model = convert_to_int8(model, X_calibration, calibration_samples)
+        tflite_path = os.path.join(netfolder, netname + "_" + str(iteration) + "_int8.tflite")
+        with open(tflite_path, 'wb') as f:
+            f.write(tflite_model)
+
+        starttime = time.time()
+        Y_pred = predict_tflite(tflite_model, model, X, batch_size=batch_size)
+        int8_latency = (time.time() - starttime) * 1000 / len(X[0])
+        int8_scores = compute_task_scores(Y_pred, dataset, evaluation_split, dataset_name)
+        int8_size = len(tflite_model) / 2**20
+
+        rows = [["float32", float_size, float_latency] + float_scores,
+                ["int8", int8_size, int8_latency] + int8_scores,
+                ["delta", int8_size - float_size, int8_latency - float_latency] +
+                list(np.array(int8_scores) - np.array(float_scores))]
+
+        for row in rows:
+            string = str(iteration) + "\t" + row[0]
+            for value in row[1:]:
+                string += "\t" + ("{:10.4f}".format(value)).replace(" ", "")
+            print(string)
+            reportfile.write(string + "\n")
+        reportfile.flush()
+
+    reportfile.close()
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Quantise a trained network and evaluate the quantised version.")
+    parser.add_argument("netname", help="The name of the network")
+
+    parser.add_argument('-c', '--corpus',
+                        choices=["rct", "drinv", "cdcp", "echr", "ukp", "scidtb"],
+                        help="corpus", default="cdcp")
+    parser.add_argument('-d', '--distance', help="The maximum distance considered in the features", type=int,
+                        default=5)
+    parser.add_argument('-q', '--calibration', help="Quantise also the activations, calibrating them on the "
+                                                    "validation split", action="store_true")
+    parser.add_argument('-s', '--samples', help="Number of validation samples used for the calibration", type=int,
+                        default=200)
+    parser.add_argument('-b', '--batch_size', help="Size of the batches used for the prediction", type=int,
+                        default=100)
+
+    args = parser.parse_args()
+
+    corpora = {"rct": ('RCT', 'neo'),
+               "drinv": ('DrInventor', 'arg10'),
+               "cdcp": ('cdcp_ACL17', 'new_3'),
+               "echr": ('ECHR2018', 'arg0'),
+               "ukp": ('AAEC_v2', 'new_2'),
+               "scidtb": ('scidtb_argmin_annotations', 'only_arg_v1')}
+
+    dataset_name, dataset_version = corpora[args.corpus.lower()]
+    netpath = os.path.join(os.getcwd(), 'network_models', dataset_name, dataset_version, args.netname)
+
+    perform_quantization(netpath, dataset_name, dataset_version, distance=args.distance,
+                         calibrate=args.calibration, calibration_samples=args.samples,
+                         batch_size=args.batch_size)
@@ -0,0 +1,290 @@
+__author__ = "Andrea Galassi"
+__copyright__ = "Copyright 2018-2020 Andrea Galassi"
+__license__ = "BSD 3-clause"
+__version__ = "0.1.0"
+__email__ = "a.galassi@unibo.it"
+
+"""
+Tokenization shared by glove_loader.py (creation of the vocabulary) and embedder.py (creation of the embeddings).
+Both split the texts on whitespaces, remove the stop symbols at the end of the words and then split the words that
+are not recognized with a cascade of separators, tried in the order of SEPARATORS. Since the outcome of the cascade
+depends only on the word and on the vocabulary, each distinct word is resolved once and memoized: the separators
+contained in a piece of word are found with a single precompiled regular expression, so pieces without separators
+skip the cascade altogether, and the others jump directly to their next separator instead of trying all of them.
+tokenizer_benchmark.py checks the results against the original implementations and compares their speed.
+"""
+
+import re
+
+
+SEPARATORS = ['(', ')', '[', ']', '{', '}', '...', '_', '--', '|',
+              ';', ':',
+              "±", "·", "≥", "≤", "≈", '=', "<", ">", "£", "$", "€",
+              '!!!', '???', '?!?', '!?!', '?!', '!?', '??', '!!',
+              '!', '?',
+              '/', '"', '%', '$', '*', '#', '+',
+              ',', '.',
+              "'s", "'ve", "'ll", "'re", "'d",
+              '-', "'",
+              "∂", "∆", "∇"]
+
+REPLACINGS = {"’": "'",
+              "‘": "'",
+              "“": '"',
+              "”": '"',
+              "''": '"',
+              "—": '-',
+              "−": '-',
+              "–": '-',
+              "⁄": '/'}
+
+STOPWORDS = ['.', ',', ':', ';']
+
+
+def normalise(text):
+    """
+    Replaces the different versions of the same character. The replacements are applied in order, since some of them
+    produce the input of the following ones
+    """
+    for old in REPLACINGS.keys():
+        text = text.replace(old, REPLACINGS[old])
+    return text
+
+
+class SeparatorFinder(object):
+    """
+    Finds which separators are contained in a piece of text: a single regular expression finds the characters that
+    start a separator, and only the separators that start with them are looked for. The result is the list of their
+    positions in the separators list, in the order of the cascade.
+    """
+
+    def __init__(self, separators):
+        self.separators = list(separators)
+        # a separator can be contained only in the pieces that contain its first character
+        self.candidates = {}
+        for position in range(len(self.separators)):
+            self.candidates.setdefault(self.separators[position][0], []).append(position)
+        self.pattern = re.compile("[" + re.escape("".join(self.candidates.keys())) + "]")
+        self.found = {}
+
+    def __call__(self, piece):
+        positions = self.found.get(piece)
+        if positions is None:
+            positions = self.find(piece)
+            self.found[piece] = positions
+        return positions
+
+    def find(self, piece):
+        """
+        Same result of calling the finder, without memoizing it
+        """
+        characters = set(self.pattern.findall(piece))
+        if len(characters) < 1:
+            return ()
+        return tuple(sorted(position for character in characters for position in self.candidates[character]
+                            if self.separators[position] in piece))
+
+
+class Tokenizer(object):
+    """
+    Splits texts in the tokens of a vocabulary, with the same results of reference_tokenize.
+    The cascade alternates a recognition pass (stop symbols removal and vocabulary lookup) and a split pass for each
+    separator: step 0 is the first recognition pass, step 2j+1 the split on the j-th separator, step 2j+2 the
+    following recognition pass. A piece of text is resolved knowing only its content, whether it has been recognized
+    and the step it has reached, so the resolutions are memoized on these three values.
+    """
+
+    def __init__(self, vocabulary, separators=None):
+        """
+        :param vocabulary: the vocabulary, or anything that supports "word in vocabulary.keys()"
+        :param separators: list of separators. If None, SEPARATORS
+        """
+        if separators is None:
+            separators = SEPARATORS
+        self.keys = vocabulary.keys()
+        self.separators = list(separators)
+        self.last_step = 2 * len(self.separators)
+        self.find_separators = SeparatorFinder(self.separators)
+        self.resolved = {}
+
+    def tokenize(self, text, misses=None):
+        """
+        :param text: the text
+        :param misses: set to be filled with the words looked up in the vocabulary without success. Optional
+        :return: the list of tokens. Unrecognized parts of the text are empty strings
+        """
+        tokens = []
+        for word in normalise(text).split():
+            word_tokens, word_misses = self.resolve(word, False, 0)
+            tokens.extend(word_tokens)
+            if misses is not None:
+                misses.update(word_misses)
+        return tokens
+
+    def lookup(self, word, misses):
+        if word in self.keys:
+            return True
+        misses.add(word)
+        return False
+
+    def resolve(self, piece, recognized, step):
+        """
+        :return: the tokens of a piece of text and the words looked up without success while resolving it
+        """
+        key = (piece, recognized, step)
+        result = self.resolved.get(key)
+        if result is None:
+            result = self.compute(piece, recognized, step)
+            self.resolved[key] = result
+        return result
+
+    def compute(self, piece, recognized, step):
+        misses = set()
+        if step % 2 == 1:
+            separator = self.separators[step // 2]
+            if not recognized and separator in piece:
+                return self.split(piece, step // 2, misses)
+            step += 1
+        if step > self.last_step:
+            return (piece,) if recognized else ('',), frozenset(misses)
+
+        # recognition pass: the stop symbol is removed only if what remains is in the vocabulary
+        if len(piece) > 1 and piece[-1] in STOPWORDS and self.lookup(piece[:-1], misses):
+            word_tokens, word_misses = self.resolve(piece[:-1], True, step + 1)
+            # the stop symbol is checked in the same pass
+            symbol_tokens, symbol_misses = self.resolve(piece[-1], True, step)
+            return word_tokens + symbol_tokens, frozenset(misses.union(word_misses, symbol_misses))
+        if self.lookup(piece, misses):
+            recognized = True
+        if recognized:
+            # nothing else can happen to a recognized piece that has no stop symbol to remove
+            return (piece,), frozenset(misses)
+
+        # an unrecognized piece changes only when it is split by the next separator that it contains
+        for position in self.find_separators(piece):
+            if 2 * position + 1 > step:
+                return self.split(piece, position, misses)
+        return ('',), frozenset(misses)
+
+    def split(self, piece, position, misses):
+        separator = self.separators[position]
+        step = 2 * position + 2
+        tokens = ()
+        for index, part in enumerate(piece.split(separator)):
+            if index > 0:
+                separator_tokens, separator_misses = self.resolve(separator, True, step)
+                tokens += separator_tokens
+                misses.update(separator_misses)
+            if part != '':
+                part_tokens, part_misses = self.resolve(part, False, step)
+                tokens += part_tokens
+                misses.update(part_misses)
+        return tokens, frozenset(misses)
+
+
+def create_vocabulary(documents, model, logfile=None, vocabulary=None, separators=None):
+    """
+    Finds the words of the model used by the documents, with the same results of reference_vocabulary.
+    The whitespace-separated words are split by the separators in order: the parts that are in the model are added
+    to the vocabulary, the others are split again by the following separators. Each separator is added to the
+    vocabulary if it is in the model, and is an orphan otherwise. Each distinct piece is split only once, by the
+    first separator that it contains, and its parts, which are substrings of it, look only for the following
+    separators contained in the piece.
+    :param documents: iterable of str
+    :param model: dictionary with all the possible tokens as keys
+    :param logfile: file where to print the log of the tokenization process. Optional
+    :param vocabulary: dictionary to be filled with the tokens found in the documents. If None, a new one
+    :param separators: list of separators. If None, SEPARATORS
+    :return: the vocabulary (from the tokens to the values in model) and the set of orphans (tokens not in model)
+    """
+    if separators is None:
+        separators = SEPARATORS
+    if vocabulary is None:
+        vocabulary = {}
+    keys = model.keys()
+    find_separators = SeparatorFinder(separators)
+    last_log = len(separators)
+
+    # the log has a line after the whitespace split (0) and one after each separator (j + 1)
+    # found: first log line in which each word is in the vocabulary
+    # present: log lines in which each orphan is present, as a list of intervals
+    found = {}
+    present = {}
+    # pending: orphans still to split, with the separators that they may contain (None if not known yet)
+    pending = []
+
+    words = set()
+    for document in documents:
+        words.update(document.split())
+    for word in words:
+        # remove stop symbols at the end of the tokens
+        if len(word) > 1 and word[-1] in STOPWORDS and word[:-1] in keys:
+            word = word[:-1]
+        if word in keys:
+            found[word] = 0
+        else:
+            pending.append((word, 0, None))
+
+    for position in range(len(separators)):
+        if separators[position] in keys:
+            if found.get(separators[position], last_log + 1) > position + 1:
+                found[separators[position]] = position + 1
+        else:
+            pending.append((separators[position], position + 1, None))
+
+    # an orphan that enters the cascade at the first-th separator is split by the next separator that it contains
+    visited = set()
+    while len(pending) > 0:
+        piece, first, candidates = pending.pop()
+        if (piece, first) in visited:
+            continue
+        visited.add((piece, first))
+
+        if candidates is None:
+            candidates = find_separators.find(piece)
+        position = None
+        for index in range(len(candidates)):
+            if candidates[index] >= first and separators[candidates[index]] in piece:
+                position = candidates[index]
+                break
+        if position is None:
+            present.setdefault(piece, []).append((first, last_log))
+            continue
+        present.setdefault(piece, []).append((first, position))
+
+        following = candidates[index + 1:]
+        for part in piece.split(separators[position]):
+            if part in keys:
+                if found.get(part, last_log + 1) > position + 1:
+                    found[part] = position + 1
+            else:
+                pending.append((part, position + 1, following))
+
+    if logfile is not None:
+        vocabulary_counts = [len(vocabulary.keys() - found.keys())] * (last_log + 1)
+        for log in found.values():
+            for line in range(log, last_log + 1):
+                vocabulary_counts[line] += 1
+        orphan_counts = [0] * (last_log + 2)
+        for intervals in present.values():
+            intervals.sort()
+            start, end = intervals[0]
+            for interval_start, interval_end in intervals[1:]:
+                if interval_start > end + 1:
+                    orphan_counts[start] += 1
+                    orphan_counts[end + 1] -= 1
+                    start = interval_start
+                end = max(end, interval_end)
+            orphan_counts[start] += 1
+            orphan_counts[end + 1] -= 1
+        for line in range(1, last_log + 1):
+            orphan_counts[line] += orphan_counts[line - 1]
+
+        labels = ["Tab, space, newline"] + list(separators)
+        for line in range(last_log + 1):
+            logfile.write(labels[line] + '\t' + str(vocabulary_counts[line]) + '\t' + str(orphan_counts[line]) + '\n')
+
+    for word in found.keys():
+        vocabulary[word] = model[word]
+    orphans = set(piece for piece in present.keys() if present[piece][-1][1] == last_log)
+    return vocabulary, orphans
@@ -0,0 +1,318 @@
+__author__ = "Andrea Galassi"
+__copyright__ = "Copyright 2018-2020 Andrea Galassi"
+__license__ = "BSD 3-clause"
+__version__ = "0.1.0"
+__email__ = "a.galassi@unibo.it"
+
+"""
+Checks the tokenization of tokenizer.py against the original implementations, reference_vocabulary and
+reference_tokenize, and compares their speed. The documents are the lines of the text files of the datasets folder
+plus synthetic documents full of separators, and the model is a random sample of their pieces.
+"""
+
+import os
+import re
+import sys
+import time
+import random
+import argparse
+
+from tokenizer import SEPARATORS, REPLACINGS, STOPWORDS, normalise, Tokenizer, create_vocabulary
+
+
+def reference_vocabulary(documents, model, logfile=None, vocabulary=None, separators=None):
+    """
+    Original implementation of create_vocabulary, which splits all the orphans once for each separator
+    """
+    if separators is None:
+        separators = SEPARATORS
+    if vocabulary is None:
+        vocabulary = {}
+
+    orphans = set()
+    for composed_word in documents:
+        words = composed_word.split()
+        for word in words:
+            if len(word) > 1 and word[-1] in STOPWORDS:
+                word2 = word[:-1]
+                if word2 in model.keys():
+                    word = word2
+
+            if word in model.keys():
+                vocabulary[word] = model[word]
+            else:
+                orphans.add(word)
+
+    if not logfile == None:
+        logfile.write("Tab, space, newline" + '\t' +
+                      str(len(vocabulary.keys())) + '\t' +
+                      str(len(orphans)) + '\n')
+
+    for separator in separators:
+        old_orphans = orphans
+        orphans = set()
+        for composed_word in old_orphans:
+            for word in composed_word.split(separator):
+                if word in model.keys():
+                    vocabulary[word] = model[word]
+                else:
+                    orphans.add(word)
+
+        if separator not in model.keys():
+            orphans.add(separator)
+        else:
+            vocabulary[separator] = model[separator]
+
+        if not logfile == None:
+            logfile.write(separator + '\t' +
+                          str(len(vocabulary.keys())) + '\t' +
+                          str(len(orphans)) + '\n')
+
+    return vocabulary, orphans
+
+
+def reference_tokenize(text, vocabulary, separators=None):
+    """
+    Original implementation of Tokenizer.tokenize, which inserts the new pieces in the middle of the lists of splits
+    and tokens once for each separator
+    """
+    if separators is None:
+        separators = SEPARATORS
+    text = normalise(text)
+
+    splits = text.split()
+    tokens = [''] * len(splits)
+
+    passes = [None] + list(separators)
+    for separator in passes:
+        if separator is not None:
+            i = 0
+            # iterate on the whole list of split, creating new splits with the separator
+            while i < len(splits):
+                # the word is not empty and is not recognized as a token
+                if tokens[i] == '' and splits[i] != '':
+                    index = 0
+                    prev_index = 0
+                    while index < len(splits[i]) and index >= 0:
+                        word = splits[i]
+                        index = word.find(separator, index)
+                        if index >= 0:
+                            prev_word = word[prev_index:index]
+                            next_word = word[index + len(separator):]
+                            if prev_word != '':
+                                splits.insert(i, prev_word)
+                                tokens.insert(i, '')
+                                i += 1
+
+                            # adds the separator
+                            splits[i] = separator
+                            tokens[i] = separator
+
+                            # avoids finding the same separator too many times
+                            index += len(separator)
+
+                            if next_word != '':
+                                splits.insert(i + 1, next_word)
+                                tokens.insert(i + 1, '')
+                i += 1
+
+        # recognize tokens
+        i = 0
+        while i < len(splits):
+            word = splits[i]
+            # remove possible stop symbols in the end of the token
+            if len(word) > 1 and word[-1] in STOPWORDS and word[:-1] in vocabulary.keys():
+                symbol = word[-1]
+                word = word[:-1]
+                splits.insert(i + 1, symbol)
+                tokens.insert(i + 1, symbol)
+                splits[i] = word
+                tokens[i] = word
+            elif word in vocabulary.keys():
+                tokens[i] = word
+            i += 1
+
+    return tokens
+
+
+class RecordingModel(object):
+    """
+    Dictionary wrapper that records the words looked up without success
+    """
+
+    def __init__(self, words):
+        self.words = words
+        self.misses = set()
+
+    def keys(self):
+        return self
+
+    def __contains__(self, word):
+        if word in self.words:
+            return True
+        self.misses.add(word)
+        return False
+
+    def __getitem__(self, word):
+        return self.words[word]
+
+
+class StringLog(object):
+    def __init__(self):
+        self.lines = []
+
+    def write(self, line):
+        self.lines.append(line)
+
+
+def load_mock_documents(datasets_path):
+    """
+    Loads the lines of the text files in the datasets folder as documents
+    """
+    documents = []
+    for folder, folder_names, file_names in os.walk(datasets_path):
+        folder_names.sort()
+        for file_name in sorted(file_names):
+            if file_name.endswith(".txt"):
+                with open(os.path.join(folder, file_name), "r", encoding="utf-8", errors="replace") as f:
+                    documents.extend(line for line in f.read().split("\n") if line.strip() != "")
+    return documents
+
+
+def create_synthetic_documents(documents, number, seed):
+    """
+    Creates documents made of words with many separators, stop symbols and replaced characters, mixing the pieces of
+    the given documents
+    """
+    rng = random.Random(seed)
+    pieces = []
+    for document in documents:
+        pieces.extend(re.split("[^A-Za-z0-9]+", document))
+    pieces = [piece for piece in pieces if piece != ''] or ["word"]
+    symbols = SEPARATORS + STOPWORDS + list(REPLACINGS.keys())
+
+    synthetic = []
+    for index in range(number):
+        words = []
+        for word_index in range(rng.randint(1, 40)):
+            word = ""
+            for piece_index in range(rng.randint(1, 6)):
+                if rng.random() < 0.6:
+                    word += rng.choice(pieces)
+                if rng.random() < 0.6:
+                    word += rng.choice(symbols)
+            words.append(word or rng.choice(pieces))
+        synthetic.append(" ".join(words))
+    return synthetic
+
+
+def create_model(documents, seed, probability=0.5):
+    """
+    Creates a model with a random sample of the pieces of the documents and of the separators
+    """
+    rng = random.Random(seed)
+    candidates = set()
+    for document in documents:
+        for word in normalise(document).split():
+            candidates.add(word)
+            candidates.add(word[:-1])
+            candidates.update(re.split("[^A-Za-z0-9]+", word))
+    candidates.update(SEPARATORS)
+    candidates.update(STOPWORDS)
+    candidates.discard('')
+    return {word: word.upper() for word in sorted(candidates) if rng.random() < probability}
+
+
+def check_equivalence(documents, model):
+    """
+    Checks that the two implementations give the same vocabulary, orphans, log, tokens and failed lookups
+    :return: the number of differences
+    """
+    differences = 0
+
+    reference_model = RecordingModel(model)
+    reference_log = StringLog()
+    reference_result = reference_vocabulary([normalise(document) for document in documents], reference_model,
+                                            reference_log)
+    new_model = RecordingModel(model)
+    new_log = StringLog()
+    new_result = create_vocabulary([normalise(document) for document in documents], new_model, new_log)
+    if reference_result != new_result:
+        print("DIFFERENT VOCABULARY OR ORPHANS")
+        differences += 1
+    if reference_log.lines != new_log.lines:
+        print("DIFFERENT LOG")
+        differences += 1
+    if reference_model.misses != new_model.misses:
+        print("DIFFERENT GLOVE LOOKUPS")
+        differences += 1
+
+    vocabulary = reference_result[0]
+    tokenizer = Tokenizer(vocabulary)
+    for document in documents:
+        reference_vocabulary_model = RecordingModel(vocabulary)
+        reference_tokens = reference_tokenize(document, reference_vocabulary_model)
+        misses = set()
+        tokens = tokenizer.tokenize(document, misses)
+        if reference_tokens != tokens or reference_vocabulary_model.misses != misses:
+            differences += 1
+            if differences < 10:
+                print("DIFFERENT TOKENS")
+                print(document)
+                print(reference_tokens)
+                print(tokens)
+                print()
+    return differences
+
+
+def benchmark(documents, model, repetitions=1):
+    """
+    Compares the time spent by the two implementations
+    """
+    normalised = [normalise(document) for document in documents]
+    for name, function in [("reference", reference_vocabulary), ("new", create_vocabulary)]:
+        start = time.time()
+        for repetition in range(repetitions):
+            vocabulary, orphans = function(normalised, model)
+        print(str(time.ctime()) + "\tVOCABULARY " + name + ": " + "%.3f" % (time.time() - start) + " s")
+
+    for name in ["reference", "new"]:
+        start = time.time()
+        for repetition in range(repetitions):
+            tokenizer = Tokenizer(vocabulary)
+            for document in documents:
+                if name == "reference":
+                    reference_tokenize(document, vocabulary)
+                else:
+                    tokenizer.tokenize(document)
+        print(str(time.ctime()) + "\tTOKENS " + name + ": " + "%.3f" % (time.time() - start) + " s")
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Checks the tokenizer against the original implementation and "
+                                                 "compares their speed")
+
+    parser.add_argument('-d', '--datasets', help="Folder of the text files used as documents",
+                        default=os.path.join(os.getcwd(), 'Datasets'))
+    parser.add_argument('-n', '--number', help="Number of synthetic documents to add",
+                        type=int, default=2000)
+    parser.add_argument('-s', '--seed', help="Seed of the synthetic documents and of the model",
+                        type=int, default=0)
+    parser.add_argument('-r', '--repetitions', help="Repetitions of the benchmark",
+                        type=int, default=1)
+
+    args = parser.parse_args()
+
+    documents = load_mock_documents(args.datasets)
+    documents += create_synthetic_documents(documents, args.number, args.seed)
+    model = create_model(documents, args.seed)
+    print(str(time.ctime()) + "\t" + str(len(documents)) + " DOCUMENTS, " + str(len(model)) + " WORDS IN THE MODEL")
+
+    differences = check_equivalence(documents, model)
+    print(str(time.ctime()) + "\t" + str(differences) + " DIFFERENCES")
+
+    benchmark(documents, model, args.repetitions)
+
+    if differences > 0:
+        sys.exit(1)
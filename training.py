@@ -9,7 +9,6 @@ Code for the training process
 """
 
 import os
-import pandas
 import numpy as np
 import sys
 import time
@@ -19,21 +18,36 @@ import tensorflow as tf
 import argparse
 
 from dataset_config import dataset_info
-from networks import (build_net_7, build_not_res_net_7, create_crop_fn, create_sum_fn, create_average_fn,
-                      create_count_nonpadding_fn, create_elementwise_division_fn, create_padding_mask_fn,
-                      create_mutiply_negative_elements_fn, build_net_11,)
+from dataset_store import load_dataframe
+from embeddings_store import open_embeddings
+from vocabulary_store import load_embedding_matrix
+from networks import build_net_7, build_not_res_net_7, build_net_11, build_net_12, build_net_13
 from tensorflow.keras.callbacks import Callback, LearningRateScheduler, ModelCheckpoint, EarlyStopping, CSVLogger
 from tensorflow.keras.optimizers import RMSprop, Adam
-from tensorflow.keras.models import load_model, model_from_json
-from training_utils import TimingCallback, create_lr_annealing_function, get_avgF1
+from tensorflow.keras.models import load_model
+from training_utils import (TimingCallback, create_lr_annealing_function, get_custom_objects,
+                            get_iterations_number, get_last_weights_path, load_network, create_document_index,
+                            create_document_data, unpack_document_predictions, reset_weights,
+                            merge_component_scores)
 from glove_loader import DIM
-from sklearn.metrics import f1_score
+from evaluation_metrics import ConfusionScores
 from tensorflow.compat.v1.keras import backend as K
 
 DEBUG = False
 train_info = {}
 global_counter = 0
 
+# the compiled models, by the parameters that define them
+MODEL_CACHE = {}
+MODEL_CACHE_SIZE = 4
+MODEL_PARAMETERS = ['network', 'feature_type', 'embed_name', 'dataset_name', 'loss_weights', 'lr_alfa', 'lr_kappa',
+                    'beta_1', 'beta_2', 'res_scale', 'resnet_layers', 'embedding_scale', 'embedder_layers',
+                    'final_scale', 'regularizer_weight', 'dropout_resnet', 'dropout_embedder', 'dropout_final',
+                    'single_LSTM', 'pooling', 'text_pooling', 'pooling_type', 'bn_embed', 'bn_res', 'bn_final',
+                    'same_layers', 'distance', 'temporalBN', 'fused_attention', 'encoder', 'encoder_layers']
+# the networks whose BoW embeddings are read from the shared store by a SharedEmbedding layer
+SHARED_EMBEDDING_NETWORKS = ['7', '11', '12', '13']
+
 config = tf.compat.v1.ConfigProto()
 config.gpu_options.per_process_gpu_memory_fraction = 0.8
 config.gpu_options.allow_growth = True
@@ -62,7 +76,12 @@ def load_dataset(dataset_split='total', dataset_name='cdcp_ACL17', dataset_versi
     dataframe_path = os.path.join(dataset_path, 'pickles', dataset_version, dataset_split + '.pkl')
     embed_path = os.path.join(dataset_path, "embeddings", embed_name, dataset_version)
 
-    df = pandas.read_pickle(dataframe_path)
+    # the texts are not needed: the propositions are loaded from their embeddings
+    df = load_dataframe(dataframe_path, columns=['text_ID', 'source_ID', 'target_ID', 'source_type', 'target_type',
+                                                 'relation_type', 'source_to_target', 'set'])
+
+    # single store of the embeddings, or one file for each proposition if it has not been created
+    proposition_embeddings = open_embeddings(embed_path)
 
     categorical_prop = dataset_info[dataset_name]["categorical_prop"]
     categorical_link = dataset_info[dataset_name]["categorical_link"]
@@ -78,13 +97,18 @@ def load_dataset(dataset_split='total', dataset_name='cdcp_ACL17', dataset_versi
         dataset[split]['sources_type'] = []
         dataset[split]['targets_type'] = []
 
+        # the difference between the positions of the components, used also by the candidate generation
+        dataset[split]['difference'] = []
         if distance > 0:
             dataset[split]['distance'] = []
-            dataset[split]['difference'] = []
 
         dataset[split]['s_id'] = []
         dataset[split]['t_id'] = []
 
+        # number of tokens of each proposition, before the padding
+        dataset[split]['source_lengths'] = []
+        dataset[split]['target_lengths'] = []
+
     for index, row in df.iterrows():
 
         s_index = int(row['source_ID'].split('_')[-1])
@@ -139,21 +163,21 @@ def load_dataset(dataset_split='total', dataset_name='cdcp_ACL17', dataset_versi
             elif difference < 0:
                 difference_array[distance + difference: distance] = [1] * -difference
             dataset[split]['distance'].append(difference_array)
-            dataset[split]['difference'].append(difference)
+        dataset[split]['difference'].append(difference)
 
-        file_path = os.path.join(embed_path, source_ID + '.npz')
-        embeddings = np.load(file_path)['arr_0']
+        embeddings = proposition_embeddings[source_ID]
         embed_length = len(embeddings)
         if embed_length > max_prop_len:
             max_prop_len = embed_length
         dataset[split]['source_props'].append(embeddings)
+        dataset[split]['source_lengths'].append(embed_length)
 
-        file_path = os.path.join(embed_path, target_ID + '.npz')
-        embeddings = np.load(file_path)['arr_0']
+        embeddings = proposition_embeddings[target_ID]
         embed_length = len(embeddings)
         if embed_length > max_prop_len:
             max_prop_len = embed_length
         dataset[split]['target_props'].append(embeddings)
+        dataset[split]['target_lengths'].append(embed_length)
 
     print(str(time.ctime()) + '\t\tPADDING...')
 
@@ -162,6 +186,9 @@ def load_dataset(dataset_split='total', dataset_name='cdcp_ACL17', dataset_versi
     for split in ('train', 'validation', 'test'):
 
         dataset[split]['distance'] = np.array(dataset[split]['distance'], dtype=np.int8)
+        dataset[split]['difference'] = np.array(dataset[split]['difference'], dtype=np.int32)
+        dataset[split]['source_lengths'] = np.array(dataset[split]['source_lengths'], dtype=np.int32)
+        dataset[split]['target_lengths'] = np.array(dataset[split]['target_lengths'], dtype=np.int32)
 
         print(str(time.ctime()) + '\t\t\tPADDING ' + split)
 
@@ -194,6 +221,77 @@ def load_dataset(dataset_split='total', dataset_name='cdcp_ACL17', dataset_versi
     return dataset, max_text_len, max_prop_len
 
 
+def create_distillation_targets(teacher_folder, X, Y, s_ids, t_ids, alpha=1.0, batch_size=500):
+    """
+    Creates the targets for the distillation of an ensemble into a single network.
+    The predictions of the members of the ensemble are averaged and cached in the folder of the teacher, so that they
+    are computed only once for each set of pairs and for each version of the weights of the members.
+    :param teacher_folder: folder of the trained ensemble
+    :param X: inputs of the pairs
+    :param Y: ground truth of the pairs (link, relation, source, target)
+    :param s_ids: source id of each pair
+    :param t_ids: target id of each pair
+    :param alpha: weight of the soft targets. The remaining weight is given to the ground truth
+    :param batch_size: size of the batches used for the prediction
+    :return: the targets (link, relation, source, target)
+    """
+    teacher_name = os.path.basename(teacher_folder)
+    cache_path = os.path.join(teacher_folder, teacher_name + '_soft_targets.npz')
+
+    member_iterations = []
+    member_paths = []
+    for iteration in range(get_iterations_number(teacher_folder, teacher_name) + 1):
+        weights_path = get_last_weights_path(teacher_folder, teacher_name, iteration)
+        if weights_path != "":
+            member_iterations.append(iteration)
+            member_paths.append(weights_path)
+    if len(member_paths) < 1:
+        raise Exception('NO TEACHER MEMBERS FOUND IN ' + teacher_folder)
+
+    # the cached targets are valid only for the same weights of the members
+    member_signatures = np.array([weights_path + '\t' + str(os.path.getmtime(weights_path))
+                                  for weights_path in member_paths])
+
+    soft_targets = None
+    if os.path.exists(cache_path):
+        cache = np.load(cache_path)
+        if np.array_equal(cache['s_id'], s_ids) and np.array_equal(cache['t_id'], t_ids) and \
+                'member_signatures' in cache.files and np.array_equal(cache['member_signatures'], member_signatures):
+            print(str(time.ctime()) + "\t\tLOADING CACHED SOFT TARGETS: " + cache_path)
+            soft_targets = [cache['link'], cache['relation'], cache['source'], cache['target']]
+        else:
+            print(str(time.ctime()) + "\t\tCACHED SOFT TARGETS REFER TO DIFFERENT PAIRS OR MEMBERS, RECOMPUTING")
+
+    if soft_targets is None:
+        # all the members share the same architecture: the model is loaded once and only the weights change
+        model, _ = load_network(teacher_folder, member_iterations[-1], get_custom_objects())
+        X = X[:len(model.inputs)]
+
+        members = 0
+        for weights_path in member_paths:
+            print(str(time.ctime()) + "\t\tPREDICTING WITH MEMBER: " + weights_path)
+            model.load_weights(weights_path)
+            Y_pred = model.predict(X, batch_size=batch_size)
+            if soft_targets is None:
+                soft_targets = [np.array(Y_part, dtype=np.float64) for Y_part in Y_pred]
+            else:
+                for index in range(len(Y_pred)):
+                    soft_targets[index] += Y_pred[index]
+            members += 1
+
+        soft_targets = [np.array(Y_part / members, dtype=np.float32) for Y_part in soft_targets]
+
+        np.savez(cache_path, link=soft_targets[0], relation=soft_targets[1], source=soft_targets[2],
+                 target=soft_targets[3], s_id=np.array(s_ids), t_id=np.array(t_ids), members=members,
+                 member_signatures=member_signatures)
+        print(str(time.ctime()) + "\t\tSOFT TARGETS OF " + str(members) + " MEMBERS SAVED: " + cache_path)
+
+    targets = []
+    for soft, hard in zip(soft_targets, Y):
+        targets.append(alpha * soft + (1 - alpha) * np.array(hard, dtype=np.float32))
+    return targets
+
+
 def perform_training(name = 'try999',
                      save_weights_only=False,
                     epochs = 1000,
@@ -240,7 +338,13 @@ def perform_training(name = 'try999',
                      clean_previous_networks=True,
                      embed_name="glove300",
                      overwrite=False,
-                     log_time=False):
+                     log_time=False,
+                     distillation_teacher=None,
+                     distillation_alpha=1.0,
+                     document_batch_size=10,
+                     fused_attention=False,
+                     encoder="conv",
+                     encoder_layers=3):
 
     embedding_size = int(DIM/embedding_scale)
     res_size = int(DIM/res_scale)
@@ -366,20 +470,68 @@ def perform_training(name = 'try999',
     print(str(time.ctime()) + "\t\tCREATING MODEL...")
 
     bow = None
+    # the networks that support it read the embeddings from the shared store, relative to the working directory,
+    # without copying them: only the other ones load their own copy of the matrix
+    network_vocabulary_path = None
     if feature_type == 'bow':
         dataset_path = os.path.join(os.getcwd(), 'Datasets', dataset_name)
         vocabulary_path = os.path.join(dataset_path, 'resources', embed_name, dataset_version,'glove.embeddings.npz')
         if not os.path.exists(vocabulary_path):
             vocabulary_path = os.path.join(dataset_path, 'resources', embed_name, 'glove.embeddings.npz')
-        vocabulary_list = np.load(vocabulary_path)
-        embed_list = vocabulary_list['embeds']
-        word_list = vocabulary_list['vocab']
-
-        bow = np.zeros((len(word_list) + 1, DIM))
-        for index in range(len(word_list)):
-            bow[index + 1] = embed_list[index]
+        if str(network) in SHARED_EMBEDDING_NETWORKS:
+            network_vocabulary_path = os.path.relpath(vocabulary_path)
+        else:
+            bow = load_embedding_matrix(vocabulary_path)
         print(str(time.ctime()) + "\t\t\tEMBEDDINGS LOADED...")
 
+    # the network is fitted on Y_fit, while the evaluation always uses the ground truth
+    Y_fit = Y_train
+    if distillation_teacher is not None:
+        print(str(time.ctime()) + "\t\tCREATING DISTILLATION TARGETS FROM: " + distillation_teacher)
+        Y_fit = create_distillation_targets(distillation_teacher, X3_train, Y_train,
+                                            dataset['train']['s_id'], dataset['train']['t_id'],
+                                            alpha=distillation_alpha, batch_size=batch_size)
+
+    # document networks classify all the pairs of a document at once: the pairs are packed into documents and the
+    # predictions are unpacked before the evaluation, so that the same measures are used
+    X_fit = X3_train
+    X_fit_validation = X3_validation
+    Y_fit_validation = Y_validation
+    fit_batch_size = batch_size
+    # the pairs of a pair network have all the same weight
+    W_fit = None
+    W_fit_validation = None
+    document_index = None
+    if network == "12" or network == 12:
+        if distillation_teacher is not None:
+            raise Exception('DISTILLATION NOT SUPPORTED BY DOCUMENT NETWORKS')
+
+        print(str(time.ctime()) + "\t\tPACKING DOCUMENTS...")
+        splits = {'train': (X3_train, Y_train),
+                  'test': (X3_test, Y_test),
+                  'validation': (X3_validation, Y_validation)}
+        document_index = {}
+        X_document = {}
+        Y_document = {}
+        W_document = {}
+        for split in splits.keys():
+            document_index[split] = create_document_index(dataset[split]['s_id'], dataset[split]['t_id'])
+        max_components = max([document_index[split]['max_components'] for split in splits.keys()])
+        for split in splits.keys():
+            X_split, Y_split = splits[split]
+            document_data = create_document_data(X_split[0], X_split[1], Y_split, document_index[split],
+                                                 distance_num, max_components)
+            X_document[split], Y_document[split], W_document[split] = document_data
+            print("Documents (" + split + "): " + str(len(X_document[split][0])))
+
+        X_fit = X_document['train']
+        Y_fit = Y_document['train']
+        X_fit_validation = X_document['validation']
+        Y_fit_validation = Y_document['validation']
+        W_fit = W_document['train']
+        W_fit_validation = W_document['validation']
+        fit_batch_size = document_batch_size
+
     realname = name
 
 
@@ -400,7 +552,61 @@ def perform_training(name = 'try999',
         for f in filelist:
             os.remove(os.path.join(save_dir, f))
 
+    relations_labels = dataset_info[dataset_name]["link_as_sum"][0]
+    not_a_link_labels = dataset_info[dataset_name]["link_as_sum"][1]
+
+    # it is necessary to save all the custom functions, for using them during model loading
+    # they are created once, for all the iterations
+    custom_objects = get_custom_objects()
+
+    fmeasure_0 = custom_objects['F1_0']
+    fmeasure_0_2 = custom_objects['F1_0_2']
+    fmeasure_0_1_2 = custom_objects['F1_0_1_2']
+    fmeasure_0_1_2_3 = custom_objects['F1_0_1_2_3']
+    fmeasure_0_1_2_3_4 = custom_objects['F1_0_1_2_3_4']
+
+    props_fmeasures = []
+
+    if dataset_name == 'cdcp_ACL17':
+        props_fmeasures = [fmeasure_0_1_2_3_4]
+    #elif dataset_name == 'AAEC_v2':
+    #    props_fmeasures = [fmeasure_0, fmeasure_1, fmeasure_2, fmeasure_0_1_2]
+    elif dataset_name == 'AAEC_v2':
+        props_fmeasures = [fmeasure_0_1_2]
+
+    lr_function = create_lr_annealing_function(initial_lr=lr_alfa, k=lr_kappa)
+
+
+    loss_variables = []
+    for weight in loss_weights:
+        loss_variables.append(K.variable(weight))
+
+    metrics = {'link': [fmeasure_0],
+               # 'relation': [fmeasure_0, fmeasure_2, fmeasure_0_2, fmeasure_0_1_2_3],
+               'relation': [fmeasure_0_2, fmeasure_0_1_2_3],
+               'source': props_fmeasures,
+               'target': props_fmeasures}
+    model_loss_weights = loss_weights
+
+    # document networks have a single component classifier
+    if document_index is not None:
+        metrics = {'link': metrics['link'],
+                   'relation': metrics['relation'],
+                   'component': props_fmeasures}
+        model_loss_weights = [loss_weights[0], loss_weights[1], loss_weights[2] + loss_weights[3]]
+
+    # the compiled model is cached, and reused by the next iterations and by the next trainings of the same network
+    signature = {parameter: parameters[parameter] for parameter in MODEL_PARAMETERS}
+    signature['propos_length'] = max_prop_len
+    signature['max_components'] = max_components if document_index is not None else None
+    signature['bow'] = None if bow is None else bow.shape
+    signature['vocabulary_path'] = network_vocabulary_path
+    signature = json.dumps(signature, sort_keys=True, default=str)
+    json_saved = False
+
     train_times = []
+    epoch_times = []
+    throughputs = []
 
     # train and test iterations
     for i in range(iterations):
@@ -414,7 +620,11 @@ def perform_training(name = 'try999',
             continue
 
         model = None
-        if network == 7 or network == "7":
+        json_model = None
+        if signature in MODEL_CACHE:
+            model, json_model = MODEL_CACHE[signature]
+            print(str(time.ctime()) + "\t\tREUSING THE COMPILED MODEL...")
+        elif network == 7 or network == "7":
             model = build_net_7(bow=bow,
                                 link_as_sum=link_as_sum,
                                 propos_length=max_prop_len,
@@ -437,7 +647,8 @@ def perform_training(name = 'try999',
                                 dropout_final=dropout_final,
                                 same_DE_layers=same_layers,
                                 distance=distance_num,
-                                temporalBN=temporalBN,)
+                                temporalBN=temporalBN,
+                                vocabulary_path=network_vocabulary_path)
         elif network == "7N" or network == "7n":
             model = build_not_res_net_7(bow=bow,
                                         propos_length=max_prop_len,
@@ -481,98 +692,84 @@ def perform_training(name = 'try999',
                                 dropout_final=dropout_final,
                                 same_DE_layers=same_layers,
                                 distance=distance_num,
-                                temporalBN=temporalBN,)
-
-        relations_labels = dataset_info[dataset_name]["link_as_sum"][0]
-        not_a_link_labels = dataset_info[dataset_name]["link_as_sum"][1]
-
-        # it is necessary to save all the custom functions
-        fmeasure_0 = get_avgF1([0])
-        fmeasure_1 = get_avgF1([1])
-        fmeasure_2 = get_avgF1([2])
-        fmeasure_3 = get_avgF1([3])
-        fmeasure_4 = get_avgF1([4])
-        fmeasure_0_1_2_3 = get_avgF1([0, 1, 2, 3])
-        fmeasure_0_1_2_3_4 = get_avgF1([0, 1, 2, 3, 4])
-        fmeasure_0_2 = get_avgF1([0, 2])
-        fmeasure_0_1_2 = get_avgF1([0, 1, 2])
-        fmeasure_0_1 = get_avgF1([0, 1, 2])
-        fmeasure_0_2_4 = get_avgF1([0, 2, 4])
-
-        fmeasures = [fmeasure_0, fmeasure_1, fmeasure_2, fmeasure_3, fmeasure_4, fmeasure_0_1_2_3, fmeasure_0_1_2_3_4,
-                     fmeasure_0_2, fmeasure_0_1_2, fmeasure_0_1, fmeasure_0_2_4]
-
-        props_fmeasures = []
-
-        if dataset_name == 'cdcp_ACL17':
-            props_fmeasures = [fmeasure_0_1_2_3_4]
-        #elif dataset_name == 'AAEC_v2':
-        #    props_fmeasures = [fmeasure_0, fmeasure_1, fmeasure_2, fmeasure_0_1_2]
-        elif dataset_name == 'AAEC_v2':
-            props_fmeasures = [fmeasure_0_1_2]
-
-        # for using them during model loading
-        custom_objects = {}
-
-        for fmeasure in fmeasures:
-            custom_objects[fmeasure.__name__] = fmeasure
-
-        crop0 = create_crop_fn(1, 0, 1)
-        crop1 = create_crop_fn(1, 1, 2)
-        crop2 = create_crop_fn(1, 2, 3)
-        crop3 = create_crop_fn(1, 3, 4)
-        crop4 = create_crop_fn(1, 4, 5)
-
-        crops = [crop0, crop1, crop2, crop3, crop4]
-        for crop in crops:
-            custom_objects[crop.__name__] = crop
-
-        mean_fn = create_average_fn(1)
-        sum_fn = create_sum_fn(1)
-        division_fn = create_elementwise_division_fn()
-        pad_fn = create_count_nonpadding_fn(1, (DIM,))
-        padd_fn = create_padding_mask_fn()
-        neg_fn = create_mutiply_negative_elements_fn()
-        custom_objects[mean_fn.__name__] = mean_fn
-        custom_objects[sum_fn.__name__] = sum_fn
-        custom_objects[division_fn.__name__] = division_fn
-        custom_objects[pad_fn.__name__] = pad_fn
-        custom_objects[padd_fn.__name__] = padd_fn
-        custom_objects[neg_fn.__name__] = neg_fn
-
-        lr_function = create_lr_annealing_function(initial_lr=lr_alfa, k=lr_kappa)
-
-
-        loss_variables = []
-        for weight in loss_weights:
-            loss_variables.append(K.variable(weight))
-
-        model.compile(loss='categorical_crossentropy',
-                      loss_weights=loss_weights,
-                      optimizer=Adam(lr=lr_function(0),
-                                     beta_1=beta_1,
-                                     beta_2=beta_2),
-                      metrics={'link': [fmeasure_0],
-                               # 'relation': [fmeasure_0, fmeasure_2, fmeasure_0_2, fmeasure_0_1_2_3],
-                               'relation': [fmeasure_0_2, fmeasure_0_1_2_3],
-                               'source': props_fmeasures,
-                               'target': props_fmeasures}
-                      )
-
-        model.summary()
-
-        print("Expected input")
-        print(model.input_shape)
-
-        print(str(time.ctime()) + "\t\tMODEL COMPILED...")
+                                temporalBN=temporalBN,
+                                fused_attention=fused_attention,
+                                vocabulary_path=network_vocabulary_path)
+        elif network == "13" or network == 13:
+            model = build_net_13(bow=bow,
+                                 link_as_sum=link_as_sum,
+                                 propos_length=max_prop_len,
+                                 regularizer_weight=regularizer_weight,
+                                 dropout_embedder=dropout_embedder,
+                                 dropout_resnet=dropout_resnet,
+                                 embedding_size=embedding_size,
+                                 embedder_layers=embedder_layers,
+                                 resnet_layers=resnet_layers,
+                                 res_size=res_size,
+                                 final_size=final_size,
+                                 outputs=output_units,
+                                 bn_embed=bn_embed,
+                                 bn_res=bn_res,
+                                 bn_final=bn_final,
+                                 single_encoder=single_LSTM,
+                                 dropout_final=dropout_final,
+                                 same_DE_layers=same_layers,
+                                 distance=distance_num,
+                                 temporalBN=temporalBN,
+                                 encoder=encoder,
+                                 encoder_layers=encoder_layers,
+                                 vocabulary_path=network_vocabulary_path)
+        elif network == "12" or network == 12:
+            model = build_net_12(bow=bow,
+                                 link_as_sum=link_as_sum,
+                                 propos_length=max_prop_len,
+                                 max_components=max_components,
+                                 regularizer_weight=regularizer_weight,
+                                 dropout_embedder=dropout_embedder,
+                                 embedding_size=embedding_size,
+                                 final_size=final_size,
+                                 outputs=output_units,
+                                 bn_embed=bn_embed,
+                                 bn_final=bn_final,
+                                 dropout_final=dropout_final,
+                                 distance=distance_num,
+                                 temporalBN=temporalBN,
+                                 vocabulary_path=network_vocabulary_path)
+
+
+        if json_model is None:
+            model.compile(loss='categorical_crossentropy',
+                          loss_weights=model_loss_weights,
+                          optimizer=Adam(lr=lr_function(0),
+                                         beta_1=beta_1,
+                                         beta_2=beta_2),
+                          metrics=metrics,
+                          # document networks weight each pair and each component of the documents
+                          sample_weight_mode='temporal' if document_index is not None else None
+                          )
+
+            model.summary()
+
+            print("Expected input")
+            print(model.input_shape)
+
+            print(str(time.ctime()) + "\t\tMODEL COMPILED...")
+
+            json_model = model.to_json()
+            while len(MODEL_CACHE) >= MODEL_CACHE_SIZE:
+                del MODEL_CACHE[next(iter(MODEL_CACHE))]
+            MODEL_CACHE[signature] = (model, json_model)
 
+        # every iteration starts from new weights, drawn with its own seed
+        reset_weights(model, seed=i)
 
         # PERSISTENCE CONFIGURATION
         complete_network_name = name + '_completemodel.{epoch:03d}.h5'
         model_name = realname + '_model.json'
-        json_model = model.to_json()
-        with open(os.path.join(save_dir, model_name), 'w') as outfile:
-            json.dump(json_model, outfile)
+        if not json_saved:
+            with open(os.path.join(save_dir, model_name), 'w') as outfile:
+                json.dump(json_model, outfile)
+            json_saved = True
         weights_name = name + '_weights.{epoch:03d}.h5'
 
         if not save_weights_only:
@@ -611,42 +808,15 @@ def perform_training(name = 'try999',
             sids = dataset['validation']['s_id']
             tids = dataset['validation']['t_id']
 
-            s_test_scores = {}
-            t_test_scores = {}
-            s_pred_scores = {}
-            t_pred_scores = {}
-
-
-            for index in range(len(sids)):
-                sid = sids[index]
-                tid = tids[index]
-
-                if sid not in s_test_scores.keys():
-                    s_test_scores[sid] = []
-                    s_pred_scores[sid] = []
-                s_test_scores[sid].append(Y_validation[2][index])
-
-                if tid not in t_test_scores.keys():
-                    t_test_scores[tid] = []
-                    t_pred_scores[tid] = []
-                t_test_scores[tid].append(Y_validation[3][index])
-
-            Y_test_prop_real_list = []
-
-            for p_id in t_test_scores.keys():
-                Y_test_prop_real_list.append(np.concatenate([s_test_scores[p_id], t_test_scores[p_id]]))
-
-            Y_test_prop_real_list = np.array(Y_test_prop_real_list)
-
-            Y_test_prop_real = []
-            for index in range(len(Y_test_prop_real_list)):
-                Y_test_prop_real.append(np.sum(Y_test_prop_real_list[index], axis=-2))
-
-            Y_test_prop_real = np.array(Y_test_prop_real)
+            _, Y_test_prop_real = merge_component_scores(sids, tids, Y_validation[2], Y_validation[3])
             Y_test_prop_real = np.argmax(Y_test_prop_real, axis=-1)
 
-            Y_test_links_or = np.argmax(Y_validation[0], axis=-1)
-            Y_test_rel_or = np.argmax(Y_validation[1], axis=-1)
+            # the reflexive pairs are not evaluated
+            not_reflexive = np.array(sids) != np.array(tids)
+            Y_test_links = np.argmax(Y_validation[0], axis=-1)[not_reflexive]
+            Y_test_rel = np.argmax(Y_validation[1], axis=-1)[not_reflexive]
+
+            positive_link_labels = dataset_info[dataset_name]["link_as_sum"][0]
 
 
             last_epoch = 0
@@ -665,10 +835,11 @@ def perform_training(name = 'try999',
                 if log_time:
                     callbacks.append(timer)
 
-                model.fit(x=X3_train,
+                model.fit(x=X_fit,
                           # y=Y_links_train,
-                          y=Y_train,
-                          batch_size=batch_size,
+                          y=Y_fit,
+                          sample_weight=W_fit,
+                          batch_size=fit_batch_size,
                           epochs=epoch+1,
                           verbose=2,
                           callbacks=callbacks,
@@ -676,63 +847,27 @@ def perform_training(name = 'try999',
                           )
 
                 # evaluation
-                Y_pred = model.predict(X3_validation)
-
-                Y_test_links = Y_test_links_or.copy()
-                Y_test_rel = Y_test_rel_or.copy()
-
-                for index in range(len(sids)):
-                    sid = sids[index]
-                    tid = tids[index]
-
-                    s_pred_scores[sid].append(Y_pred[2][index])
-                    t_pred_scores[tid].append(Y_pred[3][index])
-
-                Y_pred_prop_real_list = []
-
-                for p_id in t_test_scores.keys():
-                    Y_pred_prop_real_list.append(np.concatenate([s_pred_scores[p_id], t_pred_scores[p_id]]))
+                if document_index is not None:
+                    Y_pred = unpack_document_predictions(model.predict(X_fit_validation),
+                                                         document_index['validation'])
+                else:
+                    Y_pred = model.predict(X3_validation)
 
-                Y_pred_prop_real_list = np.array(Y_pred_prop_real_list)
+                _, Y_pred_prop_real = merge_component_scores(sids, tids, Y_pred[2], Y_pred[3])
+                Y_pred_prop_real = np.argmax(Y_pred_prop_real, axis=-1)
 
-                Y_pred_prop_real = []
-                for index in range(len(Y_test_prop_real_list)):
-                    Y_pred_prop_real.append(np.sum(Y_pred_prop_real_list[index], axis=-2))
+                Y_pred_links = np.argmax(Y_pred[0], axis=-1)[not_reflexive]
+                Y_pred_rel = np.argmax(Y_pred[1], axis=-1)[not_reflexive]
 
-                Y_pred_prop_real = np.array(Y_pred_prop_real)
-                Y_pred_prop_real = np.argmax(Y_pred_prop_real, axis=-1)
+                link_scores = ConfusionScores(Y_test_links, Y_pred_links)
+                rel_scores = ConfusionScores(Y_test_rel, Y_pred_rel)
+                prop_scores = ConfusionScores(Y_test_prop_real, Y_pred_prop_real)
 
-                Y_pred_links = np.argmax(Y_pred[0], axis=-1)
-                Y_pred_rel = np.argmax(Y_pred[1], axis=-1)
-
-
-                # Remove all the symmetric links
-                reflexive = []
-                for index in range(len(sids)):
-                    sid = sids[index]
-                    tid = tids[index]
-                    if sid == tid:
-                        reflexive.append(index)
-                if len(reflexive) > 0:
-                    Y_test_rel = np.delete(Y_test_rel, reflexive, axis=0)
-                    Y_pred_rel = np.delete(Y_pred_rel, reflexive, axis=0)
-                    Y_test_links = np.delete(Y_test_links, reflexive, axis=0)
-                    Y_pred_links = np.delete(Y_pred_links, reflexive, axis=0)
-                    if len(Y_test_rel) != len(Y_pred_rel):
-                        print(len(Y_test_rel))
-                        print(len(Y_pred_rel))
-                    if len(Y_test_links) != len(Y_pred_links):
-                        print(len(Y_test_links))
-                        print(len(Y_pred_links))
-
-                positive_link_labels = dataset_info[dataset_name]["link_as_sum"][0]
-                negative_link_labels = dataset_info[dataset_name]["link_as_sum"][1]
-
-                score_f1_link = f1_score(Y_test_links, Y_pred_links, average=None, labels=[0])
-                score_f1_rel = f1_score(Y_test_rel, Y_pred_rel, average=None, labels=positive_link_labels)
-                score_f1_rel_AVGM = f1_score(Y_test_rel, Y_pred_rel, average='macro', labels=positive_link_labels)
-                score_prop = f1_score(Y_test_prop_real, Y_pred_prop_real, average=None)
-                score_prop_AVG = f1_score(Y_test_prop_real, Y_pred_prop_real, average='macro')
+                score_f1_link = link_scores.f1_score(average=None, labels=[0])
+                score_f1_rel = rel_scores.f1_score(average=None, labels=positive_link_labels)
+                score_f1_rel_AVGM = rel_scores.f1_score(average='macro', labels=positive_link_labels)
+                score_prop = prop_scores.f1_score(average=None)
+                score_prop_AVG = prop_scores.f1_score(average='macro')
 
                 score_AVG_LP = np.mean([score_f1_link, score_prop_AVG])
                 score_AVG_all = np.mean([score_f1_link, score_prop_AVG, score_f1_rel_AVGM])
@@ -810,14 +945,20 @@ def perform_training(name = 'try999',
 
             starttime = time.time()
 
-            history = model.fit(x=X3_train,
+            if W_fit_validation is None:
+                validation_data = (X_fit_validation, Y_fit_validation)
+            else:
+                validation_data = (X_fit_validation, Y_fit_validation, W_fit_validation)
+
+            history = model.fit(x=X_fit,
                                 # y=Y_links_train,
-                                y=Y_train,
-                                batch_size=batch_size,
+                                y=Y_fit,
+                                sample_weight=W_fit,
+                                batch_size=fit_batch_size,
                                 epochs=epochs,
                                 verbose=2,
                                 # validation_data=(X_validation, Y_links_validation),
-                                validation_data=(X3_validation, Y_validation),
+                                validation_data=validation_data,
                                 callbacks=callbacks
                                 )
 
@@ -840,8 +981,6 @@ def perform_training(name = 'try999',
 
         # load the model (the last one that was saved)
         if save_weights_only:
-            model = model_from_json(json_model, custom_objects=custom_objects)
-
             for epoch in range(last_epoch, 0, -1):
                 netpath = os.path.join(save_dir, name + '_weights.%03d.h5' % epoch)
                 if os.path.exists(netpath):
@@ -879,7 +1018,9 @@ def perform_training(name = 'try999',
         print("\n\n\tLOADED NETWORK: " + last_path + "\n")
 
 
-        if not distance and len(model.input_shape) < 3:
+        if document_index is not None:
+            X = X_document
+        elif not distance and len(model.input_shape) < 3:
             X = {'test': X3_test[:-2],
                  'train': X3_train[:-2],
                  'validation': X3_validation[:-2]}
@@ -905,7 +1046,13 @@ def perform_training(name = 'try999',
             # 2 dim
             # ax0 = samples
             # ax1 = classes
+            predict_start = time.time()
             Y_pred = model.predict(X[split])
+            if document_index is not None:
+                Y_pred = unpack_document_predictions(Y_pred, document_index[split])
+            if split == 'test':
+                # pairs classified per second
+                throughput = len(dataset[split]['s_id']) / (time.time() - predict_start)
 
             # begin of the evaluation of the single propositions scores
             sids = dataset[split]['s_id']
@@ -973,13 +1120,17 @@ def perform_training(name = 'try999',
             # F1s
             positive_link_labels = dataset_info[dataset_name]["link_as_sum"][0]
             negative_link_labels = dataset_info[dataset_name]["link_as_sum"][1]
-            score_f1_link = f1_score(Y_test_links, Y_pred_links, average=None, labels=[0])
-            score_f1_rel = f1_score(Y_test_rel, Y_pred_rel, average=None, labels=positive_link_labels)
-            score_f1_rel_AVGM = f1_score(Y_test_rel, Y_pred_rel, average='macro', labels=positive_link_labels)
+            link_scores = ConfusionScores(Y_test_links, Y_pred_links)
+            rel_scores = ConfusionScores(Y_test_rel, Y_pred_rel)
+            prop_scores = ConfusionScores(Y_test_prop_real, Y_pred_prop_real)
+
+            score_f1_link = link_scores.f1_score(average=None, labels=[0])
+            score_f1_rel = rel_scores.f1_score(average=None, labels=positive_link_labels)
+            score_f1_rel_AVGM = rel_scores.f1_score(average='macro', labels=positive_link_labels)
 
-            score_f1_prop_real = f1_score(Y_test_prop_real, Y_pred_prop_real, average=None)
-            score_f1_prop_AVGM_real = f1_score(Y_test_prop_real, Y_pred_prop_real, average='macro')
-            score_f1_prop_AVGm_real = f1_score(Y_test_prop_real, Y_pred_prop_real, average='micro')
+            score_f1_prop_real = prop_scores.f1_score(average=None)
+            score_f1_prop_AVGM_real = prop_scores.f1_score(average='macro')
+            score_f1_prop_AVGm_real = prop_scores.f1_score(average='micro')
 
             score_f1_AVG_LP_real = np.mean([score_f1_link, score_f1_prop_AVGM_real])
             score_f1_AVG_all_real = np.mean([score_f1_link, score_f1_prop_AVGM_real, score_f1_rel_AVGM])
@@ -1031,6 +1182,12 @@ def perform_training(name = 'try999',
         with open(log_path, "a") as train_file:
             train_file.write("\n\nTraining time:\n" + str(train_time))
         testfile.write("\n\nTraining time:\n" + str(train_time))
+        if log_time:
+            epoch_time = np.average(timer.logs)
+            testfile.write("\n\nEpoch time:\n" + str(epoch_time))
+            testfile.write("\n\nInference throughput:\n" + str(throughput))
+            epoch_times.append(epoch_time)
+            throughputs.append(throughput)
         testfile.close()
         train_times.append(train_time)
 
@@ -1055,6 +1212,9 @@ def perform_training(name = 'try999',
         testfile.flush()
 
     testfile.write("\n\nTraining time:\n" + str(train_time))
+    if log_time and len(epoch_times) > 0:
+        testfile.write("\n\nEpoch time:\n" + str(np.average(epoch_times)))
+        testfile.write("\n\nInference throughput:\n" + str(np.average(throughputs)))
     testfile.close()
 
 
@@ -1460,6 +1620,247 @@ def ECHR_routine():
     )
 
 
+def read_evaluation_file(eval_path):
+    """
+    Reads the evaluation file written by perform_training
+    :param eval_path: path of the file
+    :return: dictionary with the scores of each split (the first evaluation, if the split has been evaluated
+    multiple times) and the times of the training
+    """
+    evaluation = {}
+    key = None
+    with open(eval_path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line == "":
+                continue
+            if key is not None:
+                evaluation[key] = float(line)
+                key = None
+            elif line in ["Training time:", "Epoch time:", "Inference throughput:"]:
+                key = line[:-1]
+            else:
+                values = line.split("\t")
+                if values[0] in ['test', 'validation', 'train'] and values[0] not in evaluation:
+                    evaluation[values[0]] = [float(value) for value in values[1:]]
+    return evaluation
+
+
+def write_comparison_report(report_path, dataset_name, labels, evaluations):
+    """
+    Writes a table that compares the times and the scores on the test split of some trainings on the same dataset.
+    The first training is the baseline of the speedups and of the score differences.
+    :param report_path: path of the tab-separated table
+    :param dataset_name: name of the dataset
+    :param labels: the name of each training in the table
+    :param evaluations: the evaluation of each training, as read by read_evaluation_file
+    :return: None
+    """
+    headline = dataset_info[dataset_name]["evaluation_headline_short"].strip("\n").split("\t")[1:]
+    baseline = evaluations[0]
+
+    with open(report_path, "w") as report:
+        report.write("network\tTraining time\tEpoch time\tEpoch speedup\tInference throughput\t" +
+                     "\t".join(headline) + "\t" + "\t".join(["delta " + column for column in headline]) + "\n")
+        for label, evaluation in zip(labels, evaluations):
+            string = label
+            string += "\t" + "{:10.2f}".format(evaluation["Training time"])
+            string += "\t" + "{:10.2f}".format(evaluation["Epoch time"])
+            string += "\t" + "{:10.2f}".format(baseline["Epoch time"] / evaluation["Epoch time"])
+            string += "\t" + "{:10.2f}".format(evaluation.get("Inference throughput", np.nan))
+            for value in evaluation['test']:
+                string += "\t" + "{:10.4f}".format(value)
+            for index in range(len(evaluation['test'])):
+                string += "\t" + "{:10.4f}".format(evaluation['test'][index] - baseline['test'][index])
+            report.write(string + "\n")
+
+    print(str(time.ctime()) + "\tCOMPARISON SAVED: " + report_path)
+
+
+def encoder_comparison_routine(corpora=(('RCT', 'neo'), ('DrInventor', 'arg10'), ('cdcp_ACL17', 'new_3'),
+                                        ('ECHR2018', 'arg0'), ('AAEC_v2', 'new_2R'),
+                                        ('scidtb_argmin_annotations', 'only_arg_v1')),
+                               iterations=1):
+    """
+    Trains, on each corpus, the network 11 (biLSTM encoder) and the network 13 with the convolutional and with the
+    self-attention encoders, and compares their epoch time, their inference throughput and their scores on the test
+    split. The comparison of each dataset is saved in network_models/<dataset>/<version>/encoder_comparison.tsv
+    :param corpora: the datasets, as (name, version)
+    :param iterations: number of networks trained with each encoder
+    """
+
+    split = 'total'
+    configurations = [("biLSTM", 11, "conv"), ("conv", 13, "conv"), ("attention", 13, "attention")]
+
+    for dataset_name, dataset_version in corpora:
+
+        names = []
+        for label, network, encoder in configurations:
+            name = dataset_name.split('_')[0] + str(network) + '_' + label
+            names.append(name)
+
+            perform_training(
+                name=name,
+                save_weights_only=True,
+                epochs=10000,
+                feature_type='bow',
+                patience=100,
+                loss_weights=[0, 10, 1, 1],
+                lr_alfa=0.005,
+                lr_kappa=0.001,
+                beta_1=0.9,
+                beta_2=0.9999,
+                res_scale=60, # res_siz =5
+                resnet_layers=(1, 2),
+                embedding_scale=6, # embedding_size=50
+                embedder_layers=4,
+                final_scale=15, # final_size=20
+                space_scale=10,
+                batch_size=500,
+                regularizer_weight=0.0001,
+                dropout_resnet=0.1,
+                dropout_embedder=0.1,
+                dropout_final=0.1,
+                bn_embed=True,
+                bn_res=True,
+                bn_final=True,
+                network=network,
+                monitor="links",
+                true_validation=True,
+                temporalBN=False,
+                same_layers=False,
+                distance=5,
+                iterations=iterations,
+                merge=None,
+                single_LSTM=True,
+                pooling=10,
+                text_pooling=50,
+                pooling_type='avg',
+                classification="softmax",
+                dataset_name=dataset_name,
+                dataset_version=dataset_version,
+                dataset_split=split,
+                clean_previous_networks=True,
+                log_time=True,
+                encoder=encoder,
+                encoder_layers=3,
+            )
+
+        versionpath = os.path.join(os.getcwd(), 'network_models', dataset_name, dataset_version)
+        evaluations = [read_evaluation_file(os.path.join(versionpath, name + "_eval.txt")) for name in names]
+        write_comparison_report(os.path.join(versionpath, "encoder_comparison.tsv"), dataset_name,
+                                [configuration[0] for configuration in configurations], evaluations)
+
+
+def distillation_routine(teacher_name, dataset_name='cdcp_ACL17', dataset_version='new_3', network=11):
+    """
+    Distills an ensemble trained on a dataset version into a single network
+    :param teacher_name: name of the ensemble network
+    """
+
+    split = 'total'
+    name = teacher_name + '_student'
+
+    teacher_folder = os.path.join(os.getcwd(), 'network_models', dataset_name, dataset_version, teacher_name)
+
+    perform_training(
+        name=name,
+        save_weights_only=True,
+        epochs=10000,
+        feature_type='bow',
+        patience=100,
+        loss_weights=[0, 10, 1, 1],
+        lr_alfa=0.005,
+        lr_kappa=0.001,
+        beta_1=0.9,
+        beta_2=0.9999,
+        res_scale=60, # res_siz =5
+        resnet_layers=(1, 2),
+        embedding_scale=6, # embedding_size=50
+        embedder_layers=4,
+        final_scale=15, # final_size=20
+        space_scale=10,
+        batch_size=500,
+        regularizer_weight=0.0001,
+        dropout_resnet=0.1,
+        dropout_embedder=0.1,
+        dropout_final=0.1,
+        bn_embed=True,
+        bn_res=True,
+        bn_final=True,
+        network=network,
+        monitor="links",
+        true_validation=True,
+        temporalBN=False,
+        same_layers=False,
+        distance=5,
+        iterations=1,
+        merge=None,
+        single_LSTM=True,
+        pooling=10,
+        text_pooling=50,
+        pooling_type='avg',
+        classification="softmax",
+        dataset_name=dataset_name,
+        dataset_version=dataset_version,
+        dataset_split=split,
+        clean_previous_networks=True,
+        distillation_teacher=teacher_folder,
+        distillation_alpha=1.0,
+    )
+
+    netpath = os.path.join(os.getcwd(), 'network_models', dataset_name, dataset_version, name)
+
+    evaluate_net.perform_evaluation(netpath, dataset_name, dataset_version, retrocompatibility=False, distance=5,
+                                    ensemble=False)
+
+
+def document_routine(dataset_name='cdcp_ACL17', dataset_version='new_3'):
+    """
+    Trains the document network (biaffine scoring of all the pairs of a document) on a dataset version
+    """
+
+    split = 'total'
+    name = dataset_name.split('_')[0] + '12'
+
+    perform_training(
+        name=name,
+        save_weights_only=True,
+        epochs=10000,
+        feature_type='bow',
+        patience=100,
+        loss_weights=[0, 10, 1, 1],
+        lr_alfa=0.005,
+        lr_kappa=0.001,
+        beta_1=0.9,
+        beta_2=0.9999,
+        embedding_scale=6, # embedding_size=50
+        final_scale=15, # final_size=20
+        batch_size=500,
+        document_batch_size=10,
+        regularizer_weight=0.0001,
+        dropout_embedder=0.1,
+        dropout_final=0.1,
+        bn_embed=True,
+        bn_final=True,
+        network=12,
+        monitor="links",
+        true_validation=True,
+        temporalBN=False,
+        distance=5,
+        iterations=10,
+        dataset_name=dataset_name,
+        dataset_version=dataset_version,
+        dataset_split=split,
+        clean_previous_networks=True,
+    )
+
+    netpath = os.path.join(os.getcwd(), 'network_models', dataset_name, dataset_version, name)
+
+    evaluate_net.perform_evaluation(netpath, dataset_name, dataset_version, retrocompatibility=False, distance=5,
+                                    ensemble=True)
+
+
 if __name__ == '__main__':
 
     global DIM
@@ -1469,12 +1870,31 @@ if __name__ == '__main__':
     parser.add_argument('-c', '--corpus',
                         choices=["rct", "drinv", "cdcp", "echr", "ukp", "scidtb"],
                         help="corpus", default="cdcp")
+    parser.add_argument('-t', '--teacher', help="Distill the ensemble with this name into a single network",
+                        default=None)
+    parser.add_argument('-m', '--matrix', help="Train the document network, which scores all the pairs of a "
+                                               "document at once", action="store_true")
+    parser.add_argument('-e', '--encoders', help="Compare the biLSTM, convolutional and self-attention encoders on "
+                                                 "all the corpora", action="store_true")
 
     args = parser.parse_args()
 
     corpus = args.corpus
 
-    if corpus.lower() == "rct":
+    corpora = {"rct": ('RCT', 'neo'),
+               "drinv": ('DrInventor', 'arg10'),
+               "cdcp": ('cdcp_ACL17', 'new_3'),
+               "echr": ('ECHR2018', 'arg0'),
+               "ukp": ('AAEC_v2', 'new_2R'),
+               "scidtb": ('scidtb_argmin_annotations', 'only_arg_v1')}
+
+    if args.encoders:
+        encoder_comparison_routine()
+    elif args.teacher is not None:
+        distillation_routine(args.teacher, *corpora[corpus.lower()])
+    elif args.matrix:
+        document_routine(*corpora[corpus.lower()])
+    elif corpus.lower() == "rct":
         RCT_routine()
     elif corpus.lower() == "cdcp":
         cdcp_routine()
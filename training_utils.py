@@ -14,10 +14,13 @@ import pandas
 import numpy as np
 import sys
 import time
+import json
 
 from keras.callbacks import Callback
 from keras import backend as K
-from sklearn.metrics import f1_score
+from evaluation_metrics import ConfusionScores
+from glove_loader import DIM
+from tensorflow.keras.models import model_from_json
 
 class TimingCallback(Callback):
     """
@@ -35,6 +38,7 @@ class TimingCallback(Callback):
         currtime = time.time()
         from_begin = (currtime-self.starttime)/60
         last_epoch = (currtime-self.lasttime)/60
+        self.logs.append(currtime-self.lasttime)
         print("Last epoch has lasted: " + str(last_epoch) + " minutes")
         print("Training is lasting: " + str(from_begin) + " minutes")
 
@@ -62,11 +66,14 @@ class RealValidationCallback(Callback):
         Y_pred_rel = np.argmax(Y_pred[1], axis=-1)
         Y_test_rel = np.argmax(Y_test[1], axis=-1)
 
-        score_link = f1_score(Y_test_links, Y_pred_links, average=None, labels=[0])
-        score_rel = f1_score(Y_test_rel, Y_pred_rel, average=None, labels=[0, 2])
-        score_rel_AVG = f1_score(Y_test_rel, Y_pred_rel, average='macro', labels=[0, 2])
-        score_prop = f1_score(Y_test_prop, Y_pred_prop, average=None)
-        score_prop_AVG = f1_score(Y_test_prop, Y_pred_prop, average='macro')
+        rel_scores = ConfusionScores(Y_test_rel, Y_pred_rel)
+        prop_scores = ConfusionScores(Y_test_prop, Y_pred_prop)
+
+        score_link = ConfusionScores(Y_test_links, Y_pred_links).f1_score(average=None, labels=[0])
+        score_rel = rel_scores.f1_score(average=None, labels=[0, 2])
+        score_rel_AVG = rel_scores.f1_score(average='macro', labels=[0, 2])
+        score_prop = prop_scores.f1_score(average=None)
+        score_prop_AVG = prop_scores.f1_score(average='macro')
 
         score_AVG_LP = np.mean([score_link, score_prop_AVG])
         score_AVG_all = np.mean([score_link, score_prop_AVG, score_rel_AVG])
@@ -215,6 +222,12 @@ def get_avgF1(indexes):
     :return: the average f1-measure
     """
 
+    def has_class(y_true):
+        """
+        The targets without any class (the padding of the document networks) are ignored
+        """
+        return K.cast(K.greater(K.sum(y_true, axis=-1), 0), 'int32')
+
     def some_class_precision(index, y_true, y_pred):
         """
         Based on https://stackoverflow.com/a/41717938/5464787
@@ -228,7 +241,7 @@ def get_avgF1(indexes):
         class_id_preds = K.argmax(y_pred, axis=-1)
 
         # predictions of the interested class (true positives + false positives)
-        mask = K.cast(K.equal(class_id_preds, index), 'int32')
+        mask = K.cast(K.equal(class_id_preds, index), 'int32') * has_class(y_true)
 
         # right predictions (true positives + true negatives)
         class_acc_tensor = K.cast(K.equal(class_id_true, class_id_preds), 'int32')
@@ -250,7 +263,7 @@ def get_avgF1(indexes):
         class_id_preds = K.argmax(y_pred, axis=-1)
 
         # true of interested class (true positives + false negatives)
-        mask = K.cast(K.equal(class_id_true, index), 'int32')
+        mask = K.cast(K.equal(class_id_true, index), 'int32') * has_class(y_true)
 
         # right predictions (true positives + true negatives)
         class_acc_tensor = K.cast(K.equal(class_id_true, class_id_preds), 'int32')
@@ -286,3 +299,488 @@ def get_avgF1(indexes):
         avgF1.__name__ = name
         return avgF1
 
+
+
+def get_custom_objects():
+    """
+    Creates all the custom functions (metrics and Lambda functions) that are necessary to load a saved network
+    :return: dictionary of custom objects, indexed by their name
+    """
+    import networks
+
+    custom_objects = {}
+
+    fmeasures = [get_avgF1([0]), get_avgF1([1]), get_avgF1([2]), get_avgF1([3]), get_avgF1([4]),
+                 get_avgF1([0, 1, 2, 3]), get_avgF1([0, 1, 2, 3, 4]), get_avgF1([0, 2]), get_avgF1([0, 1, 2]),
+                 get_avgF1([0, 2, 4])]
+    for fmeasure in fmeasures:
+        custom_objects[fmeasure.__name__] = fmeasure
+
+    for index in range(5):
+        crop = networks.create_crop_fn(1, index, index + 1)
+        custom_objects[crop.__name__] = crop
+
+    # document networks crop the flattened pair matrices
+    for index in range(8):
+        crop = networks.create_crop_fn(2, index, index + 1)
+        custom_objects[crop.__name__] = crop
+
+    functions = [networks.create_average_fn(1),
+                 networks.create_sum_fn(1),
+                 networks.create_elementwise_division_fn(),
+                 networks.create_count_nonpadding_fn(1, (DIM,)),
+                 networks.create_padding_mask_fn(),
+                 networks.create_mutiply_negative_elements_fn(),
+                 networks.create_component_mask_fn()]
+    for function in functions:
+        custom_objects[function.__name__] = function
+
+    custom_objects['Biaffine'] = networks.Biaffine
+    custom_objects['PairMasking'] = networks.PairMasking
+    custom_objects['MaskedAttentionPooling'] = networks.MaskedAttentionPooling
+    custom_objects['SharedEmbedding'] = networks.SharedEmbedding
+    custom_objects['MaskedSelfAttention'] = networks.MaskedSelfAttention
+    custom_objects['MaskedGlobalPooling'] = networks.MaskedGlobalPooling
+    custom_objects['PaddingMasking'] = networks.PaddingMasking
+
+    return custom_objects
+
+
+def get_iterations_number(netfolder, netname, max_iterations=20):
+    """
+    Determines the index of the last iteration of a network whose weights have been saved
+    :param netfolder: folder of the network
+    :param netname: name of the network
+    :param max_iterations: maximum index to look for
+    :return: the index of the last iteration, -1 if no weights have been found
+    """
+    file_names = os.listdir(netfolder)
+    for iteration in range(max_iterations, -1, -1):
+        net_file_name = (netname + "_" + str(iteration) + '_weights')
+        for name in file_names:
+            if net_file_name in name:
+                return iteration
+    return -1
+
+
+def get_last_weights_path(netfolder, netname, iteration, max_epochs=1000, save_weights_only=True):
+    """
+    Finds the last file saved for an iteration of a network
+    :param netfolder: folder of the network
+    :param netname: name of the network
+    :param iteration: index of the iteration
+    :param max_epochs: maximum epoch to look for
+    :param save_weights_only: whether the network has been saved as weights or as complete model
+    :return: the path of the file, an empty string if it has not been found
+    """
+    for epoch in range(max_epochs, 0, -1):
+        if save_weights_only:
+            netpath = os.path.join(netfolder, netname + "_" + str(iteration) + '_weights.%03d.h5' % epoch)
+        else:
+            netpath = os.path.join(netfolder, netname + "_" + str(iteration) + '_completemodel.%03d.h5' % epoch)
+        if os.path.exists(netpath):
+            return netpath
+    return ""
+
+
+def load_network(netfolder, iteration, custom_objects=None):
+    """
+    Loads an iteration of a trained network from its folder
+    :param netfolder: folder of the network
+    :param iteration: index of the iteration
+    :param custom_objects: custom objects necessary to load the model. If None, they are created
+    :return: the model and the path of the weights that have been loaded
+    """
+    netname = os.path.basename(netfolder)
+
+    if custom_objects is None:
+        custom_objects = get_custom_objects()
+
+    model_path = os.path.join(netfolder, netname + '_model.json')
+    if not os.path.exists(model_path):
+        model_path = os.path.join(netfolder, netname + '_modelv2.json')
+
+    with open(model_path, "r") as f:
+        string = json.load(f)
+        model = model_from_json(string, custom_objects=custom_objects)
+
+    weights_path = get_last_weights_path(netfolder, netname, iteration)
+    if weights_path == "":
+        raise Exception('NO WEIGHTS FOUND FOR ITERATION ' + str(iteration) + ' OF ' + netname)
+    model.load_weights(weights_path)
+
+    return model, weights_path
+
+
+def get_weight_owners(layer):
+    """
+    :param layer: a layer
+    :return: the innermost layers (e.g. the LSTM cells of a Bidirectional layer) that own the weights of the layer
+    """
+    sublayers = [getattr(layer, attribute, None) for attribute in ['forward_layer', 'backward_layer', 'layer', 'cell']]
+    sublayers = [sublayer for sublayer in sublayers if sublayer is not None]
+    if len(sublayers) < 1:
+        return [layer]
+    owners = []
+    for sublayer in sublayers:
+        owners += get_weight_owners(sublayer)
+    return owners
+
+
+def get_fans(shape):
+    """
+    :param shape: shape of a weight
+    :return: the number of its input and output units, as computed by the Keras initializers
+    """
+    if len(shape) < 1:
+        return 1, 1
+    if len(shape) == 1:
+        return shape[0], shape[0]
+    receptive_field = int(np.prod(shape[:-2]))
+    return shape[-2] * receptive_field, shape[-1] * receptive_field
+
+
+def draw_initial_value(initializer, shape, random_state):
+    """
+    Draws the initial value of a weight with numpy, with the same distribution of a Keras initializer, so that no
+    operation is added to the graph
+    :param initializer: the Keras initializer
+    :param shape: shape of the weight
+    :param random_state: numpy RandomState used to draw the value
+    :return: the value
+    """
+    # the parameters are read from the attributes, since some initializers do not list them in their config
+    class_name = initializer.__class__.__name__
+
+    if class_name == 'Zeros':
+        return np.zeros(shape)
+    if class_name == 'Ones':
+        return np.ones(shape)
+    if class_name == 'Constant':
+        return np.full(shape, initializer.value)
+    if class_name == 'RandomUniform':
+        return random_state.uniform(initializer.minval, initializer.maxval, size=shape)
+    if class_name == 'RandomNormal':
+        return random_state.normal(initializer.mean, initializer.stddev, size=shape)
+    if class_name == 'TruncatedNormal':
+        return draw_truncated_normal(initializer.mean, initializer.stddev, shape, random_state)
+    if class_name == 'Identity':
+        return initializer.gain * np.eye(*shape)
+    if class_name == 'Orthogonal':
+        rows = int(np.prod(shape[:-1]))
+        columns = shape[-1]
+        matrix = random_state.normal(0.0, 1.0, size=(max(rows, columns), min(rows, columns)))
+        q, r = np.linalg.qr(matrix)
+        q *= np.sign(np.diag(r))
+        if rows < columns:
+            q = q.T
+        return initializer.gain * q.reshape(shape)
+    if hasattr(initializer, 'distribution'):
+        # VarianceScaling and its subclasses (glorot, he, lecun)
+        fan_in, fan_out = get_fans(shape)
+        fans = {'fan_in': fan_in, 'fan_out': fan_out, 'fan_avg': (fan_in + fan_out) / 2.0}
+        scale = initializer.scale / max(1.0, fans[initializer.mode])
+        if initializer.distribution == 'uniform':
+            limit = np.sqrt(3.0 * scale)
+            return random_state.uniform(-limit, limit, size=shape)
+        if initializer.distribution == 'untruncated_normal':
+            return random_state.normal(0.0, np.sqrt(scale), size=shape)
+        # the constant is the stddev of a standard normal truncated to (-2, 2)
+        return draw_truncated_normal(0.0, np.sqrt(scale) / .87962566103423978, shape, random_state)
+    raise Exception('UNSUPPORTED INITIALIZER: ' + class_name)
+
+
+def draw_truncated_normal(mean, stddev, shape, random_state):
+    """
+    :return: values drawn from a normal distribution, where the ones farther than 2 stddev from the mean are drawn
+    again
+    """
+    value = random_state.normal(mean, stddev, size=shape)
+    outside = np.abs(value - mean) > 2 * stddev
+    while np.any(outside):
+        value[outside] = random_state.normal(mean, stddev, size=int(np.sum(outside)))
+        outside = np.abs(value - mean) > 2 * stddev
+    return value
+
+
+def reset_weights(model, seed):
+    """
+    Initialises again the weights of a model that has already been built and compiled, so that it can be trained
+    from scratch without building and compiling it again. Each trainable weight is drawn again, seeded, from the
+    distribution of the initializer its layer used for it (e.g. the kernel_initializer of a Dense layer for its
+    kernel); the statistics of the batch normalization are initialised again, while the other non-trainable weights
+    (the frozen embeddings) do not change. The state of the optimizer is cleared. The values are drawn with numpy and
+    assigned through the cached assignments of the backend, so resetting a model does not grow the graph.
+    :param model: the model
+    :param seed: the seed of the initializers
+    :return: None
+    """
+    from tensorflow.keras import backend, initializers
+
+    random_state = np.random.RandomState(seed)
+    values = []
+    reset = set()
+    for layer in model.layers:
+        for owner in get_weight_owners(layer):
+            for weight in owner.weights:
+                if id(weight) in reset:
+                    continue
+                name = weight.name.split('/')[-1].split(':')[0]
+                if not weight.trainable and name not in ['moving_mean', 'moving_variance']:
+                    continue
+                attribute = 'recurrent_initializer' if name == 'recurrent_kernel' else name + '_initializer'
+                initializer = getattr(owner, attribute, None)
+                if initializer is None:
+                    continue
+                initializer = initializers.get(initializer)
+
+                shape = tuple(backend.int_shape(weight))
+                if name == 'bias' and getattr(owner, 'unit_forget_bias', False):
+                    # as done by the LSTM cells
+                    units = shape[0] // 4
+                    value = np.concatenate([draw_initial_value(initializer, (units,), random_state), np.ones(units),
+                                            draw_initial_value(initializer, (units * 2,), random_state)])
+                else:
+                    value = draw_initial_value(initializer, shape, random_state)
+                values.append((weight, value))
+                reset.add(id(weight))
+
+    for weight in model.trainable_weights:
+        if id(weight) not in reset:
+            raise Exception('NO INITIALIZER FOR THE WEIGHT ' + weight.name)
+
+    if model.optimizer is not None:
+        for weight in model.optimizer.weights:
+            values.append((weight, np.zeros(backend.int_shape(weight))))
+
+    backend.batch_set_value(values)
+
+
+def read_weights_file(weights_path):
+    """
+    Reads the weights saved by Keras, either as weights only or as complete model
+    :param weights_path: path of the h5 file
+    :return: list of (layer name, list of weight arrays) of the layers with weights, in the order of the file
+    """
+    import h5py
+
+    layers = []
+    with h5py.File(weights_path, 'r') as f:
+        group = f['model_weights'] if 'model_weights' in f else f
+        for name in group.attrs['layer_names']:
+            name = name.decode('utf8') if isinstance(name, bytes) else name
+            weight_names = group[name].attrs['weight_names']
+            if len(weight_names) < 1:
+                continue
+            weights = []
+            for weight_name in weight_names:
+                weight_name = weight_name.decode('utf8') if isinstance(weight_name, bytes) else weight_name
+                weights.append(np.asarray(group[name][weight_name]))
+            layers.append((name, weights))
+    return layers
+
+
+INPUT_EMBEDDING_NAMES = ['text_embed', 'source_embed', 'target_embed', 'prop_embed']
+
+
+def transfer_weights(model, weights_path):
+    """
+    Loads saved weights into a model whose architecture differs from the saved one only in layers without weights,
+    e.g. a network built with fused_attention=True from the weights of the same network built without it.
+    The layers are matched by name; the remaining ones (automatically named) are matched in order, by the shapes of
+    their weights. The saved embedding tables of the inputs are skipped if the model has no layer with their name:
+    the model reads them from the shared store of the vocabularies.
+    :param model: the model
+    :param weights_path: path of the saved weights
+    :return: None
+    """
+    saved_layers = read_weights_file(weights_path)
+    model_layers = [layer for layer in model.layers if len(layer.weights) > 0]
+
+    def get_shapes(weights):
+        return [tuple(np.shape(weight)) for weight in weights]
+
+    named_layers = {layer.name: layer for layer in model_layers}
+    matched = set()
+    unmatched = []
+    for name, weights in saved_layers:
+        layer = named_layers.get(name)
+        if layer is None and name in INPUT_EMBEDDING_NAMES:
+            continue
+        if layer is not None and get_shapes(layer.get_weights()) == get_shapes(weights):
+            layer.set_weights(weights)
+            matched.add(layer.name)
+        else:
+            unmatched.append((name, weights))
+
+    remaining_layers = [layer for layer in model_layers if layer.name not in matched]
+    for name, weights in unmatched:
+        for position in range(len(remaining_layers)):
+            if get_shapes(remaining_layers[position].get_weights()) == get_shapes(weights):
+                remaining_layers.pop(position).set_weights(weights)
+                break
+        else:
+            raise Exception('NO LAYER FOR THE SAVED WEIGHTS OF ' + name)
+
+    if len(remaining_layers) > 0:
+        raise Exception('NO SAVED WEIGHTS FOR THE LAYERS ' + str([layer.name for layer in remaining_layers]))
+
+
+def merge_component_scores(sids, tids, source_scores, target_scores):
+    """
+    Every component is classified multiple times, as source and as target of its pairs. Merges these predictions
+    summing the scores of all the cases, as done during the evaluation.
+    :param sids: source id of each pair
+    :param tids: target id of each pair
+    :param source_scores: scores of the source of each pair
+    :param target_scores: scores of the target of each pair
+    :return: the sorted list of component ids and the summed scores of each of them
+    """
+    components_id_list = sorted(set(tids))
+    positions = {}
+    for index in range(len(components_id_list)):
+        positions[components_id_list[index]] = index
+
+    # components that never appear as target are not evaluated
+    source_positions = np.array([positions.get(sid, -1) for sid in sids], dtype=int)
+    known = source_positions >= 0
+
+    merged_scores = np.zeros((len(components_id_list), np.shape(source_scores)[-1]))
+    np.add.at(merged_scores, source_positions[known], np.asarray(source_scores)[known])
+    np.add.at(merged_scores, [positions[tid] for tid in tids], target_scores)
+
+    return components_id_list, merged_scores
+
+
+def is_document_model(model):
+    """
+    Whether a model classifies whole documents (see networks.build_net_12) instead of single pairs
+    """
+    return model.input_names[0] == "document_input_L"
+
+
+def create_document_index(sids, tids):
+    """
+    Groups the pairs of a split by document. The components of a document are sorted according to their index and are
+    left-padded up to the largest document, as done with the tokens of the propositions.
+    :param sids: source id of each pair
+    :param tids: target id of each pair
+    :return: a dictionary with the document position of each pair ('document'), the position of its source ('source')
+    and of its target ('target') within the document, the index of each component ('numbers', one array for each
+    document) and the number of components of the largest document ('max_components')
+    """
+    documents = {}
+    for component_id in list(sids) + list(tids):
+        separator = component_id.rfind('_')
+        doc_id = component_id[:separator]
+        if doc_id not in documents.keys():
+            documents[doc_id] = set()
+        documents[doc_id].add(int(component_id[separator + 1:]))
+
+    doc_ids = sorted(documents.keys())
+    max_components = 0
+    for doc_id in doc_ids:
+        documents[doc_id] = sorted(documents[doc_id])
+        max_components = max(max_components, len(documents[doc_id]))
+
+    doc_positions = {}
+    component_positions = {}
+    numbers = []
+    for doc_index in range(len(doc_ids)):
+        doc_id = doc_ids[doc_index]
+        doc_positions[doc_id] = doc_index
+        components = documents[doc_id]
+        offset = max_components - len(components)
+        for position in range(len(components)):
+            component_positions[doc_id + "_" + str(components[position])] = offset + position
+        numbers.append(components)
+
+    index = {'document': np.array([doc_positions[sid[:sid.rfind('_')]] for sid in sids], dtype=int),
+             'source': np.array([component_positions[sid] for sid in sids], dtype=int),
+             'target': np.array([component_positions[tid] for tid in tids], dtype=int),
+             'numbers': numbers,
+             'max_components': max_components}
+    return index
+
+
+def create_document_data(source_props, target_props, Y, index, distance, max_components=None):
+    """
+    Packs the pairs of a split into documents, creating the inputs and the outputs of a document network.
+    The pairs that are not in the split (e.g. the padding ones) and the padding components have no class and a zero
+    sample weight, so they count neither in the loss nor in the metrics, and the network is trained on the same pairs
+    of a pair network.
+    :param source_props: source proposition of each pair
+    :param target_props: target proposition of each pair
+    :param Y: list of outputs of each pair (link, relation, source, target)
+    :param index: document index created by create_document_index
+    :param distance: the maximum distance considered in the features
+    :param max_components: number of components of the packed documents. If None, the one of the index
+    :return: the inputs (documents, distances), the outputs (link, relation, component) of the network and the
+    sample weights of the outputs
+    """
+    if max_components is None:
+        max_components = index['max_components']
+    if index['max_components'] > max_components:
+        raise Exception('DOCUMENTS LONGER THAN ' + str(max_components) + ' COMPONENTS')
+    distance = max(distance, 0)
+    num_documents = len(index['numbers'])
+    documents = index['document']
+    # the positions of the index are left-padded up to its own largest document
+    shift = max_components - index['max_components']
+    sources = index['source'] + shift
+    targets = index['target'] + shift
+
+    X_props = np.zeros((num_documents, max_components) + np.shape(source_props)[1:], dtype=source_props.dtype)
+    X_props[documents, sources] = source_props
+    X_props[documents, targets] = target_props
+
+    # number of each component, aligned to the right as the positions
+    numbers = np.zeros((num_documents, max_components), dtype=int)
+    for doc_index in range(num_documents):
+        components = index['numbers'][doc_index]
+        numbers[doc_index, max_components - len(components):] = components
+    differences = np.expand_dims(numbers, axis=1) - np.expand_dims(numbers, axis=2)
+    X_dist = np.clip(differences, -distance, distance) + distance
+    X_dist = np.reshape(X_dist, (num_documents, max_components * max_components))
+
+    pairs = sources * max_components + targets
+
+    Y_links = np.zeros((num_documents, max_components * max_components, np.shape(Y[0])[-1]), dtype=np.float32)
+    Y_links[documents, pairs] = Y[0]
+
+    Y_rtype = np.zeros((num_documents, max_components * max_components, np.shape(Y[1])[-1]), dtype=np.float32)
+    Y_rtype[documents, pairs] = Y[1]
+
+    Y_ctype = np.zeros((num_documents, max_components, np.shape(Y[2])[-1]), dtype=np.float32)
+    Y_ctype[documents, sources] = Y[2]
+    Y_ctype[documents, targets] = Y[3]
+
+    W_pairs = np.zeros((num_documents, max_components * max_components), dtype=np.float32)
+    W_pairs[documents, pairs] = 1
+
+    W_components = np.zeros((num_documents, max_components), dtype=np.float32)
+    W_components[documents, sources] = 1
+    W_components[documents, targets] = 1
+
+    return [X_props, X_dist], [Y_links, Y_rtype, Y_ctype], [W_pairs, W_pairs, W_components]
+
+
+def unpack_document_predictions(Y_pred, index):
+    """
+    Converts the predictions of a document network into the ones of a pair network, so that they can be evaluated in
+    the same way
+    :param Y_pred: predictions of the document network (link, relation, component)
+    :param index: document index created by create_document_index
+    :return: the predictions for each pair of the split (link, relation, source, target)
+    """
+    max_components = np.shape(Y_pred[2])[1]
+    shift = max_components - index['max_components']
+    documents = index['document']
+    sources = index['source'] + shift
+    targets = index['target'] + shift
+    pairs = sources * max_components + targets
+
+    return [Y_pred[0][documents, pairs],
+            Y_pred[1][documents, pairs],
+            Y_pred[2][documents, sources],
+            Y_pred[2][documents, targets]]
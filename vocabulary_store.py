@@ -0,0 +1,221 @@
+__author__ = "Andrea Galassi"
+__copyright__ = "Copyright 2018-2020 Andrea Galassi"
+__license__ = "BSD 3-clause"
+__version__ = "0.1.0"
+__email__ = "a.galassi@unibo.it"
+
+"""
+Shared, content-addressed store of the embeddings of the vocabularies of all the datasets and versions.
+The same GloVe words (and, since their embeddings are seeded by the word, the same orphans) appear in the vocabulary
+of many corpora: the store keeps each distinct embedding once, identified by the hash of its float32 values.
+Each vocabulary ("glove.embeddings.npz") is registered with an index ("glove.embeddings.index.npz") that maps its
+positions (0 is the padding, word i is i + 1, as in the bow features) to the rows of the store.
+
+The store is a folder for each embedding size, in Datasets/shared_embeddings, with:
+- vectors.npy: the float32 matrix of the embeddings. Row 0 is the zero padding vector
+- hashes.npy: the SHA1 of each row
+The store is never copied by the networks that read it (see networks.SharedEmbedding): each process memory-maps it
+read-only with its index (load_embedding_view) and gathers only the rows of the words of each batch, so the trainers
+of the same node share a single copy of the embeddings, the one in the page cache of the operating system.
+"""
+
+import os
+import time
+import hashlib
+import argparse
+import numpy as np
+
+
+STORE_NAME = "shared_embeddings"
+INDEX_SUFFIX = ".index.npz"
+LOCK_TIMEOUT = 600
+
+
+def get_shared_store_path(dim, datasets_path=None):
+    """
+    :param dim: size of the embeddings
+    :param datasets_path: the Datasets folder. If None, the one in the working directory
+    :return: path of the store of the embeddings of that size
+    """
+    if datasets_path is None:
+        datasets_path = os.path.join(os.getcwd(), 'Datasets')
+    return os.path.join(datasets_path, STORE_NAME, str(dim))
+
+
+def get_index_path(vocabulary_path):
+    """
+    :param vocabulary_path: path of the npz file of the vocabulary
+    :return: path of its index in the shared store
+    """
+    return os.path.splitext(vocabulary_path)[0] + INDEX_SUFFIX
+
+
+def hash_vocabulary_file(vocabulary_path):
+    sha = hashlib.sha1()
+    with open(vocabulary_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def hash_rows(matrix):
+    """
+    :param matrix: float32 matrix
+    :return: array with the SHA1 of each row
+    """
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    return np.array([hashlib.sha1(row.tobytes()).digest() for row in matrix], dtype='S20')
+
+
+def acquire_lock(store_path):
+    """
+    Creates the lock file of the store, waiting for the other processes that are registering a vocabulary
+    :return: the path of the lock file
+    """
+    lock_path = os.path.join(store_path, "lock")
+    start = time.time()
+    while True:
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return lock_path
+        except FileExistsError:
+            if time.time() - start > LOCK_TIMEOUT:
+                raise Exception('SHARED EMBEDDINGS STORE LOCKED: ' + lock_path)
+            time.sleep(0.1)
+
+
+def register_vocabulary(vocabulary_path, store_path=None, datasets_path=None):
+    """
+    Adds the embeddings of a vocabulary to the shared store, if they are not there yet, and saves its index
+    :param vocabulary_path: path of the npz file of the vocabulary
+    :param store_path: path of the store. If None, the one of the size of the embeddings
+    :param datasets_path: the Datasets folder that contains the stores, used if store_path is None
+    :return: the index, from the positions of the vocabulary (0 is the padding) to the rows of the store
+    """
+    embeddings = np.load(vocabulary_path)['embeds'].astype(np.float32)
+    dim = embeddings.shape[1] if len(embeddings.shape) > 1 else 0
+    if store_path is None:
+        store_path = get_shared_store_path(dim, datasets_path)
+    if not os.path.exists(store_path):
+        os.makedirs(store_path)
+
+    source_hash = hash_vocabulary_file(vocabulary_path)
+    vectors_path = os.path.join(store_path, "vectors.npy")
+    hashes_path = os.path.join(store_path, "hashes.npy")
+
+    lock_path = acquire_lock(store_path)
+    try:
+        if os.path.exists(vectors_path):
+            vectors = np.load(vectors_path, mmap_mode='r')
+            hashes = np.load(hashes_path)
+        else:
+            vectors = np.zeros((1, dim), dtype=np.float32)
+            hashes = hash_rows(vectors)
+        if vectors.shape[1] != dim:
+            raise Exception('WRONG EMBEDDING SIZE IN THE SHARED STORE: ' + str(vectors.shape[1]))
+
+        rows = {digest: row for row, digest in enumerate(hashes.tolist())}
+        vocabulary_hashes = hash_rows(embeddings).tolist()
+        index = np.zeros(len(embeddings) + 1, dtype=np.int32)
+        new_rows = []
+        for position in range(len(embeddings)):
+            digest = vocabulary_hashes[position]
+            if digest not in rows:
+                rows[digest] = len(hashes) + len(new_rows)
+                new_rows.append(position)
+            index[position + 1] = rows[digest]
+
+        if len(new_rows) > 0:
+            # the files are replaced when complete: the processes that are using them keep the old version
+            new_vectors = np.lib.format.open_memmap(vectors_path + ".tmp", mode="w+", dtype=np.float32,
+                                                    shape=(len(vectors) + len(new_rows), dim))
+            new_vectors[:len(vectors)] = vectors
+            new_vectors[len(vectors):] = embeddings[new_rows]
+            new_vectors.flush()
+            del new_vectors
+            del vectors
+            with open(hashes_path + ".tmp", "wb") as f:
+                np.save(f, np.concatenate([hashes, np.array([vocabulary_hashes[position] for position in new_rows],
+                                                            dtype='S20')]))
+            os.replace(vectors_path + ".tmp", vectors_path)
+            os.replace(hashes_path + ".tmp", hashes_path)
+    finally:
+        os.remove(lock_path)
+
+    with open(get_index_path(vocabulary_path), "wb") as f:
+        np.savez(f, rows=index, source=np.array(source_hash), store=np.array(os.path.abspath(store_path)))
+
+    print(str(time.ctime()) + "\tREGISTERED " + vocabulary_path + ": " + str(len(new_rows)) +
+          " NEW EMBEDDINGS OUT OF " + str(len(embeddings)))
+    return index
+
+
+def load_index(vocabulary_path):
+    """
+    :param vocabulary_path: path of the npz file of the vocabulary
+    :return: the index of the vocabulary and the path of its store, or None if the vocabulary changed since it was
+    registered
+    """
+    index_path = get_index_path(vocabulary_path)
+    if not os.path.exists(index_path):
+        return None, None
+    with np.load(index_path) as data:
+        if str(data['source']) != hash_vocabulary_file(vocabulary_path):
+            return None, None
+        return data['rows'], str(data['store'])
+
+
+def load_embedding_view(vocabulary_path, store_path=None):
+    """
+    Opens the embeddings of a vocabulary without copying them: the embedding of the position p of the vocabulary
+    (0 is the padding, word i is i + 1) is vectors[index[p]]. The vocabulary is registered first, if needed.
+    :param vocabulary_path: path of the npz file of the vocabulary
+    :param store_path: path of the store. If None, the one of the size of the embeddings
+    :return: the read-only memory-mapped float32 matrix of the store and the index of the vocabulary
+    """
+    index, registered_store_path = load_index(vocabulary_path)
+    if store_path is None:
+        store_path = registered_store_path
+    vectors_path = None if store_path is None else os.path.join(store_path, "vectors.npy")
+
+    if index is None or not os.path.exists(vectors_path):
+        index = register_vocabulary(vocabulary_path, store_path)
+        store_path = load_index(vocabulary_path)[1]
+        vectors_path = os.path.join(store_path, "vectors.npy")
+
+    vectors = np.load(vectors_path, mmap_mode='r')
+    if len(index) > 0 and int(index.max()) >= len(vectors):
+        raise Exception('VOCABULARY INDEX OUT OF THE SHARED STORE: ' + vocabulary_path)
+    return vectors, index
+
+
+def load_embedding_matrix(vocabulary_path, store_path=None):
+    """
+    Loads the embeddings of a vocabulary as the bow matrix used by the Embedding layers: row 0 is the padding, row
+    i + 1 is the embedding of the i-th word. The rows are copied from the shared store into a new matrix, so it is
+    meant only for the networks that cannot read the store through load_embedding_view.
+    :param vocabulary_path: path of the npz file of the vocabulary
+    :param store_path: path of the store. If None, the one of the size of the embeddings
+    :return: float32 matrix
+    """
+    vectors, index = load_embedding_view(vocabulary_path, store_path)
+    return vectors[index]
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Registers the vocabularies of the datasets in the shared store")
+
+    parser.add_argument('-d', '--datasets', help="Folder of the datasets",
+                        default=os.path.join(os.getcwd(), 'Datasets'))
+
+    args = parser.parse_args()
+
+    for folder, folder_names, file_names in os.walk(args.datasets):
+        folder_names.sort()
+        if STORE_NAME in folder_names:
+            folder_names.remove(STORE_NAME)
+        if 'glove.embeddings.npz' in file_names:
+            register_vocabulary(os.path.join(folder, 'glove.embeddings.npz'), datasets_path=args.datasets)
+
+    print('Finished')